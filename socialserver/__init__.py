@@ -1,6 +1,19 @@
 #  Copyright (c) Niall Asher 2022
-from socialserver.util.output import console
-from socialserver.app import create_app
-from socialserver.util.post import start_unprocessed_post_thread
 
-application = create_app()
+"""
+    application
+
+    the wsgi application, created the first time it's looked up
+    (from socialserver import application), rather than whenever anything
+    in the package is imported. importing socialserver.db, or running a
+    cli command, shouldn't bind the database and register every resource.
+"""
+
+
+def __getattr__(name):
+    if name == "application":
+        from socialserver.app import create_app
+
+        application = globals()["application"] = create_app()
+        return application
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
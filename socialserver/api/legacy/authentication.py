@@ -1,6 +1,6 @@
 #  Copyright (c) Niall Asher 2022
 
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
 from pony.orm import db_session
 from socialserver.db import db
 from socialserver.constants import LegacyErrorCodes
@@ -12,23 +12,28 @@ from socialserver.util.auth import (
     check_totp_valid,
     TotpInvalidException,
     TotpExpendedException, check_and_handle_account_lock_status,
+    rehash_password_if_needed,
+    record_failed_login,
 )
 from flask import request
 from datetime import datetime, timedelta
 
 from socialserver.util.config import config
+from typing import Optional
+from socialserver.util.api.request_args import RequestArgs, request_args
 
 
-class LegacyAuthentication(Resource):
-    def __init__(self):
-        self.post_parser = reqparse.RequestParser()
-        self.post_parser.add_argument("username", type=str, required=True)
-        self.post_parser.add_argument("password", type=str, required=True)
-        self.post_parser.add_argument("totp", type=str, required=False, default=None)
+class LegacyAuthenticationPostArgs(RequestArgs):
+    username: str
+    password: str
+    totp: Optional[str] = None
+
 
-        self.delete_parser = reqparse.RequestParser()
-        self.delete_parser.add_argument("session_token", type=str, required=True)
+class LegacyAuthenticationDeleteArgs(RequestArgs):
+    session_token: str
 
+
+class LegacyAuthentication(Resource):
     @staticmethod
     def get(self):
         # yep, this is intentional.
@@ -37,9 +42,8 @@ class LegacyAuthentication(Resource):
         return 401
 
     @db_session
-    def post(self):
-        args = self.post_parser.parse_args()
-
+    @request_args(LegacyAuthenticationPostArgs)
+    def post(self, args):
         if args.username == "" or args.password == "":
             return {}, 401
 
@@ -57,8 +61,7 @@ class LegacyAuthentication(Resource):
         ):
             # yes, this is completely the wrong error to return, however,
             # for whatever reason, this was what API v1 did.
-            user.recent_failed_login_count += 1
-            user.last_failed_login_attempt = datetime.utcnow()
+            record_failed_login(user)
             return {"err": LegacyErrorCodes.PASSWORD_DAMAGED.value}, 401
 
         if user.totp is not None:
@@ -69,6 +72,8 @@ class LegacyAuthentication(Resource):
             except TotpInvalidException or TotpExpendedException:
                 return {"err": LegacyErrorCodes.TOTP_INCORRECT.value}, 401
 
+        rehash_password_if_needed(user, args["password"])
+
         secret = generate_key()
 
         db.UserSession(
@@ -83,9 +88,8 @@ class LegacyAuthentication(Resource):
         return secret.key
 
     @db_session
-    def delete(self):
-        args = self.delete_parser.parse_args()
-
+    @request_args(LegacyAuthenticationDeleteArgs)
+    def delete(self, args):
         access_token_hash = hash_plaintext_sha256(args["session_token"])
 
         session = db.UserSession.get(access_token_hash=access_token_hash)
@@ -1,33 +1,29 @@
 #  Copyright (c) Niall Asher 2022
 
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
 from pony.orm import db_session
 from socialserver.util.auth import get_user_object_from_token_or_abort
 from socialserver.constants import BIO_MAX_LEN
 from socialserver.db import db
+from typing import Optional
+from pydantic import Field
+from socialserver.util.api.request_args import RequestArgs, request_args
 
 
-class LegacyUserBio(Resource):
-    def __init__(self):
-        self.get_parser = reqparse.RequestParser()
-
-        self.get_parser.add_argument(
-            "session_token", type=str, required=True, help="Authentication Token"
-        )
-        self.get_parser.add_argument(
-            "username", type=str, required=False, help="Username to get"
-        )
-
-        self.post_parser = reqparse.RequestParser()
-        self.post_parser.add_argument(
-            "session_token", type=str, required=True, help="Authentication Token"
-        )
-        self.post_parser.add_argument("bio", type=str)
+class LegacyUserBioGetArgs(RequestArgs):
+    session_token: str = Field(..., description="Authentication Token")
+    username: Optional[str] = Field(None, description="Username to get")
+
+
+class LegacyUserBioPostArgs(RequestArgs):
+    session_token: str = Field(..., description="Authentication Token")
+    bio: Optional[str] = None
 
-    @db_session
-    def get(self):
-        args = self.get_parser.parse_args()
 
+class LegacyUserBio(Resource):
+    @db_session
+    @request_args(LegacyUserBioGetArgs)
+    def get(self, args):
         r_user = get_user_object_from_token_or_abort(args["session_token"])
 
         user = r_user
@@ -39,9 +35,8 @@ class LegacyUserBio(Resource):
         return {"bio": user.bio}, 201
 
     @db_session
-    def post(self):
-        args = self.post_parser.parse_args()
-
+    @request_args(LegacyUserBioPostArgs)
+    def post(self, args):
         user = get_user_object_from_token_or_abort(args["session_token"])
 
         # we **do not** want to check if it's none:
@@ -3,24 +3,21 @@
 from socialserver.db import db
 from socialserver.util.auth import get_user_object_from_token_or_abort
 from datetime import datetime
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
 from pony.orm import db_session
+from pydantic import Field
+from socialserver.util.api.request_args import RequestArgs, request_args
 
 
-class LegacyBlock(Resource):
-    def __init__(self):
-        self.post_parser = reqparse.RequestParser()
-        self.post_parser.add_argument(
-            "session_token", type=str, required=True, help="Authentication Token"
-        )
-        self.post_parser.add_argument(
-            "username", type=str, required=True, help="Username to toggle block for"
-        )
+class LegacyBlockPostArgs(RequestArgs):
+    session_token: str = Field(..., description="Authentication Token")
+    username: str = Field(..., description="Username to toggle block for")
 
-    @db_session
-    def post(self):
-        args = self.post_parser.parse_args()
 
+class LegacyBlock(Resource):
+    @db_session
+    @request_args(LegacyBlockPostArgs)
+    def post(self, args):
         user = get_user_object_from_token_or_abort(args["session_token"])
 
         user_to_block = db.User.get(username=args["username"])
@@ -41,19 +38,16 @@ class LegacyBlock(Resource):
         return {"userBlocked": True}, 201
 
 
+class LegacyUserBlocksGetArgs(RequestArgs):
+    session_token: str = Field(..., description="Authentication Token")
+
+
 # this is folded in here, since it's incredibly similar in scope.
 # it allows to get a list of blocked users.
 class LegacyUserBlocks(Resource):
-    def __init__(self):
-        self.get_parser = reqparse.RequestParser()
-        self.get_parser.add_argument(
-            "session_token", type=str, required=True, help="Authentication Token"
-        )
-
     @db_session
-    def get(self):
-        args = self.get_parser.parse_args()
-
+    @request_args(LegacyUserBlocksGetArgs)
+    def get(self, args):
         user = get_user_object_from_token_or_abort(args["session_token"])
 
         blocks = []
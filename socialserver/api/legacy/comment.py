@@ -1,52 +1,42 @@
 #  Copyright (c) Niall Asher 2022
 
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
 from socialserver.util.auth import get_user_object_from_token_or_abort
 from pony.orm import db_session, select
 from socialserver.db import db
 from socialserver.util.image import get_image_data_url_legacy
 from socialserver.constants import ImageTypes, COMMENT_MAX_LEN
 from datetime import datetime
+from typing import Optional
+from pydantic import Field
+from socialserver.util.api.request_args import RequestArgs, request_args
 
 
-class LegacyComment(Resource):
-    def __init__(self):
-        self.get_parser = reqparse.RequestParser()
-        self.get_parser.add_argument(
-            "session_token", type=str, required=True, help="Authentication Token"
-        )
-        # legacy api shared one parser between get and post reqs, hence the help message,
-        # and the lack of required=True
-        self.get_parser.add_argument(
-            "comment_id", type=int, help="Comment ID to get (get req only)"
-        )
+class LegacyCommentGetArgs(RequestArgs):
+    session_token: str = Field(..., description="Authentication Token")
+    # legacy api shared one parser between get and post reqs, hence the help message,
+    # and the lack of required=True
+    comment_id: Optional[int] = Field(None, description="Comment ID to get (get req only)")
 
-        self.post_parser = reqparse.RequestParser()
-        self.post_parser.add_argument(
-            "session_token", type=str, required=True, help="Authentication Token"
-        )
-        # these two were originally part of a single parser with the args in the GET function as well
-        self.post_parser.add_argument(
-            "post_id", type=int, help="Post to comment on (post req only)"
-        )
-        self.post_parser.add_argument(
-            "comment", type=str, help="Comment to post (post req only)"
-        )
 
-        self.delete_parser = reqparse.RequestParser()
-        self.delete_parser.add_argument(
-            "session_token", type=str, required=True, help="Authentication Token"
-        )
-        # yep, this help was wrong originally.
-        # yep, the help is wrong now.
-        self.delete_parser.add_argument(
-            "comment_id", type=int, help="Comment ID to get (get req only)"
-        )
+class LegacyCommentPostArgs(RequestArgs):
+    session_token: str = Field(..., description="Authentication Token")
+    # these two were originally part of a single parser with the args in the GET function as well
+    post_id: Optional[int] = Field(None, description="Post to comment on (post req only)")
+    comment: Optional[str] = Field(None, description="Comment to post (post req only)")
+
+
+class LegacyCommentDeleteArgs(RequestArgs):
+    session_token: str = Field(..., description="Authentication Token")
+    # yep, this help was wrong originally.
+    # yep, the help is wrong now.
+    comment_id: Optional[int] = Field(None, description="Comment ID to get (get req only)")
 
-    @db_session
-    def get(self):
-        args = self.get_parser.parse_args()
 
+class LegacyComment(Resource):
+    @db_session
+    @request_args(LegacyCommentGetArgs)
+    def get(self, args):
         user = get_user_object_from_token_or_abort(args["session_token"])
 
         if args["comment_id"] is (None or ""):
@@ -84,9 +74,8 @@ class LegacyComment(Resource):
         }, 201
 
     @db_session
-    def post(self):
-
-        args = self.post_parser.parse_args()
+    @request_args(LegacyCommentPostArgs)
+    def post(self, args):
 
         user = get_user_object_from_token_or_abort(args["session_token"])
 
@@ -119,9 +108,8 @@ class LegacyComment(Resource):
         return {}, 201
 
     @db_session
-    def delete(self):
-        args = self.delete_parser.parse_args()
-
+    @request_args(LegacyCommentDeleteArgs)
+    def delete(self, args):
         user = get_user_object_from_token_or_abort(args["session_token"])
 
         comment = db.Comment.get(id=args["comment_id"])
@@ -138,24 +126,16 @@ class LegacyComment(Resource):
         return {}, 201
 
 
+class LegacyCommentLikePostArgs(RequestArgs):
+    session_token: str = Field(..., description="Authentication Token")
+    comment_id: int = Field(..., description="Comment ID to toggle like state on")
+
+
 # might move this one to it's own file later??
 class LegacyCommentLike(Resource):
-    def __init__(self):
-        self.post_parser = reqparse.RequestParser()
-        self.post_parser.add_argument(
-            "session_token", type=str, required=True, help="Authentication Token"
-        )
-        self.post_parser.add_argument(
-            "comment_id",
-            type=int,
-            required=True,
-            help="Comment ID to toggle like state on",
-        )
-
     @db_session
-    def post(self):
-        args = self.post_parser.parse_args()
-
+    @request_args(LegacyCommentLikePostArgs)
+    def post(self, args):
         user = get_user_object_from_token_or_abort(args["session_token"])
 
         comment = db.Comment.get(id=args["comment_id"])
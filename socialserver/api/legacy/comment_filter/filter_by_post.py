@@ -3,29 +3,22 @@
 from socialserver.db import db
 from pony.orm import db_session, select, desc
 from socialserver.util.auth import get_user_object_from_token_or_abort
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
+from pydantic import Field
+from socialserver.util.api.request_args import RequestArgs, request_args
 
 
-class LegacyCommentFilterByPost(Resource):
-    def __init__(self):
-        self.get_parser = reqparse.RequestParser()
-        self.get_parser.add_argument(
-            "session_token", type=str, required=True, help="Authentication token"
-        )
-        self.get_parser.add_argument(
-            "post_id", type=int, required=True, help="Post ID to filter by"
-        )
-        self.get_parser.add_argument(
-            "count", type=int, required=True, help="Amount of IDs to return"
-        )
-        self.get_parser.add_argument(
-            "offset", type=int, required=True, help="Offset to filter by"
-        )
+class LegacyCommentFilterByPostGetArgs(RequestArgs):
+    session_token: str = Field(..., description="Authentication token")
+    post_id: int = Field(..., description="Post ID to filter by")
+    count: int = Field(..., description="Amount of IDs to return")
+    offset: int = Field(..., description="Offset to filter by")
 
-    @db_session
-    def get(self):
-        args = self.get_parser.parse_args()
 
+class LegacyCommentFilterByPost(Resource):
+    @db_session
+    @request_args(LegacyCommentFilterByPostGetArgs)
+    def get(self, args):
         user = get_user_object_from_token_or_abort(args["session_token"])
 
         post = db.Post.get(id=args["post_id"])
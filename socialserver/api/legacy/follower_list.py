@@ -1,35 +1,28 @@
 #  Copyright (c) Niall Asher 2022
 
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
 from pony.orm import db_session, select
 from socialserver.db import db
 from socialserver.util.auth import get_user_object_from_token_or_abort
 from datetime import datetime
+from pydantic import Field
+from socialserver.util.api.request_args import RequestArgs, request_args
 
 
-class LegacyFollower(Resource):
-    def __init__(self):
-        self.post_parser = reqparse.RequestParser()
-
-        self.post_parser.add_argument(
-            "session_token", type=str, required=True, help="Authentication Tokens"
-        )
-        self.post_parser.add_argument(
-            "username", type=str, required=True, help="Username to follow"
-        )
-
-        self.get_parser = reqparse.RequestParser()
-        self.get_parser.add_argument(
-            "session_token", type=str, required=True, help="Authentication Tokens"
-        )
-        self.get_parser.add_argument(
-            "username", type=str, required=True, help="Username to follow"
-        )
+class LegacyFollowerPostArgs(RequestArgs):
+    session_token: str = Field(..., description="Authentication Tokens")
+    username: str = Field(..., description="Username to follow")
+
+
+class LegacyFollowerGetArgs(RequestArgs):
+    session_token: str = Field(..., description="Authentication Tokens")
+    username: str = Field(..., description="Username to follow")
 
-    @db_session
-    def post(self):
-        args = self.post_parser.parse_args()
 
+class LegacyFollower(Resource):
+    @db_session
+    @request_args(LegacyFollowerPostArgs)
+    def post(self, args):
         user = get_user_object_from_token_or_abort(args["session_token"])
         user_to_follow = db.User.get(username=args["username"])
         if user_to_follow is None:
@@ -63,9 +56,8 @@ class LegacyFollower(Resource):
     @db_session
     # this is a weird one as you can see. IIRC it's used by the follower lists, just to
     # get the display name.
-    def get(self):
-        args = self.get_parser.parse_args()
-
+    @request_args(LegacyFollowerGetArgs)
+    def get(self, args):
         user = get_user_object_from_token_or_abort(args["session_token"])
 
         follower = db.User.get(username=args.username)
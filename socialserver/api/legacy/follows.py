@@ -1,26 +1,23 @@
 #  Copyright (c) Niall Asher 2022
 
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
 from socialserver.db import db
 from pony.orm import db_session
 from socialserver.util.auth import get_user_object_from_token_or_abort
+from typing import Optional
+from pydantic import Field
+from socialserver.util.api.request_args import RequestArgs, request_args
 
 
-class LegacyUserFollows(Resource):
-    def __init__(self):
-        self.get_parser = reqparse.RequestParser()
+class LegacyUserFollowsGetArgs(RequestArgs):
+    session_token: str = Field(..., description="Authentication Token")
+    username: Optional[str] = Field(None, description="Username to get follow list for")
 
-        self.get_parser.add_argument(
-            "session_token", type=str, help="Authentication Token", required=True
-        )
-        self.get_parser.add_argument(
-            "username", type=str, help="Username to get follow list for"
-        )
 
+class LegacyUserFollows(Resource):
     @db_session
-    def get(self):
-        args = self.get_parser.parse_args()
-
+    @request_args(LegacyUserFollowsGetArgs)
+    def get(self, args):
         r_user = get_user_object_from_token_or_abort(args["session_token"])
 
         user = r_user
@@ -38,20 +35,15 @@ class LegacyUserFollows(Resource):
         return following, 201
 
 
-class LegacyUserFollowing(Resource):
-    def __init__(self):
-        self.get_parser = reqparse.RequestParser()
-        self.get_parser.add_argument(
-            "session_token", type=str, help="Authentication Token", required=True
-        )
-        self.get_parser.add_argument(
-            "username", type=str, help="Username to get follow list for"
-        )
+class LegacyUserFollowingGetArgs(RequestArgs):
+    session_token: str = Field(..., description="Authentication Token")
+    username: Optional[str] = Field(None, description="Username to get follow list for")
 
-    @db_session
-    def get(self):
-        args = self.get_parser.parse_args()
 
+class LegacyUserFollowing(Resource):
+    @db_session
+    @request_args(LegacyUserFollowingGetArgs)
+    def get(self, args):
         r_user = get_user_object_from_token_or_abort(args["session_token"])
 
         user = r_user
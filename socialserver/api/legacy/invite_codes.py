@@ -1,8 +1,10 @@
 #  Copyright (c) Niall Asher 2022
 
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
 from pony.orm import db_session
 from socialserver.util.auth import get_user_object_from_token_or_abort
+from pydantic import Field
+from socialserver.util.api.request_args import RequestArgs, request_args
 
 """
     this class is somewhat of a stub, since invite codes are not
@@ -15,17 +17,14 @@ from socialserver.util.auth import get_user_object_from_token_or_abort
 """
 
 
-class LegacyInviteCodes(Resource):
-    def __init__(self):
-        self.get_parser = reqparse.RequestParser()
-        self.get_parser.add_argument(
-            "session_token", type=str, help="Session authentication key", required=True
-        )
+class LegacyInviteCodesGetArgs(RequestArgs):
+    session_token: str = Field(..., description="Session authentication key")
 
-    @db_session
-    def get(self):
-        args = self.get_parser.parse_args()
 
+class LegacyInviteCodes(Resource):
+    @db_session
+    @request_args(LegacyInviteCodesGetArgs)
+    def get(self, args):
         get_user_object_from_token_or_abort(args["session_token"])
 
         # here's the stub part :)
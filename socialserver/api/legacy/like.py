@@ -1,35 +1,30 @@
 #  Copyright (c) Niall Asher 2022
 
 from pony.orm import db_session, select
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
 from socialserver.db import db
 from socialserver.util.auth import get_user_object_from_token_or_abort
 from datetime import datetime
+from typing import Optional
+from pydantic import Field
+from socialserver.util.api.request_args import RequestArgs, request_args
 
 
-class LegacyLike(Resource):
-    def __init__(self):
-        self.post_parser = reqparse.RequestParser()
-        self.post_parser.add_argument(
-            "session_token", type=str, help="Authentication token", required=True
-        )
-        self.post_parser.add_argument(
-            "post_id", type=int, help="PostID to toggle like on"
-        )
-
-        self.get_parser = reqparse.RequestParser()
-        self.get_parser.add_argument(
-            "session_token", type=str, help="Authentication Tokens", required=True
-        )
-        # this should be an int, but it wasn't in the old server, so it's a string.
-        self.get_parser.add_argument(
-            "like_id", type=str, help="Authentication Tokens", required=True
-        )
+class LegacyLikePostArgs(RequestArgs):
+    session_token: str = Field(..., description="Authentication token")
+    post_id: Optional[int] = Field(None, description="PostID to toggle like on")
+
+
+class LegacyLikeGetArgs(RequestArgs):
+    session_token: str = Field(..., description="Authentication Tokens")
+    # this should be an int, but it wasn't in the old server, so it's a string.
+    like_id: str = Field(..., description="Authentication Tokens")
 
-    @db_session
-    def post(self):
-        args = self.post_parser.parse_args()
 
+class LegacyLike(Resource):
+    @db_session
+    @request_args(LegacyLikePostArgs)
+    def post(self, args):
         user = get_user_object_from_token_or_abort(args["session_token"])
 
         post = db.Post.get(id=args["post_id"])
@@ -49,9 +44,8 @@ class LegacyLike(Resource):
         return {"postIsLiked": existing_like is None, "postLikeCount": like_count}, 201
 
     @db_session
-    def get(self):
-
-        args = self.get_parser.parse_args()
+    @request_args(LegacyLikeGetArgs)
+    def get(self, args):
 
         user = get_user_object_from_token_or_abort(args["session_token"])
 
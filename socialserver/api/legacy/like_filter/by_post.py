@@ -1,32 +1,25 @@
 #  Copyright (c) Niall Asher 2022
 
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
 from socialserver.db import db
 from socialserver.util.auth import get_user_object_from_token_or_abort
 from pony.orm import db_session, select, desc
 from socialserver.constants import MAX_FEED_GET_COUNT
+from pydantic import Field
+from socialserver.util.api.request_args import RequestArgs, request_args
 
 
-class LegacyLikeFilterByPost(Resource):
-    def __init__(self):
-        self.get_parser = reqparse.RequestParser()
-        self.get_parser.add_argument(
-            "session_token", type=str, help="Authentication token", required=True
-        )
-        self.get_parser.add_argument(
-            "post_id", type=int, help="Post ID to get likes for", required=True
-        )
-        self.get_parser.add_argument(
-            "count", type=int, help="Amount of likes to get", required=True
-        )
-        self.get_parser.add_argument(
-            "offset", type=int, help="Offset to get from", required=True
-        )
+class LegacyLikeFilterByPostGetArgs(RequestArgs):
+    session_token: str = Field(..., description="Authentication token")
+    post_id: int = Field(..., description="Post ID to get likes for")
+    count: int = Field(..., description="Amount of likes to get")
+    offset: int = Field(..., description="Offset to get from")
 
-    @db_session
-    def get(self):
-        args = self.get_parser.parse_args()
 
+class LegacyLikeFilterByPost(Resource):
+    @db_session
+    @request_args(LegacyLikeFilterByPostGetArgs)
+    def get(self, args):
         get_user_object_from_token_or_abort(args["session_token"])
 
         if args["count"] > MAX_FEED_GET_COUNT:
@@ -1,57 +1,37 @@
 #  Copyright (c) Niall Asher 2022
 
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
 from pony.orm import db_session, select, desc
 from socialserver.db import db
 from socialserver.constants import LegacyErrorCodes
 from socialserver.util.auth import get_user_object_from_token_or_abort
+from pydantic import Field
+from socialserver.util.api.request_args import RequestArgs, request_args
 
 
-class LegacyModQueue(Resource):
-    def __init__(self):
-        self.post_parser = reqparse.RequestParser()
-        # this used to be required=False for some reason, but no server code
-        # ever did anything if it was invalid, so why even keep it that way I guess?
-        self.post_parser.add_argument(
-            "session_token",
-            type=str,
-            help="Key for session authentication.",
-            required=True,
-        )
-        # same here
-        self.post_parser.add_argument(
-            "post_id", type=int, help="Post to hide and add", required=True
-        )
+class LegacyModQueuePostArgs(RequestArgs):
+    # this used to be required=False for some reason, but no server code
+    # ever did anything if it was invalid, so why even keep it that way I guess?
+    session_token: str = Field(..., description="Key for session authentication.")
+    # same here
+    post_id: int = Field(..., description="Post to hide and add")
 
-        self.delete_parser = reqparse.RequestParser()
-        self.delete_parser.add_argument(
-            "session_token",
-            type=str,
-            help="Key for session authentication.",
-            required=True,
-        )
-        self.delete_parser.add_argument(
-            "post_id", type=int, help="Post to hide and add", required=True
-        )
 
-        self.get_parser = reqparse.RequestParser()
-        self.get_parser.add_argument(
-            "session_token",
-            type=str,
-            help="Key for session authentication.",
-            required=True,
-        )
-        self.get_parser.add_argument(
-            "count", type=int, required=True, help="Amount of posts to return."
-        )
-        self.get_parser.add_argument(
-            "offset", type=int, required=True, help="Amount of posts to skip."
-        )
+class LegacyModQueueDeleteArgs(RequestArgs):
+    session_token: str = Field(..., description="Key for session authentication.")
+    post_id: int = Field(..., description="Post to hide and add")
 
-    @db_session
-    def post(self):
-        args = self.post_parser.parse_args()
 
+class LegacyModQueueGetArgs(RequestArgs):
+    session_token: str = Field(..., description="Key for session authentication.")
+    count: int = Field(..., description="Amount of posts to return.")
+    offset: int = Field(..., description="Amount of posts to skip.")
+
+
+class LegacyModQueue(Resource):
+    @db_session
+    @request_args(LegacyModQueuePostArgs)
+    def post(self, args):
         user = get_user_object_from_token_or_abort(args["session_token"])
         if True not in [user.is_moderator, user.is_admin]:
             return {
@@ -66,9 +46,8 @@ class LegacyModQueue(Resource):
         return {}, 201
 
     @db_session
-    def delete(self):
-
-        args = self.delete_parser.parse_args()
+    @request_args(LegacyModQueueDeleteArgs)
+    def delete(self, args):
 
         user = get_user_object_from_token_or_abort(args["session_token"])
         if True not in [user.is_moderator, user.is_admin]:
@@ -84,9 +63,8 @@ class LegacyModQueue(Resource):
         return {}, 201
 
     @db_session
-    def get(self):
-        args = self.get_parser.parse_args()
-
+    @request_args(LegacyModQueueGetArgs)
+    def get(self, args):
         user = get_user_object_from_token_or_abort(args["session_token"])
         if True not in [user.is_moderator, user.is_admin]:
             return {
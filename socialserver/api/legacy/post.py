@@ -1,27 +1,29 @@
 #  Copyright (c) Niall Asher 2022
 
 from socialserver.db import db
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
 
 from socialserver.util.api.legacy.thumbnail import make_unsupported_msg_thumbnail_b64
 from socialserver.util.auth import get_user_object_from_token_or_abort
 from socialserver.util.config import config
 from socialserver.util.filesystem import fs_images
+from socialserver.util.hashtag import extract_hashtags, attach_hashtags_to_post, trending_hashtags
 from socialserver.util.image import get_image_data_url_legacy
 from socialserver.constants import (
     LegacyErrorCodes,
     ImageTypes,
     MAX_FEED_GET_COUNT,
+    MAX_TAGS_PER_POST,
     POST_MAX_LEN,
-    REGEX_HASHTAG,
     ROOT_DIR,
 )
-import re
-from pony.orm import db_session, select, desc
+from pony.orm import db_session, select, desc, commit
 from datetime import datetime
 from base64 import b64encode
-from PIL import Image
 from io import BytesIO
+from typing import Optional
+from pydantic import Field
+from socialserver.util.api.request_args import RequestArgs, request_args
 
 SERVE_FULL_POST_IMAGES = config.legacy_api_interface.deliver_full_post_images
 
@@ -34,50 +36,28 @@ with open(
     )
 
 
-class LegacyPost(Resource):
-    def __init__(self):
-        self.post_parser = reqparse.RequestParser()
-        self.post_parser.add_argument(
-            "session_token", type=str, help="Key for session authentication."
-        )
-        self.post_parser.add_argument(
-            "post_text", type=str, help="Text for post to contain.", required=True
-        )
-        self.post_parser.add_argument(
-            "post_image_hash",
-            type=str,
-            help="Hash for image if wanted.",
-            required=False,
-        )
+class LegacyPostPostArgs(RequestArgs):
+    session_token: Optional[str] = Field(None, description="Key for session authentication.")
+    post_text: str = Field(..., description="Text for post to contain.")
+    post_image_hash: Optional[str] = Field(None, description="Hash for image if wanted.")
 
-        self.delete_parser = reqparse.RequestParser()
-        self.delete_parser.add_argument(
-            "session_token",
-            type=str,
-            help="Key for session authentication.",
-            required=True,
-        )
-        self.delete_parser.add_argument(
-            "post_id", type=int, help="Post to remove.", required=True
-        )
 
-        self.get_parser = reqparse.RequestParser()
-        self.get_parser.add_argument(
-            "session_token",
-            type=str,
-            help="Key for session authentication.",
-            required=True,
-        )
-        self.get_parser.add_argument("count", type=int, help="amount to retrieve.")
-        self.get_parser.add_argument("offset", type=int, help="amount to offset.")
-        self.get_parser.add_argument(
-            "post_id", type=int, help="Post ID to get.", default=None
-        )
+class LegacyPostDeleteArgs(RequestArgs):
+    session_token: str = Field(..., description="Key for session authentication.")
+    post_id: int = Field(..., description="Post to remove.")
 
-    @db_session
-    def post(self):
-        args = self.post_parser.parse_args()
 
+class LegacyPostGetArgs(RequestArgs):
+    session_token: str = Field(..., description="Key for session authentication.")
+    count: Optional[int] = Field(None, description="amount to retrieve.")
+    offset: Optional[int] = Field(None, description="amount to offset.")
+    post_id: Optional[int] = Field(None, description="Post ID to get.")
+
+
+class LegacyPost(Resource):
+    @db_session
+    @request_args(LegacyPostPostArgs)
+    def post(self, args):
         user = get_user_object_from_token_or_abort(args["session_token"])
 
         text_content = args["post_text"]
@@ -109,38 +89,29 @@ class LegacyPost(Resource):
 
         # while the old api doesn't understand hashtags or anything,
         # we still want to make them for people using the new one!
-        hashregex = re.compile(REGEX_HASHTAG)
-        # the regex is case-insensitive,
-        # but we want to store them lowercase in db anyway!
-        tags = hashregex.findall(text_content.lower())
-
-        # db_tags will be populated with each tag associated with the post.
-        db_tags = []
-        for tag_name in tags:
-            existing_tag = db.Hashtag.get(name=tag_name)
-            if existing_tag is None:
-                tag = db.Hashtag(creation_time=datetime.utcnow(), name=tag_name)
-            else:
-                tag = existing_tag
-            db_tags.append(tag)
-
-        db.Post(
+        # the old api has no way to report too many tags, so we just
+        # keep the first MAX_TAGS_PER_POST, same as with the post length.
+        tags = extract_hashtags(text_content)[0:MAX_TAGS_PER_POST]
+
+        new_post = db.Post(
             under_moderation=False,
             user=user,
             creation_time=datetime.utcnow(),
             text=text_content,
-            hashtags=db_tags,
             processed=True,
             attachments=attachments
         )
 
+        attach_hashtags_to_post(new_post, tags)
+        commit()
+        trending_hashtags.record(tags)
+
         # api v1 didn't return the post id.
         return {}, 201
 
     @db_session
-    def delete(self):
-        args = self.delete_parser.parse_args()
-
+    @request_args(LegacyPostDeleteArgs)
+    def delete(self, args):
         user = get_user_object_from_token_or_abort(args["session_token"])
 
         post = db.Post.get(id=args["post_id"])
@@ -157,9 +128,8 @@ class LegacyPost(Resource):
         return {}, 401
 
     @db_session
-    def get(self):
-        args = self.get_parser.parse_args()
-
+    @request_args(LegacyPostGetArgs)
+    def get(self, args):
         user = get_user_object_from_token_or_abort(args["session_token"])
 
         # if a post id is specified, we want to grab
@@ -1,37 +1,28 @@
 #  Copyright (c) Niall Asher 2022
 
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
 from socialserver.db import db
 from socialserver.util.auth import get_user_object_from_token_or_abort
 from socialserver.constants import MAX_FEED_GET_COUNT
 from pony.orm import db_session, select, desc
+from typing import List
+from pydantic import Field
+from socialserver.util.api.request_args import RequestArgs, request_args
 
 
-class LegacyPostFilterByUser(Resource):
-    def __init__(self):
-        self.get_parser = reqparse.RequestParser()
-        # this slightly breaks compat, but it could cause crashes in the original server, so we're changing it
-        # (nothing *should* have been omitting these)
-        self.get_parser.add_argument(
-            "session_token",
-            type=str,
-            help="Key for session authentication.",
-            required=True,
-        )
-        self.get_parser.add_argument(
-            "count", type=int, help="Amount of posts to return", required=True
-        )
-        self.get_parser.add_argument(
-            "offset", type=int, help="Amount of posts to skip.", required=True
-        )
-        self.get_parser.add_argument(
-            "users", action="append", help="Users to filter by", required=True
-        )
+class LegacyPostFilterByUserGetArgs(RequestArgs):
+    # this slightly breaks compat, but it could cause crashes in the original server, so we're changing it
+    # (nothing *should* have been omitting these)
+    session_token: str = Field(..., description="Key for session authentication.")
+    count: int = Field(..., description="Amount of posts to return")
+    offset: int = Field(..., description="Amount of posts to skip.")
+    users: List[str] = Field(..., description="Users to filter by")
 
-    @db_session
-    def get(self):
 
-        args = self.get_parser.parse_args()
+class LegacyPostFilterByUser(Resource):
+    @db_session
+    @request_args(LegacyPostFilterByUserGetArgs)
+    def get(self, args):
 
         r_user = get_user_object_from_token_or_abort(args["session_token"])
 
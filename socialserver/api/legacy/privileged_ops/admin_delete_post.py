@@ -1,26 +1,23 @@
 #  Copyright (c) Niall Asher 2022
 
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
 from pony.orm import db_session
 from socialserver.constants import LegacyErrorCodes
 from socialserver.util.auth import get_user_object_from_token_or_abort
 from socialserver.db import db
+from pydantic import Field
+from socialserver.util.api.request_args import RequestArgs, request_args
 
 
-class LegacyAdminDeletePost(Resource):
-    def __init__(self):
-        self.delete_parser = reqparse.RequestParser()
-        self.delete_parser.add_argument(
-            "session_token", type=str, required=True, help="Authentication Token"
-        )
-        self.delete_parser.add_argument(
-            "post_id", type=int, required=True, help="Post ID to admin delete"
-        )
+class LegacyAdminDeletePostDeleteArgs(RequestArgs):
+    session_token: str = Field(..., description="Authentication Token")
+    post_id: int = Field(..., description="Post ID to admin delete")
 
-    @db_session
-    def delete(self):
-        args = self.delete_parser.parse_args()
 
+class LegacyAdminDeletePost(Resource):
+    @db_session
+    @request_args(LegacyAdminDeletePostDeleteArgs)
+    def delete(self, args):
         user = get_user_object_from_token_or_abort(args["session_token"])
 
         if not user.is_admin:
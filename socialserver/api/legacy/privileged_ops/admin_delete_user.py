@@ -1,32 +1,29 @@
 #  Copyright (c) Niall Asher 2022
 
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
 from pony.orm import db_session
 from socialserver.db import db
+from socialserver.util.username_filter import username_filter
+from socialserver.util.api_key import api_key_cache
 from socialserver.constants import LegacyErrorCodes
 from socialserver.util.auth import (
     get_user_object_from_token_or_abort,
     verify_password_valid,
 )
+from pydantic import Field
+from socialserver.util.api.request_args import RequestArgs, request_args
 
 
-class LegacyAdminDeleteUser(Resource):
-    def __init__(self):
-        self.delete_parser = reqparse.RequestParser()
-        self.delete_parser.add_argument(
-            "session_token", type=str, required=True, help="Authentication Token"
-        )
-        self.delete_parser.add_argument(
-            "username", type=str, required=True, help="Username to Admin Delete"
-        )
-        self.delete_parser.add_argument(
-            "password", type=str, required=True, help="Password for session account"
-        )
+class LegacyAdminDeleteUserDeleteArgs(RequestArgs):
+    session_token: str = Field(..., description="Authentication Token")
+    username: str = Field(..., description="Username to Admin Delete")
+    password: str = Field(..., description="Password for session account")
 
-    @db_session
-    def delete(self):
-        args = self.delete_parser.parse_args()
 
+class LegacyAdminDeleteUser(Resource):
+    @db_session
+    @request_args(LegacyAdminDeleteUserDeleteArgs)
+    def delete(self, args):
         r_user = get_user_object_from_token_or_abort(args["session_token"])
 
         if not r_user.is_admin:
@@ -49,5 +46,7 @@ class LegacyAdminDeleteUser(Resource):
             }, 401
 
         # rip bozo
+        username_filter.remove(user.username)
+        api_key_cache.evict_owner(user.id)
         user.delete()
         return {}, 201
@@ -1,6 +1,6 @@
 #  Copyright (c) Niall Asher 2022
 
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
 from socialserver.db import db
 from socialserver.util.auth import get_user_object_from_token_or_abort
 from socialserver.constants import (
@@ -9,21 +9,21 @@ from socialserver.constants import (
     LegacyAdminUserModTypes,
 )
 from pony.orm import db_session
+from typing import Optional
+from pydantic import Field
+from socialserver.util.api.request_args import RequestArgs, request_args
 
 
-class LegacyAdminUserMod(Resource):
-    def __init__(self):
-        self.post_parser = reqparse.RequestParser()
-        self.post_parser.add_argument(
-            "session_token", type=str, required=True, help="Authentication Token"
-        )
-        self.post_parser.add_argument("modtype", type=str, help="Modification Type")
-        self.post_parser.add_argument("username", type=str, help="Username")
+class LegacyAdminUserModPostArgs(RequestArgs):
+    session_token: str = Field(..., description="Authentication Token")
+    modtype: Optional[str] = Field(None, description="Modification Type")
+    username: Optional[str] = Field(None, description="Username")
 
-    @db_session
-    def post(self):
-        args = self.post_parser.parse_args()
 
+class LegacyAdminUserMod(Resource):
+    @db_session
+    @request_args(LegacyAdminUserModPostArgs)
+    def post(self, args):
         r_user = get_user_object_from_token_or_abort(args["session_token"])
 
         if not r_user.is_admin:
@@ -36,18 +36,12 @@ class LegacyAdminUserMod(Resource):
 
         # toggle verification status
         if args["modtype"] == LegacyAdminUserModTypes.VERIFICATION_STATUS.value:
-            if user.is_verified:
-                user.account_attributes.remove(AccountAttributes.VERIFIED.value)
-            else:
-                user.account_attributes.append(AccountAttributes.VERIFIED.value)
+            user.set_attribute(AccountAttributes.VERIFIED, not user.is_verified)
             return {}, 201
         # toggle mod status
 
         elif args["modtype"] == LegacyAdminUserModTypes.MODERATOR_STATUS.value:
-            if user.is_moderator:
-                user.account_attributes.remove(AccountAttributes.MODERATOR.value)
-            else:
-                user.account_attributes.append(AccountAttributes.MODERATOR.value)
+            user.set_attribute(AccountAttributes.MODERATOR, not user.is_moderator)
             return {}, 201
 
         # yep, you're seeing that right.
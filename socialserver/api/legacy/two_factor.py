@@ -7,47 +7,38 @@ from socialserver.util.auth import (
 )
 import pyotp
 from socialserver.util.config import config
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
 from socialserver.constants import LegacyErrorCodes
 from pony.orm import commit, db_session
 from socialserver.db import db
 from datetime import datetime, timedelta
+from typing import Optional
+from pydantic import Field
+from socialserver.util.api.request_args import RequestArgs, request_args
 
 
-class LegacyTwoFactor(Resource):
-    def __init__(self):
-        self.get_parser = reqparse.RequestParser()
-        self.get_parser.add_argument(
-            "session_token", type=str, required=True, help="Authentication Token"
-        )
-
-        self.post_parser = reqparse.RequestParser()
-        self.post_parser.add_argument(
-            "session_token", type=str, required=True, help="Authentication Token"
-        )
-        self.post_parser.add_argument(
-            "action",
-            type=str,
-            required=True,
-            help="Action to take (add/remove/confirm)",
-        )
-        # needed for removal and addition, but not confirmations
-        self.post_parser.add_argument(
-            "password", type=str, required=False, help="Authentication Password"
-        )
-        self.post_parser.add_argument("totp", type=str, help="Code for confirmations")
+class LegacyTwoFactorGetArgs(RequestArgs):
+    session_token: str = Field(..., description="Authentication Token")
+
+
+class LegacyTwoFactorPostArgs(RequestArgs):
+    session_token: str = Field(..., description="Authentication Token")
+    action: str = Field(..., description="Action to take (add/remove/confirm)")
+    # needed for removal and addition, but not confirmations
+    password: Optional[str] = Field(None, description="Authentication Password")
+    totp: Optional[str] = Field(None, description="Code for confirmations")
 
-    @db_session
-    def get(self):
-        args = self.get_parser.parse_args()
 
+class LegacyTwoFactor(Resource):
+    @db_session
+    @request_args(LegacyTwoFactorGetArgs)
+    def get(self, args):
         user = get_user_object_from_token_or_abort(args["session_token"])
         return {"enabled": user.totp is not None and user.totp.confirmed}, 201
 
     @db_session
-    def post(self):
-        args = self.post_parser.parse_args()
-
+    @request_args(LegacyTwoFactorPostArgs)
+    def post(self, args):
         user = get_user_object_from_token_or_abort(args["session_token"])
 
         # input validation, old server style
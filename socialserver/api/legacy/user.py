@@ -2,10 +2,12 @@
 
 from datetime import datetime
 import re
-from pony.orm import db_session
+from pony.orm import db_session, commit, TransactionIntegrityError
 from socialserver.db import db
 from socialserver.util.image import get_image_data_url_legacy
 from socialserver.util.config import config
+from socialserver.util.username_filter import username_filter, username_taken
+from socialserver.util.api_key import api_key_cache
 from socialserver.constants import (
     DISPLAY_NAME_MAX_LEN,
     MAX_PASSWORD_LEN,
@@ -21,48 +23,33 @@ from socialserver.util.auth import (
     verify_password_valid,
     get_user_object_from_token_or_abort,
 )
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
+from typing import Optional
+from pydantic import Field
+from socialserver.util.api.request_args import RequestArgs, request_args
 
 
-class LegacyUser(Resource):
-    def __init__(self):
-        self.get_parser = reqparse.RequestParser()
-        self.get_parser.add_argument(
-            "session_token", type=str, help="Session authentication key", required=True
-        )
-        self.get_parser.add_argument("username", type=str, help="username to get")
-        self.get_parser.add_argument(
-            "disable_include_images",
-            type=str,
-            help="Set to not include images in the returned data.",
-        )
+class LegacyUserGetArgs(RequestArgs):
+    session_token: str = Field(..., description="Session authentication key")
+    username: Optional[str] = Field(None, description="username to get")
+    disable_include_images: Optional[str] = Field(None, description="Set to not include images in the returned data.")
 
-        self.post_parser = reqparse.RequestParser()
-        self.post_parser.add_argument(
-            "username", type=str, help="Username for created account", required=True
-        )
-        self.post_parser.add_argument(
-            "password", type=str, help="Password for created account", required=True
-        )
-        self.post_parser.add_argument(
-            "display_name",
-            type=str,
-            help="Display name for created account",
-            required=True,
-        )
 
-        self.delete_parser = reqparse.RequestParser()
-        self.delete_parser.add_argument(
-            "session_token", type=str, help="Session authentication key", required=True
-        )
-        self.delete_parser.add_argument(
-            "password", type=str, help="password to delete user"
-        )
+class LegacyUserPostArgs(RequestArgs):
+    username: str = Field(..., description="Username for created account")
+    password: str = Field(..., description="Password for created account")
+    display_name: str = Field(..., description="Display name for created account")
 
-    @db_session
-    def get(self):
-        args = self.get_parser.parse_args()
 
+class LegacyUserDeleteArgs(RequestArgs):
+    session_token: str = Field(..., description="Session authentication key")
+    password: Optional[str] = Field(None, description="password to delete user")
+
+
+class LegacyUser(Resource):
+    @db_session
+    @request_args(LegacyUserGetArgs)
+    def get(self, args):
         r_user = get_user_object_from_token_or_abort(args["session_token"])
         if r_user is None:
             return {"err": LegacyErrorCodes.TOKEN_INVALID.value}, 401
@@ -115,7 +102,7 @@ class LegacyUser(Resource):
             "isAdmin": user.is_admin,
             "isModerator": user.is_moderator,
             "isOwnPage": user_owns_page,
-            "isEarlyAdopter": AccountAttributes.OG.value in user.account_attributes,
+            "isEarlyAdopter": user.has_attribute(AccountAttributes.OG),
             "followerCount": follower_count,
             "followingCount": following_count,
             "isFollowing": following_user,
@@ -123,9 +110,8 @@ class LegacyUser(Resource):
         }, 200
 
     @db_session
-    def delete(self):
-        args = self.delete_parser.parse_args()
-
+    @request_args(LegacyUserDeleteArgs)
+    def delete(self, args):
         user = get_user_object_from_token_or_abort(args["session_token"])
 
         # in any normal circumstance, this would just be a required
@@ -137,13 +123,16 @@ class LegacyUser(Resource):
         if verify_password_valid(
             args["password"], user.password_salt, user.password_hash
         ):
+            username_filter.remove(user.username)
+            api_key_cache.evict_owner(user.id)
             user.delete()
             return {}, 201
         else:
             return {}, 401
 
     @db_session
-    def post(self):
+    @request_args(LegacyUserPostArgs)
+    def post(self, args):
         # we don't really have a better error to launch back here,
         # since the old client doesn't support any others
         if not config.legacy_api_interface.signup_enabled:
@@ -157,7 +146,6 @@ class LegacyUser(Resource):
 
         # parser.add_argument('invite_code', type=str, help="Invite code to socialshare", required=False)
 
-        args = self.post_parser.parse_args()
 
         # NOTE: this isn't *exactly* compatible, since the old version had basically no validation
         # for usernames, but we've gotta diverge a bit here since the new server does
@@ -175,8 +163,7 @@ class LegacyUser(Resource):
         if len(args["display_name"]) > DISPLAY_NAME_MAX_LEN:
             return {}, 400
 
-        existing_user = db.User.get(username=args["username"])
-        if existing_user is not None:
+        if username_taken(args["username"]):
             return {"err": LegacyErrorCodes.USERNAME_TAKEN.value}, 400
 
         salt = generate_salt()
@@ -193,11 +180,15 @@ class LegacyUser(Resource):
             # any new account should be indistinguishable regardless
             # of if it was made through back-compat
             is_legacy_account=False,
-            account_attributes=[],
             recent_failed_login_count=0,
             bio="",
             # we've already returned if approval was required...
             account_approved=True,
         )
+        try:
+            commit()
+        except TransactionIntegrityError:
+            return {"err": LegacyErrorCodes.USERNAME_TAKEN.value}, 400
+        username_filter.add(args["username"])
 
         return {}, 201
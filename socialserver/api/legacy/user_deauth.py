@@ -1,32 +1,26 @@
 #  Copyright (c) Niall Asher 2022
 
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
 from socialserver.util.auth import (
     verify_password_valid,
     get_user_object_from_token_or_abort,
 )
 from socialserver.constants import LegacyErrorCodes
 from pony.orm import db_session
+from pydantic import Field
+from socialserver.util.api.request_args import RequestArgs, request_args
+
+
+class LegacyAllDeauthPostArgs(RequestArgs):
+    session_token: str = Field(..., description="Authentication Token")
+    password: str = Field(..., description="Account password for confirmation")
 
 
 # removes all sessions from a user
 class LegacyAllDeauth(Resource):
-    def __init__(self):
-        self.post_parser = reqparse.RequestParser()
-        self.post_parser.add_argument(
-            "session_token", type=str, required=True, help="Authentication Token"
-        )
-        self.post_parser.add_argument(
-            "password",
-            type=str,
-            required=True,
-            help="Account password for confirmation",
-        )
-
     @db_session
-    def post(self):
-        args = self.post_parser.parse_args()
-
+    @request_args(LegacyAllDeauthPostArgs)
+    def post(self, args):
         user = get_user_object_from_token_or_abort(args["session_token"])
 
         if not verify_password_valid(
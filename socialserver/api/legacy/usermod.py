@@ -5,52 +5,60 @@ from socialserver.util.auth import (
     generate_salt,
     hash_password,
 )
-from socialserver.util.image import check_image_exists
+from socialserver.util.image import check_image_exists, ensure_image_variants
 from socialserver.util.config import config
 from socialserver.constants import (
     REGEX_USERNAME_VALID,
     MAX_PASSWORD_LEN,
     MIN_PASSWORD_LEN,
     DISPLAY_NAME_MAX_LEN,
+    ImageUploadPurposes,
+    LegacyErrorCodes,
 )
 from socialserver.db import db
+from socialserver.util.username_filter import username_filter, username_taken, record_username_change
 import re
-from flask_restful import Resource, reqparse
-from pony.orm import db_session
+from flask_restful import Resource
+from pony.orm import db_session, commit, TransactionIntegrityError
+from typing import Optional
+from pydantic import Field
+from socialserver.util.api.request_args import RequestArgs, request_args
 
 LESS_SECURE_PASSWORD_CHANGE_ENABLED = (
     config.legacy_api_interface.enable_less_secure_password_change
 )
 
 
-class LegacyUsermod(Resource):
-    def __init__(self):
-        self.post_parser = reqparse.RequestParser()
+class LegacyUsermodPostArgs(RequestArgs):
+    session_token: str = Field(..., description="Session authentication key")
+    username: Optional[str] = Field(None, description="New Username")
+    password: Optional[str] = Field(None, description="New Password")
+    display_name: Optional[str] = Field(None, description="New Display Name")
+    avatar_hash: Optional[str] = Field(None, description="New Avatar Hash (from upload point)")
+    header_hash: Optional[str] = Field(None, description="New Header Hash (from upload point)")
 
-        self.post_parser.add_argument(
-            "session_token", type=str, help="Session authentication key", required=True
-        )
-        self.post_parser.add_argument("username", type=str, help="New Username")
-        self.post_parser.add_argument("password", type=str, help="New Password")
-        self.post_parser.add_argument("display_name", type=str, help="New Display Name")
-        self.post_parser.add_argument(
-            "avatar_hash", type=str, help="New Avatar Hash (from upload point)"
-        )
-        self.post_parser.add_argument(
-            "header_hash", type=str, help="New Header Hash (from upload point)"
-        )
 
+class LegacyUsermod(Resource):
     @db_session
-    def post(self):
-
-        args = self.post_parser.parse_args()
+    @request_args(LegacyUsermodPostArgs)
+    def post(self, args):
 
         user = get_user_object_from_token_or_abort(args["session_token"])
 
         if args["username"] is not None:
             if not bool(re.match(REGEX_USERNAME_VALID, args["username"])):
                 return {}, 400
+            if username_taken(args["username"]):
+                return {"err": LegacyErrorCodes.USERNAME_TAKEN.value}, 400
+            old_username = user.username
             user.username = args["username"]
+            record_username_change(args["username"])
+            try:
+                commit()
+            except TransactionIntegrityError:
+                return {"err": LegacyErrorCodes.USERNAME_TAKEN.value}, 400
+            username_filter.add(args["username"])
+            username_filter.remove(old_username)
             return {}, 201
 
         if args["password"] is not None:
@@ -78,13 +86,20 @@ class LegacyUsermod(Resource):
             if not check_image_exists(args["avatar_hash"]):
                 return {}, 404
             image = db.Image.get(identifier=args["avatar_hash"])
+            # unprocessed images get theirs once they've been processed
+            if image.processed and not ensure_image_variants(image.sha256sum, ImageUploadPurposes.AVATAR):
+                return {}, 404
             user.profile_pic = image
             return {}, 201
 
         if args["header_hash"] is not None:
             if not check_image_exists(args["header_hash"]):
                 return {}, 404
-            user.header_pic = db.Image.get(identifier=args["header_hash"])
+            image = db.Image.get(identifier=args["header_hash"])
+            # unprocessed images get theirs once they've been processed
+            if image.processed and not ensure_image_variants(image.sha256sum, ImageUploadPurposes.HEADER):
+                return {}, 404
+            user.header_pic = image
             return {}, 201
 
         return {}, 201
@@ -0,0 +1,14 @@
+#  Copyright (c) Niall Asher 2022
+
+from flask import Response
+from flask_restful import Resource
+from socialserver.util.auth import admin_reqd
+from socialserver.util.metrics import render_metrics
+
+
+class Metrics(Resource):
+    # prometheus text format. scrapers can authenticate
+    # with an api key that has the ACCESS_ADMIN permission.
+    @admin_reqd
+    def get(self):
+        return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,14 @@
+#  Copyright (c) Niall Asher 2022
+
+from flask_restful import Resource
+from socialserver.db import db
+from socialserver.util.auth import admin_reqd
+from socialserver.util.statistics import get_statistics
+
+
+class Statistics(Resource):
+    # the same numbers as socialserver admin get-stats, cached for
+    # STATISTICS_CACHE_SECONDS, so it's fine to poll from monitoring.
+    @admin_reqd
+    def get(self):
+        return get_statistics(db), 200
@@ -2,35 +2,39 @@
 
 from socialserver.db import db
 from socialserver.util.auth import admin_reqd
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
 from socialserver.constants import ApprovalSortTypes, ErrorCodes, MAX_FEED_GET_COUNT
 from pony.orm import db_session, select, desc
 
 from socialserver.util.date import format_timestamp_string
+from socialserver.util.username_filter import username_filter
+from socialserver.util.api_key import api_key_cache
+from typing import Optional
+from socialserver.util.api.request_args import RequestArgs, request_args
 
 
-class UserApprovals(Resource):
-    def __init__(self):
+class UserApprovalsGetArgs(RequestArgs):
+    count: int
+    offset: int
+    # must be a valid member of ApprovalSortTypes
+    sort: int
+    # only usernames are filtered for now.
+    filter: Optional[str] = None
+
 
-        self.get_parser = reqparse.RequestParser()
-        self.get_parser.add_argument("count", type=int, required=True)
-        self.get_parser.add_argument("offset", type=int, required=True)
-        # must be a valid member of ApprovalSortTypes
-        self.get_parser.add_argument("sort", type=int, required=True)
-        # only usernames are filtered for now.
-        self.get_parser.add_argument("filter", type=str, required=False)
+class UserApprovalsPatchArgs(RequestArgs):
+    username: str
 
-        self.patch_parser = reqparse.RequestParser()
-        self.patch_parser.add_argument("username", type=str, required=True)
 
-        self.delete_parser = reqparse.RequestParser()
-        self.delete_parser.add_argument("username", type=str, required=True)
+class UserApprovalsDeleteArgs(RequestArgs):
+    username: str
 
+
+class UserApprovals(Resource):
     @db_session
     @admin_reqd
-    def get(self):
-        args = self.get_parser.parse_args()
-
+    @request_args(UserApprovalsGetArgs)
+    def get(self, args):
         if args["count"] > MAX_FEED_GET_COUNT:
             return {"error": ErrorCodes.FEED_GET_COUNT_TOO_HIGH.value}, 400
 
@@ -75,9 +79,8 @@ class UserApprovals(Resource):
     @db_session
     @admin_reqd
     # only a partial mod to a resource, so it's a patch request.
-    def patch(self):
-        args = self.patch_parser.parse_args()
-
+    @request_args(UserApprovalsPatchArgs)
+    def patch(self, args):
         user = db.User.get(username=args["username"])
         if user is None:
             return {"error": ErrorCodes.USERNAME_NOT_FOUND.value}, 404
@@ -91,9 +94,8 @@ class UserApprovals(Resource):
     @db_session
     @admin_reqd
     # obliterate a user completely (aka reject them, deleting the unapproved account)
-    def delete(self):
-        args = self.delete_parser.parse_args()
-
+    @request_args(UserApprovalsDeleteArgs)
+    def delete(self, args):
         user = db.User.get(username=args["username"])
         if user is None:
             return {"error": ErrorCodes.USERNAME_NOT_FOUND.value}, 404
@@ -101,5 +103,7 @@ class UserApprovals(Resource):
         if user.account_approved:
             return {"error": ErrorCodes.USER_ALREADY_APPROVED.value}, 400
 
+        username_filter.remove(user.username)
+        api_key_cache.evict_owner(user.id)
         user.delete()
         return {}, 200
@@ -0,0 +1,107 @@
+#  Copyright (c) Niall Asher 2022
+
+from datetime import datetime
+from flask_restful import Resource
+from pony.orm import db_session, commit
+from socialserver.constants import ErrorCodes, ApiKeyPermissions, MAX_API_KEYS_PER_USER
+from socialserver.db import db
+from socialserver.util.api.v3.error_format import format_error_return_v3
+from socialserver.util.api_key import generate_api_key_secret, format_api_key, api_key_cache
+from socialserver.util.auth import (
+    auth_reqd,
+    api_key_permission,
+    get_user_from_auth_header,
+    verify_password_valid,
+)
+from socialserver.util.date import format_timestamp_string
+from typing import List
+from socialserver.util.api.request_args import RequestArgs, request_args
+
+
+class UserApiKeyPostArgs(RequestArgs):
+    password: str
+    # list of ApiKeyPermissions values
+    permissions: List[int]
+
+
+class UserApiKeyDeleteArgs(RequestArgs):
+    key_id: int
+
+
+class UserApiKey(Resource):
+    # api keys can't be used to manage api keys; otherwise a leaked
+    # key could be used to mint new ones that outlive its revocation.
+
+    @db_session
+    @auth_reqd
+    @api_key_permission(None)
+    def get(self):
+        requesting_user = get_user_from_auth_header()
+
+        api_keys = []
+        for key in requesting_user.associated_api_keys.select().order_by(db.ApiKey.id):
+            api_keys.append({
+                "key_id": key.id,
+                "creation_time": format_timestamp_string(key.creation_time),
+                "permissions": list(key.permissions),
+            })
+
+        return {"api_keys": api_keys}, 200
+
+    @db_session
+    @auth_reqd
+    @api_key_permission(None)
+    @request_args(UserApiKeyPostArgs)
+    def post(self, args):
+        requesting_user = get_user_from_auth_header()
+
+        if not verify_password_valid(
+            args.password,
+            requesting_user.password_salt,
+            requesting_user.password_hash,
+        ):
+            return format_error_return_v3(ErrorCodes.INCORRECT_PASSWORD, 401)
+
+        valid_permissions = [permission.value for permission in ApiKeyPermissions]
+        if any(permission not in valid_permissions for permission in args.permissions):
+            return format_error_return_v3(ErrorCodes.API_KEY_PERMISSION_INVALID, 400)
+
+        if ApiKeyPermissions.ACCESS_ADMIN.value in args.permissions and not requesting_user.is_admin:
+            return format_error_return_v3(ErrorCodes.USER_NOT_ADMIN, 401)
+
+        if ApiKeyPermissions.ACCESS_MODERATION.value in args.permissions and not (
+            requesting_user.is_moderator or requesting_user.is_admin
+        ):
+            return format_error_return_v3(ErrorCodes.USER_NOT_MODERATOR_OR_ADMIN, 401)
+
+        if requesting_user.associated_api_keys.count() >= MAX_API_KEYS_PER_USER:
+            return format_error_return_v3(ErrorCodes.API_KEY_LIMIT_REACHED, 400)
+
+        secret = generate_api_key_secret()
+        key = db.ApiKey(
+            owner=requesting_user,
+            creation_time=datetime.utcnow(),
+            key_hash=secret.hash,
+            permissions=sorted(set(args.permissions)),
+        )
+        # we need the id for the key itself
+        commit()
+
+        # this is the only time the full key is ever available.
+        return {"key_id": key.id, "api_key": format_api_key(key.id, secret.secret)}, 201
+
+    @db_session
+    @auth_reqd
+    @api_key_permission(None)
+    @request_args(UserApiKeyDeleteArgs)
+    def delete(self, args):
+        requesting_user = get_user_from_auth_header()
+
+        key = db.ApiKey.get(id=args.key_id)
+        if key is None or key.owner != requesting_user:
+            return format_error_return_v3(ErrorCodes.OBJECT_NOT_FOUND, 404)
+
+        key.delete()
+        api_key_cache.evict(args.key_id)
+
+        return {}, 200
@@ -1,31 +1,32 @@
 #  Copyright (c) Niall Asher 2022
 
 from datetime import datetime
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
 from socialserver.db import db
 from socialserver.util.api.v3.error_format import format_error_return_v3
-from socialserver.util.auth import get_user_from_auth_header, auth_reqd
-from socialserver.constants import ErrorCodes, UserNotFoundException
+from socialserver.util.auth import get_user_from_auth_header, auth_reqd, api_key_permission
+from socialserver.constants import ErrorCodes, UserNotFoundException, ApiKeyPermissions
 from pony.orm import db_session
 from socialserver.util.user import get_user_from_db
+from socialserver.util.api.request_args import RequestArgs, request_args
 
 
-class Block(Resource):
-    def __init__(self):
+class BlockPostArgs(RequestArgs):
+    # the username to block
+    username: str
+
 
-        self.post_parser = reqparse.RequestParser()
-        # the username to block
-        self.post_parser.add_argument("username", type=str, required=True)
+class BlockDeleteArgs(RequestArgs):
+    # the username to unblock
+    username: str
 
-        self.delete_parser = reqparse.RequestParser()
-        # the username to unblock
-        self.delete_parser.add_argument("username", type=str, required=True)
 
+class Block(Resource):
     @db_session
     @auth_reqd
-    def post(self):
-        args = self.post_parser.parse_args()
-
+    @api_key_permission(ApiKeyPermissions.MODIFY_FOLLOWERS)
+    @request_args(BlockPostArgs)
+    def post(self, args):
         requesting_user_db = get_user_from_auth_header()
 
         try:
@@ -50,9 +51,9 @@ class Block(Resource):
 
     @db_session
     @auth_reqd
-    def delete(self):
-        args = self.delete_parser.parse_args()
-
+    @api_key_permission(ApiKeyPermissions.MODIFY_FOLLOWERS)
+    @request_args(BlockDeleteArgs)
+    def delete(self, args):
         requesting_user_db = get_user_from_auth_header()
 
         try:
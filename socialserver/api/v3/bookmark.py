@@ -1,29 +1,31 @@
 #  Copyright (c) Niall Asher 2022
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
 
-from socialserver.constants import ErrorCodes, MAX_FEED_GET_COUNT
+from socialserver.constants import ErrorCodes, MAX_FEED_GET_COUNT, ApiKeyPermissions
 from socialserver.db import db
 from socialserver.util.api.v3.data_format import format_post_v3, format_userdata_v3
 from socialserver.util.api.v3.error_format import format_error_return_v3
-from socialserver.util.auth import auth_reqd, get_user_from_auth_header
+from socialserver.util.auth import auth_reqd, get_user_from_auth_header, api_key_permission
 from pony.orm import db_session
 from pony import orm
+from socialserver.util.api.request_args import RequestArgs, request_args
 
 
-class BookmarkPost(Resource):
+class BookmarkPostPostArgs(RequestArgs):
+    post_id: int
+
 
-    def __init__(self):
-        self.post_parser = reqparse.RequestParser()
-        self.post_parser.add_argument("post_id", type=int, required=True)
+class BookmarkPostDeleteArgs(RequestArgs):
+    post_id: int
 
-        self.delete_parser = reqparse.RequestParser()
-        self.delete_parser.add_argument("post_id", type=int, required=True)
+
+class BookmarkPost(Resource):
 
     @db_session
     @auth_reqd
-    def post(self):
-        args = self.post_parser.parse_args()
-
+    @api_key_permission(ApiKeyPermissions.POST)
+    @request_args(BookmarkPostPostArgs)
+    def post(self, args):
         user = get_user_from_auth_header()
 
         post = db.Post.get(id=args.post_id)
@@ -40,9 +42,9 @@ class BookmarkPost(Resource):
 
     @db_session
     @auth_reqd
-    def delete(self):
-        args = self.delete_parser.parse_args()
-
+    @api_key_permission(ApiKeyPermissions.POST)
+    @request_args(BookmarkPostDeleteArgs)
+    def delete(self, args):
         user = get_user_from_auth_header()
 
         post = db.Post.get(id=args.post_id)
@@ -61,18 +63,17 @@ class BookmarkPost(Resource):
         return {"post_bookmarked": False}, 200
 
 
-class BookmarkFeed(Resource):
+class BookmarkFeedGetArgs(RequestArgs):
+    count: int
+    offset: int
 
-    def __init__(self):
-        self.get_parser = reqparse.RequestParser()
-        self.get_parser.add_argument("count", type=int, required=True)
-        self.get_parser.add_argument("offset", type=int, required=True)
+
+class BookmarkFeed(Resource):
 
     @db_session
     @auth_reqd
-    def get(self):
-        args = self.get_parser.parse_args()
-
+    @request_args(BookmarkFeedGetArgs)
+    def get(self, args):
         if args.count > MAX_FEED_GET_COUNT:
             return format_error_return_v3(ErrorCodes.FEED_GET_COUNT_TOO_HIGH, 400)
 
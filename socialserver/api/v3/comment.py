@@ -1,29 +1,30 @@
 #  Copyright (c) Niall Asher 2022
 
-from flask_restful import Resource, reqparse
-from socialserver.constants import ErrorCodes, COMMENT_MAX_LEN
+from flask_restful import Resource
+from socialserver.constants import ErrorCodes, COMMENT_MAX_LEN, ApiKeyPermissions
 from socialserver.util.api.v3.error_format import format_error_return_v3
-from socialserver.util.auth import auth_reqd, get_user_from_auth_header
+from socialserver.util.auth import auth_reqd, get_user_from_auth_header, api_key_permission
 from pony.orm import db_session, commit
 from socialserver.db import db
 from datetime import datetime
+from socialserver.util.api.request_args import RequestArgs, request_args
 
 
-class Comment(Resource):
-    def __init__(self):
+class CommentPostArgs(RequestArgs):
+    text_content: str
+    post_id: int
+
 
-        self.post_parser = reqparse.RequestParser()
-        self.post_parser.add_argument("text_content", type=str, required=True)
-        self.post_parser.add_argument("post_id", type=int, required=True)
+class CommentDeleteArgs(RequestArgs):
+    comment_id: int
 
-        self.delete_parser = reqparse.RequestParser()
-        self.delete_parser.add_argument("comment_id", type=int, required=True)
 
+class Comment(Resource):
     @db_session
     @auth_reqd
-    def post(self):
-        args = self.post_parser.parse_args()
-
+    @api_key_permission(ApiKeyPermissions.POST)
+    @request_args(CommentPostArgs)
+    def post(self, args):
         user = get_user_from_auth_header()
 
         post = db.Post.get(id=args.post_id)
@@ -53,9 +54,9 @@ class Comment(Resource):
 
     @db_session
     @auth_reqd
-    def delete(self):
-        args = self.delete_parser.parse_args()
-
+    @api_key_permission(ApiKeyPermissions.POST)
+    @request_args(CommentDeleteArgs)
+    def delete(self, args):
         user = get_user_from_auth_header()
 
         comment = db.Comment.get(id=args.comment_id)
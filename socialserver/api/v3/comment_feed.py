@@ -1,30 +1,29 @@
 #  Copyright (c) Niall Asher 2022
 
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
 from socialserver.constants import MAX_FEED_GET_COUNT, ErrorCodes, CommentFeedSortTypes
 from socialserver.db import db
 from socialserver.util.api.v3.data_format import format_userdata_v3
 from socialserver.util.api.v3.error_format import format_error_return_v3
 from socialserver.util.auth import auth_reqd, get_user_from_auth_header
 from pony.orm import db_session, select, desc, count
+from socialserver.util.api.request_args import RequestArgs, request_args
 
-from socialserver.util.date import format_timestamp_string
 
 
-class CommentFeed(Resource):
-    def __init__(self):
-        self.get_parser = reqparse.RequestParser()
-        self.get_parser.add_argument("post_id", type=int, required=True)
-        self.get_parser.add_argument("count", type=int, required=True)
-        self.get_parser.add_argument("offset", type=int, required=True)
-        # one of CommentFeedSortTypes
-        self.get_parser.add_argument("sort", type=int, required=True)
+class CommentFeedGetArgs(RequestArgs):
+    post_id: int
+    count: int
+    offset: int
+    # one of CommentFeedSortTypes
+    sort: int
+
 
+class CommentFeed(Resource):
     @db_session
     @auth_reqd
-    def get(self):
-        args = self.get_parser.parse_args()
-
+    @request_args(CommentFeedGetArgs)
+    def get(self, args):
         requesting_user_db = get_user_from_auth_header()
 
         post = db.Post.get(id=args.post_id)
@@ -70,7 +69,8 @@ class CommentFeed(Resource):
                     "comment": {
                         "id": comment.id,
                         "content": comment.text,
-                        "creation_time": format_timestamp_string(comment.creation_time),
+                        # serialized by the json representation, see util.api.json_representation
+                        "creation_time": comment.creation_time,
                         "like_count": len(comment.likes),
                     },
                     "user": format_userdata_v3(comment.user),
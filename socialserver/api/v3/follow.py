@@ -1,31 +1,33 @@
 #  Copyright (c) Niall Asher 2022
 
 from datetime import datetime
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
 from socialserver.db import db
 from socialserver.util.api.v3.error_format import format_error_return_v3
-from socialserver.util.auth import auth_reqd, get_user_from_auth_header
-from socialserver.constants import ErrorCodes, UserNotFoundException
+from socialserver.util.auth import auth_reqd, get_user_from_auth_header, api_key_permission
+from socialserver.constants import ErrorCodes, UserNotFoundException, ApiKeyPermissions
 from pony.orm import db_session
 
 from socialserver.util.user import get_user_from_db
+from socialserver.util.api.request_args import RequestArgs, request_args
 
 
-class Follow(Resource):
-    def __init__(self):
-        self.get_parser = reqparse.RequestParser()
-        # the username to follow
-        self.get_parser.add_argument("username", type=str, required=True)
+class FollowGetArgs(RequestArgs):
+    # the username to follow
+    username: str
+
+
+class FollowDeleteArgs(RequestArgs):
+    # screw this guy
+    username: str
 
-        self.delete_parser = reqparse.RequestParser()
-        # screw this guy
-        self.delete_parser.add_argument("username", type=str, required=True)
 
+class Follow(Resource):
     @db_session
     @auth_reqd
-    def post(self):
-        args = self.get_parser.parse_args()
-
+    @api_key_permission(ApiKeyPermissions.MODIFY_FOLLOWERS)
+    @request_args(FollowGetArgs)
+    def post(self, args):
         requesting_user_db = get_user_from_auth_header()
 
         try:
@@ -52,9 +54,9 @@ class Follow(Resource):
 
     @db_session
     @auth_reqd
-    def delete(self):
-        args = self.delete_parser.parse_args()
-
+    @api_key_permission(ApiKeyPermissions.MODIFY_FOLLOWERS)
+    @request_args(FollowDeleteArgs)
+    def delete(self, args):
         requesting_user_db = get_user_from_auth_header()
 
         try:
@@ -5,25 +5,27 @@ from socialserver.util.auth import auth_reqd, get_user_from_auth_header
 from socialserver.constants import ErrorCodes, MAX_FEED_GET_COUNT, UserNotFoundException, FollowListSortTypes, \
     FollowListListTypes
 from pony.orm import db_session, select, desc
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
 
 from socialserver.util.api.v3.error_format import format_error_return_v3
 from socialserver.util.user import get_user_from_db
+from typing import Optional
+from socialserver.util.api.request_args import RequestArgs, request_args
 
 
-class FollowerList(Resource):
-    def __init__(self):
-        self.get_parser = reqparse.RequestParser()
-        self.get_parser.add_argument("sort_type", type=int, required=True)
-        # we assume the user want's information about themselves if they don't specify a username
-        self.get_parser.add_argument("username", type=str, required=False)
-        self.get_parser.add_argument("count", type=int, required=True)
-        self.get_parser.add_argument("offset", type=int, required=True)
+class FollowerListGetArgs(RequestArgs):
+    sort_type: int
+    # we assume the user want's information about themselves if they don't specify a username
+    username: Optional[str] = None
+    count: int
+    offset: int
+
 
+class FollowerList(Resource):
     @auth_reqd
     @db_session
-    def get(self):
-        args = self.get_parser.parse_args()
+    @request_args(FollowerListGetArgs)
+    def get(self, args):
         user = get_user_from_auth_header()
 
         wanted_user = user
@@ -37,22 +39,22 @@ class FollowerList(Resource):
             return format_error_return_v3(ErrorCodes.FEED_GET_COUNT_TOO_HIGH, 400)
 
         return get_follow_info_for_user(wanted_user, count=args.count, offset=args.offset, sort_type=args.sort_type,
-                                        list_type=FollowListListTypes.FOLLOWERS)
+                                        list_type=FollowListListTypes.FOLLOWERS, viewer=user)
 
 
-class FollowingList(Resource):
-    def __init__(self):
-        self.get_parser = reqparse.RequestParser()
-        self.get_parser.add_argument("sort_type", type=int, required=True)
-        # we assume the user want's information about themselves if they don't specify a username
-        self.get_parser.add_argument("username", type=str, required=False)
-        self.get_parser.add_argument("count", type=int, required=True)
-        self.get_parser.add_argument("offset", type=int, required=True)
+class FollowingListGetArgs(RequestArgs):
+    sort_type: int
+    # we assume the user want's information about themselves if they don't specify a username
+    username: Optional[str] = None
+    count: int
+    offset: int
+
 
+class FollowingList(Resource):
     @auth_reqd
     @db_session
-    def get(self):
-        args = self.get_parser.parse_args()
+    @request_args(FollowingListGetArgs)
+    def get(self, args):
         user = get_user_from_auth_header()
 
         wanted_user = user
@@ -66,4 +68,4 @@ class FollowingList(Resource):
             return format_error_return_v3(ErrorCodes.FEED_GET_COUNT_TOO_HIGH, 400)
 
         return get_follow_info_for_user(wanted_user, count=args.count, offset=args.offset, sort_type=args.sort_type,
-                                        list_type=FollowListListTypes.FOLLOWING)
+                                        list_type=FollowListListTypes.FOLLOWING, viewer=user)
@@ -0,0 +1,104 @@
+#  Copyright (c) Niall Asher 2022
+
+import re
+from flask_restful import Resource
+from socialserver.constants import (
+    MAX_FEED_GET_COUNT,
+    REGEX_HASHTAG_NAME_VALID,
+    ErrorCodes,
+)
+from socialserver.db import db
+from socialserver.util.api.v3.error_format import format_error_return_v3
+from socialserver.util.api.v3.feed import (
+    get_blocked_users_for_feed,
+    format_feed_posts_v3,
+    encode_feed_cursor,
+    decode_feed_cursor,
+    InvalidFeedCursorException,
+)
+from socialserver.util.auth import auth_reqd, get_user_from_auth_header
+from pony.orm import db_session
+from pony import orm
+from typing import Optional
+from socialserver.util.api.request_args import RequestArgs, request_args
+
+
+class HashtagFeedGetArgs(RequestArgs):
+    # with or without the leading #, case doesn't matter.
+    tag: str
+    count: int
+    # the next_cursor from the previous page. leave it out to start
+    # from the newest post. we don't use an offset here, since tags
+    # can have a *lot* of posts, and offsets get slower the further
+    # into the feed you go.
+    cursor: Optional[str] = None
+
+
+class HashtagFeed(Resource):
+    @db_session
+    @auth_reqd
+    @request_args(HashtagFeedGetArgs)
+    def get(self, args):
+        if args.count > MAX_FEED_GET_COUNT:
+            return format_error_return_v3(ErrorCodes.FEED_GET_COUNT_TOO_HIGH, 400)
+        if args.count < 1:
+            return format_error_return_v3(ErrorCodes.FEED_GET_COUNT_TOO_LOW, 400)
+
+        tag_name = args.tag.lower()
+        if tag_name.startswith("#"):
+            tag_name = tag_name[1:]
+
+        if not bool(re.match(REGEX_HASHTAG_NAME_VALID, tag_name)):
+            return format_error_return_v3(ErrorCodes.TAG_INVALID, 400)
+
+        cursor = None
+        if args.cursor is not None:
+            try:
+                cursor = decode_feed_cursor(args.cursor)
+            except InvalidFeedCursorException:
+                return format_error_return_v3(ErrorCodes.INVALID_FEED_CURSOR, 400)
+
+        requesting_user_db = get_user_from_auth_header()
+
+        tag = db.Hashtag.get(name=tag_name)
+        # nobody has used the tag yet, so there's nothing to show.
+        if tag is None:
+            return {"meta": {"reached_end": True, "next_cursor": None}, "posts": []}, 201
+
+        blocks = get_blocked_users_for_feed(requesting_user_db)
+
+        # noinspection PyTypeChecker
+        query = orm.select(
+            e
+            for e in db.PostHashtag
+            if e.hashtag == tag
+            and e.post.user not in blocks
+            and e.post.under_moderation is False
+            and e.post.processed is True
+        )
+
+        if cursor is not None:
+            cursor_time, cursor_id = cursor
+            query = query.filter(
+                lambda e: e.creation_time < cursor_time
+                or (e.creation_time == cursor_time and e.id < cursor_id)
+            )
+
+        entries = query.order_by(
+            orm.desc(db.PostHashtag.creation_time), orm.desc(db.PostHashtag.id)
+        )[:args.count]
+
+        posts = format_feed_posts_v3([e.post for e in entries], requesting_user_db)
+
+        reached_end = len(posts) < args.count
+        next_cursor = None
+        if not reached_end:
+            next_cursor = encode_feed_cursor(entries[-1].creation_time, entries[-1].id)
+
+        return {
+                   "meta": {
+                       "reached_end": reached_end,
+                       "next_cursor": next_cursor,
+                   },
+                   "posts": posts,
+               }, 201
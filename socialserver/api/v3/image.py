@@ -3,48 +3,46 @@
 from io import BytesIO
 from flask.helpers import send_file
 from flask import request
-from socialserver.constants import MAX_PIXEL_RATIO, ErrorCodes, ImageTypes, \
-    ServerSupportedImageFormats, SERVER_SUPPORTED_IMAGE_FORMATS_MIMETYPES
+from socialserver.constants import MAX_PIXEL_RATIO, ErrorCodes, ApiKeyPermissions, ImageTypes, \
+    ServerSupportedImageFormats, SERVER_SUPPORTED_IMAGE_FORMATS_MIMETYPES, ImageUploadPurposes
 from math import ceil
 from socialserver.db import db
 from socialserver.util.api.v3.error_format import format_error_return_v3
 from socialserver.util.config import config
 from socialserver.util.image import handle_upload, InvalidImageException
-from socialserver.util.auth import auth_reqd, get_user_from_auth_header
+from socialserver.util.image_backend import ImageTooLargeException
+from socialserver.util.auth import auth_reqd, get_user_from_auth_header, api_key_permission
 from socialserver.util.file import max_req_size, mb_to_b, b_to_mb
 from socialserver.util.output import console
-from socialserver.util.filesystem import fs_images
+from socialserver.util.filesystem import fs_images, hash_directory
+from socialserver.util.image_variants import IMAGE_VARIANTS, closest_pixel_ratio, stored_pixel_ratio
+from socialserver.util.image_formats import negotiate_image_format
 
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
 from pony.orm import db_session
+from typing import Optional
+from socialserver.util.api.request_args import RequestArgs, request_args
 
 IMAGE_DIR = config.media.images.storage_dir
 IMAGE_MAX_REQ_SIZE_MB = config.media.images.max_image_request_size_mb
 IMAGE_MAX_REQ_SIZE = mb_to_b(IMAGE_MAX_REQ_SIZE_MB)
 
 
-class Image(Resource):
-    def __init__(self):
-        self.get_parser = reqparse.RequestParser()
-        # check out the imagetypes enum for the valid ones
-        self.get_parser.add_argument("wanted_type", type=str, required=True)
-        # this is a float since we want it to actually pass this parse
-        # check, so we can round it after!
-        self.get_parser.add_argument("pixel_ratio", type=float, required=True)
-        self.get_parser.add_argument("download", type=bool, required=False)
-        self.get_parser.add_argument("format", type=str, required=False)
+class ImageGetArgs(RequestArgs):
+    # check out the imagetypes enum for the valid ones
+    wanted_type: str
+    # this is a float since we want it to actually pass this parse
+    # check, so we can round it after!
+    pixel_ratio: float
+    download: Optional[bool] = None
+    format: Optional[str] = None
+
 
+class Image(Resource):
     # kwargs.imageid contains the image identifier
     @db_session
-    def get(self, **kwargs):
-        args = self.get_parser.parse_args()
-
-        # default to jpg if no or invalid format specified; it's the most compatible.
-        try:
-            wanted_image_format = ServerSupportedImageFormats(args.format)
-        except ValueError:
-            wanted_image_format = ServerSupportedImageFormats.JPG
-
+    @request_args(ImageGetArgs)
+    def get(self, args, **kwargs):
         image = db.Image.get(identifier=kwargs.get("imageid"))
         if image is None:
             return format_error_return_v3(ErrorCodes.IMAGE_NOT_FOUND, 404)
@@ -62,17 +60,35 @@ class Image(Resource):
             pixel_ratio = 1
         if pixel_ratio > MAX_PIXEL_RATIO:
             pixel_ratio = MAX_PIXEL_RATIO
-
-        if args.wanted_type == "post":
-            pixel_ratio = 1
-
-        file = f"/{image.sha256sum}/{wanted_image_type.value}_{pixel_ratio}x."
+        # not every variant is stored at every pixel ratio, and the bigger
+        # ones might not have been generated yet (see MediaJobPhases).
+        variant = IMAGE_VARIANTS.get(wanted_image_type)
+        urgent_format = variant.formats[0] if variant is not None else ServerSupportedImageFormats.JPG
+        pixel_ratio = stored_pixel_ratio(fs_images, image.sha256sum, wanted_image_type, pixel_ratio, urgent_format) \
+            or closest_pixel_ratio(wanted_image_type, pixel_ratio)
+
+        file = f"{hash_directory(image.sha256sum)}/{wanted_image_type.value}_{pixel_ratio}x."
+
+        # if no format is specified, the best one the client says it
+        # supports (in its accept header) is sent.
+        negotiated = args.format is None
+        if negotiated:
+            wanted_image_format = negotiate_image_format(
+                request.accept_mimetypes, lambda image_format: fs_images.exists(file + image_format.value)
+            )
+        else:
+            # default to jpg if an invalid format is specified; it's the most compatible.
+            try:
+                wanted_image_format = ServerSupportedImageFormats(args.format)
+            except ValueError:
+                wanted_image_format = ServerSupportedImageFormats.JPG
 
         # attempt to fall back to jpeg
         if not fs_images.exists(file + wanted_image_format.value):
-            if wanted_image_format == ServerSupportedImageFormats.WEBP and \
+            if wanted_image_format != ServerSupportedImageFormats.JPG and \
                     config.media.images.webp.send_jpeg_if_not_available:
-                console.log(f"[red]Couldn't find a WEBP version of image {image.id}[/red] Attempting JPG fallback.")
+                console.log(f"[red]Couldn't find a {wanted_image_format.value.upper()} version of image "
+                            f"{image.id}[/red] Attempting JPG fallback.")
                 if not fs_images.exists(file + ServerSupportedImageFormats.JPG.value):
                     return format_error_return_v3(ErrorCodes.IMAGE_NOT_FOUND, 404)
                 wanted_image_format = ServerSupportedImageFormats.JPG
@@ -83,21 +99,46 @@ class Image(Resource):
 
         download_name = f"{image.sha256sum}.{wanted_image_format.value}"
 
-        return send_file(
+        response = send_file(
             file_object, mimetype=SERVER_SUPPORTED_IMAGE_FORMATS_MIMETYPES.get(wanted_image_format.value),
             download_name=download_name,
             as_attachment=args.download is True
         )
+        if negotiated:
+            # so caches don't give one client's avif to another
+            response.vary.add("Accept")
+        return response
+
+
+class NewImagePostArgs(RequestArgs):
+    # what the image is for, from ImageUploadPurposes.
+    # decides which sizes are generated. defaults to post.
+    purpose: Optional[str] = None
+
+
+def _get_upload_purpose(args) -> Optional[ImageUploadPurposes]:
+    if args.purpose is None:
+        return ImageUploadPurposes.POST
+    try:
+        return ImageUploadPurposes(args.purpose)
+    except ValueError:
+        return None
 
 
 class NewImage(Resource):
     @max_req_size(IMAGE_MAX_REQ_SIZE)
     @db_session
     @auth_reqd
-    def post(self):
+    @api_key_permission(ApiKeyPermissions.POST)
+    @request_args(NewImagePostArgs)
+    def post(self, args):
         if request.files.get("image") is None:
             return format_error_return_v3(ErrorCodes.INVALID_IMAGE_PACKAGE, 400)
 
+        purpose = _get_upload_purpose(args)
+        if purpose is None:
+            return format_error_return_v3(ErrorCodes.IMAGE_PURPOSE_INVALID, 400)
+
         console.log("Files package parsed OK!")
 
         image: bytes = request.files.get("image").read()
@@ -112,10 +153,12 @@ class NewImage(Resource):
 
         try:
             image_info = handle_upload(
-                BytesIO(image), get_user_from_auth_header().id, threaded=True
+                BytesIO(image), get_user_from_auth_header().id, threaded=True, purpose=purpose
             )
         except InvalidImageException:
             return format_error_return_v3(ErrorCodes.INVALID_IMAGE_PACKAGE, 400)
+        except ImageTooLargeException:
+            return format_error_return_v3(ErrorCodes.IMAGE_TOO_LARGE, 413)
 
         return {
                    "identifier": image_info.identifier,
@@ -127,10 +170,16 @@ class NewImageProcessBeforeReturn(Resource):
     @max_req_size(IMAGE_MAX_REQ_SIZE)
     @db_session
     @auth_reqd
-    def post(self):
+    @api_key_permission(ApiKeyPermissions.POST)
+    @request_args(NewImagePostArgs)
+    def post(self, args):
         if request.files.get("image") is None:
             return format_error_return_v3(ErrorCodes.INVALID_IMAGE_PACKAGE, 400)
 
+        purpose = _get_upload_purpose(args)
+        if purpose is None:
+            return format_error_return_v3(ErrorCodes.IMAGE_PURPOSE_INVALID, 400)
+
         image: bytes = request.files.get("image").read()
 
         # I think we still need this, since content length can be spoofed?
@@ -143,10 +192,12 @@ class NewImageProcessBeforeReturn(Resource):
 
         try:
             image_info = handle_upload(
-                BytesIO(image), get_user_from_auth_header().id, threaded=False
+                BytesIO(image), get_user_from_auth_header().id, threaded=False, purpose=purpose
             )
         except InvalidImageException:
             return format_error_return_v3(ErrorCodes.INVALID_IMAGE_PACKAGE, 400)
+        except ImageTooLargeException:
+            return format_error_return_v3(ErrorCodes.IMAGE_TOO_LARGE, 413)
 
         return {
                    "identifier": image_info.identifier,
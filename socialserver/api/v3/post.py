@@ -1,43 +1,50 @@
 #  Copyright (c) Niall Asher 2022
 import json
 from datetime import datetime
-import re
 from json import JSONDecodeError
 
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
 from pydantic import ValidationError
 from socialserver.api.v3.models.post import AttachmentEntryModel, InvalidAttachmentEntryException
 from socialserver.db import db
 from pony.orm import db_session, commit
 from socialserver.constants import (
     MAX_IMAGES_PER_POST,
+    MAX_TAGS_PER_POST,
     POST_MAX_LEN,
-    REGEX_HASHTAG,
     ErrorCodes,
+    ApiKeyPermissions,
     PostAdditionalContentTypes,
+    ImageUploadPurposes,
 )
 from socialserver.util.api.v3.data_format import format_post_v3, format_userdata_v3
 from socialserver.util.api.v3.error_format import format_error_return_v3
-from socialserver.util.auth import get_user_from_auth_header, auth_reqd
+from socialserver.util.auth import get_user_from_auth_header, auth_reqd, api_key_permission
+from socialserver.util.hashtag import extract_hashtags, attach_hashtags_to_post, trending_hashtags
+from socialserver.util.image import ensure_image_variants
+from typing import List, Optional
+from socialserver.util.api.request_args import RequestArgs, request_args
 
 
-class Post(Resource):
-    def __init__(self):
-        self.post_parser = reqparse.RequestParser()
-        self.post_parser.add_argument("text_content", type=str, required=True)
-        self.post_parser.add_argument("attachments", type=dict, required=False, action="append")
+class PostPostArgs(RequestArgs):
+    text_content: str
+    attachments: Optional[List[dict]] = None
+
+
+class PostGetArgs(RequestArgs):
+    post_id: int
 
-        self.get_parser = reqparse.RequestParser()
-        self.get_parser.add_argument("post_id", type=int, required=True)
 
-        self.delete_parser = reqparse.RequestParser()
-        self.delete_parser.add_argument("post_id", type=int, required=True)
+class PostDeleteArgs(RequestArgs):
+    post_id: int
 
+
+class Post(Resource):
     @db_session
     @auth_reqd
-    def post(self):
-        args = self.post_parser.parse_args()
-
+    @api_key_permission(ApiKeyPermissions.POST)
+    @request_args(PostPostArgs)
+    def post(self, args):
         user = get_user_from_auth_header()
 
         # make sure the post is conforming to length requirements.
@@ -83,7 +90,11 @@ class Post(Resource):
                         return format_error_return_v3(ErrorCodes.IMAGE_NOT_FOUND, 400)
                     if resource.processed is False:
                         # the post won't be ready to go immediately.
+                        # the unprocessed post check makes sure it has
+                        # post sized copies once it's done.
                         processed = False
+                    elif not ensure_image_variants(resource.sha256sum, ImageUploadPurposes.POST):
+                        return format_error_return_v3(ErrorCodes.IMAGE_NOT_FOUND, 400)
                     image_identifiers.append(resource.identifier)
                 elif mdl.type == "video":
                     resource = db.Video.get(identifier=mdl.identifier)
@@ -104,45 +115,34 @@ class Post(Resource):
 
         # checking for hashtags in the post content
         # hashtags can be 1 to 12 chars long and only alphanumeric.
-        hashregex = re.compile(REGEX_HASHTAG)
-        # the regex is actually case-insensitive,
-        # but we store them in the database lowercase
-        # and converting them here means we don't have
-        # to loop over the created list.
-        tags = hashregex.findall(text_content.lower())
-
-        db_tags = []
-        for tag_name in tags:
-            existing_tag = db.Hashtag.get(name=tag_name)
-            if existing_tag is None:
-                tag = db.Hashtag(creation_time=datetime.utcnow(), name=tag_name)
-            else:
-                tag = existing_tag
-            db_tags.append(tag)
+        tags = extract_hashtags(text_content)
+        if len(tags) > MAX_TAGS_PER_POST:
+            return format_error_return_v3(ErrorCodes.POST_TOO_MANY_TAGS, 400)
 
         new_post = db.Post(
             under_moderation=False,
             user=user,
             creation_time=datetime.utcnow(),
             text=text_content,
-            hashtags=db_tags,
             processed=processed,
             attachments=attachments
         )
 
+        attach_hashtags_to_post(new_post, tags)
+
         # we commit earlier than normal, so we
         # can return the ID before the function ends
         # (the default decorator will only commit
         # the new post right at the end)
         commit()
+        trending_hashtags.record(tags)
 
         return {"post_id": new_post.id, "processed": processed}, 200
 
     @db_session
     @auth_reqd
-    def get(self):
-
-        args = self.get_parser.parse_args()
+    @request_args(PostGetArgs)
+    def get(self, args):
 
         user = get_user_from_auth_header()
 
@@ -184,9 +184,9 @@ class Post(Resource):
 
     @db_session
     @auth_reqd
-    def delete(self):
-        args = self.delete_parser.parse_args()
-
+    @api_key_permission(ApiKeyPermissions.POST)
+    @request_args(PostDeleteArgs)
+    def delete(self, args):
         user = get_user_from_auth_header()
 
         post = db.Post.get(id=args.post_id)
@@ -1,27 +1,29 @@
 #  Copyright (c) Niall Asher 2022
 
-from socialserver.constants import ErrorCodes
+from socialserver.constants import ErrorCodes, ApiKeyPermissions
 from socialserver.db import db
 from socialserver.util.api.v3.error_format import format_error_return_v3
-from socialserver.util.auth import auth_reqd, get_user_from_auth_header
-from flask_restful import reqparse, Resource
+from socialserver.util.auth import auth_reqd, get_user_from_auth_header, api_key_permission
+from flask_restful import Resource
 from pony.orm import db_session, commit, select
 from datetime import datetime
+from socialserver.util.api.request_args import RequestArgs, request_args
 
 
-class PostLike(Resource):
-    def __init__(self):
-        self.get_parser = reqparse.RequestParser()
-        self.get_parser.add_argument("post_id", type=int, required=True)
+class PostLikeGetArgs(RequestArgs):
+    post_id: int
+
+
+class PostLikeDeleteArgs(RequestArgs):
+    post_id: int
 
-        self.delete_parser = reqparse.RequestParser()
-        self.delete_parser.add_argument("post_id", type=int, required=True)
 
+class PostLike(Resource):
     @db_session
     @auth_reqd
-    def post(self):
-        args = self.get_parser.parse_args()
-
+    @api_key_permission(ApiKeyPermissions.POST)
+    @request_args(PostLikeGetArgs)
+    def post(self, args):
         user = get_user_from_auth_header()
 
         post = db.Post.get(id=args.post_id)
@@ -45,9 +47,9 @@ class PostLike(Resource):
 
     @db_session
     @auth_reqd
-    def delete(self):
-        args = self.delete_parser.parse_args()
-
+    @api_key_permission(ApiKeyPermissions.POST)
+    @request_args(PostLikeDeleteArgs)
+    def delete(self, args):
         user = get_user_from_auth_header()
 
         post = db.Post.get(id=args.post_id)
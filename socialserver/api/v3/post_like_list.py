@@ -5,21 +5,23 @@ from socialserver.util.api.v3.data_format import format_userdata_v3
 from socialserver.util.auth import auth_reqd, get_user_from_auth_header
 from socialserver.constants import ErrorCodes, MAX_FEED_GET_COUNT
 from pony.orm import db_session, select, desc
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
 from socialserver.util.api.v3.error_format import format_error_return_v3
+from socialserver.util.relationships import resolve_relationships
+from socialserver.util.api.request_args import RequestArgs, request_args
 
 
-class PostLikeList(Resource):
-    def __init__(self):
-        self.get_parser = reqparse.RequestParser()
-        self.get_parser.add_argument("post_id", type=int, required=True)
-        self.get_parser.add_argument("count", type=int, required=True)
-        self.get_parser.add_argument("offset", type=int, required=True)
+class PostLikeListGetArgs(RequestArgs):
+    post_id: int
+    count: int
+    offset: int
+
 
+class PostLikeList(Resource):
     @auth_reqd
     @db_session
-    def get(self):
-        args = self.get_parser.parse_args()
+    @request_args(PostLikeListGetArgs)
+    def get(self, args):
         user = get_user_from_auth_header()
 
         wanted_post = db.Post.get(id=args.post_id)
@@ -34,12 +36,14 @@ class PostLikeList(Resource):
 
         like_count = likes.count()
 
-        likes = likes.limit(args.count, offset=args.offset)
+        likes = likes.limit(args.count, offset=args.offset)[::]
+
+        relationships = resolve_relationships(user.id, [like.user.id for like in likes])
 
         formatted_likes = []
 
         for like in likes:
-            formatted_likes.append(format_userdata_v3(like.user))
+            formatted_likes.append(format_userdata_v3(like.user, relationship=relationships[like.user.id]))
 
         return {
                    "meta": {
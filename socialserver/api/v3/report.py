@@ -2,45 +2,48 @@
 
 from datetime import datetime
 from typing import List
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
 from socialserver.constants import (
     REPORT_SUPPLEMENTARY_INFO_MAX_LEN,
     ErrorCodes,
+    ApiKeyPermissions,
     ReportReasons,
 )
 from socialserver.db import db
 from socialserver.util.api.v3.error_format import format_error_return_v3
-from socialserver.util.auth import auth_reqd, get_user_from_auth_header
+from socialserver.util.auth import auth_reqd, get_user_from_auth_header, api_key_permission
 from socialserver.util.config import config
 from pony.orm import db_session
 
 from socialserver.util.date import format_timestamp_string
+from typing import List, Optional
+from socialserver.util.api.request_args import RequestArgs, request_args
 
 
-class Report(Resource):
-    def __init__(self):
-        self.get_parser = reqparse.RequestParser()
-        self.get_parser.add_argument("post_id", type=int, required=True)
-
-        self.post_parser = reqparse.RequestParser()
-        self.post_parser.add_argument("post_id", type=int, required=True)
-        # we are going to allow multiple infringement report reasons
-        # per post, since we're not allowing a single user to report
-        # a post multiple times.
-        self.post_parser.add_argument(
-            "report_reason", type=int, required=True, action="append"
-        )
-        self.post_parser.add_argument("supplemental_info", type=str, required=False)
+class ReportGetArgs(RequestArgs):
+    post_id: int
+
+
+class ReportPostArgs(RequestArgs):
+    post_id: int
+    # we are going to allow multiple infringement report reasons
+    # per post, since we're not allowing a single user to report
+    # a post multiple times.
+    report_reason: List[int]
+    supplemental_info: Optional[str] = None
+
 
-        self.patch_parser = reqparse.RequestParser()
-        self.patch_parser.add_argument("report_id", type=int, required=True)
-        self.patch_parser.add_argument("mark_active", type=bool, required=True)
+class ReportPatchArgs(RequestArgs):
+    report_id: int
+    mark_active: bool
 
+
+class Report(Resource):
     @db_session
     @auth_reqd
-    def get(self):
-        args = self.get_parser.parse_args()
-
+    @api_key_permission(ApiKeyPermissions.ACCESS_MODERATION)
+    @request_args(ReportGetArgs)
+    def get(self, args):
         user = get_user_from_auth_header()
 
         if not (user.is_admin or user.is_moderator):
@@ -70,9 +73,9 @@ class Report(Resource):
 
     @db_session
     @auth_reqd
-    def post(self):
-        args = self.post_parser.parse_args()
-
+    @api_key_permission(ApiKeyPermissions.POST)
+    @request_args(ReportPostArgs)
+    def post(self, args):
         reporting_user_db = get_user_from_auth_header()
 
         post_to_be_reported = db.Post.get(id=args.post_id)
@@ -126,9 +129,9 @@ class Report(Resource):
 
     @db_session
     @auth_reqd
-    def patch(self):
-        args = self.patch_parser.parse_args()
-
+    @api_key_permission(ApiKeyPermissions.ACCESS_MODERATION)
+    @request_args(ReportPatchArgs)
+    def patch(self, args):
         modifying_user_db = get_user_from_auth_header()
 
         # only a moderator or admin should be able to influence this
@@ -0,0 +1,115 @@
+#  Copyright (c) Niall Asher 2022
+
+from flask_restful import Resource
+from socialserver.constants import MAX_FEED_GET_COUNT, SEARCH_QUERY_MAX_LEN, ErrorCodes
+from socialserver.db import db
+from socialserver.util.api.v3.data_format import format_userdata_v3
+from socialserver.util.relationships import resolve_relationships
+from socialserver.util.api.v3.error_format import format_error_return_v3
+from socialserver.util.api.v3.feed import format_feed_posts_v3
+from socialserver.util.auth import auth_reqd, get_user_from_auth_header
+from socialserver.util.search import (
+    search_posts,
+    search_users,
+    encode_search_cursor,
+    decode_search_cursor,
+    InvalidSearchQueryException,
+    InvalidSearchCursorException,
+)
+from pony.orm import db_session, select
+from typing import Optional
+from socialserver.util.api.request_args import RequestArgs, request_args
+
+
+class SearchArgs(RequestArgs):
+    query: str
+    count: int
+    # the next_cursor from the previous page. leave it out for the first page.
+    cursor: Optional[str] = None
+
+
+"""
+    _run_search
+
+    validates the common search arguments and runs the given search function.
+    returns either the results and the next cursor, or an error return.
+"""
+
+
+def _run_search(args, search_function, requesting_user):
+    if args.count > MAX_FEED_GET_COUNT:
+        return None, format_error_return_v3(ErrorCodes.FEED_GET_COUNT_TOO_HIGH, 400)
+    if args.count < 1:
+        return None, format_error_return_v3(ErrorCodes.FEED_GET_COUNT_TOO_LOW, 400)
+
+    if len(args.query) > SEARCH_QUERY_MAX_LEN:
+        return None, format_error_return_v3(ErrorCodes.SEARCH_QUERY_INVALID, 400)
+
+    cursor = None
+    if args.cursor is not None:
+        try:
+            cursor = decode_search_cursor(args.cursor)
+        except InvalidSearchCursorException:
+            return None, format_error_return_v3(ErrorCodes.INVALID_FEED_CURSOR, 400)
+
+    try:
+        results = search_function(args.query, requesting_user.id, args.count, cursor)
+    except InvalidSearchQueryException:
+        return None, format_error_return_v3(ErrorCodes.SEARCH_QUERY_INVALID, 400)
+
+    return results, None
+
+
+def _format_search_meta(results, count) -> dict:
+    reached_end = len(results) < count
+    next_cursor = None
+    if not reached_end:
+        last_id, last_score = results[-1]
+        next_cursor = encode_search_cursor(last_score, last_id)
+    return {"reached_end": reached_end, "next_cursor": next_cursor}
+
+
+class PostSearch(Resource):
+    @db_session
+    @auth_reqd
+    @request_args(SearchArgs)
+    def get(self, args):
+        requesting_user_db = get_user_from_auth_header()
+
+        results, error = _run_search(args, search_posts, requesting_user_db)
+        if error is not None:
+            return error
+
+        result_ids = [post_id for post_id, _ in results]
+        posts = {p.id: p for p in select(p for p in db.Post if p.id in result_ids)}
+
+        return {
+                   "meta": _format_search_meta(results, args.count),
+                   "posts": format_feed_posts_v3(
+                       [posts[post_id] for post_id in result_ids], requesting_user_db
+                   ),
+               }, 200
+
+
+class UserSearch(Resource):
+    @db_session
+    @auth_reqd
+    @request_args(SearchArgs)
+    def get(self, args):
+        requesting_user_db = get_user_from_auth_header()
+
+        results, error = _run_search(args, search_users, requesting_user_db)
+        if error is not None:
+            return error
+
+        result_ids = [user_id for user_id, _ in results]
+        users = {u.id: u for u in select(u for u in db.User if u.id in result_ids)}
+        relationships = resolve_relationships(requesting_user_db.id, result_ids)
+
+        return {
+                   "meta": _format_search_meta(results, args.count),
+                   "users": [
+                       format_userdata_v3(users[user_id], relationship=relationships[user_id])
+                       for user_id in result_ids
+                   ],
+               }, 200
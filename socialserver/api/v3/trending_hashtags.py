@@ -0,0 +1,33 @@
+#  Copyright (c) Niall Asher 2022
+
+from flask_restful import Resource
+from socialserver.constants import MAX_TRENDING_HASHTAGS_GET_COUNT, ErrorCodes
+from socialserver.util.api.v3.error_format import format_error_return_v3
+from socialserver.util.auth import auth_reqd
+from socialserver.util.hashtag import trending_hashtags
+from typing import Optional
+from socialserver.util.api.request_args import RequestArgs, request_args
+
+
+class TrendingHashtagsGetArgs(RequestArgs):
+    count: Optional[int] = MAX_TRENDING_HASHTAGS_GET_COUNT
+
+
+class TrendingHashtags(Resource):
+    # no db_session here; the counts are kept in memory,
+    # so serving them never touches the database.
+    @auth_reqd
+    @request_args(TrendingHashtagsGetArgs)
+    def get(self, args):
+        if args.count > MAX_TRENDING_HASHTAGS_GET_COUNT:
+            return format_error_return_v3(ErrorCodes.FEED_GET_COUNT_TOO_HIGH, 400)
+        if args.count < 1:
+            return format_error_return_v3(ErrorCodes.FEED_GET_COUNT_TOO_LOW, 400)
+
+        return {
+                   "hashtags": [
+                       # counts are approximate, and only cover the trending window.
+                       {"name": name, "recent_post_count": count}
+                       for name, count in trending_hashtags.top(args.count)
+                   ]
+               }, 200
@@ -1,6 +1,6 @@
 #  Copyright (c) Niall Asher 2022
 
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
 from socialserver.db import db
 from socialserver.util.api.v3.error_format import format_error_return_v3
 from socialserver.util.auth import (
@@ -15,16 +15,18 @@ from pony.orm import db_session, commit
 from socialserver.constants import ErrorCodes
 from socialserver.util.config import config
 from datetime import datetime, timedelta
+from socialserver.util.api.request_args import RequestArgs, request_args
 
 
-class TwoFactorAuthentication(Resource):
-    def __init__(self):
-        self.delete_parser = reqparse.RequestParser()
-        self.delete_parser.add_argument("password", type=str, required=True)
+class TwoFactorAuthenticationDeleteArgs(RequestArgs):
+    password: str
+
+
+class TwoFactorAuthenticationPostArgs(RequestArgs):
+    password: str
 
-        self.post_parser = reqparse.RequestParser()
-        self.post_parser.add_argument("password", type=str, required=True)
 
+class TwoFactorAuthentication(Resource):
     @auth_reqd
     @db_session
     # return true if the user has 2FA, & it's confirmed
@@ -34,9 +36,8 @@ class TwoFactorAuthentication(Resource):
 
     @auth_reqd
     @db_session
-    def delete(self):
-        args = self.delete_parser.parse_args()
-
+    @request_args(TwoFactorAuthenticationDeleteArgs)
+    def delete(self, args):
         user = get_user_from_auth_header()
 
         if not verify_password_valid(
@@ -55,9 +56,8 @@ class TwoFactorAuthentication(Resource):
 
     @auth_reqd
     @db_session
-    def post(self):
-        args = self.post_parser.parse_args()
-
+    @request_args(TwoFactorAuthenticationPostArgs)
+    def post(self, args):
         user = get_user_from_auth_header()
 
         if not verify_password_valid(
@@ -109,17 +109,16 @@ class TwoFactorAuthentication(Resource):
         }, 201
 
 
+class TwoFactorAuthenticationVerificationPostArgs(RequestArgs):
+    totp: str
+
+
 # it's a mouthful lol
 class TwoFactorAuthenticationVerification(Resource):
-    def __init__(self):
-        self.post_parser = reqparse.RequestParser()
-        self.post_parser.add_argument("totp", type=str, required=True)
-
     @auth_reqd
     @db_session
-    def post(self):
-        args = self.post_parser.parse_args()
-
+    @request_args(TwoFactorAuthenticationVerificationPostArgs)
+    def post(self, args):
         user = get_user_from_auth_header()
 
         if user.totp is None:
@@ -3,41 +3,49 @@
 from datetime import datetime
 import re
 from socialserver.db import db
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
 from socialserver.constants import (
     BIO_MAX_LEN,
     DISPLAY_NAME_MAX_LEN,
     MAX_PASSWORD_LEN,
     MIN_PASSWORD_LEN,
     ErrorCodes,
+    ApiKeyPermissions,
     REGEX_USERNAME_VALID, UserNotFoundException,
+    ImageUploadPurposes,
 )
 from socialserver.util.api.v3.data_format import format_userdata_v3
 from socialserver.util.api.v3.error_format import format_error_return_v3
 from socialserver.util.auth import (
+    api_key_permission,
     generate_salt,
     hash_password,
     verify_password_valid,
     auth_reqd,
     get_user_from_auth_header,
 )
-from pony.orm import db_session
+from pony.orm import db_session, commit, TransactionIntegrityError
 from socialserver.util.config import config
+from socialserver.util.image import ensure_image_variants
 from socialserver.util.user import get_user_from_db
+from socialserver.util.username_filter import username_filter, username_taken, record_username_change
+from socialserver.util.api_key import api_key_cache
+from typing import Optional
+from socialserver.util.api.request_args import RequestArgs, request_args
 
 
-class UserInfo(Resource):
-    def __init__(self):
-        self.get_parser = reqparse.RequestParser()
-        self.get_parser.add_argument("username", type=str, required=False)
+class UserInfoGetArgs(RequestArgs):
+    username: Optional[str] = None
+
 
+class UserInfo(Resource):
     @db_session
     @auth_reqd
-    def get(self):
+    @request_args(UserInfoGetArgs)
+    def get(self, args):
 
         user = get_user_from_auth_header()
 
-        args = self.get_parser.parse_args()
 
         if args.username is None:
             wanted_user = get_user_from_auth_header()
@@ -59,34 +67,34 @@ class UserInfo(Resource):
         )
 
 
-class User(Resource):
-    def __init__(self):
+class UserPatchArgs(RequestArgs):
+    display_name: Optional[str] = None
+    username: Optional[str] = None
+    bio: Optional[str] = None
+    profile_pic_ref: Optional[str] = None
+    header_pic_ref: Optional[str] = None
 
-        self.patch_parser = reqparse.RequestParser()
-        self.patch_parser.add_argument("display_name", type=str, required=False)
-        self.patch_parser.add_argument("username", type=str, required=False)
-        self.patch_parser.add_argument("bio", type=str, required=False)
-        self.patch_parser.add_argument("profile_pic_ref", type=str, required=False)
-        self.patch_parser.add_argument("header_pic_ref", type=str, required=False)
 
-        self.post_parser = reqparse.RequestParser()
-        self.post_parser.add_argument("display_name", type=str, required=True)
-        self.post_parser.add_argument("username", type=str, required=True)
-        self.post_parser.add_argument("password", type=str, required=True)
-        self.post_parser.add_argument("bio", type=str)
+class UserPostArgs(RequestArgs):
+    display_name: str
+    username: str
+    password: str
+    bio: Optional[str] = None
 
-        self.delete_parser = reqparse.RequestParser()
-        self.delete_parser.add_argument("password", type=str, required=True)
 
+class UserDeleteArgs(RequestArgs):
+    password: str
+
+
+class User(Resource):
     @db_session
-    def post(self):
+    @request_args(UserPostArgs)
+    def post(self, args):
         # birthday is unimplemented for now.
         # this will have to be turned into a datetime.date,
         # and there are a lot of considerations. probably
         # a feature to do *after* everything else works!
         # parser.add_argument('birthday', type=str)
-        args = self.post_parser.parse_args()
-
         # all this validation should be done clientside,
         # but we're replicating here in case of an error on the client
         # or a bad actor. hence, the ux doesn't have to be amazing,
@@ -98,8 +106,7 @@ class User(Resource):
         if not bool(re.match(REGEX_USERNAME_VALID, args.username)):
             return format_error_return_v3(ErrorCodes.USERNAME_INVALID, 400)
 
-        existing_user = db.User.get(username=args.username)
-        if existing_user is not None:
+        if username_taken(args.username):
             return format_error_return_v3(ErrorCodes.USERNAME_TAKEN, 400)
 
         if args.bio is not None and len(args.bio) >= BIO_MAX_LEN:
@@ -122,21 +129,27 @@ class User(Resource):
             password_salt=salt,
             creation_time=datetime.utcnow(),
             is_legacy_account=False,
-            account_attributes=[],
             bio=args.bio if args.bio is not None else "",
             recent_failed_login_count=0,
             account_approved=True
             if config.auth.registration.approval_required is False
             else False,
         )
+        # the filter might not know about a name that was just taken
+        # through another process, so the unique constraint has the final say.
+        try:
+            commit()
+        except TransactionIntegrityError:
+            return format_error_return_v3(ErrorCodes.USERNAME_TAKEN, 400)
+        username_filter.add(args.username)
 
         return {"needs_approval": config.auth.registration.approval_required}, 201
 
     @db_session
     @auth_reqd
-    def patch(self):
-        args = self.patch_parser.parse_args()
-
+    @api_key_permission(ApiKeyPermissions.MODIFY_ACCOUNT_SETTINGS)
+    @request_args(UserPatchArgs)
+    def patch(self, args):
         user = get_user_from_auth_header()
 
         if args.display_name is not None:
@@ -148,9 +161,17 @@ class User(Resource):
         if args.username is not None:
             if not bool(re.match(REGEX_USERNAME_VALID, args.username)):
                 return format_error_return_v3(ErrorCodes.USERNAME_INVALID, 400)
-            if db.User.get(username=args.username) is not None:
+            if username_taken(args.username):
                 return format_error_return_v3(ErrorCodes.USERNAME_TAKEN, 400)
+            old_username = user.username
             user.username = args.username
+            record_username_change(args.username)
+            try:
+                commit()
+            except TransactionIntegrityError:
+                return format_error_return_v3(ErrorCodes.USERNAME_TAKEN, 400)
+            username_filter.add(args.username)
+            username_filter.remove(old_username)
             return {"username": args.username}
 
         if args.bio is not None:
@@ -167,6 +188,8 @@ class User(Resource):
                 return format_error_return_v3(ErrorCodes.IMAGE_NOT_FOUND, 404)
             if existing_image.processed is False:
                 return format_error_return_v3(ErrorCodes.IMAGE_NOT_PROCESSED, 404)
+            if not ensure_image_variants(existing_image.sha256sum, ImageUploadPurposes.AVATAR):
+                return format_error_return_v3(ErrorCodes.IMAGE_NOT_FOUND, 404)
             user.profile_pic = existing_image
             return {"profile_pic_ref": args.profile_pic_ref}, 201
 
@@ -176,6 +199,8 @@ class User(Resource):
                 return format_error_return_v3(ErrorCodes.IMAGE_NOT_FOUND, 404)
             if existing_image.processed is False:
                 return format_error_return_v3(ErrorCodes.IMAGE_NOT_PROCESSED, 404)
+            if not ensure_image_variants(existing_image.sha256sum, ImageUploadPurposes.HEADER):
+                return format_error_return_v3(ErrorCodes.IMAGE_NOT_FOUND, 404)
             user.header_pic = existing_image
             return {"header_pic_ref": args.header_pic_ref}, 201
 
@@ -183,9 +208,9 @@ class User(Resource):
 
     @db_session
     @auth_reqd
-    def delete(self):
-        args = self.delete_parser.parse_args()
-
+    @api_key_permission(ApiKeyPermissions.DELETE_ACCOUNT)
+    @request_args(UserDeleteArgs)
+    def delete(self, args):
         requesting_user = get_user_from_auth_header()
 
         if not verify_password_valid(
@@ -195,5 +220,7 @@ class User(Resource):
         ):
             return format_error_return_v3(ErrorCodes.INCORRECT_PASSWORD, 401)
 
+        username_filter.remove(requesting_user.username)
+        api_key_cache.evict_owner(requesting_user.id)
         requesting_user.delete()
         return {}, 200
@@ -1,6 +1,6 @@
 #  Copyright (c) Niall Asher 2022
 
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
 from socialserver.db import db
 from pony.orm import db_session, select
 from socialserver.constants import ErrorCodes, MIN_PASSWORD_LEN, MAX_PASSWORD_LEN
@@ -13,23 +13,25 @@ from socialserver.util.auth import (
     generate_salt,
     get_user_session_from_header,
 )
+from typing import Optional
+from socialserver.util.api.request_args import RequestArgs, request_args
 
 
-class UserPasswordChange(Resource):
-    def __init__(self):
-        self.patch_parser = reqparse.RequestParser()
-        self.patch_parser.add_argument("old_password", type=str, required=True)
-        self.patch_parser.add_argument("new_password", type=str, required=True)
-        # assumed to be false if not given.
-        self.patch_parser.add_argument("delete_other_sessions", type=bool, required=False)
+class UserPasswordChangePatchArgs(RequestArgs):
+    old_password: str
+    new_password: str
+    # assumed to be false if not given.
+    delete_other_sessions: Optional[bool] = None
+
 
+class UserPasswordChange(Resource):
     @db_session
     @auth_reqd
     # patch not post, since we're not creating a new resource.
-    def patch(self):
+    @request_args(UserPasswordChangePatchArgs)
+    def patch(self, args):
         # Should TOTP be required? I'm thinking no, because it's for keeping a session safe,
         # and you already need to be signed in to change the password. Worth considering though.
-        args = self.patch_parser.parse_args()
         user = get_user_from_auth_header()
 
         delete_other_sessions = args.delete_other_sessions or False
@@ -2,12 +2,13 @@
 
 from datetime import datetime, timedelta
 from socialserver.db import db
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
 from pony.orm import db_session
 from flask import request
 from socialserver.constants import ErrorCodes
 from socialserver.util.api.v3.error_format import format_error_return_v3
 from socialserver.util.auth import (
+    api_key_permission,
     generate_key,
     get_ip_from_request,
     hash_plaintext_sha256,
@@ -17,23 +18,33 @@ from socialserver.util.auth import (
     check_totp_valid,
     TotpExpendedException,
     TotpInvalidException, check_and_handle_account_lock_status, get_user_session_from_header,
+    rehash_password_if_needed,
+    record_failed_login,
 )
 from socialserver.util.config import config
-from user_agents import parse as ua_parse
+from socialserver.util.write_behind import write_behind
+from socialserver.util.lazy_import import LazyModule
 
 from socialserver.util.date import format_timestamp_string
+from typing import Optional
+from socialserver.util.api.request_args import RequestArgs, request_args
 
+# its regex database takes a while to load, and it's only
+# needed for listing sessions.
+user_agents = LazyModule("user_agents")
 
-class UserSession(Resource):
-    def __init__(self):
-        self.post_parser = reqparse.RequestParser()
-        self.post_parser.add_argument("username", type=str, required=True)
-        self.post_parser.add_argument("password", type=str, required=True)
-        # Only needed if TOTP is enabled!
-        self.post_parser.add_argument("totp", type=str, required=False)
 
+class UserSessionPostArgs(RequestArgs):
+    username: str
+    password: str
+    # Only needed if TOTP is enabled!
+    totp: Optional[str] = None
+
+
+class UserSession(Resource):
     @db_session
     @auth_reqd
+    @api_key_permission(None)
     def get(self):
 
         session = db.UserSession.get(
@@ -52,23 +63,27 @@ class UserSession(Resource):
                 "creation_ip": session.creation_ip,
                 "creation_time": format_timestamp_string(session.creation_time),
                 "current_server_time": format_timestamp_string(datetime.utcnow()),
-                "last_access_time": format_timestamp_string(session.last_access_time),
+                "last_access_time": format_timestamp_string(
+                    write_behind.session_access_time(session.id, session.last_access_time)
+                ),
                 "user_agent": session.user_agent,
             },
             200,
         )
 
     @db_session
-    def post(self):
-        args = self.post_parser.parse_args()
-
+    @request_args(UserSessionPostArgs)
+    def post(self, args):
         user = db.User.get(username=args.username)
         if user is None:
             return format_error_return_v3(ErrorCodes.USERNAME_NOT_FOUND, 404)
 
         account_locked = check_and_handle_account_lock_status(user)
         if account_locked:
-            unlocks_at = user.last_failed_login_attempt + timedelta(seconds=config.auth.failure_lock.lock_time_seconds)
+            _, last_failed_login_attempt = write_behind.failed_logins(
+                user.id, user.recent_failed_login_count, user.last_failed_login_attempt
+            )
+            unlocks_at = last_failed_login_attempt + timedelta(seconds=config.auth.failure_lock.lock_time_seconds)
             return format_error_return_v3(ErrorCodes.ACCOUNT_TEMPORARILY_LOCKED, 401,
                                           {
                                               "locked_for_seconds": config.auth.failure_lock.lock_time_seconds,
@@ -78,8 +93,7 @@ class UserSession(Resource):
         if not verify_password_valid(
                 args.password, user.password_salt, user.password_hash
         ):
-            user.recent_failed_login_count += 1
-            user.last_failed_login_attempt = datetime.utcnow()
+            record_failed_login(user)
             return format_error_return_v3(ErrorCodes.INCORRECT_PASSWORD, 401)
 
         if config.auth.registration.approval_required:
@@ -101,6 +115,8 @@ class UserSession(Resource):
             except TotpInvalidException:
                 return format_error_return_v3(ErrorCodes.TOTP_INCORRECT, 401)
 
+        rehash_password_if_needed(user, args.password)
+
         secret = generate_key()
 
         db.UserSession(
@@ -116,6 +132,7 @@ class UserSession(Resource):
 
     @db_session
     @auth_reqd
+    @api_key_permission(None)
     def delete(self):
 
         session = get_user_session_from_header()
@@ -135,17 +152,19 @@ class UserSessionList(Resource):
 
     @db_session
     @auth_reqd
+    @api_key_permission(None)
     def get(self):
         sessions = []
         user = get_user_from_auth_header()
 
         for s in user.sessions:
-            user_agent = ua_parse(s.user_agent)
+            user_agent = user_agents.parse(s.user_agent)
+            last_access_time = write_behind.session_access_time(s.id, s.last_access_time)
             sessions.append(
                 {
                     "creation_ip": s.creation_ip,
                     "creation_time": format_timestamp_string(s.creation_time),
-                    "last_access_time": format_timestamp_string(s.last_access_time),
+                    "last_access_time": format_timestamp_string(last_access_time),
                     # current = true if this is the session the user used to request the list
                     # this is just to make it easy for a client to add a tag saying something
                     # like [THIS DEVICE] to an entry in the list of sessions
@@ -1,25 +1,23 @@
 #  Copyright (c) Niall Asher 2022
 
 from socialserver.constants import REGEX_USERNAME_VALID, ErrorCodes
-from socialserver.db import db
+from socialserver.util.username_filter import username_taken
 from pony.orm import db_session
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
 import re
 from socialserver.util.api.v3.error_format import format_error_return_v3
+from socialserver.util.api.request_args import RequestArgs, request_args
 
 
-class UsernameAvailable(Resource):
-    def __init__(self):
-        self.get_parser = reqparse.RequestParser()
-        self.get_parser.add_argument("username", type=str, required=True)
+class UsernameAvailableGetArgs(RequestArgs):
+    username: str
 
-    @db_session
-    def get(self):
-        args = self.get_parser.parse_args()
 
+class UsernameAvailable(Resource):
+    @db_session
+    @request_args(UsernameAvailableGetArgs)
+    def get(self, args):
         if not bool(re.match(REGEX_USERNAME_VALID, args.username)):
             return format_error_return_v3(ErrorCodes.USERNAME_INVALID, 400)
 
-        existing_user = db.User.get(username=args.username)
-
-        return existing_user is None, 200
+        return not username_taken(args.username), 200
@@ -2,33 +2,34 @@
 
 from io import BytesIO
 from flask.helpers import send_file
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
 from flask import request
-from socialserver.constants import ErrorCodes, MAX_VIDEO_SIZE_MB
+from socialserver.constants import ErrorCodes, MAX_VIDEO_SIZE_MB, ApiKeyPermissions
 from socialserver.util.api.v3.error_format import format_error_return_v3
 from socialserver.util.file import mb_to_b, max_req_size, b_to_mb
 from pony.orm import db_session
-from socialserver.util.auth import get_user_from_auth_header, auth_reqd
+from socialserver.util.auth import get_user_from_auth_header, auth_reqd, api_key_permission
 from socialserver.util.video import handle_video_upload, InvalidVideoException
 from socialserver.db import db
-from socialserver.util.filesystem import fs_videos
+from socialserver.util.filesystem import fs_videos, hash_directory
+from typing import Optional
+from socialserver.util.api.request_args import RequestArgs, request_args
 
 
-class Video(Resource):
-    def __init__(self):
-        self.get_parser = reqparse.RequestParser()
-        self.get_parser.add_argument("download", type=bool, required=False)
+class VideoGetArgs(RequestArgs):
+    download: Optional[bool] = None
 
-    @db_session
-    def get(self, **kwargs):
 
-        args = self.get_parser.parse_args()
+class Video(Resource):
+    @db_session
+    @request_args(VideoGetArgs)
+    def get(self, args, **kwargs):
 
         video = db.Video.get(identifier=kwargs.get("videoid"))
         if video is None:
             return format_error_return_v3(ErrorCodes.OBJECT_NOT_FOUND, 404)
 
-        file = f"/{video.sha256sum}/video.mp4"
+        file = f"{hash_directory(video.sha256sum)}/video.mp4"
         if not fs_videos.exists(file):
             return format_error_return_v3(ErrorCodes.OBJECT_NOT_FOUND, 404)
 
@@ -48,6 +49,7 @@ class NewVideo(Resource):
     @max_req_size(mb_to_b(MAX_VIDEO_SIZE_MB))
     @db_session
     @auth_reqd
+    @api_key_permission(ApiKeyPermissions.POST)
     def post(self):
 
         user = get_user_from_auth_header()
@@ -12,17 +12,28 @@ from socialserver.api.v3.bookmark import BookmarkPost, BookmarkFeed
 from socialserver.api.v3.follow_list import FollowerList, FollowingList
 from socialserver.api.v3.post_like_list import PostLikeList
 from socialserver.util.config import config
+from socialserver.db import bind_database
 from socialserver.maintenance import maintenance
 from socialserver.util.post import start_unprocessed_post_thread
+from socialserver.util.hashtag import start_trending_hashtag_checkpoint_thread
+from socialserver.util.username_filter import start_username_filter_thread
+from socialserver.util.write_behind import start_write_behind_flush_thread
+from socialserver.util.rate_limit import check_ip_rate_limit, add_rate_limit_headers
+from socialserver.util.api.json_representation import get_json_serializer, make_json_representation
+from socialserver.util.metrics import start_request_metrics, record_request_metrics, finish_request_profile
 
 # API Version 3
 from socialserver.api.v3.comment import Comment
 from socialserver.api.v3.report import Report
 from socialserver.api.v3.info import ServerInfo
 from socialserver.api.v3.user_session import UserSession, UserSessionList
+from socialserver.api.v3.api_key import UserApiKey
 from socialserver.api.v3.user import User, UserInfo
 from socialserver.api.v3.username_available import UsernameAvailable
 from socialserver.api.v3.feed import PostFeed
+from socialserver.api.v3.hashtag_feed import HashtagFeed
+from socialserver.api.v3.trending_hashtags import TrendingHashtags
+from socialserver.api.v3.search import PostSearch, UserSearch
 from socialserver.api.v3.post import Post
 from socialserver.api.v3.post_like import PostLike
 from socialserver.api.v3.image import Image, NewImage, NewImageProcessBeforeReturn
@@ -39,37 +50,8 @@ from socialserver.api.v3.video import NewVideo, Video
 
 # API Version 3 Admin stuff
 from socialserver.api.v3.admin.user_approvals import UserApprovals
-
-# API legacy (v1/v2, it's confusing!)
-from socialserver.api.legacy.like import LegacyLike
-from socialserver.api.legacy.bio import LegacyUserBio
-from socialserver.api.legacy.follows import LegacyUserFollows, LegacyUserFollowing
-from socialserver.api.legacy.user import LegacyUser
-from socialserver.api.legacy.usermod import LegacyUsermod
-from socialserver.api.legacy.post import LegacyPost
-from socialserver.api.legacy.authentication import LegacyAuthentication
-from socialserver.api.legacy.info import LegacyInfo
-from socialserver.api.legacy.comment_filter.filter_by_post import (
-    LegacyCommentFilterByPost,
-)
-from socialserver.api.legacy.image import LegacyImage
-from socialserver.api.legacy.post_filter.by_user import LegacyPostFilterByUser
-from socialserver.api.legacy.like_filter.by_post import LegacyLikeFilterByPost
-from socialserver.api.legacy.follower_list import LegacyFollower
-from socialserver.api.legacy.block import LegacyBlock, LegacyUserBlocks
-from socialserver.api.legacy.comment import LegacyComment
-from socialserver.api.legacy.comment import LegacyCommentLike
-from socialserver.api.legacy.user_deauth import LegacyAllDeauth
-from socialserver.api.legacy.invite_codes import LegacyInviteCodes
-from socialserver.api.legacy.privileged_ops.admin_usermod import LegacyAdminUserMod
-from socialserver.api.legacy.privileged_ops.admin_delete_user import (
-    LegacyAdminDeleteUser,
-)
-from socialserver.api.legacy.privileged_ops.admin_delete_post import (
-    LegacyAdminDeletePost,
-)
-from socialserver.api.legacy.modqueue import LegacyModQueue
-from socialserver.api.legacy.two_factor import LegacyTwoFactor
+from socialserver.api.v3.admin.metrics import Metrics
+from socialserver.api.v3.admin.statistics import Statistics
 
 TOTP_REPLAY_PREVENTION_ENABLED = config.auth.totp.replay_prevention_enabled
 LESS_SECURE_PASSWORD_CHANGE_ENABLED = (
@@ -80,15 +62,30 @@ FAILURE_LOCK_ENABLED = config.auth.failure_lock.enabled
 
 
 def create_app():
+    bind_database()
+
     application = Flask(__name__)
     CORS(application)
     api = Api(application)
+    api.representations["application/json"] = make_json_representation(
+        get_json_serializer(config.api.json_serializer)
+    )
+
+    # metrics first, so requests turned away by the rate limiter are still timed.
+    application.before_request(start_request_metrics)
+    application.before_request(check_ip_rate_limit)
+    application.after_request(add_rate_limit_headers)
+    application.after_request(record_request_metrics)
+    application.teardown_request(finish_request_profile)
 
     # stuff that gets setup before the server processes
     # its first request.
     @application.before_first_request
     def _setup():
         start_unprocessed_post_thread()
+        start_trending_hashtag_checkpoint_thread()
+        start_username_filter_thread()
+        start_write_behind_flush_thread()
 
     if not TOTP_REPLAY_PREVENTION_ENABLED:
         console.log("[bold red]TOTP replay prevention is disabled!")
@@ -112,6 +109,7 @@ def create_app():
     api.add_resource(UserInfo, "/api/v3/user/info")
     api.add_resource(UserSession, "/api/v3/user/session")
     api.add_resource(UserSessionList, "/api/v3/user/session/list")
+    api.add_resource(UserApiKey, "/api/v3/user/api_keys")
     api.add_resource(TwoFactorAuthentication, "/api/v3/user/2fa")
     api.add_resource(TwoFactorAuthenticationVerification, "/api/v3/user/2fa/verify")
     api.add_resource(Follow, "/api/v3/user/follow")
@@ -122,6 +120,8 @@ def create_app():
 
     api.add_resource(Post, "/api/v3/posts/single")
     api.add_resource(PostFeed, "/api/v3/posts/feed")
+    api.add_resource(HashtagFeed, "/api/v3/posts/tag")
+    api.add_resource(TrendingHashtags, "/api/v3/hashtags/trending")
     api.add_resource(Report, "/api/v3/posts/report")
     api.add_resource(PostLike, "/api/v3/posts/like")
     api.add_resource(PostLikeList, "/api/v3/posts/like/feed")
@@ -129,6 +129,9 @@ def create_app():
     api.add_resource(BookmarkPost, "/api/v3/posts/bookmark")
     api.add_resource(BookmarkFeed, "/api/v3/posts/bookmark/feed")
 
+    api.add_resource(PostSearch, "/api/v3/search/posts")
+    api.add_resource(UserSearch, "/api/v3/search/users")
+
     api.add_resource(Comment, "/api/v3/comments")
     api.add_resource(CommentFeed, "/api/v3/comments/feed")
     api.add_resource(CommentLike, "/api/v3/comments/like")
@@ -141,6 +144,8 @@ def create_app():
     api.add_resource(NewVideo, "/api/v3/videos")
 
     api.add_resource(UserApprovals, "/api/v3/admin/userApprovals")
+    api.add_resource(Metrics, "/api/v3/admin/metrics")
+    api.add_resource(Statistics, "/api/v3/admin/statistics")
 
     if config.legacy_api_interface.enable:
         console.log(
@@ -153,6 +158,38 @@ def create_app():
                 + "Please only enable this for compatibility reasons"
             )
 
+        # only imported when they're enabled, since there's
+        # quite a lot of them, and most deployments won't be.
+        from socialserver.api.legacy.like import LegacyLike
+        from socialserver.api.legacy.bio import LegacyUserBio
+        from socialserver.api.legacy.follows import LegacyUserFollows, LegacyUserFollowing
+        from socialserver.api.legacy.user import LegacyUser
+        from socialserver.api.legacy.usermod import LegacyUsermod
+        from socialserver.api.legacy.post import LegacyPost
+        from socialserver.api.legacy.authentication import LegacyAuthentication
+        from socialserver.api.legacy.info import LegacyInfo
+        from socialserver.api.legacy.comment_filter.filter_by_post import (
+            LegacyCommentFilterByPost,
+        )
+        from socialserver.api.legacy.image import LegacyImage
+        from socialserver.api.legacy.post_filter.by_user import LegacyPostFilterByUser
+        from socialserver.api.legacy.like_filter.by_post import LegacyLikeFilterByPost
+        from socialserver.api.legacy.follower_list import LegacyFollower
+        from socialserver.api.legacy.block import LegacyBlock, LegacyUserBlocks
+        from socialserver.api.legacy.comment import LegacyComment
+        from socialserver.api.legacy.comment import LegacyCommentLike
+        from socialserver.api.legacy.user_deauth import LegacyAllDeauth
+        from socialserver.api.legacy.invite_codes import LegacyInviteCodes
+        from socialserver.api.legacy.privileged_ops.admin_usermod import LegacyAdminUserMod
+        from socialserver.api.legacy.privileged_ops.admin_delete_user import (
+            LegacyAdminDeleteUser,
+        )
+        from socialserver.api.legacy.privileged_ops.admin_delete_post import (
+            LegacyAdminDeletePost,
+        )
+        from socialserver.api.legacy.modqueue import LegacyModQueue
+        from socialserver.api.legacy.two_factor import LegacyTwoFactor
+
         api.add_resource(LegacyPostFilterByUser, "/api/v1/posts/byUser")
         api.add_resource(LegacyPost, "/api/v1/posts")
         api.add_resource(LegacyCommentFilterByPost, "/api/v1/comments/byPost")
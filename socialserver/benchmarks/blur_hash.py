@@ -0,0 +1,70 @@
+#  Copyright (c) Niall Asher 2022
+
+# benchmarks generating an image's blur hash: before, re-encoding the
+# full image to a jpeg and handing that to blurhash-python, against
+# encoding a tiny linear light sample of the post sized copy, which
+# process_image has already made by the time it needs the hash.
+# run with python -m socialserver.benchmarks.blur_hash
+
+import json
+from argparse import ArgumentParser
+from copy import copy
+from io import BytesIO
+from time import perf_counter
+import blurhash
+from PIL import Image
+from socialserver.constants import BLURHASH_X_COMPONENTS, BLURHASH_Y_COMPONENTS, MAX_IMAGE_SIZE_POST
+from socialserver.util.blur_hash import encode_image, encode_images
+from socialserver.util.image_backend import PillowBackend
+
+
+def _generate_image(width: int, height: int):
+    # smooth, with some detail, like a photo
+    gradient = Image.linear_gradient("L").resize((width, height))
+    noise = Image.effect_noise((width, height), 64)
+    return Image.merge("RGB", [gradient, noise, gradient.transpose(Image.FLIP_LEFT_RIGHT)])
+
+
+def _before(image) -> str:
+    im = copy(image)
+    buffer = BytesIO()
+    im.save(buffer, format="jpeg")
+    return blurhash.encode(buffer, BLURHASH_X_COMPONENTS, BLURHASH_Y_COMPONENTS)
+
+
+def _time(function, repeat: int) -> float:
+    start_time = perf_counter()
+    for _ in range(0, repeat):
+        function()
+    return (perf_counter() - start_time) / repeat * 1000
+
+
+def run_benchmark(width: int, height: int, repeat: int, batch_size: int) -> dict:
+    image = _generate_image(width, height)
+    post_image = PillowBackend().fit(image, MAX_IMAGE_SIZE_POST)
+    batch = [post_image] * batch_size
+
+    before_ms = _time(lambda: _before(image), repeat)
+    after_ms = _time(lambda: encode_image(post_image), repeat)
+    batch_ms = _time(lambda: encode_images(batch), repeat)
+    return {
+        "image_size": [width, height],
+        "post_image_size": list(post_image.size),
+        "repeat": repeat,
+        "before_ms": round(before_ms, 2),
+        "after_ms": round(after_ms, 2),
+        "speedup": round(before_ms / after_ms, 2),
+        "batch_per_image_ms": round(batch_ms / batch_size, 2),
+        "blur_hash_before": _before(image),
+        "blur_hash_after": encode_image(post_image),
+    }
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=20)
+    args = parser.parse_args()
+    print(json.dumps(run_benchmark(args.width, args.height, args.repeat, args.batch_size), indent=2))
@@ -0,0 +1,123 @@
+#  Copyright (c) Niall Asher 2022
+
+# benchmarks the image backends (media.images.backend) on large photos:
+# decoding an upload, saving its original, generating the variants for
+# its purpose and making its blur hash, like handle_upload does. each
+# is run decoding the whole photo, and decoding it at the size its
+# variants need (as uploads are), to compare. each run is in a fresh
+# interpreter, so its peak rss (resident memory) isn't mixed up with
+# the others'. images are written to memory, rather than the
+# configured storage.
+# run with python -m socialserver.benchmarks.image_backend
+
+import json
+import resource
+import subprocess
+import sys
+from argparse import ArgumentParser
+from io import BytesIO
+from tempfile import NamedTemporaryFile
+from time import perf_counter
+from PIL import Image, ImageDraw
+
+CHILD_CODE = (
+    "import sys\n"
+    "from socialserver.benchmarks.image_backend import _run_backend\n"
+    "_run_backend(sys.argv[1], sys.argv[2], int(sys.argv[3]), sys.argv[4], sys.argv[5] == 'True')"
+)
+
+
+def _generate_photo(width: int, height: int) -> bytes:
+    # smooth, with some detail & hard edges, like a photo
+    gradient = Image.linear_gradient("L").resize((width, height))
+    noise = Image.effect_noise((width, height), 32)
+    image = Image.merge("RGB", [gradient, noise, gradient.transpose(Image.FLIP_LEFT_RIGHT)])
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((width // 4, height // 4, width // 2, height // 2), fill=(200, 40, 40))
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=92)
+    return buffer.getvalue()
+
+
+def _peak_rss_mb() -> float:
+    # kilobytes, on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# run in the child process; prints its results as json.
+def _run_backend(backend_name: str, photo_path: str, repeat: int, purpose_name: str, reduced_decode: bool):
+    from fs.memoryfs import MemoryFS
+    import socialserver.util.image
+    from socialserver.constants import ImageUploadPurposes
+    from socialserver.util.config import config
+    from socialserver.util.image import generate_blur_hash, generate_variants, save_original_to_disk, \
+        variant_decode_targets
+    from socialserver.util.image_backend import get_image_backend
+    from socialserver.util.image_variants import variants_for_purpose
+
+    config.media.images.backend = backend_name
+    backend = get_image_backend()
+    variants = variants_for_purpose(ImageUploadPurposes(purpose_name))
+    targets = variant_decode_targets(variants) if reduced_decode else None
+    with open(photo_path, "rb") as photo_file:
+        data = photo_file.read()
+    baseline_rss_mb = _peak_rss_mb()
+
+    times = []
+    for _ in range(0, repeat):
+        socialserver.util.image.fs_images = MemoryFS()
+        start_time = perf_counter()
+        image = backend.open(data, targets)
+        save_original_to_disk(data, "benchmark", "jpg")
+        images = generate_variants(image, "benchmark", variants)
+        generate_blur_hash(images[variants[0].image_type][0][1])
+        times.append(perf_counter() - start_time)
+
+    print(json.dumps({
+        "backend": backend.name,
+        "decoded_size": list(backend.size(image)),
+        "mean_ms": round(sum(times) / repeat * 1000, 2),
+        "best_ms": round(min(times) * 1000, 2),
+        "baseline_rss_mb": round(baseline_rss_mb, 1),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+    }))
+
+
+def run_benchmark(width: int, height: int, repeat: int, purpose: str, backends: list) -> dict:
+    results = {}
+    with NamedTemporaryFile(suffix=".jpg") as photo_file:
+        photo_file.write(_generate_photo(width, height))
+        photo_file.flush()
+        for backend in backends:
+            results[backend] = {}
+            for decode, reduced in [("full", False), ("reduced", True)]:
+                process = subprocess.run(
+                    [sys.executable, "-c", CHILD_CODE, backend, photo_file.name, str(repeat), purpose, str(reduced)],
+                    capture_output=True, text=True, check=True,
+                )
+                # the config loader logs to stdout too; the results are the last line.
+                result = json.loads(process.stdout.strip().splitlines()[-1])
+                if result["backend"] != backend:
+                    # i.e. pyvips isn't installed, so it fell back to pillow.
+                    result["error"] = f"{backend} isn't available"
+                megapixels = width * height / 1_000_000
+                result["megapixels_per_second"] = round(megapixels / (result["mean_ms"] / 1000), 2)
+                results[backend][decode] = result
+    return {
+        "image_size": [width, height],
+        "repeat": repeat,
+        "purpose": purpose,
+        "backends": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--width", type=int, default=6000)
+    parser.add_argument("--height", type=int, default=4000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--purpose", default="post")
+    parser.add_argument("--backends", nargs="+", default=["pillow", "vips"])
+    args = parser.parse_args()
+    report = run_benchmark(args.width, args.height, args.repeat, args.purpose, args.backends)
+    print(json.dumps(report, indent=2))
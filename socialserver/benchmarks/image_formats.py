@@ -0,0 +1,103 @@
+#  Copyright (c) Niall Asher 2022
+
+# benchmarks each format images can be stored in: the bytes stored for
+# a corpus of images, resized to the variants of a purpose, and the cpu
+# time taken to encode them, against jpg. formats the image backend
+# can't encode (i.e. avif without libheif) are listed as skipped. the
+# corpus is a few generated images (a photo, a screenshot & a detailed
+# texture) unless --corpus is given a directory of real ones, which is
+# a much better idea.
+# run with python -m socialserver.benchmarks.image_formats
+
+import json
+from argparse import ArgumentParser
+from io import BytesIO
+from pathlib import Path
+from time import process_time
+from PIL import Image, ImageDraw
+from socialserver.constants import ImageUploadPurposes
+from socialserver.util.config import config
+from socialserver.util.image import resize_to_variant
+from socialserver.util.image_backend import IMAGE_BACKENDS, get_image_backend
+from socialserver.util.image_formats import IMAGE_ENCODERS, image_format_quality
+from socialserver.util.image_variants import variants_for_purpose
+
+
+def _encoded(image) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=95)
+    return buffer.getvalue()
+
+
+def _generated_corpus(width: int, height: int) -> dict:
+    gradient = Image.linear_gradient("L").resize((width, height))
+    noise = Image.effect_noise((width, height), 32)
+    photo = Image.merge("RGB", [gradient, noise, gradient.transpose(Image.FLIP_LEFT_RIGHT)])
+    ImageDraw.Draw(photo).ellipse((width // 4, height // 4, width // 2, height // 2), fill=(200, 40, 40))
+
+    # flat colours & hard edges, like a screenshot
+    screenshot = Image.new("RGB", (width, height), (245, 245, 245))
+    draw = ImageDraw.Draw(screenshot)
+    for y in range(0, height, 40):
+        draw.rectangle((20, y + 8, width * (y % 7 + 3) // 10, y + 24), fill=(40, 40, 40))
+
+    detail = Image.merge("RGB", [Image.effect_noise((width, height), 96) for _ in range(0, 3)])
+    return {"photo": _encoded(photo), "screenshot": _encoded(screenshot), "detail": _encoded(detail)}
+
+
+def _load_corpus(directory: str) -> dict:
+    return {path.name: path.read_bytes() for path in sorted(Path(directory).iterdir()) if path.is_file()}
+
+
+def run_benchmark(corpus: dict, backend_name: str, purpose: str) -> dict:
+    # resize_to_variant uses the configured backend
+    config.media.images.backend = backend_name
+    backend = get_image_backend()
+    variants = variants_for_purpose(ImageUploadPurposes(purpose))
+
+    resized = []
+    for data in corpus.values():
+        image = backend.open(data)
+        for variant in variants:
+            resized += [(variant.image_type, image) for _, image in resize_to_variant(image, variant)]
+
+    formats = {}
+    skipped = []
+    for encoder in IMAGE_ENCODERS.values():
+        image_format = encoder.image_format
+        if not backend.supports(image_format):
+            skipped.append(image_format.value)
+            continue
+        total_bytes = 0
+        start_time = process_time()
+        for image_type, image in resized:
+            total_bytes += len(backend.encode(image, image_format, image_format_quality(image_format, image_type)))
+        formats[image_format.value] = {
+            "bytes": total_bytes,
+            "cpu_ms": round((process_time() - start_time) * 1000, 2),
+        }
+
+    jpeg = formats["jpg"]
+    for result in formats.values():
+        result["bytes_saved_percent"] = round((1 - result["bytes"] / jpeg["bytes"]) * 100, 1)
+        result["cpu_vs_jpg"] = round(result["cpu_ms"] / jpeg["cpu_ms"], 2)
+    return {
+        "backend": backend.name,
+        "purpose": purpose,
+        "corpus": list(corpus.keys()),
+        "images_encoded": len(resized),
+        "formats": formats,
+        "skipped": skipped,
+    }
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--corpus", help="a directory of images to use, rather than generated ones")
+    parser.add_argument("--width", type=int, default=2000)
+    parser.add_argument("--height", type=int, default=1500)
+    parser.add_argument("--backend", default=config.media.images.backend, choices=list(IMAGE_BACKENDS.keys()))
+    parser.add_argument("--purpose", default="post")
+    args = parser.parse_args()
+    images = _load_corpus(args.corpus) if args.corpus else _generated_corpus(args.width, args.height)
+    print(json.dumps(run_benchmark(images, args.backend, args.purpose), indent=2))
@@ -0,0 +1,76 @@
+#  Copyright (c) Niall Asher 2022
+
+# benchmarks processing an upload for each purpose: before, every
+# variant was generated for every upload, against only the variants
+# configured for the upload's purpose. reports the time taken and
+# the number of files stored for each. the original is saved the same
+# way either way, so it's left out. images are written to memory,
+# rather than the configured storage.
+# run with python -m socialserver.benchmarks.image_variants
+
+import json
+from argparse import ArgumentParser
+from io import BytesIO
+from time import perf_counter
+from fs.memoryfs import MemoryFS
+from PIL import Image
+import socialserver.util.image
+from socialserver.constants import ImageUploadPurposes
+from socialserver.util.image import generate_variants
+from socialserver.util.image_backend import get_image_backend
+from socialserver.util.image_variants import IMAGE_VARIANTS, variants_for_purpose
+
+
+def _generate_image(width: int, height: int):
+    # smooth, with some detail, like a photo
+    gradient = Image.linear_gradient("L").resize((width, height))
+    noise = Image.effect_noise((width, height), 64)
+    image = Image.merge("RGB", [gradient, noise, gradient.transpose(Image.FLIP_LEFT_RIGHT)])
+    # opened with whichever image backend is configured
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=95)
+    return get_image_backend().open(buffer.getvalue())
+
+
+def _process(image, variants, repeat: int) -> tuple:
+    # returns the average time in ms, and how many files were stored.
+    total_time = 0
+    file_count = 0
+    for _ in range(0, repeat):
+        fs = socialserver.util.image.fs_images = MemoryFS()
+        start_time = perf_counter()
+        generate_variants(image, "benchmark", variants)
+        total_time += perf_counter() - start_time
+        file_count = len(list(fs.walk.files()))
+    return total_time / repeat * 1000, file_count
+
+
+def run_benchmark(width: int, height: int, repeat: int) -> dict:
+    image = _generate_image(width, height)
+    before_ms, before_files = _process(image, tuple(IMAGE_VARIANTS.values()), repeat)
+
+    purposes = {}
+    for purpose in ImageUploadPurposes:
+        after_ms, after_files = _process(image, variants_for_purpose(purpose), repeat)
+        purposes[purpose.value] = {
+            "variants": [variant.image_type.value for variant in variants_for_purpose(purpose)],
+            "after_ms": round(after_ms, 2),
+            "after_files": after_files,
+            "speedup": round(before_ms / after_ms, 2),
+        }
+    return {
+        "image_size": [width, height],
+        "repeat": repeat,
+        "before_ms": round(before_ms, 2),
+        "before_files": before_files,
+        "purposes": purposes,
+    }
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    print(json.dumps(run_benchmark(args.width, args.height, args.repeat), indent=2))
@@ -0,0 +1,96 @@
+#  Copyright (c) Niall Asher 2022
+
+# compares flask-restful's default json encoder with the serializers in
+# socialserver.util.api.json_representation, on real feed payloads: pages
+# of the newest posts in the configured database, formatted the same way
+# as /api/v3/posts/feed, from the point of view of random users.
+#
+# the database needs some posts in it, i.e. from
+#   python -m socialserver.benchmarks.load_test seed --users 2000
+# then run with
+#   python -m socialserver.benchmarks.json_serialization --pages 50
+
+import json
+from argparse import ArgumentParser
+from random import Random
+from time import perf_counter
+from pony.orm import db_session, select, desc
+from socialserver.constants import MAX_FEED_GET_COUNT
+from socialserver.db import db, bind_database
+from socialserver.util.api.json_representation import dumps_stdlib, dumps_orjson, orjson, _default
+from socialserver.util.api.v3.feed import format_feed_posts_v3
+
+
+@db_session
+def build_feed_payloads(pages: int, page_size: int, seed: int = 0) -> list:
+    rng = Random(seed)
+    user_ids = select(u.id for u in db.User)[:]
+    posts = select(p for p in db.Post).order_by(lambda p: desc(p.creation_time))[:pages * page_size]
+    if len(posts) == 0:
+        raise SystemExit("There aren't any posts in the database. Seed it first (see above).")
+
+    payloads = []
+    for start in range(0, len(posts), page_size):
+        viewer = db.User[rng.choice(user_ids)]
+        payloads.append({
+            "meta": {"reached_end": False, "next_cursor": None},
+            "posts": format_feed_posts_v3(posts[start:start + page_size], viewer),
+        })
+    return payloads
+
+
+def _flask_restful_default(data) -> bytes:
+    # flask_restful.representations.json.output_json, plus the datetime
+    # formatting the payloads did themselves before.
+    return (json.dumps(data, default=_default) + "\n").encode()
+
+
+def run_benchmark(payloads: list, repeat: int) -> dict:
+    serializers = {
+        "flask_restful_default": _flask_restful_default,
+        "stdlib": dumps_stdlib,
+    }
+    if orjson is not None:
+        serializers["orjson"] = dumps_orjson
+
+    results = {}
+    for name, serializer in serializers.items():
+        start_time = perf_counter()
+        for _ in range(0, repeat):
+            for payload in payloads:
+                serializer(payload)
+        seconds = perf_counter() - start_time
+        count = repeat * len(payloads)
+        results[name] = {
+            "payloads_per_second": round(count / seconds),
+            "microseconds_per_payload": round(seconds / count * 1_000_000, 2),
+            "bytes_per_payload": round(sum(len(serializer(payload)) for payload in payloads) / len(payloads)),
+        }
+
+    baseline = results["flask_restful_default"]["microseconds_per_payload"]
+    for result in results.values():
+        result["speedup"] = round(baseline / result["microseconds_per_payload"], 2)
+
+    return {
+        "pages": len(payloads),
+        "repeat": repeat,
+        # orjson writes it compactly, so only the parsed json matches.
+        "same_json": orjson is None or all(
+            json.loads(dumps_orjson(p)) == json.loads(dumps_stdlib(p)) for p in payloads
+        ),
+        "stdlib_matches_flask_restful": all(dumps_stdlib(p) == _flask_restful_default(p) for p in payloads),
+        "serializers": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--page-size", type=int, default=MAX_FEED_GET_COUNT)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    bind_database()
+    feed_payloads = build_feed_payloads(args.pages, args.page_size, args.seed)
+    print(json.dumps(run_benchmark(feed_payloads, args.repeat), indent=2))
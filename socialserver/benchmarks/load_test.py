@@ -0,0 +1,355 @@
+#  Copyright (c) Niall Asher 2022
+
+# end to end load test. seeds a synthetic social graph into the configured
+# database, then drives the main endpoints with concurrent clients, and
+# reports latency percentiles and throughput as JSON, so runs can be
+# compared across commits.
+#
+# point $SOCIALSERVER_ROOT at a scratch directory first; seeding writes to
+# whichever database (sqlite or postgres) the config there points at.
+# every client connects from the same address, so turn rate limiting off
+# in that config ([rate_limit] enabled = false), or the results will mostly
+# be 429s.
+#
+#   python -m socialserver.benchmarks.load_test seed --users 2000
+#   python -m socialserver.benchmarks.load_test run --concurrency 16 --duration 30 --output run.json
+#
+# (the server logs to stdout, so use --output rather than redirecting it.)
+#
+# run starts its own server in a separate process (werkzeug, threaded),
+# unless it's given the address of one with --server, i.e. gunicorn running
+# against the same root.
+
+import json
+import subprocess
+import sys
+from argparse import ArgumentParser
+from datetime import datetime
+from itertools import accumulate
+from random import Random
+from threading import Thread, Event
+from time import perf_counter, sleep
+import requests
+from socialserver.constants import ROOT_DIR, CommentFeedSortTypes, FollowListSortTypes, ImageTypes
+from socialserver.util.config import config, FILE_ROOT
+
+MANIFEST_PATH = f"{FILE_ROOT}/load_test_dataset.json"
+SEED_USERNAME_PREFIX = "loadtest_"
+
+"""
+    seed_dataset
+
+    fills the database with a synthetic graph (see socialserver admin
+    seed), and writes a manifest describing it for run_load_test.
+"""
+
+
+def seed_dataset(users: int, follows_per_user: float, posts_per_user: float, likes_per_post: float,
+                 comments_per_post: float, blocks_per_user: float, images: int, seed: int) -> dict:
+    from socialserver.cli.admin.seed import seed_database
+    from socialserver.db import bind_database
+
+    bind_database()
+    try:
+        manifest = seed_database(
+            users, follows_per_user=follows_per_user, posts_per_user=posts_per_user,
+            likes_per_post=likes_per_post, comments_per_post=comments_per_post,
+            blocks_per_user=blocks_per_user, images=images, username_prefix=SEED_USERNAME_PREFIX, seed=seed,
+        )
+    except ValueError:
+        raise SystemExit("This database has already been seeded. Use a fresh $SOCIALSERVER_ROOT.")
+
+    with open(MANIFEST_PATH, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    return manifest
+
+
+"""
+    Scenarios
+
+    each takes a requests session, the client's state, and an rng, and
+    makes a single request. weights are relative; scenarios are picked at
+    random by weight, by each client, for every request.
+"""
+
+
+def _auth(client):
+    return {"Authorization": f"Bearer {client['token']}"}
+
+
+def _random_post_id(client, rng):
+    low, high = client["manifest"]["post_id_range"]
+    return rng.randint(low, high)
+
+
+def _random_username(client, rng):
+    manifest = client["manifest"]
+    return f"{manifest['username_prefix']}{rng.randrange(manifest['counts']['users'])}"
+
+
+def scenario_feed(session, client, rng):
+    return session.get(f"{client['server']}/api/v3/posts/feed",
+                       json={"count": 20, "offset": 0}, headers=_auth(client))
+
+
+def scenario_post(session, client, rng):
+    return session.get(f"{client['server']}/api/v3/posts/single",
+                       json={"post_id": _random_post_id(client, rng)}, headers=_auth(client))
+
+
+def scenario_comment_feed(session, client, rng):
+    return session.get(f"{client['server']}/api/v3/comments/feed",
+                       json={"post_id": _random_post_id(client, rng), "count": 20, "offset": 0,
+                             "sort": CommentFeedSortTypes.CREATION_TIME_DESCENDING.value},
+                       headers=_auth(client))
+
+
+def scenario_follow_list(session, client, rng):
+    return session.get(f"{client['server']}/api/v3/user/followers",
+                       json={"username": _random_username(client, rng), "count": 20, "offset": 0,
+                             "sort_type": FollowListSortTypes.AGE_DESCENDING.value},
+                       headers=_auth(client))
+
+
+def scenario_create_post(session, client, rng):
+    return session.post(f"{client['server']}/api/v3/posts/single",
+                        json={"text_content": f"load test post #loadtest{rng.randrange(10)}"},
+                        headers=_auth(client))
+
+
+def scenario_session(session, client, rng):
+    return session.post(f"{client['server']}/api/v3/user/session",
+                        json={"username": _random_username(client, rng),
+                              "password": client["manifest"]["password"]})
+
+
+def scenario_image(session, client, rng):
+    identifier = rng.choice(client["manifest"]["image_identifiers"])
+    return session.get(f"{client['server']}/api/v3/image/{identifier}",
+                       json={"wanted_type": ImageTypes.POST_PREVIEW.value, "pixel_ratio": 2},
+                       headers=_auth(client))
+
+
+SCENARIOS = {
+    "feed": (scenario_feed, 30),
+    "post": (scenario_post, 20),
+    "comment_feed": (scenario_comment_feed, 15),
+    "follow_list": (scenario_follow_list, 10),
+    "image": (scenario_image, 18),
+    "create_post": (scenario_create_post, 5),
+    "session": (scenario_session, 2),
+}
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    # nearest rank
+    if len(sorted_values) == 0:
+        return 0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarise(latencies: list, errors: int, status_codes: dict, duration: float) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "status_codes": status_codes,
+        "throughput_rps": round(len(latencies) / duration, 2),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50) * 1000, 3),
+            "p95": round(percentile(latencies, 0.95) * 1000, 3),
+            "p99": round(percentile(latencies, 0.99) * 1000, 3),
+            "mean": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0,
+            "max": round(latencies[-1] * 1000, 3) if latencies else 0,
+        },
+    }
+
+
+def _client_thread(client_number: int, server: str, manifest: dict, scenario_names: list,
+                   seed: int, recording: Event, stop: Event, results: dict):
+    rng = Random(seed + client_number)
+    session = requests.Session()
+    client = {"server": server, "manifest": manifest}
+
+    login = session.post(f"{server}/api/v3/user/session",
+                         json={"username": _random_username(client, rng), "password": manifest["password"]})
+    login.raise_for_status()
+    client["token"] = login.json()["access_token"]
+
+    weights = list(accumulate(SCENARIOS[name][1] for name in scenario_names))
+    while not stop.is_set():
+        name = rng.choices(scenario_names, cum_weights=weights)[0]
+        start_time = perf_counter()
+        try:
+            response = SCENARIOS[name][0](session, client, rng)
+            status = str(response.status_code)
+            failed = response.status_code >= 400
+        except requests.RequestException:
+            status = "exception"
+            failed = True
+        latency = perf_counter() - start_time
+
+        if recording.is_set():
+            result = results[name]
+            result["latencies"].append(latency)
+            result["status_codes"][status] = result["status_codes"].get(status, 0) + 1
+            if failed:
+                result["errors"] += 1
+
+
+def _wait_for_server(server: str, timeout: float = 30) -> None:
+    deadline = perf_counter() + timeout
+    while perf_counter() < deadline:
+        try:
+            requests.get(f"{server}/api/v3/server/info", timeout=1)
+            return
+        except requests.RequestException:
+            sleep(0.2)
+    raise SystemExit(f"The server at {server} didn't come up.")
+
+
+def _current_commit() -> str or None:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+"""
+    run_load_test
+
+    drives the server with concurrency clients for duration seconds, after
+    a warmup that isn't recorded, and returns the results.
+"""
+
+
+def run_load_test(server: str, concurrency: int, duration: float, warmup: float,
+                  scenario_names: list, seed: int) -> dict:
+    with open(MANIFEST_PATH, "r") as manifest_file:
+        manifest = json.load(manifest_file)
+    if manifest["counts"]["images"] == 0 and "image" in scenario_names:
+        scenario_names = [name for name in scenario_names if name != "image"]
+
+    results = {name: {"latencies": [], "errors": 0, "status_codes": {}} for name in scenario_names}
+    recording = Event()
+    stop = Event()
+    clients = [
+        Thread(target=_client_thread, daemon=True,
+               args=(i, server, manifest, scenario_names, seed, recording, stop, results))
+        for i in range(concurrency)
+    ]
+    for client in clients:
+        client.start()
+
+    sleep(warmup)
+    recording.set()
+    sleep(duration)
+    recording.clear()
+    stop.set()
+    for client in clients:
+        client.join()
+
+    all_latencies = [latency for result in results.values() for latency in result["latencies"]]
+    all_status_codes = {}
+    for result in results.values():
+        for status, count in result["status_codes"].items():
+            all_status_codes[status] = all_status_codes.get(status, 0) + count
+
+    return {
+        "meta": {
+            "commit": _current_commit(),
+            "started_at": datetime.utcnow().isoformat() + "Z",
+            "server": server,
+            "database": config.database.connector,
+            "concurrency": concurrency,
+            "duration_seconds": duration,
+            "warmup_seconds": warmup,
+            "seed": seed,
+            "dataset": manifest["counts"],
+        },
+        "scenarios": {
+            name: summarise(result["latencies"], result["errors"], result["status_codes"], duration)
+            for name, result in results.items()
+        },
+        "total": summarise(
+            all_latencies, sum(result["errors"] for result in results.values()), all_status_codes, duration
+        ),
+    }
+
+
+def serve(port: int) -> None:
+    from werkzeug.serving import make_server
+    from socialserver import application
+
+    make_server("127.0.0.1", port, application, threaded=True).serve_forever()
+
+
+def main():
+    parser = ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = subparsers.add_parser("seed")
+    seed_parser.add_argument("--users", type=int, default=1000)
+    seed_parser.add_argument("--follows-per-user", type=float, default=20)
+    seed_parser.add_argument("--posts-per-user", type=float, default=5)
+    seed_parser.add_argument("--likes-per-post", type=float, default=5)
+    seed_parser.add_argument("--comments-per-post", type=float, default=2)
+    seed_parser.add_argument("--blocks-per-user", type=float, default=0.1)
+    seed_parser.add_argument("--images", type=int, default=20)
+    seed_parser.add_argument("--seed", type=int, default=0)
+
+    run_parser = subparsers.add_parser("run")
+    run_parser.add_argument("--server", type=str, default=None,
+                            help="Address of a running server. One is started if not given.")
+    run_parser.add_argument("--port", type=int, default=9802,
+                            help="Port for the server started when --server isn't given.")
+    run_parser.add_argument("--concurrency", type=int, default=8)
+    run_parser.add_argument("--duration", type=float, default=30)
+    run_parser.add_argument("--warmup", type=float, default=3)
+    run_parser.add_argument("--scenario", action="append", choices=list(SCENARIOS.keys()),
+                            help="Only run this scenario. Can be given more than once.")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--output", type=str, default=None, help="Write the results here, not stdout.")
+
+    serve_parser = subparsers.add_parser("serve")
+    serve_parser.add_argument("--port", type=int, default=9802)
+
+    args = parser.parse_args()
+
+    if args.command == "seed":
+        manifest = seed_dataset(args.users, args.follows_per_user, args.posts_per_user, args.likes_per_post,
+                                args.comments_per_post, args.blocks_per_user, args.images, args.seed)
+        print(json.dumps({key: manifest[key] for key in ["counts", "seconds", "rows_per_second"]}, indent=2))
+    elif args.command == "serve":
+        serve(args.port)
+    elif args.command == "run":
+        server_process = None
+        server = args.server
+        if server is None:
+            server = f"http://127.0.0.1:{args.port}"
+            server_process = subprocess.Popen(
+                [sys.executable, "-m", "socialserver.benchmarks.load_test", "serve", "--port", str(args.port)],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+        try:
+            _wait_for_server(server)
+            results = run_load_test(server, args.concurrency, args.duration, args.warmup,
+                                    args.scenario or list(SCENARIOS.keys()), args.seed)
+        finally:
+            if server_process is not None:
+                server_process.terminate()
+                server_process.wait()
+
+        output = json.dumps(results, indent=2)
+        if args.output is not None:
+            with open(args.output, "w") as output_file:
+                output_file.write(output)
+        else:
+            print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#  Copyright (c) Niall Asher 2022
+
+# benchmarks the per request cost of rate limiting: a bare bucket update
+# in the shared table, and the whole before/after request hook pair
+# (ip + user buckets, and the headers) inside a request context.
+# run with python -m socialserver.benchmarks.rate_limit
+
+import json
+from argparse import ArgumentParser
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from flask import Flask, make_response
+from socialserver.util import rate_limit
+from socialserver.util.config import config
+from socialserver.util.rate_limit import (
+    SharedRateLimiter,
+    check_ip_rate_limit,
+    check_user_rate_limit,
+    add_rate_limit_headers,
+)
+
+
+def run_benchmark(iterations: int, key_count: int) -> dict:
+    with TemporaryDirectory() as temp_dir:
+        limiter = SharedRateLimiter(f"{temp_dir}/rate_limit.bin")
+        # the hooks use the module level limiter
+        rate_limit.rate_limiter = limiter
+
+        start_time = perf_counter()
+        for i in range(iterations):
+            limiter.take(f"ip:read:10.0.{i % key_count}.1", 1_000_000)
+        take_seconds = perf_counter() - start_time
+
+        # high enough that nothing's ever limited, so every
+        # iteration takes the same path as an allowed request.
+        config.rate_limit.read.per_ip_per_minute = 1_000_000_000
+        config.rate_limit.read.per_user_per_minute = 1_000_000_000
+
+        app = Flask(__name__)
+        app.add_url_rule("/bench", "postfeed", lambda: "")
+
+        with app.test_request_context("/bench", environ_base={"REMOTE_ADDR": "10.0.0.1"}):
+            response = make_response("")
+            start_time = perf_counter()
+            for i in range(iterations):
+                check_ip_rate_limit()
+                check_user_rate_limit(i % key_count)
+                add_rate_limit_headers(response)
+            hook_seconds = perf_counter() - start_time
+
+    return {
+        "iterations": iterations,
+        "key_count": key_count,
+        "take_us": round(take_seconds / iterations * 1_000_000, 3),
+        "request_overhead_us": round(hook_seconds / iterations * 1_000_000, 3),
+    }
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200_000)
+    parser.add_argument("--keys", type=int, default=10_000)
+    args = parser.parse_args()
+    print(json.dumps(run_benchmark(args.iterations, args.keys), indent=2))
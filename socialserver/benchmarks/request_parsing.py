@@ -0,0 +1,137 @@
+#  Copyright (c) Niall Asher 2022
+
+# benchmarks the per request cost of reading and validating arguments,
+# for every v3 and legacy resource that takes any: before, constructing
+# all of a resource's reqparse parsers (as its __init__ did, for every
+# request) and parsing with one, against the RequestArgs models now.
+# each request gets a valid json body for the method's arguments.
+# run with python -m socialserver.benchmarks.request_parsing
+
+import inspect
+import json
+import pkgutil
+from importlib import import_module
+from argparse import ArgumentParser
+from time import perf_counter
+from flask import Flask
+from flask_restful import Resource, reqparse
+from pydantic.fields import SHAPE_LIST
+import socialserver.api
+from socialserver.util.api.request_args import parse_request_args
+
+METHODS = ["get", "post", "patch", "put", "delete"]
+
+SAMPLE_VALUES = {
+    str: "value",
+    int: 1,
+    float: 1.5,
+    bool: True,
+    dict: {"type": "image", "identifier": "value"},
+}
+
+
+def _method_models(resource) -> dict:
+    models = {}
+    for method in METHODS:
+        handler = getattr(resource, method, None)
+        if handler is None:
+            continue
+        handler = inspect.unwrap(handler, stop=lambda f: hasattr(f, "request_args_model"))
+        if hasattr(handler, "request_args_model"):
+            models[method] = handler.request_args_model
+    return models
+
+
+def _reqparse_parser(model) -> reqparse.RequestParser:
+    parser = reqparse.RequestParser()
+    for name, field in model.__fields__.items():
+        parser.add_argument(
+            name, type=field.type_, required=field.required, help=field.field_info.description,
+            action="append" if field.shape == SHAPE_LIST else "store",
+            default=None if field.required else field.default,
+        )
+    return parser
+
+
+def _sample_body(model) -> dict:
+    body = {}
+    for name, field in model.__fields__.items():
+        value = SAMPLE_VALUES[field.type_]
+        body[name] = [value] if field.shape == SHAPE_LIST else value
+    return body
+
+
+def _time(application, method: str, body: dict, iterations: int, parse) -> float:
+    total = 0
+    for _ in range(0, iterations):
+        # a new context every time, so nothing's cached on the request
+        with application.test_request_context(method=method.upper(), json=body):
+            start_time = perf_counter()
+            parse()
+            total += perf_counter() - start_time
+    return total / iterations * 1_000_000
+
+
+def _resources() -> set:
+    # every resource in socialserver.api, whether or not it's enabled
+    resources = set()
+    for module_info in pkgutil.walk_packages(socialserver.api.__path__, "socialserver.api."):
+        module = import_module(module_info.name)
+        resources.update(
+            value for value in vars(module).values()
+            if inspect.isclass(value) and issubclass(value, Resource) and value is not Resource
+            and value.__module__ == module.__name__
+        )
+    return resources
+
+
+def run_benchmark(iterations: int) -> dict:
+    application = Flask(__name__)
+
+    resources = _resources()
+
+    results = {}
+    totals = {"v3": [0, 0], "legacy": [0, 0]}
+    for resource in sorted(resources, key=lambda r: r.__name__):
+        models = _method_models(resource)
+        interface = "legacy" if ".legacy." in resource.__module__ else "v3"
+        for method, model in models.items():
+            def before():
+                # __init__ built every method's parser, whichever was used
+                parsers = {m: _reqparse_parser(mdl) for m, mdl in models.items()}
+                parsers[method].parse_args()
+
+            def after():
+                parse_request_args(model)
+
+            body = _sample_body(model)
+            before_us = _time(application, method, body, iterations, before)
+            after_us = _time(application, method, body, iterations, after)
+            results[f"{resource.__name__}.{method}"] = {
+                "arguments": len(model.__fields__),
+                "parsers_built_before": len(models),
+                "before_us": round(before_us, 2),
+                "after_us": round(after_us, 2),
+                "speedup": round(before_us / after_us, 2),
+            }
+            totals[interface][0] += before_us
+            totals[interface][1] += after_us
+
+    return {
+        "iterations": iterations,
+        "totals": {
+            interface: {
+                "before_us": round(before_us, 2),
+                "after_us": round(after_us, 2),
+                "speedup": round(before_us / after_us, 2) if after_us else None,
+            } for interface, (before_us, after_us) in totals.items()
+        },
+        "endpoints": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+    print(json.dumps(run_benchmark(args.iterations), indent=2))
@@ -0,0 +1,102 @@
+#  Copyright (c) Niall Asher 2022
+
+# measures how long the server and the cli take to start, each in a
+# fresh interpreter, with python -X importtime. reports the slowest
+# imports, and whether any of the heavy libraries that should only be
+# loaded on first use (pillow, libmagic etc.) were imported anyway.
+# exits with a non-zero status if a target is over its budget, or
+# one of those was imported, so it can be used as a check.
+# create_app binds the configured database, so point $SOCIALSERVER_ROOT
+# somewhere disposable.
+# run with python -m socialserver.benchmarks.startup
+
+import json
+import re
+import subprocess
+import sys
+from argparse import ArgumentParser
+from statistics import median
+
+# python code run for each target, and the default budget for it, in ms.
+# create_app is measured after its imports, so it's only the setup itself.
+TARGETS = {
+    "cli": ("import socialserver.cli.cli", 150),
+    "app_import": ("import socialserver.app", 750),
+    "create_app": (
+        "import socialserver.app\n"
+        "from time import perf_counter\n"
+        "start_time = perf_counter()\n"
+        "socialserver.app.create_app()\n"
+        "print(f'create_app_ms={(perf_counter() - start_time) * 1000}')",
+        500,
+    ),
+}
+
+# these should only be imported by the code paths that use them.
+LAZY_MODULES = ["PIL", "pyvips", "magic", "ffmpeg", "blurhash", "user_agents", "fs.osfs", "fs_s3fs"]
+
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+def _run_target(code: str) -> dict:
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, check=True,
+    )
+    imports = {}
+    total_us = 0
+    for line in process.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match is None:
+            continue
+        self_us, cumulative_us, indent, module = match.groups()
+        imports[module] = int(self_us)
+        # top level imports aren't indented
+        if indent == "":
+            total_us += int(cumulative_us)
+
+    result = {"import_ms": total_us / 1000, "imports": imports}
+    create_app_time = re.search(r"create_app_ms=([\d.]+)", process.stdout)
+    if create_app_time is not None:
+        result["create_app_ms"] = float(create_app_time.group(1))
+    return result
+
+
+def run_benchmark(runs: int, budgets: dict, top_count: int = 10) -> dict:
+    results = {}
+    for name, (code, _) in TARGETS.items():
+        target_runs = [_run_target(code) for _ in range(0, runs)]
+        timing_key = "create_app_ms" if name == "create_app" else "import_ms"
+        median_ms = median(run[timing_key] for run in target_runs)
+        # self times from the last run; the order barely changes between runs
+        imports = target_runs[-1]["imports"]
+        slowest = sorted(imports.items(), key=lambda item: item[1], reverse=True)[:top_count]
+        loaded_lazy_modules = [
+            module for module in LAZY_MODULES
+            if module in imports or any(m.startswith(f"{module}.") for m in imports)
+        ]
+        results[name] = {
+            "median_ms": round(median_ms, 2),
+            "budget_ms": budgets[name],
+            "within_budget": median_ms <= budgets[name] and not loaded_lazy_modules,
+            "modules_imported": len(imports),
+            "lazy_modules_imported": loaded_lazy_modules,
+            "slowest_imports_ms": {module: round(us / 1000, 2) for module, us in slowest},
+        }
+    return {"runs": runs, "targets": results}
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    for target, (_, default_budget) in TARGETS.items():
+        parser.add_argument(f"--{target.replace('_', '-')}-budget", type=float, default=default_budget,
+                            help=f"Budget for {target}, in ms. Default is {default_budget}.")
+    args = parser.parse_args()
+
+    target_budgets = {target: getattr(args, f"{target}_budget") for target in TARGETS}
+    report = run_benchmark(args.runs, target_budgets, args.top)
+    print(json.dumps(report, indent=2))
+    if not all(target["within_budget"] for target in report["targets"].values()):
+        sys.exit(1)
@@ -0,0 +1,80 @@
+#  Copyright (c) Niall Asher 2022
+
+# benchmarks the trending hashtag counter against a synthetic stream
+# of tags with a zipf-like distribution (a few tags are very popular,
+# most are used once or twice), and checks how much memory it holds onto.
+# run with python -m socialserver.benchmarks.trending_hashtags
+
+import json
+import random
+import tracemalloc
+from argparse import ArgumentParser
+from collections import Counter
+from itertools import accumulate
+from time import perf_counter
+from socialserver.constants import (
+    TRENDING_HASHTAG_WINDOW_SECONDS,
+    TRENDING_HASHTAG_BUCKET_COUNT,
+    TRENDING_HASHTAG_CAPACITY,
+)
+from socialserver.util.trending import TrendingCounter
+
+
+def _generate_tags(tag_count: int, vocabulary_size: int, seed: int) -> list:
+    rng = random.Random(seed)
+    cumulative_weights = list(accumulate(1 / (rank + 1) for rank in range(vocabulary_size)))
+    ranks = rng.choices(range(vocabulary_size), cum_weights=cumulative_weights, k=tag_count)
+    return [f"tag{rank}" for rank in ranks]
+
+
+def run_benchmark(tag_count: int, vocabulary_size: int, top_count: int = 10, seed: int = 0) -> dict:
+    tags = _generate_tags(tag_count, vocabulary_size, seed)
+
+    # spread the stream evenly over the trending window,
+    # so every bucket gets used.
+    fake_time = [0.0]
+    time_step = TRENDING_HASHTAG_WINDOW_SECONDS / tag_count
+
+    counter = TrendingCounter(
+        window_seconds=TRENDING_HASHTAG_WINDOW_SECONDS,
+        bucket_count=TRENDING_HASHTAG_BUCKET_COUNT,
+        capacity=TRENDING_HASHTAG_CAPACITY,
+        refresh_seconds=0,
+        clock=lambda: fake_time[0],
+    )
+
+    tracemalloc.start()
+    start_time = perf_counter()
+    for tag in tags:
+        counter.record((tag,))
+        fake_time[0] += time_step
+    ingest_seconds = perf_counter() - start_time
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start_time = perf_counter()
+    approximate_top = counter.top(top_count)
+    top_seconds = perf_counter() - start_time
+
+    exact_top = Counter(tags).most_common(top_count)
+    overlap = len({t for t, _ in approximate_top} & {t for t, _ in exact_top})
+
+    return {
+        "tag_count": tag_count,
+        "vocabulary_size": vocabulary_size,
+        "ingest_seconds": round(ingest_seconds, 3),
+        "tags_per_second": round(tag_count / ingest_seconds),
+        # peak memory used while ingesting, not counting the generated tags.
+        "peak_memory_bytes": peak_memory,
+        "top_rebuild_ms": round(top_seconds * 1000, 3),
+        "top_overlap_with_exact": f"{overlap}/{top_count}",
+    }
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--tags", type=int, default=2_000_000)
+    parser.add_argument("--vocabulary", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(json.dumps(run_benchmark(args.tags, args.vocabulary, seed=args.seed), indent=2))
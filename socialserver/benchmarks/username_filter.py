@@ -0,0 +1,49 @@
+#  Copyright (c) Niall Asher 2022
+
+# benchmarks building the username bloom filter, as done at startup,
+# and checks its size, lookup time and false positive rate.
+# the database scan isn't included; it's a plain keyset walk over
+# the user table's primary key.
+# run with python -m socialserver.benchmarks.username_filter
+
+import json
+from argparse import ArgumentParser
+from time import perf_counter
+from socialserver.constants import USERNAME_FILTER_ERROR_RATE
+from socialserver.util.bloom import BloomFilter
+
+
+def run_benchmark(user_count: int, lookup_count: int = 100_000) -> dict:
+    # same headroom as UsernameFilter.build
+    bloom_filter = BloomFilter(user_count * 2, USERNAME_FILTER_ERROR_RATE)
+
+    start_time = perf_counter()
+    for i in range(0, user_count):
+        bloom_filter.add(f"user_{i}")
+    build_seconds = perf_counter() - start_time
+
+    # none of these were added, so every hit is a false positive.
+    start_time = perf_counter()
+    false_positives = 0
+    for i in range(0, lookup_count):
+        if f"free_{i}" in bloom_filter:
+            false_positives += 1
+    lookup_seconds = perf_counter() - start_time
+
+    return {
+        "user_count": user_count,
+        "build_seconds": round(build_seconds, 3),
+        "users_per_second": round(user_count / build_seconds),
+        "filter_size_bytes": bloom_filter.size_bytes,
+        "hash_count": bloom_filter.hash_count,
+        "lookup_us": round(lookup_seconds / lookup_count * 1_000_000, 3),
+        "false_positive_rate": round(false_positives / lookup_count, 5),
+    }
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--users", type=int, default=10_000_000)
+    parser.add_argument("--lookups", type=int, default=100_000)
+    args = parser.parse_args()
+    print(json.dumps(run_benchmark(args.users, args.lookups), indent=2))
@@ -98,7 +98,7 @@ def create_user_account():
         password_salt = salt,
         creation_time = datetime.utcnow(),
         is_legacy_account=False,
-        account_attributes = [AccountAttributes.ADMIN.value] if user_should_be_admin else [],
+        attribute_flags = 1 << AccountAttributes.ADMIN.value if user_should_be_admin else 0,
         bio="",
         recent_failed_login_count=0,
         account_approved=True
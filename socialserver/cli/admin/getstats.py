@@ -1,108 +1,98 @@
 #  Copyright (c) Niall Asher 2022
-from socialserver.constants import AccountAttributes, SERVER_VERSION
+from socialserver.constants import SERVER_VERSION
 from socialserver.db import db
+from socialserver.util.statistics import get_statistics, recount_statistics
 from pony import orm
 from datetime import datetime
 from rich import print
 
 
-def get_data():
-    users = orm.select(u for u in db.User)
-    admins = orm.select(u for u in db.User if AccountAttributes.ADMIN.value in u.account_attributes)
-    mods = orm.select(u for u in db.User if AccountAttributes.MODERATOR.value in u.account_attributes)
-    verified_users = orm.select(u for u in db.User if AccountAttributes.VERIFIED.value in u.account_attributes)
-    unapproved_users = orm.select(u for u in db.User if u.account_approved is False)
-    enabled_totp_objects = orm.select(t for t in db.Totp if t.confirmed is True)
-    blocks = orm.select(b for b in db.Block)
-    sessions = orm.select(s for s in db.UserSession)
-    posts = orm.select(p for p in db.Post)
-    posts_under_moderation = orm.select(p for p in db.Post if p.under_moderation is True)
-    post_reports_open = orm.select(r for r in db.PostReport if r.active is True)
-    post_reports_closed = orm.select(r for r in db.PostReport if r.active is False)
-    post_hashtags = orm.select(h for h in db.Hashtag)
-    comments = orm.select(c for c in db.Comment)
-    images = orm.select(i for i in db.Image)
-    videos = orm.select(v for v in db.Video)
+def get_data(recount=False):
+    if recount:
+        with orm.db_session:
+            recount_statistics(db)
+    # always fresh here; the cache is for the api.
+    stats = get_statistics(db, max_age=0)
 
     results = {
         "Users": [
             {
                 "field_name": "User count",
-                "value": users.count()
+                "value": stats["users"]["total"]
             },
             {
                 "field_name": "User(s) with admin attribute",
-                "value": admins.count()
+                "value": stats["users"]["admins"]
             },
             {
                 "field_name": "User(s) with moderator attribute",
-                "value": mods.count()
+                "value": stats["users"]["moderators"]
             },
             {
                 "field_name": "User(s) with verified attribute",
-                "value": verified_users.count()
+                "value": stats["users"]["verified"]
             },
             {
                 "field_name": "User(s) with active TOTP 2FA",
-                "value": enabled_totp_objects.count()
+                "value": stats["users"]["totp_enabled"]
             },
             {
                 "field_name": "Unapproved user(s)",
-                "value": unapproved_users.count()
+                "value": stats["users"]["unapproved"]
             },
             {
                 "field_name": "Block records",
-                "value": blocks.count()
+                "value": stats["users"]["blocks"]
             },
             {
                 "field_name": "User session count",
-                "value": sessions.count()
+                "value": stats["users"]["sessions"]
             }
         ],
         "Posts": [
             {
                 "field_name": "Post count (incl. under moderation)",
-                "value": posts.count()
+                "value": stats["posts"]["total"]
             },
             {
                 "field_name": "Post(s) under moderation",
-                "value": posts_under_moderation.count()
+                "value": stats["posts"]["under_moderation"]
             },
             {
                 "field_name": "Post report count (active)",
-                "value": post_reports_open.count()
+                "value": stats["posts"]["reports_active"]
             },
             {
                 "field_name": "Post report count (inactive)",
-                "value": post_reports_closed.count()
+                "value": stats["posts"]["reports_inactive"]
             },
             {
                 "field_name": "Unique hashtag count",
-                "value": post_hashtags.count()
+                "value": stats["posts"]["hashtags"]
             }
         ],
         "Comments": [
             {
                 "field_name": "Comment count",
-                "value": comments.count()
+                "value": stats["comments"]["total"]
             }
         ],
         "Media": [
             {
                 "field_name": "Image count",
-                "value": images.count()
+                "value": stats["media"]["images"]
             },
             {
                 "field_name": "Video count",
-                "value": videos.count()
+                "value": stats["media"]["videos"]
             }
         ]
     }
     return results
 
 
-def print_server_statistics():
-    results = get_data()
+def print_server_statistics(recount=False):
+    results = get_data(recount)
     print("\n\n")
     print("Statistics Report")
     print(f"Server version {SERVER_VERSION}")
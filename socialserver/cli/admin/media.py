@@ -0,0 +1,187 @@
+#  Copyright (c) Niall Asher 2022
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from time import perf_counter, process_time, sleep
+from typing import Optional
+from pony.orm import db_session, select
+from rich import print
+from socialserver.constants import ImageUploadPurposes
+from socialserver.db import db
+from socialserver.util.config import config, FILE_ROOT
+from socialserver.util.filesystem import fs_images, fs_videos, migrate_storage_layout
+from socialserver.util.image import regenerate_image_variants, stored_image_purposes
+from socialserver.util.image_variants import variants_for_purpose
+from socialserver.util.output import console
+
+DEFAULT_REGENERATE_CHECKPOINT_PATH = f"{FILE_ROOT}/media_regenerate_checkpoint.json"
+
+"""
+    throttle_delay
+
+    How long to sleep for, to bring cpu_seconds used over wall_seconds
+    down to the given share (from 0 to 1) of cpus cores.
+"""
+
+
+def throttle_delay(cpu_seconds: float, wall_seconds: float, budget: float, cpus: int) -> float:
+    # how long it should have taken, to stay within the budget
+    wanted_seconds = cpu_seconds / (budget * cpus)
+    return max(wanted_seconds - wall_seconds, 0)
+
+
+class _CpuThrottle:
+    def __init__(self, budget: float):
+        self.budget = budget
+        self.cpus = os.cpu_count() or 1
+        self._lock = Lock()
+        # process_time counts every thread in the process, so it's
+        # everything the workers have used between them.
+        self._started_at = perf_counter()
+        self._cpu_started_at = process_time()
+
+    def throttle(self) -> None:
+        with self._lock:
+            delay = throttle_delay(process_time() - self._cpu_started_at,
+                                   perf_counter() - self._started_at, self.budget, self.cpus)
+        if delay > 0:
+            sleep(delay)
+
+
+def _read_checkpoint(path: str) -> Optional[dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path) as checkpoint_file:
+        return json.load(checkpoint_file)
+
+
+def _write_checkpoint(path: str, checkpoint: dict) -> None:
+    # written to the side, then moved over the old one, so it's never
+    # left half written if this is killed.
+    with open(path + ".tmp", "w") as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+    os.replace(path + ".tmp", path)
+
+
+# what _regenerate can return, other than None, for an image that's done.
+# they're counted in the checkpoint under the same names.
+_MISSING_ORIGINAL = "missing_original"
+_FAILED = "failed"
+
+
+def _regenerate(image_hash: str, purposes: set, overwrite: bool, throttle: _CpuThrottle) -> Optional[str]:
+    try:
+        variants = {}
+        for purpose in purposes | set(stored_image_purposes(image_hash)):
+            for variant in variants_for_purpose(purpose):
+                variants[variant.image_type] = variant
+        if len(variants) > 0 and not regenerate_image_variants(image_hash, list(variants.values()), overwrite):
+            return _MISSING_ORIGINAL
+        return None
+    except Exception as e:
+        # i.e. a corrupt original. one image shouldn't stop the rest.
+        console.log(f"[bold red]Couldn't regenerate image {image_hash}: {e}")
+        return _FAILED
+    finally:
+        throttle.throttle()
+
+
+"""
+    regenerate_media
+
+    Makes the variants every processed image is missing, i.e. after
+    sizes are added or formats enabled in the config, or remakes them
+    all, if overwrite is true. Images are walked in batches, by hash,
+    and done on a pool of worker threads, staying under the cpu budget.
+    The last hash done is saved to checkpoint_path after each batch, and
+    picked up from next time, unless restart is true; it's removed once
+    every image is done. images that can't be regenerated are counted
+    and skipped, rather than stopping the run.
+"""
+
+
+def regenerate_media(workers: int = 0, batch_size: int = 100, cpu_budget: Optional[float] = None,
+                     overwrite: bool = False, restart: bool = False,
+                     checkpoint_path: str = DEFAULT_REGENERATE_CHECKPOINT_PATH, progress=None) -> dict:
+    workers = workers or config.media.processing.workers or os.cpu_count() or 1
+    throttle = _CpuThrottle(cpu_budget or config.media.processing.regenerate_cpu_budget)
+    start_time = perf_counter()
+
+    checkpoint = None if restart else _read_checkpoint(checkpoint_path)
+    if checkpoint is None:
+        checkpoint = {"last_hash": "", "images": 0}
+    for status in [_MISSING_ORIGINAL, _FAILED]:
+        checkpoint.setdefault(status, 0)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            with db_session:
+                # duplicate uploads share their files, so this walks the
+                # stored images, rather than the Image entries.
+                image_hashes = select(
+                    image.sha256sum for image in db.Image
+                    if image.processed is True and image.sha256sum > checkpoint["last_hash"]
+                ).order_by(1)[:batch_size]
+                # what an image is used as needs its variants too, even
+                # if it wasn't uploaded for it.
+                avatar_hashes = set(select(
+                    image.sha256sum for image in db.Image
+                    if image.sha256sum in image_hashes and len(image.associated_profile_pics) > 0
+                ))
+                header_hashes = set(select(
+                    image.sha256sum for image in db.Image
+                    if image.sha256sum in image_hashes and len(image.associated_header_pics) > 0
+                ))
+            if len(image_hashes) == 0:
+                break
+
+            def _purposes(image_hash: str) -> set:
+                purposes = set()
+                if image_hash in avatar_hashes:
+                    purposes.add(ImageUploadPurposes.AVATAR)
+                if image_hash in header_hashes:
+                    purposes.add(ImageUploadPurposes.HEADER)
+                return purposes
+
+            results = list(pool.map(
+                lambda image_hash: _regenerate(image_hash, _purposes(image_hash), overwrite, throttle), image_hashes
+            ))
+            checkpoint["last_hash"] = image_hashes[-1]
+            checkpoint["images"] += len(image_hashes)
+            for status in [_MISSING_ORIGINAL, _FAILED]:
+                checkpoint[status] += results.count(status)
+            _write_checkpoint(checkpoint_path, checkpoint)
+            if progress is not None:
+                progress(checkpoint["images"], perf_counter() - start_time)
+
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return {
+        "images": checkpoint["images"],
+        "missing_original": checkpoint[_MISSING_ORIGINAL],
+        "failed": checkpoint[_FAILED],
+        "seconds": round(perf_counter() - start_time, 3),
+    }
+
+
+def print_regenerate_progress(images: int, seconds: float):
+    print(f"[bold]=> {images}[/bold] images done in {seconds:.2f}s")
+
+
+def regenerate_media_cli(**kwargs):
+    print("Regenerating image variants...")
+    results = regenerate_media(progress=print_regenerate_progress, **kwargs)
+    print(f"Done in {results['seconds']:.2f}s.")
+    for name, count in results.items():
+        if name != "seconds":
+            print(f"{name}: {count}")
+
+
+def migrate_layout_cli(layout: str):
+    for title, filesystem in [("images", fs_images), ("videos", fs_videos)]:
+        print(f"Moving stored {title} to the {layout} layout...")
+        print(f"{title}: {migrate_storage_layout(filesystem, layout)} moved")
+    if config.media.storage_layout != layout:
+        print(f"[bold]Set media.storage_layout to \"{layout}\" in the config before starting the server again.")
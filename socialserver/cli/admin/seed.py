@@ -0,0 +1,364 @@
+#  Copyright (c) Niall Asher 2022
+
+import re
+import sqlite3
+from datetime import datetime, timedelta
+from io import BytesIO
+from itertools import accumulate
+from random import Random
+from time import perf_counter
+from pony.orm import db_session, commit, select
+from rich import print
+from socialserver.constants import MediaJobLanes
+from socialserver.db import db
+from socialserver.util.auth import hash_password, generate_salt
+from socialserver.util.image import handle_upload
+from socialserver.util.media_jobs import media_jobs
+from socialserver.util.lazy_import import LazyModule
+
+Image = LazyModule("PIL.Image")
+
+# how many parameters a single insert statement can have. sqlite
+# before 3.32 was compiled with a limit of 999; postgres allows 65535.
+SEED_MAX_STATEMENT_PARAMETERS = 32766 if sqlite3.sqlite_version_info >= (3, 32, 0) else 999
+SEED_HASHTAG_POOL_SIZE = 1000
+SEED_SENTENCES = [
+    "Just got back from a long walk.",
+    "Does anybody know a good place to get coffee around here?",
+    "Finally finished that project I've been putting off for months.",
+    "The weather today is absolutely perfect.",
+    "Trying out a new recipe tonight, wish me luck.",
+    "Can't believe it's already the end of the week.",
+    "Reading a really good book at the moment.",
+    "Hot take: pineapple belongs on pizza.",
+    "Anybody else up this late?",
+    "New week, new goals.",
+]
+SEED_COMMENTS = ["Nice!", "Agreed.", "Haha, same here.", "Love this.", "Not sure about that one.", "Congrats!"]
+
+"""
+    _BulkInserter
+
+    Inserts rows into an entity's table with multi-row INSERT statements,
+    on a raw cursor, rather than creating pony objects. Pony's per object
+    bookkeeping is most of the cost of an insert otherwise, and a few
+    hundred rows per statement is far cheaper than a round trip for each.
+
+    Rows are given as values for the listed attributes, in order, already
+    converted to what the database expects (see _db_value). Inserters for
+    the rows these reference are passed as parents, and flushed first, so
+    foreign keys are always satisfied.
+"""
+
+
+class _BulkInserter:
+    def __init__(self, cursor, entity, attribute_names: list, parents: list = None):
+        self.cursor = cursor
+        self.parents = parents or []
+        self.count = 0
+        quote_name = db.provider.quote_name
+        columns = [quote_name(getattr(entity, name).columns[0]) for name in attribute_names]
+        placeholder = "?" if db.provider.paramstyle == "qmark" else "%s"
+
+        self._row_placeholders = "(" + ", ".join([placeholder] * len(columns)) + ")"
+        self._statement_start = f"INSERT INTO {quote_name(entity._table_)} ({', '.join(columns)}) VALUES "
+        self.rows_per_statement = max(1, SEED_MAX_STATEMENT_PARAMETERS // len(columns))
+        # the same statement's used for every full batch, so the driver
+        # only has to prepare it once.
+        self._full_statement = self._statement_start + ", ".join(
+            [self._row_placeholders] * self.rows_per_statement
+        )
+        self._pending = []
+        self._pending_rows = 0
+
+    def add(self, *values) -> None:
+        self._pending.extend(values)
+        self._pending_rows += 1
+        if self._pending_rows == self.rows_per_statement:
+            for parent in self.parents:
+                parent.flush()
+            self.cursor.execute(self._full_statement, self._pending)
+            self.count += self._pending_rows
+            self._pending = []
+            self._pending_rows = 0
+
+    def flush(self) -> None:
+        if self._pending_rows == 0:
+            return
+        for parent in self.parents:
+            parent.flush()
+        self.cursor.execute(
+            self._statement_start + ", ".join([self._row_placeholders] * self._pending_rows), self._pending
+        )
+        self.count += self._pending_rows
+        self._pending = []
+        self._pending_rows = 0
+
+
+def _db_value(entity, attribute_name: str, value):
+    return getattr(entity, attribute_name).converters[0].val2dbval(value)
+
+
+def _sqlite_datetime(value: datetime) -> str:
+    # the format pony stores them in.
+    return value.isoformat(" ", "microseconds")
+
+
+def _next_id(entity) -> int:
+    return (select(e.id for e in entity).max() or 0) + 1
+
+
+"""
+    _power_law_picker
+
+    returns a function picking k indexes from range(n), where index i is
+    picked with probability proportional to 1 / (i + 1) ** alpha. a few
+    users end up with most of the followers and posts, and a few hashtags
+    on most of the posts, like a real network.
+"""
+
+
+def _power_law_picker(n: int, rng: Random, alpha: float = 1.1):
+    cumulative_weights = list(accumulate(1 / (i + 1) ** alpha for i in range(n)))
+    population = range(n)
+
+    def pick(k: int) -> list:
+        return rng.choices(population, cum_weights=cumulative_weights, k=k)
+
+    return pick
+
+
+def _generate_test_image(rng: Random, size=(1024, 768)) -> BytesIO:
+    # a gradient, rather than noise, so it compresses like a photo would.
+    start = [rng.randrange(256) for _ in range(3)]
+    end = [rng.randrange(256) for _ in range(3)]
+    gradient = Image.linear_gradient("L").resize(size)
+    channels = [
+        gradient.point(lambda v, a=a, b=b: a + (b - a) * v // 255)
+        for a, b in zip(start, end)
+    ]
+    buffer = BytesIO()
+    Image.merge("RGB", channels).save(buffer, format="JPEG", quality=90)
+    buffer.seek(0)
+    return buffer
+
+
+def _around(rng: Random, mean: float) -> int:
+    # a whole number averaging out to mean, even if it's fractional.
+    whole = int(mean)
+    return rng.randint(0, whole * 2) + (1 if rng.random() < mean - whole else 0)
+
+
+def _fix_postgres_sequences(cursor, entities: list) -> None:
+    # rows were inserted with explicit ids, so the sequences
+    # behind the id columns need moving past them.
+    quote_name = db.provider.quote_name
+    for entity in entities:
+        table = quote_name(entity._table_)
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"(SELECT COALESCE(MAX(id), 1) FROM {table}))"
+        )
+
+
+"""
+    seed_database
+
+    Fills the database with a synthetic social graph, for benchmarking
+    and capacity planning. Users are named username_prefix followed by
+    a number from 0, and all share the given password.
+
+    Follows and post authors are power-law distributed, so a few users
+    are far more popular (and busier) than the rest. Likes and comments
+    per post, and follows and blocks per user, are averages.
+
+    Everything but the images is bulk inserted with raw sql, a table at a
+    time, committing after each. Images go through the normal upload
+    pipeline, so they're processed and stored like real ones, and are
+    attached to random posts.
+"""
+
+
+def seed_database(users: int, follows_per_user: float = 20, posts_per_user: float = 5,
+                  likes_per_post: float = 5, comments_per_post: float = 2, blocks_per_user: float = 0.1,
+                  images: int = 0, days: int = 30, username_prefix: str = "seed_", password: str = "password",
+                  seed: int = 0, progress=None) -> dict:
+    rng = Random(seed)
+    start_time = perf_counter()
+    timings = {}
+
+    def report(stage: str, count: int, stage_start: float):
+        timings[stage] = round(perf_counter() - stage_start, 3)
+        if progress is not None:
+            progress(stage, count, timings[stage])
+
+    with db_session:
+        if db.User.get(username=f"{username_prefix}0") is not None:
+            raise ValueError(f"Users named {username_prefix}... already exist. Use a different prefix.")
+
+    # argon2 is slow on purpose, so every seeded user shares one hash.
+    salt = generate_salt()
+    password_hash = hash_password(password, salt)
+
+    now = datetime.utcnow()
+    window_start = now - timedelta(days=days)
+    window_seconds = days * 86400
+    pick_popular_user = _power_law_picker(users, rng)
+
+    with db_session:
+        cursor = db.get_connection().cursor()
+        first_user_id = _next_id(db.User)
+        first_post_id = _next_id(db.Post)
+        first_hashtag_id = _next_id(db.Hashtag)
+        no_attachments = _db_value(db.Post, "attachments", [])
+        true = _db_value(db.User, "account_approved", True)
+        false = _db_value(db.User, "account_approved", False)
+        # every datetime attribute converts the same way. sqlite3's own adapter
+        # for them is slow enough to show up here, so we do it ourselves, once
+        # for each post and everything attached to it.
+        datetime_to_db = db.Post.creation_time.converters[0].val2dbval
+        if db.provider_name == "sqlite":
+            datetime_to_db = _sqlite_datetime
+        user_creation_time = datetime_to_db(window_start)
+
+        stage_start = perf_counter()
+        inserter = _BulkInserter(cursor, db.User, [
+            "id", "display_name", "username", "password_hash", "password_salt", "creation_time",
+            "is_legacy_account", "attribute_flags", "bio", "account_approved",
+        ])
+        for i in range(users):
+            inserter.add(first_user_id + i, f"Seed User {i}", f"{username_prefix}{i}", password_hash, salt,
+                         user_creation_time, false, 0, "", true)
+        inserter.flush()
+        commit()
+        report("users", inserter.count, stage_start)
+
+        # blocks are made alongside follows, so a user never blocks somebody they follow.
+        stage_start = perf_counter()
+        follows = _BulkInserter(cursor, db.Follow, ["user", "following", "creation_time"])
+        blocks = _BulkInserter(cursor, db.Block, ["user", "blocking", "creation_time"])
+        for i in range(users):
+            user_id = first_user_id + i
+            following = set(pick_popular_user(_around(rng, follows_per_user)))
+            following.discard(i)
+            follow_time = datetime_to_db(window_start + timedelta(seconds=rng.random() * window_seconds))
+            for followed in following:
+                follows.add(user_id, first_user_id + followed, follow_time)
+            for _ in range(_around(rng, blocks_per_user)):
+                blocked = rng.randrange(users)
+                if blocked != i and blocked not in following:
+                    blocks.add(user_id, first_user_id + blocked, user_creation_time)
+        follows.flush()
+        blocks.flush()
+        commit()
+        report("follows_and_blocks", follows.count + blocks.count, stage_start)
+
+        stage_start = perf_counter()
+        tag_prefix = re.sub(r"[^a-z0-9]", "", username_prefix.lower())[:7] or "seed"
+        existing_tags = dict(select((h.name, h.id) for h in db.Hashtag if h.name.startswith(tag_prefix)))
+        hashtag_inserter = _BulkInserter(cursor, db.Hashtag, ["id", "name", "creation_time"])
+        hashtags = []
+        next_hashtag_id = first_hashtag_id
+        for i in range(SEED_HASHTAG_POOL_SIZE):
+            name = f"{tag_prefix}{i}"
+            if name in existing_tags:
+                hashtags.append((name, existing_tags[name]))
+                continue
+            hashtag_inserter.add(next_hashtag_id, name, user_creation_time)
+            hashtags.append((name, next_hashtag_id))
+            next_hashtag_id += 1
+        hashtag_inserter.flush()
+        pick_popular_hashtag = _power_law_picker(len(hashtags), rng)
+
+        # posts are spread evenly through the window, in id order, the same
+        # as they'd have been created. authors are picked like follows.
+        post_count = int(users * posts_per_user)
+        post_authors = pick_popular_user(post_count)
+        posts = _BulkInserter(cursor, db.Post, [
+            "id", "under_moderation", "user", "creation_time", "text", "processed", "attachments",
+        ])
+        post_hashtags = _BulkInserter(cursor, db.PostHashtag, ["post", "hashtag", "creation_time"],
+                                      parents=[posts, hashtag_inserter])
+        likes = _BulkInserter(cursor, db.PostLike, ["user", "post", "creation_time"], parents=[posts])
+        comments = _BulkInserter(cursor, db.Comment, ["user", "post", "text", "creation_time"], parents=[posts])
+        for i in range(post_count):
+            post_id = first_post_id + i
+            creation_time = window_start + timedelta(seconds=(i + rng.random()) * window_seconds / post_count)
+            db_creation_time = datetime_to_db(creation_time)
+            tags = {hashtags[tag] for tag in pick_popular_hashtag(rng.randrange(4))}
+            text = " ".join([rng.choice(SEED_SENTENCES)] + [f"#{name}" for name, _ in tags])
+            posts.add(post_id, false, first_user_id + post_authors[i], db_creation_time, text, true,
+                      no_attachments)
+            for _, hashtag_id in tags:
+                post_hashtags.add(post_id, hashtag_id, db_creation_time)
+            for liker in {rng.randrange(users) for _ in range(_around(rng, likes_per_post))}:
+                likes.add(first_user_id + liker, post_id, db_creation_time)
+            for _ in range(_around(rng, comments_per_post)):
+                comments.add(first_user_id + rng.randrange(users), post_id, rng.choice(SEED_COMMENTS),
+                             db_creation_time)
+        for inserter in [posts, post_hashtags, likes, comments]:
+            inserter.flush()
+
+        if db.provider_name == "postgres":
+            _fix_postgres_sequences(cursor, [db.User, db.Hashtag, db.Post])
+        commit()
+        report("posts", posts.count + post_hashtags.count + likes.count + comments.count
+               + hashtag_inserter.count, stage_start)
+
+    stage_start = perf_counter()
+    image_identifiers = []
+    for _ in range(images):
+        with db_session:
+            uploaded = handle_upload(_generate_test_image(rng), first_user_id + rng.randrange(users),
+                                     threaded=False, lane=MediaJobLanes.BACKLOG)
+            if post_count > 0:
+                post = db.Post[first_post_id + rng.randrange(post_count)]
+                post.attachments = post.attachments + [{"type": "image", "identifier": uploaded.identifier}]
+                post.associated_images.add(db.Image[uploaded.id])
+        image_identifiers.append(uploaded.identifier)
+    if images > 0:
+        # the other formats & pixel ratios are made in the background
+        media_jobs.wait_until_idle()
+        report("images", images, stage_start)
+
+    counts = {
+        "users": users,
+        "follows": follows.count,
+        "blocks": blocks.count,
+        "hashtags": hashtag_inserter.count,
+        "posts": posts.count,
+        "post_hashtags": post_hashtags.count,
+        "post_likes": likes.count,
+        "comments": comments.count,
+        "images": len(image_identifiers),
+    }
+    bulk_rows = sum(counts.values()) - counts["images"]
+    bulk_seconds = sum(seconds for stage, seconds in timings.items() if stage != "images")
+    return {
+        "seed": seed,
+        "counts": counts,
+        "timings": timings,
+        "seconds": round(perf_counter() - start_time, 3),
+        "rows_per_second": round(bulk_rows / bulk_seconds) if bulk_seconds > 0 else 0,
+        "username_prefix": username_prefix,
+        "password": password,
+        "user_id_range": [first_user_id, first_user_id + users - 1] if users > 0 else None,
+        "post_id_range": [first_post_id, first_post_id + post_count - 1] if post_count > 0 else None,
+        "image_identifiers": image_identifiers,
+    }
+
+
+def print_seed_progress(stage: str, count: int, seconds: float):
+    print(f"[bold]=> {stage}[/bold]: {count} rows in {seconds:.2f}s")
+
+
+def seed_database_cli(**kwargs):
+    print("Seeding database...")
+    try:
+        results = seed_database(progress=print_seed_progress, **kwargs)
+    except ValueError as e:
+        print(f"[bold red]{e}")
+        exit(1)
+    print(f"Done in {results['seconds']:.2f}s ({results['rows_per_second']} rows/s, excluding images).")
+    for name, count in results["counts"].items():
+        print(f"{name}: {count}")
@@ -20,58 +20,58 @@ def _get_user(name):
 @db_session
 def verify_user(name):
     user = _get_user(name)
-    if AccountAttributes.VERIFIED.value in user.account_attributes:
+    if user.has_attribute(AccountAttributes.VERIFIED):
         print(f"[yellow]User, {name}, is already verified.")
         exit(1)
-    user.account_attributes.append(AccountAttributes.VERIFIED.value)
+    user.set_attribute(AccountAttributes.VERIFIED)
     print(f"[green]User, {name}, is now verified!")
 
 
 @db_session
 def unverify_user(name):
     user = _get_user(name)
-    if AccountAttributes.VERIFIED.value not in user.account_attributes:
+    if not user.has_attribute(AccountAttributes.VERIFIED):
         print(f"[yellow]User, {name}, is already un-verified.")
         exit(1)
-    user.account_attributes.remove(AccountAttributes.VERIFIED.value)
+    user.set_attribute(AccountAttributes.VERIFIED, False)
     print(f"[green]User, {name}, is no longer verified.")
 
 
 @db_session
 def mod_user(name):
     user = _get_user(name)
-    if AccountAttributes.MODERATOR.value in user.account_attributes:
+    if user.has_attribute(AccountAttributes.MODERATOR):
         print(f"[yellow]User, {name}, is already a moderator.")
         exit(1)
-    user.account_attributes.append(AccountAttributes.MODERATOR.value)
+    user.set_attribute(AccountAttributes.MODERATOR)
     print(f"[green]User, {name}, is now a moderator.")
 
 
 @db_session
 def unmod_user(name):
     user = _get_user(name)
-    if AccountAttributes.MODERATOR.value not in user.account_attributes:
+    if not user.has_attribute(AccountAttributes.MODERATOR):
         print(f"[yellow]User, {name}, isn't a moderator.")
         exit(1)
-    user.account_attributes.remove(AccountAttributes.MODERATOR.value)
+    user.set_attribute(AccountAttributes.MODERATOR, False)
     print(f"[green]User, {name}, is no longer a moderator.")
 
 
 @db_session
 def make_user_admin(name):
     user = _get_user(name)
-    if AccountAttributes.ADMIN.value in user.account_attributes:
+    if user.has_attribute(AccountAttributes.ADMIN):
         print(f"[yellow]User, {name}, is already an admin.")
         exit(1)
-    user.account_attributes.append(AccountAttributes.ADMIN.value)
+    user.set_attribute(AccountAttributes.ADMIN)
     print(f"[green]User, {name}, is now an admin.")
 
 
 @db_session
 def remove_user_admin_role(name):
     user = _get_user(name)
-    if AccountAttributes.ADMIN.value not in user.account_attributes:
+    if not user.has_attribute(AccountAttributes.ADMIN):
         print(f"[yellow]User, {name}, isn't an admin.")
         exit(1)
-    user.account_attributes.remove(AccountAttributes.ADMIN.value)
+    user.set_attribute(AccountAttributes.ADMIN, False)
     print(f"[green]User, {name}, is no longer an admin.")
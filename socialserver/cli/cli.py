@@ -1,10 +1,9 @@
 #  Copyright (c) Niall Asher 2022
 
 import click
-from socialserver.cli.admin.getstats import print_server_statistics
-from socialserver.cli.admin.create_user import create_user_account
-from socialserver.cli.admin.usermod import verify_user, unverify_user, mod_user, unmod_user, make_user_admin, \
-    remove_user_admin_role
+
+# commands import what they need when they're run, so the cli starts
+# quickly, without loading the server or connecting to the database.
 
 
 @click.group()
@@ -14,12 +13,69 @@ def cli():
 
 @click.group()
 def admin():
+    # every admin command works on the database.
+    from socialserver.db import bind_database
+    bind_database()
+
+
+@click.command()
+@click.option(
+    "recount", "--recount", is_flag=True, default=False,
+    help="Recount everything from scratch, rather than using the running totals."
+)
+def get_stats(recount):
+    from socialserver.cli.admin.getstats import print_server_statistics
+    print_server_statistics(recount)
+
+
+@click.command()
+@click.option("users", "--users", "-u", default=10000, help="Number of users. Default is 10000.")
+@click.option("follows_per_user", "--follows-per-user", default=20.0, help="Average follows per user. Default is 20.")
+@click.option("posts_per_user", "--posts-per-user", default=5.0, help="Average posts per user. Default is 5.")
+@click.option("likes_per_post", "--likes-per-post", default=5.0, help="Average likes per post. Default is 5.")
+@click.option("comments_per_post", "--comments-per-post", default=2.0,
+              help="Average comments per post. Default is 2.")
+@click.option("blocks_per_user", "--blocks-per-user", default=0.1, help="Average blocks per user. Default is 0.1.")
+@click.option("images", "--images", "-i", default=0,
+              help="Number of generated images, attached to random posts. Default is 0.")
+@click.option("days", "--days", default=30, help="Spread posts over this many days. Default is 30.")
+@click.option("username_prefix", "--username-prefix", default="seed_",
+              help="Usernames are this, followed by a number. Default is seed_.")
+@click.option("password", "--password", default="password", help="Password for every user. Default is password.")
+@click.option("seed", "--seed", default=0, help="Random seed. Default is 0.")
+def seed(**kwargs):
+    from socialserver.cli.admin.seed import seed_database_cli
+    seed_database_cli(**kwargs)
+
+
+@click.group()
+def media():
     pass
 
 
 @click.command()
-def get_stats():
-    print_server_statistics()
+@click.option("workers", "--workers", "-w", default=0,
+              help="Number of worker threads. Default is media.processing.workers.")
+@click.option("batch_size", "--batch-size", default=100,
+              help="Images read from the database at a time. Progress is saved after each batch. Default is 100.")
+@click.option("cpu_budget", "--cpu-budget", type=click.FloatRange(0, 1, min_open=True), default=None,
+              help="Share of the machine's cpu time to use, from 0 to 1. "
+                   "Default is media.processing.regenerate_cpu_budget.")
+@click.option("overwrite", "--overwrite", is_flag=True, default=False,
+              help="Remake every variant, not just missing ones, i.e. after changing the quality settings.")
+@click.option("restart", "--restart", is_flag=True, default=False,
+              help="Start from the first image, rather than where the last run stopped.")
+def regenerate(**kwargs):
+    from socialserver.cli.admin.media import regenerate_media_cli
+    regenerate_media_cli(**kwargs)
+
+
+@click.command()
+@click.option("layout", "--to", type=click.Choice(["flat", "sharded"]), default="sharded",
+              help="The layout to move stored images & videos to. Default is sharded.")
+def migrate_layout(layout):
+    from socialserver.cli.admin.media import migrate_layout_cli
+    migrate_layout_cli(layout)
 
 
 @click.group()
@@ -29,6 +85,7 @@ def user():
 
 @click.command()
 def create():
+    from socialserver.cli.admin.create_user import create_user_account
     create_user_account()
     pass
 
@@ -36,36 +93,42 @@ def create():
 @click.command()
 @click.argument("username")
 def verify(username):
+    from socialserver.cli.admin.usermod import verify_user
     verify_user(username)
 
 
 @click.command()
 @click.argument("username")
 def unverify(username):
+    from socialserver.cli.admin.usermod import unverify_user
     unverify_user(username)
 
 
 @click.command()
 @click.argument("username")
 def make_mod(username):
+    from socialserver.cli.admin.usermod import mod_user
     mod_user(username)
 
 
 @click.command()
 @click.argument("username")
 def revoke_mod(username):
+    from socialserver.cli.admin.usermod import unmod_user
     unmod_user(username)
 
 
 @click.command()
 @click.argument("username")
 def make_admin(username):
+    from socialserver.cli.admin.usermod import make_user_admin
     make_user_admin(username)
 
 
 @click.command()
 @click.argument("username")
 def revoke_admin(username):
+    from socialserver.cli.admin.usermod import remove_user_admin_role
     remove_user_admin_role(username)
 
 
@@ -77,8 +140,13 @@ user.add_command(make_admin)
 user.add_command(revoke_admin)
 user.add_command(create)
 
+media.add_command(regenerate)
+media.add_command(migrate_layout)
+
 admin.add_command(user)
+admin.add_command(media)
 admin.add_command(get_stats)
+admin.add_command(seed)
 
 
 @click.command()
@@ -21,6 +21,52 @@ SERVER_VERSION = "3.0.0"
 # post queue, in seconds.
 UNPROCESSED_POST_CHECK_INTERVAL = 10
 
+# trending hashtags are counted over a sliding window, split
+# into buckets. only TRENDING_HASHTAG_CAPACITY tags are tracked
+# per bucket, so memory use doesn't depend on how many tags exist.
+TRENDING_HASHTAG_WINDOW_SECONDS = 3600
+TRENDING_HASHTAG_BUCKET_COUNT = 12
+TRENDING_HASHTAG_CAPACITY = 512
+# how often the trending list served to clients is rebuilt, in seconds.
+TRENDING_HASHTAG_REFRESH_INTERVAL = 10
+# how often trending counts are saved to the database, so they
+# survive a restart, in seconds.
+TRENDING_HASHTAG_CHECKPOINT_INTERVAL = 60
+MAX_TRENDING_HASHTAGS_GET_COUNT = 32
+
+# how long a statistics snapshot is reused for, in seconds.
+STATISTICS_CACHE_SECONDS = 30
+
+# taken usernames are kept in a bloom filter, so most
+# availability checks don't need to touch the database.
+USERNAME_FILTER_ERROR_RATE = 0.01
+USERNAME_FILTER_MIN_CAPACITY = 100_000
+# how many users are read at once when building the filter.
+USERNAME_FILTER_SCAN_BATCH_SIZE = 10_000
+# how often users created by other processes are added
+# to the filter, in seconds.
+USERNAME_FILTER_SYNC_INTERVAL = 5
+
+# session access times and failed login counts are buffered in memory
+# and written to the database this often, in seconds.
+WRITE_BEHIND_FLUSH_INTERVAL = 5
+# how many rows are written by each batched UPDATE.
+WRITE_BEHIND_BATCH_SIZE = 200
+
+# api keys start with this, so they can be told apart from session tokens.
+API_KEY_PREFIX = "ssk_"
+# how long a validated api key is trusted before checking the
+# database again, in seconds. this is how long a key revoked through
+# another worker process can keep working.
+API_KEY_CACHE_TTL_SECONDS = 60
+MAX_API_KEYS_PER_USER = 16
+
+# the shared rate limit table is split into groups of slots. each key
+# always lands in the same group, which is locked while it's updated.
+# 8192 groups of 8 is 65536 buckets, in a 1.5MB file.
+RATE_LIMIT_TABLE_GROUPS = 8192
+RATE_LIMIT_SLOTS_PER_GROUP = 8
+
 # The blurhash to use during image processing.
 # 000000 is just plain black.
 PROCESSING_BLURHASH = "000000"
@@ -50,6 +96,9 @@ COMMENT_MAX_LEN = 256
 MIN_PASSWORD_LEN = 8
 MAX_PASSWORD_LEN = 256
 MAX_FEED_GET_COUNT = 32
+SEARCH_QUERY_MAX_LEN = 128
+# any words past this in a search query are ignored.
+MAX_SEARCH_TERMS = 8
 
 """
   Maximum amounts of attribs per post
@@ -200,6 +249,17 @@ class ErrorCodes(Enum):
     ACCOUNT_TEMPORARILY_LOCKED = 69
     POST_ALREADY_BOOKMARKED = 70
     POST_NOT_BOOKMARKED = 71
+    POST_TOO_MANY_TAGS = 72
+    INVALID_FEED_CURSOR = 73
+    SEARCH_QUERY_INVALID = 74
+    SERVER_BUSY = 75
+    RATE_LIMITED = 76
+    API_KEY_MISSING_PERMISSION = 77
+    API_KEY_PERMISSION_INVALID = 78
+    API_KEY_LIMIT_REACHED = 79
+    IMAGE_PURPOSE_INVALID = 80
+    IMAGE_TOO_LARGE = 81
+    FEED_GET_COUNT_TOO_LOW = 82
 
 
 """
@@ -310,6 +370,49 @@ class ImageTypes(Enum):
     ORIGINAL = "orig"
 
 
+"""
+    ImageUploadPurposes
+    What an image is being uploaded for. Decides which ImageTypes
+    are generated for it; see media.images.purposes in the config.
+"""
+
+
+class ImageUploadPurposes(Enum):
+    POST = "post"
+    AVATAR = "avatar"
+    HEADER = "header"
+    VIDEO_THUMBNAIL = "video-thumbnail"
+
+
+"""
+    MediaJobPhases
+    Image processing is done in two phases: the urgent one makes what's
+    needed to show an image (its variants at their smallest pixel ratio,
+    in their first format, and its blur hash), then it's marked as
+    processed. The deferred one makes the other pixel ratios & formats.
+    Every urgent phase waiting is run before any deferred one.
+"""
+
+
+class MediaJobPhases(Enum):
+    URGENT = "urgent"
+    DEFERRED = "deferred"
+
+
+"""
+    MediaJobLanes
+    How soon a media job is wanted, within its phase. Interactive jobs
+    are ones somebody is waiting on (avatars, headers, and uploads a
+    request doesn't return until are processed); the backlog is
+    everything else, like post images.
+"""
+
+
+class MediaJobLanes(Enum):
+    INTERACTIVE = "interactive"
+    BACKLOG = "backlog"
+
+
 """
   ApprovalSortTypes
   A list of sort types for the user approval queue
@@ -361,8 +464,9 @@ UserAuthenticationModificationOptions = ["password"]
 
 """
   ImageSupportedMimeTypes
-  A list of image formats supported for upload,
-  in MIME type form. These have to be supported
+  The image formats supported for upload, in MIME
+  type form, mapped to the extension the uploaded
+  original is stored with. These have to be supported
   by PIL, and we convert them all to jpg anyway.
   Possible future idea: WebP serving support?
   The client can just tell us to use it if it
@@ -375,20 +479,20 @@ UserAuthenticationModificationOptions = ["password"]
   for now, lets not support it.
 """
 
-ImageSupportedMimeTypes = [
-    "image/bmp",
-    "image/gif",
+ImageSupportedMimeTypes = {
+    "image/bmp": "bmp",
+    "image/gif": "gif",
     # .ico WHY WOULD PEOPLE USE THIS????
     # pil supports it so we'll keep it for now
-    "image/x-icon",
-    "image/jpg",
-    "image/jpeg",
+    "image/x-icon": "ico",
+    "image/jpg": "jpg",
+    "image/jpeg": "jpg",
     # jpeg 2000
-    "image/jp2",
-    "image/png",
-    "image/webp",
-    "image/tiff",
-]
+    "image/jp2": "jp2",
+    "image/png": "png",
+    "image/webp": "webp",
+    "image/tiff": "tiff",
+}
 
 """
   Regex expressions for validating data.
@@ -398,6 +502,8 @@ ImageSupportedMimeTypes = [
 REGEX_USERNAME_VALID = r"^[a-z0-9_]{1," + USERNAME_MAX_LEN.__str__() + r"}$"
 # split out hashtags
 REGEX_HASHTAG = r"#[a-zA-Z0-9]{1,12}"
+# a hashtag name as it's stored in the database (lowercase, no leading #)
+REGEX_HASHTAG_NAME_VALID = r"^[a-z0-9]{1," + TAG_MAX_LEN.__str__() + r"}$"
 
 """
     Values for BlurHash encoding
@@ -406,6 +512,9 @@ REGEX_HASHTAG = r"#[a-zA-Z0-9]{1,12}"
 
 BLURHASH_X_COMPONENTS = 4
 BLURHASH_Y_COMPONENTS = 3
+# hashes are computed from a copy of the image no bigger than this.
+# with this few components, more pixels don't change the result.
+BLURHASH_SAMPLE_SIZE = (32, 32)
 
 """
     post media types, to send to the client.
@@ -441,6 +550,22 @@ class FollowListListTypes(Enum):
     FOLLOWING = 1
 
 
+"""
+    RateLimitClasses
+    groups of routes that share a rate limit. values match
+    the sections under [rate_limit] in the config.
+"""
+
+
+class RateLimitClasses(Enum):
+    # anything that checks a password, or creates an account
+    LOGIN = "login"
+    # media uploads, which are expensive to process
+    UPLOAD = "upload"
+    WRITE = "write"
+    READ = "read"
+
+
 # Exceptions
 
 # pretty self-explanatory
@@ -464,6 +589,8 @@ class AuthHeaderInvalidOrNotPresentException(Exception):
 class ServerSupportedImageFormats(Enum):
     WEBP = "webp"
     JPG = "jpg"
+    AVIF = "avif"
+    JXL = "jxl"
 
 
 """
@@ -473,5 +600,7 @@ class ServerSupportedImageFormats(Enum):
 
 SERVER_SUPPORTED_IMAGE_FORMATS_MIMETYPES = {
     "webp": "image/webp",
-    "jpg": "image/jpg"
+    "jpg": "image/jpg",
+    "avif": "image/avif",
+    "jxl": "image/jxl",
 }
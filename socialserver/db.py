@@ -2,6 +2,8 @@
 
 from pony import orm
 import datetime
+from hashlib import sha256
+from threading import Lock
 from socialserver.constants import (
     BIO_MAX_LEN,
     COMMENT_MAX_LEN,
@@ -14,6 +16,8 @@ from socialserver.constants import (
 from socialserver.util.config import config, CONFIG_PATH
 from pony.orm import OperationalError
 from socialserver.util.output import console
+from socialserver.util.metrics import instrument_database
+from socialserver.util.statistics import create_statistics_counters
 
 
 # these are used when define_entities
@@ -30,10 +34,11 @@ def define_entities(db_object):
         password_hash = orm.Required(str)
         password_salt = orm.Required(str)
         # reset when next signing in if the throttling time from config has elapsed.
-        recent_failed_login_count = orm.Optional(int, nullable=True)
+        # volatile, since it's updated behind pony's back by util.write_behind.
+        recent_failed_login_count = orm.Optional(int, nullable=True, volatile=True)
         # used to determine whether the failure limit has been tripped,
         # or whether it should be cleared.
-        last_failed_login_attempt = orm.Optional(datetime.datetime, nullable=True)
+        last_failed_login_attempt = orm.Optional(datetime.datetime, nullable=True, volatile=True)
         creation_time = orm.Required(datetime.datetime)
         birthday = orm.Optional(datetime.date)
         totp = orm.Optional("Totp")
@@ -41,8 +46,10 @@ def define_entities(db_object):
         # this doesn't mean much now, but might become important in the future
         # so might as well have it.
         is_legacy_account = orm.Required(bool)
-        # check out AccountAttributes enum in constants for more info
-        account_attributes = orm.Required(orm.IntArray)
+        # check out AccountAttributes enum in constants for more info.
+        # bit n is set if the user has the attribute with the value n.
+        # use has_attribute/set_attribute, or account_attributes for a list.
+        attribute_flags = orm.Required(int, size=64, default=0)
         bio = orm.Optional(str, max_len=BIO_MAX_LEN)
         posts = orm.Set("Post", cascade_delete=True)
         comments = orm.Set("Comment", cascade_delete=True)
@@ -68,25 +75,63 @@ def define_entities(db_object):
         # bookmarks.
         bookmarks = orm.Set("Post", cascade_delete=False)
 
+        def has_attribute(self, attribute: AccountAttributes) -> bool:
+            return self.attribute_flags & (1 << attribute.value) != 0
+
+        def set_attribute(self, attribute: AccountAttributes, enabled: bool = True) -> None:
+            if enabled:
+                self.attribute_flags |= 1 << attribute.value
+            else:
+                self.attribute_flags &= ~(1 << attribute.value)
+
+        # the attribute values as a list, which is what the api has always
+        # returned (and the way they used to be stored). always in order.
+        @property
+        def account_attributes(self):
+            flags = self.attribute_flags
+            return [value for value in range(flags.bit_length()) if flags >> value & 1]
+
+        @account_attributes.setter
+        def account_attributes(self, values):
+            flags = 0
+            for value in values:
+                flags |= 1 << value
+            self.attribute_flags = flags
+
+        """
+            attribute_condition_sql
+
+            sql that's true for users with the given attribute, for raw
+            queries and triggers. role queries should use this as is, so
+            they can use the partial indexes from _create_attribute_indexes.
+        """
+
+        @classmethod
+        def attribute_condition_sql(cls, attribute: AccountAttributes, row: str = None) -> str:
+            column = db_object.provider.quote_name("attribute_flags")
+            if row is not None:
+                column = f"{row}.{column}"
+            return f"({column} & {1 << attribute.value}) <> 0"
+
         @property
         def is_private(self):
-            return AccountAttributes.PRIVATE.value in self.account_attributes
+            return self.attribute_flags & (1 << AccountAttributes.PRIVATE.value) != 0
 
         @property
         def is_verified(self):
-            return AccountAttributes.VERIFIED.value in self.account_attributes
+            return self.attribute_flags & (1 << AccountAttributes.VERIFIED.value) != 0
 
         @property
         def is_admin(self):
-            return AccountAttributes.ADMIN.value in self.account_attributes
+            return self.attribute_flags & (1 << AccountAttributes.ADMIN.value) != 0
 
         @property
         def is_moderator(self):
-            return AccountAttributes.MODERATOR.value in self.account_attributes
+            return self.attribute_flags & (1 << AccountAttributes.MODERATOR.value) != 0
 
         @property
         def has_config_permissions(self):
-            return AccountAttributes.INSTANCE_ADMIN.value in self.account_attributes
+            return self.attribute_flags & (1 << AccountAttributes.INSTANCE_ADMIN.value) != 0
 
         @property
         def has_profile_picture(self):
@@ -121,9 +166,18 @@ def define_entities(db_object):
         user = orm.Required("User")
         creation_ip = orm.Required(str)
         creation_time = orm.Required(datetime.datetime)
-        last_access_time = orm.Required(datetime.datetime)
+        # volatile for the same reason as User.recent_failed_login_count
+        last_access_time = orm.Required(datetime.datetime, volatile=True)
         user_agent = orm.Required(str)
 
+    class UsernameChange(db_object.Entity):
+        # a log of the names users have changed to, so the username filter
+        # in each worker (see socialserver.util.username_filter) can pick
+        # up renames made through the others, the same way it picks up
+        # new users, by id.
+        username = orm.Required(str, max_len=USERNAME_MAX_LEN)
+        change_time = orm.Required(datetime.datetime)
+
     class Post(db_object.Entity):
         # whether the post is currently in the mod-queue
         under_moderation = orm.Required(bool)
@@ -138,7 +192,7 @@ def define_entities(db_object):
         associated_videos = orm.Set("Video", reverse="associated_posts")
         comments = orm.Set("Comment", cascade_delete=True)
         likes = orm.Set("PostLike", cascade_delete=True)
-        hashtags = orm.Set("Hashtag")
+        hashtags = orm.Set("PostHashtag", cascade_delete=True)
         reports = orm.Set("PostReport", cascade_delete=True)
         # if false, won't show up in feeds. good for if media is incomplete.
         processed = orm.Required(bool)
@@ -205,7 +259,41 @@ def define_entities(db_object):
     class Hashtag(db_object.Entity):
         creation_time = orm.Required(datetime.datetime)
         name = orm.Required(str, max_len=TAG_MAX_LEN, unique=True)
-        posts = orm.Set("Post", reverse="hashtags")
+        posts = orm.Set("PostHashtag", cascade_delete=True)
+
+    class PostHashtag(db_object.Entity):
+        # explicit association between posts and hashtags, rather than
+        # a plain many-to-many set, so that we can index it by time.
+        # this is what the hashtag feed pages through, so it has to stay
+        # fast with a lot of posts under a single tag.
+        post = orm.Required("Post", reverse="hashtags")
+        hashtag = orm.Required("Hashtag", reverse="posts")
+        # copied from the post on creation. posts never change their
+        # creation time, so we don't need to worry about keeping it in sync.
+        creation_time = orm.Required(datetime.datetime)
+        orm.composite_key(post, hashtag)
+        orm.composite_index(hashtag, creation_time)
+
+    class TrendingHashtagSnapshot(db_object.Entity):
+        # periodic checkpoint of the in-memory trending hashtag counts
+        # (see socialserver.util.trending), so a restart doesn't wipe them.
+        # there is only ever one of these, which every worker merges its
+        # counts into.
+        last_update_time = orm.Required(datetime.datetime)
+        data = orm.Required(orm.Json)
+
+    class StatisticsCounter(db_object.Entity):
+        # running totals behind the server statistics, kept up to date
+        # by triggers. see socialserver.util.statistics.
+        name = orm.PrimaryKey(str)
+        value = orm.Required(int, size=64, volatile=True)
+
+    class SchemaVersion(db_object.Entity):
+        # fingerprint of the schema the database was last set up with.
+        # see bind_database.
+        id = orm.PrimaryKey(int)
+        fingerprint = orm.Required(str)
+        applied_at = orm.Required(datetime.datetime)
 
     class PostLike(db_object.Entity):
         user = orm.Required("User")
@@ -264,6 +352,235 @@ def define_entities(db_object):
         processed = orm.Required(bool)
 
 
+"""
+    _create_search_index
+
+    Creates the full-text search index for posts and users, if it doesn't
+    already exist. On sqlite, this is a pair of FTS5 tables, kept in sync
+    with the Post and User tables by triggers, so anything that creates,
+    edits or deletes a post or user (including cascades) is picked up.
+    On postgres, it's GIN indexes over tsvector expressions, which postgres
+    keeps up to date by itself. socialserver.util.search queries these.
+    
+    If rebuild is true, the sqlite tables are dropped and rebuilt from scratch.
+"""
+
+
+def _create_search_index(db_object, rebuild=False):
+    quote_name = db_object.provider.quote_name
+    post_table = quote_name(db_object.Post._table_)
+    user_table = quote_name(db_object.User._table_)
+
+    with orm.db_session:
+        if db_object.provider_name == "sqlite":
+            if rebuild:
+                db_object.execute("DROP TABLE IF EXISTS post_search")
+                db_object.execute("DROP TABLE IF EXISTS user_search")
+
+            existing_tables = db_object.select(
+                "SELECT name FROM sqlite_master WHERE name IN ('post_search', 'user_search')"
+            )
+
+            db_object.execute(f"""
+                CREATE VIRTUAL TABLE IF NOT EXISTS post_search USING fts5(
+                    text, content={post_table}, content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2'
+                )""")
+            # prefix indexes make prefix queries on short usernames quick,
+            # since they're run on every keystroke of a search box.
+            db_object.execute(f"""
+                CREATE VIRTUAL TABLE IF NOT EXISTS user_search USING fts5(
+                    username, display_name, content={user_table}, content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2', prefix='1 2 3'
+                )""")
+
+            db_object.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS post_search_insert AFTER INSERT ON {post_table} BEGIN
+                    INSERT INTO post_search(rowid, text) VALUES (new.id, new.text);
+                END""")
+            db_object.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS post_search_delete AFTER DELETE ON {post_table} BEGIN
+                    INSERT INTO post_search(post_search, rowid, text) VALUES ('delete', old.id, old.text);
+                END""")
+            db_object.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS post_search_update AFTER UPDATE OF text ON {post_table} BEGIN
+                    INSERT INTO post_search(post_search, rowid, text) VALUES ('delete', old.id, old.text);
+                    INSERT INTO post_search(rowid, text) VALUES (new.id, new.text);
+                END""")
+
+            db_object.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS user_search_insert AFTER INSERT ON {user_table} BEGIN
+                    INSERT INTO user_search(rowid, username, display_name)
+                        VALUES (new.id, new.username, new.display_name);
+                END""")
+            db_object.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS user_search_delete AFTER DELETE ON {user_table} BEGIN
+                    INSERT INTO user_search(user_search, rowid, username, display_name)
+                        VALUES ('delete', old.id, old.username, old.display_name);
+                END""")
+            db_object.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS user_search_update
+                    AFTER UPDATE OF username, display_name ON {user_table} BEGIN
+                    INSERT INTO user_search(user_search, rowid, username, display_name)
+                        VALUES ('delete', old.id, old.username, old.display_name);
+                    INSERT INTO user_search(rowid, username, display_name)
+                        VALUES (new.id, new.username, new.display_name);
+                END""")
+
+            # index anything that was already in the database
+            # before the search tables existed.
+            if "post_search" not in existing_tables:
+                db_object.execute("INSERT INTO post_search(post_search) VALUES ('rebuild')")
+            if "user_search" not in existing_tables:
+                db_object.execute("INSERT INTO user_search(user_search) VALUES ('rebuild')")
+
+        elif db_object.provider_name == "postgres":
+            # the 'simple' configuration doesn't stem or drop stop words.
+            # posts can be in any language, so english rules would do more harm than good.
+            db_object.execute(f"""
+                CREATE INDEX IF NOT EXISTS post_text_search_idx
+                    ON {post_table} USING GIN (to_tsvector('simple', "text"))""")
+            db_object.execute(f"""
+                CREATE INDEX IF NOT EXISTS user_name_search_idx
+                    ON {user_table} USING GIN (to_tsvector('simple', "username" || ' ' || "display_name"))""")
+
+
+"""
+    _create_attribute_indexes
+
+    Partial indexes over the users with each role that gets looked up,
+    so role queries (i.e. the statistics counters being rebuilt) only
+    touch those users.
+    They're tiny, since very few users have any of these.
+"""
+
+INDEXED_ACCOUNT_ATTRIBUTES = [
+    AccountAttributes.ADMIN,
+    AccountAttributes.MODERATOR,
+    AccountAttributes.BANNED,
+]
+
+
+def _create_attribute_indexes(db_object):
+    user_table = db_object.provider.quote_name(db_object.User._table_)
+    with orm.db_session:
+        for attribute in INDEXED_ACCOUNT_ATTRIBUTES:
+            db_object.execute(f"""
+                CREATE INDEX IF NOT EXISTS user_{attribute.name.lower()}_idx ON {user_table} ("id")
+                    WHERE {db_object.User.attribute_condition_sql(attribute)}""")
+
+
+"""
+    _migrate_account_attributes
+
+    Account attributes used to be stored as an array of values. This
+    converts databases from before that into the bitmask, and drops the
+    old column. Has to run before generate_mapping, since pony checks the
+    tables match the entities.
+"""
+
+
+def _migrate_account_attributes(db_object):
+    quote_name = db_object.provider.quote_name
+    user_table = db_object.provider.normalize_name("User")
+    with orm.db_session:
+        if db_object.provider_name == "sqlite":
+            columns = [row[1] for row in db_object.select(f"SELECT * FROM pragma_table_info('{user_table}')")]
+        else:
+            columns = db_object.select(
+                "SELECT column_name FROM information_schema.columns WHERE table_name = $user_table"
+            )
+        if "account_attributes" not in columns:
+            return
+
+        console.log("Migrating account attributes to bitmask...")
+        table = quote_name(user_table)
+        if db_object.provider_name == "sqlite":
+            # the statistics triggers read the old column, and sqlite won't drop
+            # a column anything refers to. they're recreated after mapping.
+            for event in ["insert", "delete", "update"]:
+                db_object.execute(f"DROP TRIGGER IF EXISTS statistics_user_{event}")
+            db_object.execute(f'ALTER TABLE {table} ADD COLUMN "attribute_flags" INTEGER NOT NULL DEFAULT 0')
+            db_object.execute(f"""
+                UPDATE {table} SET "attribute_flags" = (
+                    SELECT COALESCE(SUM(DISTINCT 1 << value), 0) FROM json_each("account_attributes")
+                )""")
+        else:
+            db_object.execute(f"DROP TRIGGER IF EXISTS statistics_user ON {table}")
+            db_object.execute(f'ALTER TABLE {table} ADD COLUMN "attribute_flags" BIGINT NOT NULL DEFAULT 0')
+            db_object.execute(f"""
+                UPDATE {table} SET "attribute_flags" = (
+                    SELECT COALESCE(SUM(DISTINCT 1::BIGINT << value), 0) FROM unnest("account_attributes") value
+                )""")
+        db_object.execute(f'ALTER TABLE {table} DROP COLUMN "account_attributes"')
+
+
+"""
+    _migrate_post_hashtags
+
+    Posts and hashtags used to be linked by a plain many-to-many set,
+    which pony keeps in its own join table. This copies those links
+    into PostHashtag, taking the time from the post, and drops the old
+    table. Has to run after the tables are created, so PostHashtag
+    exists to copy into.
+
+    Hashtags were also stored with their leading #, which they aren't
+    anymore, so that's taken off. If the same tag has since been made
+    without it, the old one's posts are moved over to that, and the old
+    one's deleted.
+"""
+
+
+def _migrate_post_hashtags(db_object):
+    _copy_post_hashtag_links(db_object)
+    _strip_hashtag_prefixes(db_object)
+
+
+def _copy_post_hashtag_links(db_object):
+    quote_name = db_object.provider.quote_name
+    old_table = db_object.provider.normalize_name("Hashtag_Post")
+    with orm.db_session:
+        if not db_object.provider.table_exists(db_object.get_connection(), old_table):
+            return
+
+        console.log("Migrating post hashtags...")
+        post_hashtag_table = quote_name(db_object.PostHashtag._table_)
+        # in post order, so the ids tie break the same way new ones do.
+        db_object.execute(f"""
+            INSERT INTO {post_hashtag_table} ("post", "hashtag", "creation_time")
+            SELECT old_link."post", old_link."hashtag", post."creation_time"
+            FROM {quote_name(old_table)} old_link
+            JOIN {quote_name(db_object.Post._table_)} post ON post."id" = old_link."post"
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {post_hashtag_table} link
+                WHERE link."post" = old_link."post" AND link."hashtag" = old_link."hashtag"
+            )
+            ORDER BY post."creation_time", post."id"
+        """)
+        db_object.execute(f"DROP TABLE {quote_name(old_table)}")
+
+
+@orm.db_session
+def _strip_hashtag_prefixes(db_object):
+    old_tags = orm.select(h for h in db_object.Hashtag if h.name.startswith("#"))[:]
+    if len(old_tags) == 0:
+        return
+
+    console.log("Removing # from hashtag names...")
+    for old_tag in old_tags:
+        name = old_tag.name[1:]
+        tag = db_object.Hashtag.get(name=name)
+        if tag is None:
+            old_tag.name = name
+            continue
+        for link in old_tag.posts.select()[:]:
+            if db_object.PostHashtag.get(post=link.post, hashtag=tag) is None:
+                link.hashtag = tag
+            else:
+                link.delete()
+        old_tag.delete()
+
+
 """
     
     Create a database object bound to an in-memory sqlite database.
@@ -275,11 +592,16 @@ def create_test_db():
     mem_db = orm.Database()
     define_entities(mem_db)
     mem_db.bind("sqlite", "/tmp/test.db", create_db=True)
+    _migrate_account_attributes(mem_db)
     if mem_db.schema is None:
         mem_db.generate_mapping(create_tables=True)
     if mem_db is not None:
         mem_db.drop_all_tables(with_all_data=True)
         mem_db.create_tables()
+        _create_search_index(mem_db, rebuild=True)
+        _create_attribute_indexes(mem_db)
+        create_statistics_counters(mem_db, rebuild=True)
+    instrument_database(mem_db)
     return mem_db
 
 
@@ -311,9 +633,93 @@ def _bind_to_config_specified_db(db_object):
                 f"[bold]Please check the configuration file, located at {CONFIG_PATH}!"
             )
             exit()
-    db_object.generate_mapping(create_tables=True)
+
+
+"""
+    _schema_fingerprint
+
+    A hash of everything bind_database would set up: the tables pony
+    would create for the entities, plus SCHEMA_REVISION, which covers
+    what pony doesn't know about (the search index, triggers etc.).
+    Bump SCHEMA_REVISION whenever any of those change, so existing
+    databases pick the changes up.
+"""
+
+SCHEMA_REVISION = 3
+
+
+def _schema_fingerprint(db_object) -> str:
+    create_script = db_object.schema.generate_create_script()
+    return sha256(f"{SCHEMA_REVISION}\n{create_script}".encode()).hexdigest()
+
+
+@orm.db_session
+def _get_stored_schema_fingerprint(db_object):
+    connection = db_object.get_connection()
+    table_name = db_object.SchemaVersion._table_
+    if not db_object.provider.table_exists(connection, table_name):
+        return None
+    version = db_object.SchemaVersion.get(id=1)
+    return version.fingerprint if version is not None else None
+
+
+@orm.db_session
+def _store_schema_fingerprint(db_object, fingerprint: str):
+    version = db_object.SchemaVersion.get(id=1)
+    if version is None:
+        db_object.SchemaVersion(id=1, fingerprint=fingerprint, applied_at=datetime.datetime.utcnow())
+    else:
+        version.fingerprint = fingerprint
+        version.applied_at = datetime.datetime.utcnow()
+
+
+"""
+    _set_up_schema
+
+    Maps the entities, then brings the database up to date: migrations,
+    tables, the search index, attribute indexes and statistics counters.
+    Checking all of that takes a while, and it's almost never changed,
+    so it's skipped if the database was last set up with the same schema.
+"""
+
+
+def _set_up_schema(db_object):
+    # mapping without touching the database, so it can be fingerprinted.
+    # migrations have to run before the tables are checked, which
+    # create_tables does once they're done.
+    db_object.generate_mapping(create_tables=False, check_tables=False)
+    fingerprint = _schema_fingerprint(db_object)
+    if _get_stored_schema_fingerprint(db_object) == fingerprint:
+        return
+
+    console.log("Setting up database schema...")
+    _migrate_account_attributes(db_object)
+    db_object.create_tables(check_tables=True)
+    _migrate_post_hashtags(db_object)
+    _create_search_index(db_object)
+    _create_attribute_indexes(db_object)
+    create_statistics_counters(db_object)
+    _store_schema_fingerprint(db_object, fingerprint)
 
 
 db = orm.Database()
 define_entities(db)
-_bind_to_config_specified_db(db)
+_db_bind_lock = Lock()
+
+"""
+    bind_database
+
+    Binds db to the database in the configuration file, and sets it up.
+    Nothing does this on import, so importing anything that uses db is
+    cheap; create_app, and cli commands touching the database, call it.
+    Safe to call more than once.
+"""
+
+
+def bind_database():
+    with _db_bind_lock:
+        if db.schema is not None:
+            return
+        _bind_to_config_specified_db(db)
+        _set_up_schema(db)
+        instrument_database(db)
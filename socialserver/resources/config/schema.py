@@ -1,8 +1,18 @@
 #  Copyright (c) Niall Asher 2022
 
 from pydantic import BaseModel, IPvAnyAddress, Field, validator
-from socialserver.constants import MAX_PIXEL_RATIO
-from typing import Literal, Optional
+from socialserver.constants import (
+    MAX_PIXEL_RATIO,
+    MAX_IMAGE_SIZE_POST,
+    MAX_IMAGE_SIZE_POST_PREVIEW,
+    MAX_IMAGE_SIZE_GALLERY_PREVIEW,
+    MAX_IMAGE_SIZE_PROFILE_PICTURE,
+    MAX_IMAGE_SIZE_PROFILE_PICTURE_LARGE,
+    MAX_IMAGE_SIZE_HEADER,
+    ImageTypes,
+    ImageUploadPurposes,
+)
+from typing import Dict, List, Literal, Optional
 
 
 class _ServerConfigNetwork(BaseModel):
@@ -54,6 +64,67 @@ class _ServerConfigMediaImagesWebp(BaseModel):
     post_quality: int = Field(..., ge=1,le=100)
     use_progressive_images: bool
 
+# avif & jxl are optional, and off by default; see image_formats.py.
+class _ServerConfigMediaImagesAvif(BaseModel):
+    enabled: bool = False
+    quality: int = Field(50, ge=1, le=100)
+    post_quality: int = Field(60, ge=1, le=100)
+    # 0 (fastest) to 9 (smallest)
+    effort: int = Field(2, ge=0, le=9)
+
+class _ServerConfigMediaImagesJxl(BaseModel):
+    enabled: bool = False
+    quality: int = Field(70, ge=1, le=100)
+    post_quality: int = Field(80, ge=1, le=100)
+
+class _ServerConfigMediaImagesVariant(BaseModel):
+    width: int = Field(..., ge=1)
+    height: int = Field(..., ge=1)
+    # cropped (from the centre) to the aspect ratio of width & height,
+    # rather than just shrunk to fit inside them.
+    crop: bool = True
+    pixel_ratios: List[int] = Field(list(range(1, MAX_PIXEL_RATIO + 1)), min_items=1)
+    # the others are only generated if they're enabled (i.e.
+    # media.images.webp.enabled is true) too.
+    formats: List[Literal["jpg", "webp", "avif", "jxl"]] = Field(["jpg", "webp", "avif", "jxl"], min_items=1)
+
+    @validator("pixel_ratios")
+    def pixel_ratio_validation(cls, value):
+        for pixel_ratio in value:
+            assert 1 <= pixel_ratio <= MAX_PIXEL_RATIO, f"pixel ratios must be from 1 to {MAX_PIXEL_RATIO}"
+        return sorted(set(value))
+
+
+def _variant_from_size(size, **kwargs) -> _ServerConfigMediaImagesVariant:
+    return _ServerConfigMediaImagesVariant(width=size[0], height=size[1], **kwargs)
+
+
+# keyed by ImageTypes value. the original is always stored, so it isn't one.
+DEFAULT_IMAGE_VARIANTS = {
+    ImageTypes.POST.value: _variant_from_size(MAX_IMAGE_SIZE_POST, crop=False, pixel_ratios=[1]),
+    ImageTypes.POST_PREVIEW.value: _variant_from_size(MAX_IMAGE_SIZE_POST_PREVIEW),
+    ImageTypes.GALLERY_PREVIEW.value: _variant_from_size(MAX_IMAGE_SIZE_GALLERY_PREVIEW),
+    ImageTypes.PROFILE_PICTURE.value: _variant_from_size(MAX_IMAGE_SIZE_PROFILE_PICTURE),
+    ImageTypes.PROFILE_PICTURE_LARGE.value: _variant_from_size(MAX_IMAGE_SIZE_PROFILE_PICTURE_LARGE),
+    ImageTypes.HEADER.value: _variant_from_size(MAX_IMAGE_SIZE_HEADER),
+}
+
+# keyed by ImageUploadPurposes value. the first variant is the one the
+# blur hash is made from.
+DEFAULT_IMAGE_PURPOSES = {
+    ImageUploadPurposes.POST.value: [
+        ImageTypes.POST.value, ImageTypes.POST_PREVIEW.value, ImageTypes.GALLERY_PREVIEW.value
+    ],
+    ImageUploadPurposes.AVATAR.value: [
+        ImageTypes.PROFILE_PICTURE_LARGE.value, ImageTypes.PROFILE_PICTURE.value
+    ],
+    ImageUploadPurposes.HEADER.value: [ImageTypes.HEADER.value],
+    ImageUploadPurposes.VIDEO_THUMBNAIL.value: [
+        ImageTypes.POST_PREVIEW.value, ImageTypes.GALLERY_PREVIEW.value
+    ],
+}
+
+
 class _ServerConfigMediaImages(BaseModel):
     storage_dir: str
     # max size cannot be negative. god knows what would happen if it was.
@@ -61,15 +132,55 @@ class _ServerConfigMediaImages(BaseModel):
     max_image_request_size_mb: float = Field(..., ge=0)
     jpeg: _ServerConfigMediaImagesJpeg
     webp: _ServerConfigMediaImagesWebp
+    avif: _ServerConfigMediaImagesAvif = _ServerConfigMediaImagesAvif()
+    jxl: _ServerConfigMediaImagesJxl = _ServerConfigMediaImagesJxl()
+    backend: Literal["pillow", "vips"] = "pillow"
+    # decompression bomb limits, checked against the image's header
+    # before it's decoded.
+    max_image_pixels: int = Field(100_000_000, ge=1)
+    max_image_dimension: int = Field(30_000, ge=1)
+    # anything left out of these uses the defaults above,
+    # so a config only needs to list what it changes.
+    variants: Dict[str, _ServerConfigMediaImagesVariant] = DEFAULT_IMAGE_VARIANTS
+    purposes: Dict[str, List[str]] = DEFAULT_IMAGE_PURPOSES
+
+    @validator("variants", pre=True)
+    def variant_validation(cls, value):
+        for name in value.keys():
+            assert name in DEFAULT_IMAGE_VARIANTS, \
+                f"unknown image variant {name}. valid ones are {', '.join(DEFAULT_IMAGE_VARIANTS)}"
+        return {**DEFAULT_IMAGE_VARIANTS, **value}
+
+    @validator("purposes", pre=True)
+    def purpose_validation(cls, value):
+        for purpose, variants in value.items():
+            assert purpose in DEFAULT_IMAGE_PURPOSES, \
+                f"unknown image purpose {purpose}. valid ones are {', '.join(DEFAULT_IMAGE_PURPOSES)}"
+            assert len(variants) > 0, f"image purpose {purpose} needs at least one variant"
+            for name in variants:
+                assert name in DEFAULT_IMAGE_VARIANTS, f"unknown image variant {name} in purpose {purpose}"
+        return {**DEFAULT_IMAGE_PURPOSES, **value}
 
 
 class _ServerConfigMediaVideos(BaseModel):
     storage_dir: str
 
 
+class _ServerConfigMediaProcessing(BaseModel):
+    # 0 uses the number of cpu cores
+    workers: int = Field(0, ge=0)
+    # the share of the machine's cpu time admin media regenerate uses
+    regenerate_cpu_budget: float = Field(0.5, gt=0, le=1)
+
+
 class _ServerConfigMedia(BaseModel):
+    # see filesystem.hash_directory. existing configs don't have it, and
+    # their files are stored flat, so that's the default; new ones are
+    # made (from default_config.toml) with sharded.
+    storage_layout: Literal["flat", "sharded"] = "flat"
     images: _ServerConfigMediaImages
     videos: _ServerConfigMediaVideos
+    processing: _ServerConfigMediaProcessing = _ServerConfigMediaProcessing()
 
 
 class _ServerConfigAuthRegistration(BaseModel):
@@ -92,10 +203,30 @@ class _ServerConfigAuthFailureLock(BaseModel):
     fail_count_before_lock: int
 
 
+class _ServerConfigAuthPasswordHashing(BaseModel):
+    # argon2 parameters. changing these will transparently
+    # rehash each user's password the next time they log in.
+    time_cost: int = Field(3, ge=1)
+    memory_cost_kib: int = Field(65536, ge=8)
+    parallelism: int = Field(4, ge=1)
+    # 0 uses the number of cpu cores.
+    max_concurrent: int = Field(0, ge=0)
+    max_queued: int = Field(64, ge=0)
+    queue_timeout_seconds: float = Field(2, ge=0)
+
+
+class _ServerConfigAuthApiKeys(BaseModel):
+    # requests allowed per api key per minute.
+    rate_limit_per_minute: int = Field(600, ge=1)
+
+
 class _ServerConfigAuth(BaseModel):
     registration: _ServerConfigAuthRegistration
     totp: _ServerConfigAuthTotp
     failure_lock: _ServerConfigAuthFailureLock
+    # optional, so configs written before this section existed still load.
+    password_hashing: _ServerConfigAuthPasswordHashing = _ServerConfigAuthPasswordHashing()
+    api_keys: _ServerConfigAuthApiKeys = _ServerConfigAuthApiKeys()
 
 
 class _ServerConfigPosts(BaseModel):
@@ -114,6 +245,49 @@ class _ServerConfigLegacyApiInterface(BaseModel):
     send_webp_images: bool
 
 
+class _ServerConfigRateLimitClass(BaseModel):
+    per_user_per_minute: int = Field(..., ge=1)
+    per_ip_per_minute: int = Field(..., ge=1)
+
+
+class _ServerConfigRateLimit(BaseModel):
+    enabled: bool = True
+    # the bucket table shared by every worker process.
+    # defaults to $FILE_ROOT/rate_limit.bin
+    storage_file: Optional[str]
+    login: _ServerConfigRateLimitClass = _ServerConfigRateLimitClass(
+        per_user_per_minute=10, per_ip_per_minute=60
+    )
+    upload: _ServerConfigRateLimitClass = _ServerConfigRateLimitClass(
+        per_user_per_minute=30, per_ip_per_minute=60
+    )
+    write: _ServerConfigRateLimitClass = _ServerConfigRateLimitClass(
+        per_user_per_minute=120, per_ip_per_minute=300
+    )
+    read: _ServerConfigRateLimitClass = _ServerConfigRateLimitClass(
+        per_user_per_minute=600, per_ip_per_minute=1200
+    )
+
+
+class _ServerConfigMetricsProfiling(BaseModel):
+    # fraction of requests to profile, from 0 (off) to 1 (all of them)
+    sample_rate: float = Field(0, ge=0, le=1)
+    slow_request_threshold_ms: float = Field(500, ge=0)
+    # defaults to $FILE_ROOT/profiles
+    output_dir: Optional[str]
+
+
+class _ServerConfigMetrics(BaseModel):
+    enabled: bool = True
+    # 0 disables the slow query log.
+    slow_query_threshold_ms: float = Field(250, ge=0)
+    profiling: _ServerConfigMetricsProfiling = _ServerConfigMetricsProfiling()
+
+
+class _ServerConfigApi(BaseModel):
+    json_serializer: Literal["auto", "orjson", "stdlib"] = "auto"
+
+
 class ServerConfig(BaseModel):
     network: _ServerConfigNetwork
     misc: _ServerConfigMisc
@@ -122,3 +296,7 @@ class ServerConfig(BaseModel):
     auth: _ServerConfigAuth
     posts: _ServerConfigPosts
     legacy_api_interface: _ServerConfigLegacyApiInterface
+    # optional, so configs written before this section existed still load.
+    rate_limit: _ServerConfigRateLimit = _ServerConfigRateLimit()
+    metrics: _ServerConfigMetrics = _ServerConfigMetrics()
+    api: _ServerConfigApi = _ServerConfigApi()
@@ -4,11 +4,14 @@
 from socialserver.util.test import (
     test_db,
     create_post_with_request,
+    create_user_with_request,
     server_address,
     image_data_binary,
 )
-from socialserver.constants import DISPLAY_NAME_MAX_LEN
+from socialserver.constants import DISPLAY_NAME_MAX_LEN, ErrorCodes, LegacyErrorCodes
+from socialserver.util.username_filter import username_filter
 from secrets import token_urlsafe
+from time import sleep
 import requests
 
 
@@ -57,6 +60,26 @@ def test_update_username_legacy(test_db, server_address, monkeypatch):
     assert r2.json()["displayName"] == "test"
 
 
+def test_update_username_taken_legacy(test_db, server_address):
+    create_user_with_request(username="taken", password="password")
+    r = requests.post(
+        f"{server_address}/api/v1/usermod",
+        json={"session_token": test_db.access_token, "username": "taken"},
+    )
+    assert r.status_code == 400
+    assert r.json()["err"] == LegacyErrorCodes.USERNAME_TAKEN.value
+
+
+def test_update_username_filter_legacy(test_db, server_address):
+    username_filter.build()
+    r = requests.post(
+        f"{server_address}/api/v1/usermod",
+        json={"session_token": test_db.access_token, "username": "new_username"},
+    )
+    assert r.status_code == 201
+    assert username_filter.might_contain("new_username")
+
+
 def test_update_username_invalid_legacy(test_db, server_address):
     r = requests.post(
         f"{server_address}/api/v1/usermod",
@@ -81,3 +104,14 @@ def test_update_avatar_legacy(test_db, server_address, image_data_binary):
         json={"session_token": test_db.access_token, "username": test_db.username},
     )
     print(r2.json())
+    # it was set before being processed, so the avatar sizes are only
+    # made once it has been.
+    for _ in range(0, 30):
+        r3 = requests.get(
+            f"{server_address}/api/v3/image/{image_identifier}",
+            json={"wanted_type": "prof-pic", "pixel_ratio": 1},
+        )
+        if r3.status_code != 404 or r3.json()["error"] != ErrorCodes.IMAGE_NOT_PROCESSED.value:
+            break
+        sleep(0.5)
+    assert r3.status_code == 200
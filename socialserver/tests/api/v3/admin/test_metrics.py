@@ -0,0 +1,80 @@
+#  Copyright (c) Niall Asher 2022
+
+import requests
+from socialserver.util.test import (
+    test_db,
+    set_user_attributes_db,
+    server_address,
+    image_data_binary,
+)
+from socialserver.constants import AccountAttributes, ErrorCodes
+from socialserver.util import metrics
+from socialserver.util.config import config
+
+
+def test_get_metrics(test_db, server_address):
+    set_user_attributes_db(
+        test_db.db, test_db.username, [AccountAttributes.ADMIN.value]
+    )
+    requests.get(
+        f"{server_address}/api/v3/posts/feed",
+        json={"count": 10, "offset": 0},
+        headers={"Authorization": f"bearer {test_db.access_token}"},
+    )
+
+    r = requests.get(
+        f"{server_address}/api/v3/admin/metrics",
+        headers={"Authorization": f"bearer {test_db.access_token}"},
+    )
+    assert r.status_code == 200
+    assert r.headers["Content-Type"].startswith("text/plain")
+    assert "# TYPE socialserver_request_duration_seconds histogram" in r.text
+    assert 'socialserver_request_duration_seconds_count{endpoint="postfeed",method="GET",status="201"}' in r.text
+    assert 'socialserver_request_db_queries_bucket{endpoint="postfeed",method="GET",le="+Inf"}' in r.text
+    assert "socialserver_db_queries_total" in r.text
+
+
+def test_get_metrics_not_admin(test_db, server_address):
+    r = requests.get(
+        f"{server_address}/api/v3/admin/metrics",
+        headers={"Authorization": f"bearer {test_db.access_token}"},
+    )
+    assert r.status_code == 401
+    assert r.json()["error"] == ErrorCodes.USER_NOT_ADMIN.value
+
+
+def test_metrics_count_request_queries(test_db, server_address):
+    before = metrics.request_db_queries.count("postfeed", "GET")
+    requests.get(
+        f"{server_address}/api/v3/posts/feed",
+        json={"count": 10, "offset": 0},
+        headers={"Authorization": f"bearer {test_db.access_token}"},
+    )
+    assert metrics.request_db_queries.count("postfeed", "GET") == before + 1
+
+
+def test_metrics_image_stages(test_db, server_address, image_data_binary):
+    before = metrics.image_stage_duration.count("resize")
+    r = requests.post(
+        f"{server_address}/api/v3/image/process_before_return",
+        files={"image": image_data_binary},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+    assert r.status_code == 201
+    assert metrics.image_stage_duration.count("resize") == before + 1
+    assert metrics.image_stage_duration.count("decode") >= 1
+
+
+def test_slow_request_profile(test_db, server_address, monkeypatch, tmp_path):
+    monkeypatch.setattr(config.metrics.profiling, "sample_rate", 1)
+    monkeypatch.setattr(config.metrics.profiling, "slow_request_threshold_ms", 0)
+    monkeypatch.setattr(config.metrics.profiling, "output_dir", str(tmp_path))
+
+    requests.get(
+        f"{server_address}/api/v3/posts/feed",
+        json={"count": 10, "offset": 0},
+        headers={"Authorization": f"bearer {test_db.access_token}"},
+    )
+
+    profiles = list(tmp_path.glob("*_postfeed_GET_*.prof"))
+    assert len(profiles) == 1
@@ -0,0 +1,39 @@
+#  Copyright (c) Niall Asher 2022
+
+import requests
+# noinspection PyUnresolvedReferences
+from socialserver.util.test import (
+    test_db,
+    set_user_attributes_db,
+    server_address,
+    create_post_with_request,
+)
+from socialserver.constants import AccountAttributes, ErrorCodes
+
+
+def test_get_statistics(test_db, server_address):
+    set_user_attributes_db(
+        test_db.db, test_db.username, [AccountAttributes.ADMIN.value]
+    )
+    create_post_with_request(test_db.access_token)
+
+    r = requests.get(
+        f"{server_address}/api/v3/admin/statistics",
+        headers={"Authorization": f"bearer {test_db.access_token}"},
+    )
+    assert r.status_code == 200
+    assert r.json()["users"]["total"] == 1
+    assert r.json()["users"]["admins"] == 1
+    assert r.json()["users"]["unapproved"] == 0
+    assert r.json()["posts"]["total"] == 1
+    assert r.json()["comments"]["total"] == 0
+    assert r.json()["media"]["images"] == 0
+
+
+def test_get_statistics_not_admin(test_db, server_address):
+    r = requests.get(
+        f"{server_address}/api/v3/admin/statistics",
+        headers={"Authorization": f"bearer {test_db.access_token}"},
+    )
+    assert r.status_code == 401
+    assert r.json()["error"] == ErrorCodes.USER_NOT_ADMIN.value
@@ -0,0 +1,236 @@
+#  Copyright (c) Niall Asher 2022
+
+# pycharm isn't detecting fixture usage, so we're
+# disabling PyUnresolvedReferences for the import.
+# noinspection PyUnresolvedReferences
+from socialserver.util.test import test_db, server_address, set_user_attributes_db
+from socialserver.constants import ErrorCodes, ApiKeyPermissions, AccountAttributes
+from socialserver.util.config import config
+from pony.orm import db_session
+import requests
+
+
+def _create_api_key(server_address, test_db, permissions):
+    r = requests.post(
+        f"{server_address}/api/v3/user/api_keys",
+        json={"password": test_db.password, "permissions": permissions},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+    assert r.status_code == 201
+    return r.json()
+
+
+def test_create_and_use_api_key(test_db, server_address):
+    api_key = _create_api_key(server_address, test_db, [ApiKeyPermissions.READ.value])
+
+    r = requests.get(
+        f"{server_address}/api/v3/posts/feed",
+        json={"count": 10, "offset": 0},
+        headers={"Authorization": f"Bearer {api_key['api_key']}"},
+    )
+    assert r.status_code == 201
+
+
+def test_api_key_missing_permission(test_db, server_address):
+    api_key = _create_api_key(server_address, test_db, [ApiKeyPermissions.READ.value])
+
+    r = requests.post(
+        f"{server_address}/api/v3/posts/single",
+        json={"text_content": "hello"},
+        headers={"Authorization": f"Bearer {api_key['api_key']}"},
+    )
+    assert r.status_code == 403
+    assert r.json()["error"] == ErrorCodes.API_KEY_MISSING_PERMISSION.value
+
+
+def test_api_key_with_post_permission(test_db, server_address):
+    api_key = _create_api_key(server_address, test_db, [ApiKeyPermissions.POST.value])
+
+    r = requests.post(
+        f"{server_address}/api/v3/posts/single",
+        json={"text_content": "hello"},
+        headers={"Authorization": f"Bearer {api_key['api_key']}"},
+    )
+    assert r.status_code == 200
+
+
+def test_list_api_keys(test_db, server_address):
+    api_key = _create_api_key(
+        server_address, test_db, [ApiKeyPermissions.READ.value, ApiKeyPermissions.POST.value]
+    )
+
+    r = requests.get(
+        f"{server_address}/api/v3/user/api_keys",
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+    assert r.status_code == 200
+    assert len(r.json()["api_keys"]) == 1
+    assert r.json()["api_keys"][0]["key_id"] == api_key["key_id"]
+    assert r.json()["api_keys"][0]["permissions"] == [0, 1]
+
+
+def test_create_api_key_invalid_password(test_db, server_address):
+    r = requests.post(
+        f"{server_address}/api/v3/user/api_keys",
+        json={"password": "wrong_password", "permissions": [ApiKeyPermissions.READ.value]},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+    assert r.status_code == 401
+    assert r.json()["error"] == ErrorCodes.INCORRECT_PASSWORD.value
+
+
+def test_create_api_key_invalid_permission(test_db, server_address):
+    r = requests.post(
+        f"{server_address}/api/v3/user/api_keys",
+        json={"password": test_db.password, "permissions": [1000]},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+    assert r.status_code == 400
+    assert r.json()["error"] == ErrorCodes.API_KEY_PERMISSION_INVALID.value
+
+
+def test_create_admin_api_key_not_admin(test_db, server_address):
+    r = requests.post(
+        f"{server_address}/api/v3/user/api_keys",
+        json={"password": test_db.password, "permissions": [ApiKeyPermissions.ACCESS_ADMIN.value]},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+    assert r.status_code == 401
+    assert r.json()["error"] == ErrorCodes.USER_NOT_ADMIN.value
+
+
+def test_admin_api_key(test_db, server_address):
+    set_user_attributes_db(test_db.db, test_db.username, [AccountAttributes.ADMIN.value])
+    api_key = _create_api_key(server_address, test_db, [ApiKeyPermissions.ACCESS_ADMIN.value])
+
+    r = requests.get(
+        f"{server_address}/api/v3/admin/userApprovals",
+        json={"count": 10, "offset": 0, "sort": 0},
+        headers={"Authorization": f"Bearer {api_key['api_key']}"},
+    )
+    assert r.status_code == 200
+
+    # the key stops working for admin routes once the owner isn't an admin
+    set_user_attributes_db(test_db.db, test_db.username, [])
+    r = requests.get(
+        f"{server_address}/api/v3/admin/userApprovals",
+        json={"count": 10, "offset": 0, "sort": 0},
+        headers={"Authorization": f"Bearer {api_key['api_key']}"},
+    )
+    assert r.status_code == 401
+
+
+def test_revoked_api_key(test_db, server_address):
+    api_key = _create_api_key(server_address, test_db, [ApiKeyPermissions.READ.value])
+
+    r = requests.delete(
+        f"{server_address}/api/v3/user/api_keys",
+        json={"key_id": api_key["key_id"]},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+    assert r.status_code == 200
+
+    r = requests.get(
+        f"{server_address}/api/v3/posts/feed",
+        json={"count": 10, "offset": 0},
+        headers={"Authorization": f"Bearer {api_key['api_key']}"},
+    )
+    assert r.status_code == 401
+    assert r.json()["error"] == ErrorCodes.API_KEY_INVALID.value
+
+
+def test_api_key_owner_deleted(test_db, server_address):
+    api_key = _create_api_key(server_address, test_db, [ApiKeyPermissions.READ.value])
+    r = requests.get(
+        f"{server_address}/api/v3/user/info",
+        json={"username": test_db.username},
+        headers={"Authorization": f"Bearer {api_key['api_key']}"},
+    )
+    assert r.status_code == 200
+
+    r = requests.delete(
+        f"{server_address}/api/v3/user",
+        json={"password": test_db.password},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+    assert r.status_code == 200
+
+    r = requests.get(
+        f"{server_address}/api/v3/user/info",
+        json={"username": test_db.username},
+        headers={"Authorization": f"Bearer {api_key['api_key']}"},
+    )
+    assert r.status_code == 401
+    assert r.json()["error"] == ErrorCodes.API_KEY_INVALID.value
+
+
+def test_api_key_owner_deleted_elsewhere(test_db, server_address):
+    set_user_attributes_db(test_db.db, test_db.username, [AccountAttributes.ADMIN.value])
+    api_key = _create_api_key(server_address, test_db, [ApiKeyPermissions.ACCESS_ADMIN.value])
+    r = requests.get(
+        f"{server_address}/api/v3/admin/userApprovals",
+        json={"count": 10, "offset": 0, "sort": 0},
+        headers={"Authorization": f"Bearer {api_key['api_key']}"},
+    )
+    assert r.status_code == 200
+
+    # as if deleted through another worker process, so the key's still cached
+    with db_session:
+        test_db.db.User.get(username=test_db.username).delete()
+
+    r = requests.get(
+        f"{server_address}/api/v3/admin/userApprovals",
+        json={"count": 10, "offset": 0, "sort": 0},
+        headers={"Authorization": f"Bearer {api_key['api_key']}"},
+    )
+    assert r.status_code == 401
+    assert r.json()["error"] == ErrorCodes.API_KEY_INVALID.value
+
+
+def test_invalid_api_key(test_db, server_address):
+    api_key = _create_api_key(server_address, test_db, [ApiKeyPermissions.READ.value])
+
+    r = requests.get(
+        f"{server_address}/api/v3/posts/feed",
+        json={"count": 10, "offset": 0},
+        headers={"Authorization": f"Bearer {api_key['api_key']}x"},
+    )
+    assert r.status_code == 401
+    assert r.json()["error"] == ErrorCodes.API_KEY_INVALID.value
+
+
+def test_api_key_cannot_manage_api_keys_or_sessions(test_db, server_address):
+    api_key = _create_api_key(server_address, test_db, [ApiKeyPermissions.READ.value])
+
+    r = requests.get(
+        f"{server_address}/api/v3/user/api_keys",
+        headers={"Authorization": f"Bearer {api_key['api_key']}"},
+    )
+    assert r.status_code == 403
+
+    r = requests.get(
+        f"{server_address}/api/v3/user/session/list",
+        headers={"Authorization": f"Bearer {api_key['api_key']}"},
+    )
+    assert r.status_code == 403
+
+
+def test_api_key_rate_limited(test_db, server_address, monkeypatch):
+    monkeypatch.setattr(config.auth.api_keys, "rate_limit_per_minute", 2)
+    api_key = _create_api_key(server_address, test_db, [ApiKeyPermissions.READ.value])
+
+    for _ in range(2):
+        r = requests.get(
+            f"{server_address}/api/v3/posts/feed",
+            json={"count": 10, "offset": 0},
+            headers={"Authorization": f"Bearer {api_key['api_key']}"},
+        )
+        assert r.status_code == 201
+
+    r = requests.get(
+        f"{server_address}/api/v3/posts/feed",
+        json={"count": 10, "offset": 0},
+        headers={"Authorization": f"Bearer {api_key['api_key']}"},
+    )
+    assert r.status_code == 429
+    assert r.json()["error"] == ErrorCodes.RATE_LIMITED.value
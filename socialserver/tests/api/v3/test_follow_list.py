@@ -164,3 +164,45 @@ def test_get_follower_list(test_db, server_address):
     assert r.json()["meta"]["count"] == 20
     assert r.json()["meta"]["reached_end"] is False
     assert len(r.json()["follow_entries"]) == 10
+
+
+def test_follow_list_includes_relationships(test_db, server_address):
+    create_user_with_request(username="user2")
+    create_user_with_request(username="user3")
+    user2_token = create_user_session_with_request(username="user2", password="password")
+    follow_user_with_request(test_db.access_token, "user2")
+    follow_user_with_request(user2_token, test_db.username)
+    follow_user_with_request(user2_token, "user3")
+
+    r = requests.get(f"{server_address}/api/v3/user/following",
+                     json={
+                         "sort_type": FollowListSortTypes.AGE_ASCENDING.value,
+                         "username": "user2",
+                         "count": 10,
+                         "offset": 0
+                     },
+                     headers={
+                         "Authorization": f"bearer {test_db.access_token}"
+                     })
+    assert r.status_code == 200
+    entries = {entry["username"]: entry for entry in r.json()["follow_entries"]}
+    assert entries[test_db.username]["followed"] is False
+    assert entries["user3"]["followed"] is False
+    assert entries["user3"]["follows_you"] is False
+
+    r = requests.get(f"{server_address}/api/v3/user/followers",
+                     json={
+                         "sort_type": FollowListSortTypes.AGE_ASCENDING.value,
+                         "count": 10,
+                         "offset": 0
+                     },
+                     headers={
+                         "Authorization": f"bearer {test_db.access_token}"
+                     })
+    assert r.status_code == 200
+    entry = r.json()["follow_entries"][0]
+    assert entry["username"] == "user2"
+    assert entry["followed"] is True
+    assert entry["follows_you"] is True
+    assert entry["blocked"] is False
+    assert entry["blocked_by"] is False
@@ -0,0 +1,215 @@
+#  Copyright (c) Niall Asher 2022
+
+# noinspection PyUnresolvedReferences
+from socialserver.util.test import (
+    test_db,
+    server_address,
+    create_post_with_request,
+    create_user_with_request,
+    create_user_session_with_request,
+)
+from socialserver.constants import ErrorCodes, MAX_FEED_GET_COUNT
+from socialserver.db import define_entities, _migrate_post_hashtags
+from pony import orm
+from pony.orm import db_session
+import datetime
+import requests
+
+
+def test_get_tag_feed(test_db, server_address):
+    create_post_with_request(test_db.access_token, text_content="a #Tagged post")
+    create_post_with_request(test_db.access_token, text_content="an untagged post")
+    create_post_with_request(test_db.access_token, text_content="#other #tagged post")
+
+    r = requests.get(
+        f"{server_address}/api/v3/posts/tag",
+        json={"tag": "#tagged", "count": 15},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+
+    assert r.status_code == 201
+    assert r.json()["meta"]["reached_end"] is True
+    assert r.json()["meta"]["next_cursor"] is None
+    # newest first
+    assert [p["post"]["id"] for p in r.json()["posts"]] == [3, 1]
+
+
+def test_get_tag_feed_without_hash(test_db, server_address):
+    create_post_with_request(test_db.access_token, text_content="#tagged")
+
+    r = requests.get(
+        f"{server_address}/api/v3/posts/tag",
+        json={"tag": "TAGGED", "count": 15},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+
+    assert r.status_code == 201
+    assert len(r.json()["posts"]) == 1
+
+
+def test_get_tag_feed_unused_tag(test_db, server_address):
+    r = requests.get(
+        f"{server_address}/api/v3/posts/tag",
+        json={"tag": "unused", "count": 15},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+
+    assert r.status_code == 201
+    assert r.json()["meta"]["reached_end"] is True
+    assert len(r.json()["posts"]) == 0
+
+
+def test_get_tag_feed_paginated(test_db, server_address):
+    for i in range(0, 5):
+        create_post_with_request(test_db.access_token, text_content=f"#paged post {i}")
+
+    seen_ids = []
+    cursor = None
+    while True:
+        request_data = {"tag": "paged", "count": 2}
+        if cursor is not None:
+            request_data["cursor"] = cursor
+        r = requests.get(
+            f"{server_address}/api/v3/posts/tag",
+            json=request_data,
+            headers={"Authorization": f"Bearer {test_db.access_token}"},
+        )
+        assert r.status_code == 201
+        seen_ids += [p["post"]["id"] for p in r.json()["posts"]]
+        cursor = r.json()["meta"]["next_cursor"]
+        if r.json()["meta"]["reached_end"]:
+            break
+
+    assert seen_ids == [5, 4, 3, 2, 1]
+
+
+def test_get_tag_feed_blocked_user(test_db, server_address):
+    create_user_with_request(username="user2", password="password")
+    at_user_two = create_user_session_with_request(username="user2", password="password")
+    create_post_with_request(at_user_two, text_content="#blocked")
+
+    r = requests.post(
+        f"{server_address}/api/v3/user/block",
+        json={"username": "user2"},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+    assert r.status_code == 201
+
+    r = requests.get(
+        f"{server_address}/api/v3/posts/tag",
+        json={"tag": "blocked", "count": 15},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+
+    assert r.status_code == 201
+    assert len(r.json()["posts"]) == 0
+
+
+def test_get_tag_feed_invalid_tag(test_db, server_address):
+    r = requests.get(
+        f"{server_address}/api/v3/posts/tag",
+        json={"tag": "not a tag", "count": 15},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+
+    assert r.status_code == 400
+    assert r.json()["error"] == ErrorCodes.TAG_INVALID.value
+
+
+def test_get_tag_feed_invalid_cursor(test_db, server_address):
+    r = requests.get(
+        f"{server_address}/api/v3/posts/tag",
+        json={"tag": "tag", "count": 15, "cursor": "garbage"},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+
+    assert r.status_code == 400
+    assert r.json()["error"] == ErrorCodes.INVALID_FEED_CURSOR.value
+
+
+def test_get_tag_feed_count_too_high(test_db, server_address):
+    r = requests.get(
+        f"{server_address}/api/v3/posts/tag",
+        json={"tag": "tag", "count": MAX_FEED_GET_COUNT + 1},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+
+    assert r.status_code == 400
+    assert r.json()["error"] == ErrorCodes.FEED_GET_COUNT_TOO_HIGH.value
+
+
+def test_get_tag_feed_count_too_low(test_db, server_address):
+    r = requests.get(
+        f"{server_address}/api/v3/posts/tag",
+        json={"tag": "tag", "count": 0},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+
+    assert r.status_code == 400
+    assert r.json()["error"] == ErrorCodes.FEED_GET_COUNT_TOO_LOW.value
+
+
+def _create_migration_test_db(tmp_path):
+    migrated_db = orm.Database()
+    define_entities(migrated_db)
+    migrated_db.bind("sqlite", str(tmp_path / "old.db"), create_db=True)
+    migrated_db.generate_mapping(create_tables=True)
+    with db_session:
+        migrated_db.User(display_name="old", username="old", password_hash="x", password_salt="x",
+                         creation_time=datetime.datetime(2022, 1, 1), is_legacy_account=False,
+                         account_approved=True)
+    return migrated_db
+
+
+def _create_migration_test_posts(migrated_db, days):
+    user = migrated_db.User.get(username="old")
+    return [
+        migrated_db.Post(user=user, text="#tag", under_moderation=False, processed=True,
+                         creation_time=datetime.datetime(2022, 1, day))
+        for day in days
+    ]
+
+
+def test_migrate_post_hashtags(tmp_path):
+    migrated_db = _create_migration_test_db(tmp_path)
+    with db_session:
+        # stored with the #, as they used to be
+        tag = migrated_db.Hashtag(name="#tag", creation_time=datetime.datetime(2022, 1, 1))
+        posts = _create_migration_test_posts(migrated_db, [2, 1])
+        orm.commit()
+        # the join table pony made for the old many-to-many set
+        migrated_db.execute('CREATE TABLE "Hashtag_Post" ("hashtag" INTEGER NOT NULL, "post" INTEGER NOT NULL)')
+        for post in posts:
+            migrated_db.execute(f'INSERT INTO "Hashtag_Post" VALUES ({tag.id}, {post.id})')
+
+    _migrate_post_hashtags(migrated_db)
+    # already done
+    _migrate_post_hashtags(migrated_db)
+
+    with db_session:
+        links = migrated_db.PostHashtag.select().order_by(migrated_db.PostHashtag.id)[:]
+        assert [(link.post.id, link.creation_time) for link in links] == [
+            (posts[1].id, posts[1].creation_time), (posts[0].id, posts[0].creation_time)
+        ]
+        assert all(link.hashtag.id == tag.id for link in links)
+        assert migrated_db.Hashtag[tag.id].name == "tag"
+        assert not migrated_db.provider.table_exists(migrated_db.get_connection(), "Hashtag_Post")
+    migrated_db.disconnect()
+
+
+def test_migrate_post_hashtags_merges_duplicates(tmp_path):
+    migrated_db = _create_migration_test_db(tmp_path)
+    with db_session:
+        old_tag = migrated_db.Hashtag(name="#tag", creation_time=datetime.datetime(2022, 1, 1))
+        # made without the # after upgrading, before the names were fixed
+        tag = migrated_db.Hashtag(name="tag", creation_time=datetime.datetime(2022, 1, 3))
+        posts = _create_migration_test_posts(migrated_db, [1, 2, 3])
+        for post, post_tag in [(posts[0], old_tag), (posts[1], old_tag), (posts[1], tag), (posts[2], tag)]:
+            migrated_db.PostHashtag(post=post, hashtag=post_tag, creation_time=post.creation_time)
+
+    _migrate_post_hashtags(migrated_db)
+
+    with db_session:
+        assert migrated_db.Hashtag.select().count() == 1
+        assert sorted(link.post.id for link in migrated_db.Hashtag[tag.id].posts) == [p.id for p in posts]
+    migrated_db.disconnect()
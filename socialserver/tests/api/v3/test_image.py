@@ -3,10 +3,17 @@
 # noinspection PyUnresolvedReferences
 import magic
 from socialserver.util.test import test_db, server_address, image_data_binary
-from socialserver.constants import ErrorCodes, ImageTypes
+from socialserver.util.config import config
+from socialserver.util.media_jobs import MediaJobQueue, media_jobs
+from socialserver.constants import ErrorCodes, ImageTypes, ImageUploadPurposes, MAX_IMAGE_SIZE_HEADER, \
+    MAX_IMAGE_SIZE_PROFILE_PICTURE_LARGE, MediaJobLanes, MediaJobPhases
 from magic import from_buffer as magic_from_buffer
 from io import BytesIO
+from pony.orm import db_session
+from random import randint
+from PIL import Image
 import requests
+import socialserver.util.image
 
 
 def test_upload_image(test_db, server_address, image_data_binary):
@@ -40,6 +47,8 @@ def test_get_image_webp(test_db, server_address, image_data_binary):
         headers={"Authorization": f"Bearer {test_db.access_token}"},
     ).json()["identifier"]
     print(image_identifier)
+    # webps are made in the deferred phase
+    media_jobs.wait_until_idle()
     r = requests.get(
         f"{server_address}/api/v3/image/{image_identifier}",
         json={"wanted_type": "post", "pixel_ratio": 1, "format": "webp"},
@@ -52,6 +61,42 @@ def test_get_image_webp(test_db, server_address, image_data_binary):
     assert magic_from_buffer(file_buf.read(2048), mime=True) == "image/webp"
 
 
+def test_get_image_accept_header(test_db, server_address, image_data_binary):
+    image_identifier = requests.post(
+        f"{server_address}/api/v3/image/process_before_return",
+        files={"image": image_data_binary},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    ).json()["identifier"]
+    media_jobs.wait_until_idle()
+
+    # no format given, so it's picked from the accept header
+    r = requests.get(
+        f"{server_address}/api/v3/image/{image_identifier}",
+        json={"wanted_type": "post", "pixel_ratio": 1},
+        headers={"Accept": "image/avif,image/webp,*/*;q=0.8"},
+    )
+    assert r.status_code == 200
+    # there's no avif, since it isn't enabled
+    assert magic_from_buffer(r.content[:2048], mime=True) == "image/webp"
+    assert r.headers["Vary"] == "Accept"
+
+    r = requests.get(
+        f"{server_address}/api/v3/image/{image_identifier}",
+        json={"wanted_type": "post", "pixel_ratio": 1},
+        headers={"Accept": "*/*"},
+    )
+    assert magic_from_buffer(r.content[:2048], mime=True) == "image/jpeg"
+
+    # an explicit format wins over the header
+    r = requests.get(
+        f"{server_address}/api/v3/image/{image_identifier}",
+        json={"wanted_type": "post", "pixel_ratio": 1, "format": "jpg"},
+        headers={"Accept": "image/webp"},
+    )
+    assert magic_from_buffer(r.content[:2048], mime=True) == "image/jpeg"
+    assert "Vary" not in r.headers
+
+
 def test_get_image_invalid_use(test_db, server_address, image_data_binary):
     image_identifier = requests.post(
         f"{server_address}/api/v3/image/process_before_return",
@@ -91,3 +136,132 @@ def test_upload_image_threaded(test_db, server_address, image_data_binary):
     )
     assert r.status_code == 404
     assert r.json()["error"] == ErrorCodes.IMAGE_NOT_PROCESSED.value
+
+
+def _upload_image(server_address, access_token, image_data_binary, purpose=None):
+    return requests.post(
+        f"{server_address}/api/v3/image/process_before_return",
+        files={"image": image_data_binary},
+        data={"purpose": purpose} if purpose is not None else {},
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+
+
+def _get_image(server_address, identifier, image_type: ImageTypes, pixel_ratio=1):
+    return requests.get(
+        f"{server_address}/api/v3/image/{identifier}",
+        json={"wanted_type": image_type.value, "pixel_ratio": pixel_ratio},
+    )
+
+
+def _unique_image() -> bytes:
+    # other tests upload image_data_binary for posts, which would already
+    # have generated the post variants for it.
+    image = Image.new("RGB", (640, 480), tuple(randint(0, 255) for _ in range(0, 3)))
+    image_bytes = BytesIO()
+    image.save(image_bytes, format="JPEG")
+    return image_bytes.getvalue()
+
+
+def test_upload_image_purpose_variants(test_db, server_address):
+    identifier = _upload_image(server_address, test_db.access_token, _unique_image(),
+                               ImageUploadPurposes.AVATAR.value).json()["identifier"]
+    assert _get_image(server_address, identifier, ImageTypes.PROFILE_PICTURE).status_code == 200
+    assert _get_image(server_address, identifier, ImageTypes.PROFILE_PICTURE_LARGE, 4).status_code == 200
+    # not needed for an avatar, so not generated
+    r = _get_image(server_address, identifier, ImageTypes.POST)
+    assert r.status_code == 404
+    assert r.json()["error"] == ErrorCodes.IMAGE_NOT_FOUND.value
+    assert _get_image(server_address, identifier, ImageTypes.HEADER).status_code == 404
+
+
+def test_upload_image_header_size(test_db, server_address, image_data_binary):
+    identifier = _upload_image(server_address, test_db.access_token, image_data_binary,
+                               ImageUploadPurposes.HEADER.value).json()["identifier"]
+    r = _get_image(server_address, identifier, ImageTypes.HEADER)
+    assert r.status_code == 200
+    assert Image.open(BytesIO(r.content)).size == MAX_IMAGE_SIZE_HEADER
+
+
+def test_upload_image_invalid_purpose(test_db, server_address, image_data_binary):
+    r = _upload_image(server_address, test_db.access_token, image_data_binary, "invalid_purpose")
+    assert r.status_code == 400
+    assert r.json()["error"] == ErrorCodes.IMAGE_PURPOSE_INVALID.value
+
+
+def test_upload_image_too_large(test_db, server_address, monkeypatch):
+    # the test server runs in this process, so it sees this.
+    monkeypatch.setattr(config.media.images, "max_image_pixels", 640 * 480 - 1)
+    r = _upload_image(server_address, test_db.access_token, _unique_image())
+    assert r.status_code == 413
+    assert r.json()["error"] == ErrorCodes.IMAGE_TOO_LARGE.value
+
+
+def test_get_image_closest_pixel_ratio(test_db, server_address, image_data_binary):
+    identifier = _upload_image(server_address, test_db.access_token, image_data_binary).json()["identifier"]
+    # posts are only stored at 1x
+    assert _get_image(server_address, identifier, ImageTypes.POST, 3).status_code == 200
+
+
+def test_image_variants_generated_when_reused(test_db, server_address):
+    # uploaded for a post, then used as a profile picture & header
+    identifier = _upload_image(server_address, test_db.access_token, _unique_image()).json()["identifier"]
+    assert _get_image(server_address, identifier, ImageTypes.PROFILE_PICTURE).status_code == 404
+    for key in ["profile_pic_ref", "header_pic_ref"]:
+        r = requests.patch(
+            f"{server_address}/api/v3/user",
+            json={key: identifier},
+            headers={"Authorization": f"Bearer {test_db.access_token}"},
+        )
+        assert r.status_code == 201
+    assert _get_image(server_address, identifier, ImageTypes.PROFILE_PICTURE).status_code == 200
+    assert _get_image(server_address, identifier, ImageTypes.HEADER).status_code == 200
+
+
+def test_duplicate_upload_generates_missing_variants(test_db, server_address):
+    image_data_binary = _unique_image()
+    first = _upload_image(server_address, test_db.access_token, image_data_binary,
+                          ImageUploadPurposes.AVATAR.value).json()["identifier"]
+    second = _upload_image(server_address, test_db.access_token, image_data_binary).json()
+    assert second["processed"] is True
+    # same files, so both have everything now
+    for identifier in [first, second["identifier"]]:
+        assert _get_image(server_address, identifier, ImageTypes.POST).status_code == 200
+        assert _get_image(server_address, identifier, ImageTypes.PROFILE_PICTURE).status_code == 200
+
+
+def test_get_image_before_deferred_phase(test_db, server_address, monkeypatch):
+    # a queue without any workers, so the deferred phase waits
+    queue = MediaJobQueue(0)
+    monkeypatch.setattr("socialserver.util.image.media_jobs", queue)
+    identifier = _upload_image(server_address, test_db.access_token, _unique_image(),
+                               ImageUploadPurposes.AVATAR.value).json()["identifier"]
+    # the 1x jpg is there straight away, and is served for bigger
+    # pixel ratios, and other formats, until they've been made.
+    r = _get_image(server_address, identifier, ImageTypes.PROFILE_PICTURE_LARGE, 2)
+    assert r.status_code == 200
+    assert Image.open(BytesIO(r.content)).size == MAX_IMAGE_SIZE_PROFILE_PICTURE_LARGE
+    r = requests.get(
+        f"{server_address}/api/v3/image/{identifier}",
+        json={"wanted_type": ImageTypes.PROFILE_PICTURE_LARGE.value, "pixel_ratio": 1},
+        headers={"Accept": "image/webp,*/*"},
+    )
+    assert magic_from_buffer(r.content[:2048], mime=True) == "image/jpeg"
+
+    queue.workers = 1
+    queue.submit(lambda: None, MediaJobPhases.DEFERRED, MediaJobLanes.BACKLOG)
+    assert queue.wait_until_idle(timeout=60)
+    r = _get_image(server_address, identifier, ImageTypes.PROFILE_PICTURE_LARGE, 2)
+    assert Image.open(BytesIO(r.content)).size[0] == MAX_IMAGE_SIZE_PROFILE_PICTURE_LARGE[0] * 2
+
+
+def test_get_image_sharded_layout(test_db, server_address, monkeypatch):
+    monkeypatch.setattr(config.media, "storage_layout", "sharded")
+    upload = _upload_image(server_address, test_db.access_token, _unique_image()).json()
+    r = _get_image(server_address, upload["identifier"], ImageTypes.POST)
+    assert r.status_code == 200
+    with db_session:
+        image_hash = test_db.db.Image.get(identifier=upload["identifier"]).sha256sum
+    fs = socialserver.util.image.fs_images
+    assert fs.exists(f"/{image_hash[0:2]}/{image_hash[2:4]}/{image_hash}/{ImageTypes.POST.value}_1x.jpg")
+    assert not fs.exists(f"/{image_hash}")
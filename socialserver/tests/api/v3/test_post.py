@@ -182,3 +182,25 @@ def test_try_delete_post_from_other_user(test_db, server_address, monkeypatch):
 
     assert r.status_code == 401
     assert r.json()["error"] == ErrorCodes.OBJECT_NOT_OWNED_BY_USER.value
+
+
+def test_create_single_post_too_many_tags(test_db, server_address, monkeypatch):
+    r = requests.post(
+        f"{server_address}/api/v3/posts/single",
+        json={"text_content": "#one #two #three #four #five #six"},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+
+    assert r.status_code == 400
+    assert r.json()["error"] == ErrorCodes.POST_TOO_MANY_TAGS.value
+
+
+def test_create_single_post_repeated_tags(test_db, server_address, monkeypatch):
+    # the same tag repeated doesn't count against the limit.
+    r = requests.post(
+        f"{server_address}/api/v3/posts/single",
+        json={"text_content": "#tag #tag #TAG #tag #tag #tag"},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+
+    assert r.status_code == 200
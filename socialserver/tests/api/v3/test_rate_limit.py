@@ -0,0 +1,81 @@
+#  Copyright (c) Niall Asher 2022
+
+# pycharm isn't detecting fixture usage, so we're
+# disabling PyUnresolvedReferences for the import.
+# noinspection PyUnresolvedReferences
+from socialserver.util.test import test_db, server_address
+from socialserver.constants import ErrorCodes
+from socialserver.util.config import config
+import requests
+
+
+def test_rate_limit_headers(test_db, server_address):
+    r = requests.get(
+        f"{server_address}/api/v3/posts/feed",
+        json={"count": 10, "offset": 0},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+    assert r.status_code == 201
+    assert int(r.headers["RateLimit-Limit"]) == config.rate_limit.read.per_user_per_minute
+    assert int(r.headers["RateLimit-Remaining"]) == config.rate_limit.read.per_user_per_minute - 1
+    assert "RateLimit-Reset" in r.headers
+
+
+def test_rate_limit_login_by_ip(test_db, server_address, monkeypatch):
+    monkeypatch.setattr(config.rate_limit.login, "per_ip_per_minute", 2)
+
+    for _ in range(2):
+        r = requests.post(
+            f"{server_address}/api/v3/user/session",
+            json={"username": test_db.username, "password": "wrong_password"},
+        )
+        assert r.status_code == 401
+
+    r = requests.post(
+        f"{server_address}/api/v3/user/session",
+        json={"username": test_db.username, "password": test_db.password},
+    )
+    assert r.status_code == 429
+    assert r.json()["error"] == ErrorCodes.RATE_LIMITED.value
+    assert int(r.headers["Retry-After"]) > 0
+    assert r.headers["RateLimit-Remaining"] == "0"
+
+
+def test_rate_limit_by_user(test_db, server_address, monkeypatch):
+    monkeypatch.setattr(config.rate_limit.read, "per_user_per_minute", 1)
+
+    r = requests.get(
+        f"{server_address}/api/v3/posts/feed",
+        json={"count": 10, "offset": 0},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+    assert r.status_code == 201
+
+    r = requests.get(
+        f"{server_address}/api/v3/posts/feed",
+        json={"count": 10, "offset": 0},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+    assert r.status_code == 429
+
+    # route classes have separate limits
+    r = requests.post(
+        f"{server_address}/api/v3/posts/single",
+        json={"text_content": "hello"},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+    assert r.status_code == 200
+
+
+def test_rate_limit_disabled(test_db, server_address, monkeypatch):
+    monkeypatch.setattr(config.rate_limit, "enabled", False)
+    monkeypatch.setattr(config.rate_limit.read, "per_user_per_minute", 1)
+
+    for _ in range(3):
+        r = requests.get(
+            f"{server_address}/api/v3/posts/feed",
+            json={"count": 10, "offset": 0},
+            headers={"Authorization": f"Bearer {test_db.access_token}"},
+        )
+        assert r.status_code == 201
+        assert "RateLimit-Limit" not in r.headers
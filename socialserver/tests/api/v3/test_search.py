@@ -0,0 +1,205 @@
+#  Copyright (c) Niall Asher 2022
+
+# noinspection PyUnresolvedReferences
+from socialserver.util.test import (
+    test_db,
+    server_address,
+    create_post_with_request,
+    create_user_with_request,
+    create_user_session_with_request,
+)
+from socialserver.constants import ErrorCodes, MAX_FEED_GET_COUNT
+import pytest
+import requests
+
+
+def test_search_posts(test_db, server_address):
+    create_post_with_request(test_db.access_token, text_content="the quick brown fox")
+    create_post_with_request(test_db.access_token, text_content="a slow brown dog")
+    create_post_with_request(test_db.access_token, text_content="something else")
+
+    r = requests.get(
+        f"{server_address}/api/v3/search/posts",
+        json={"query": "Brown", "count": 10},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+
+    assert r.status_code == 200
+    assert r.json()["meta"]["reached_end"] is True
+    assert sorted(p["post"]["id"] for p in r.json()["posts"]) == [1, 2]
+
+
+def test_search_posts_all_terms_required(test_db, server_address):
+    create_post_with_request(test_db.access_token, text_content="the quick brown fox")
+    create_post_with_request(test_db.access_token, text_content="a slow brown dog")
+
+    r = requests.get(
+        f"{server_address}/api/v3/search/posts",
+        json={"query": "brown fox", "count": 10},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+
+    assert r.status_code == 200
+    assert [p["post"]["id"] for p in r.json()["posts"]] == [1]
+
+
+def test_search_posts_deleted_post(test_db, server_address):
+    post_id = create_post_with_request(test_db.access_token, text_content="delete me")
+    r = requests.delete(
+        f"{server_address}/api/v3/posts/single",
+        json={"post_id": post_id},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+    assert r.status_code == 200
+
+    r = requests.get(
+        f"{server_address}/api/v3/search/posts",
+        json={"query": "delete", "count": 10},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+
+    assert r.status_code == 200
+    assert len(r.json()["posts"]) == 0
+
+
+def test_search_posts_blocked_user(test_db, server_address):
+    create_user_with_request(username="user2", password="password")
+    at_user_two = create_user_session_with_request(username="user2", password="password")
+    create_post_with_request(at_user_two, text_content="hidden post")
+
+    r = requests.post(
+        f"{server_address}/api/v3/user/block",
+        json={"username": "user2"},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+    assert r.status_code == 201
+
+    r = requests.get(
+        f"{server_address}/api/v3/search/posts",
+        json={"query": "hidden", "count": 10},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+
+    assert r.status_code == 200
+    assert len(r.json()["posts"]) == 0
+
+
+def test_search_posts_paginated(test_db, server_address):
+    for i in range(0, 5):
+        create_post_with_request(test_db.access_token, text_content=f"paged post {i}")
+
+    seen_ids = []
+    cursor = None
+    while True:
+        request_data = {"query": "paged", "count": 2}
+        if cursor is not None:
+            request_data["cursor"] = cursor
+        r = requests.get(
+            f"{server_address}/api/v3/search/posts",
+            json=request_data,
+            headers={"Authorization": f"Bearer {test_db.access_token}"},
+        )
+        assert r.status_code == 200
+        seen_ids += [p["post"]["id"] for p in r.json()["posts"]]
+        cursor = r.json()["meta"]["next_cursor"]
+        if r.json()["meta"]["reached_end"]:
+            break
+
+    assert sorted(seen_ids) == [1, 2, 3, 4, 5]
+
+
+def test_search_posts_invalid_query(test_db, server_address):
+    r = requests.get(
+        f"{server_address}/api/v3/search/posts",
+        json={"query": "\" * ()", "count": 10},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+
+    assert r.status_code == 400
+    assert r.json()["error"] == ErrorCodes.SEARCH_QUERY_INVALID.value
+
+
+def test_search_posts_count_too_high(test_db, server_address):
+    r = requests.get(
+        f"{server_address}/api/v3/search/posts",
+        json={"query": "post", "count": MAX_FEED_GET_COUNT + 1},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+
+    assert r.status_code == 400
+    assert r.json()["error"] == ErrorCodes.FEED_GET_COUNT_TOO_HIGH.value
+
+
+@pytest.mark.parametrize("count", [0, -1])
+def test_search_posts_count_too_low(test_db, server_address, count):
+    r = requests.get(
+        f"{server_address}/api/v3/search/posts",
+        json={"query": "post", "count": count},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+
+    assert r.status_code == 400
+    assert r.json()["error"] == ErrorCodes.FEED_GET_COUNT_TOO_LOW.value
+
+
+def test_search_posts_paginated_mixed_scores(test_db, server_address):
+    # different lengths, so a mix of different and tied scores
+    for i in range(0, 6):
+        create_post_with_request(test_db.access_token, text_content="ranked" + " filler" * (i // 2))
+
+    pages = []
+    cursor = None
+    while cursor is not None or len(pages) == 0:
+        request_data = {"query": "ranked", "count": 1}
+        if cursor is not None:
+            request_data["cursor"] = cursor
+        r = requests.get(
+            f"{server_address}/api/v3/search/posts",
+            json=request_data,
+            headers={"Authorization": f"Bearer {test_db.access_token}"},
+        )
+        assert r.status_code == 200
+        pages += [p["post"]["id"] for p in r.json()["posts"]]
+        cursor = r.json()["meta"]["next_cursor"]
+
+    # every post once, and the same order as all in one page
+    r = requests.get(
+        f"{server_address}/api/v3/search/posts",
+        json={"query": "ranked", "count": 10},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+    assert pages == [p["post"]["id"] for p in r.json()["posts"]]
+    assert sorted(pages) == [1, 2, 3, 4, 5, 6]
+
+
+def test_search_users_prefix(test_db, server_address):
+    create_user_with_request(username="searchable", password="password", display_name="Someone")
+    create_user_with_request(username="other", password="password", display_name="Search Person")
+    create_user_with_request(username="unrelated", password="password", display_name="Nobody")
+
+    r = requests.get(
+        f"{server_address}/api/v3/search/users",
+        json={"query": "sear", "count": 10},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+
+    assert r.status_code == 200
+    assert sorted(u["username"] for u in r.json()["users"]) == ["other", "searchable"]
+
+
+def test_search_users_renamed(test_db, server_address):
+    r = requests.patch(
+        f"{server_address}/api/v3/user",
+        json={"username": "renamed"},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+    assert r.status_code == 200
+
+    r = requests.get(
+        f"{server_address}/api/v3/search/users",
+        json={"query": "renamed", "count": 10},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+
+    assert r.status_code == 200
+    assert [u["username"] for u in r.json()["users"]] == ["renamed"]
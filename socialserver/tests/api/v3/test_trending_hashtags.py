@@ -0,0 +1,78 @@
+#  Copyright (c) Niall Asher 2022
+
+# noinspection PyUnresolvedReferences
+from socialserver.util.test import test_db, server_address, create_post_with_request
+from socialserver.constants import ErrorCodes, MAX_TRENDING_HASHTAGS_GET_COUNT
+from socialserver.util.hashtag import _new_trending_counter, checkpoint_trending_hashtags
+from pony.orm import db_session
+import pytest
+import requests
+
+
+def test_get_trending_hashtags(test_db, server_address, monkeypatch):
+    # the trending list is only rebuilt every so often, so make
+    # sure it's rebuilt for this request.
+    monkeypatch.setattr("socialserver.util.hashtag.trending_hashtags.refresh_seconds", 0)
+    for i in range(0, 3):
+        create_post_with_request(test_db.access_token, text_content="#trendtest")
+
+    r = requests.get(
+        f"{server_address}/api/v3/hashtags/trending",
+        json={},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+
+    assert r.status_code == 200
+    assert "trendtest" in [t["name"] for t in r.json()["hashtags"]]
+
+
+def test_get_trending_hashtags_count_too_high(test_db, server_address):
+    r = requests.get(
+        f"{server_address}/api/v3/hashtags/trending",
+        json={"count": MAX_TRENDING_HASHTAGS_GET_COUNT + 1},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+
+    assert r.status_code == 400
+    assert r.json()["error"] == ErrorCodes.FEED_GET_COUNT_TOO_HIGH.value
+
+
+@pytest.mark.parametrize("count", [0, -1])
+def test_get_trending_hashtags_count_too_low(test_db, server_address, count):
+    r = requests.get(
+        f"{server_address}/api/v3/hashtags/trending",
+        json={"count": count},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+
+    assert r.status_code == 400
+    assert r.json()["error"] == ErrorCodes.FEED_GET_COUNT_TOO_LOW.value
+
+
+def test_get_trending_hashtags_invalid_token(test_db, server_address):
+    r = requests.get(
+        f"{server_address}/api/v3/hashtags/trending",
+        json={},
+        headers={"Authorization": "Bearer invalid"},
+    )
+
+    assert r.status_code == 401
+
+
+def test_checkpoint_trending_hashtags_merges_workers(test_db, monkeypatch):
+    # as if each was the counter in a different worker process
+    workers = [_new_trending_counter() for _ in range(0, 2)]
+    workers[0].record(["shared", "first"])
+    workers[1].record(["shared"])
+    for worker in workers:
+        monkeypatch.setattr("socialserver.util.hashtag.trending_hashtags", worker)
+        checkpoint_trending_hashtags()
+        worker.refresh_seconds = 0
+    assert dict(workers[1].top(10)) == {"shared": 2, "first": 1}
+    with db_session:
+        assert test_db.db.TrendingHashtagSnapshot.select().count() == 1
+
+    # nothing new since, so nothing's counted twice
+    monkeypatch.setattr("socialserver.util.hashtag.trending_hashtags", workers[0])
+    checkpoint_trending_hashtags()
+    assert dict(workers[0].top(10)) == {"shared": 2, "first": 1}
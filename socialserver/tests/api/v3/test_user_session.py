@@ -8,6 +8,10 @@ from time import sleep
 from socialserver.util.config import config
 from socialserver.util.test import test_db, server_address
 from socialserver.constants import ErrorCodes
+from socialserver.util.auth import hasher
+from socialserver.util.hashing_pool import HashingPool
+from pony.orm import db_session
+import argon2
 import requests
 
 
@@ -75,6 +79,17 @@ def test_get_user_session_list(test_db, server_address):
     assert r.status_code == 200
 
 
+def test_get_user_session_list_last_access_time(test_db, server_address):
+    r = requests.get(
+        f"{server_address}/api/v3/user/session/list",
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+    assert r.status_code == 200
+    session = r.json()[0]
+    # the access is still buffered, but should show up straight away.
+    assert session["last_access_time"] > session["creation_time"]
+
+
 def test_get_user_session_list_invalid_auth(test_db, server_address):
     r = requests.get(
         f"{server_address}/api/v3/user/session/list",
@@ -118,3 +133,38 @@ def test_account_lock(test_db, server_address):
     config.auth.failure_lock.enabled = fail_lock_enabled_prev
     config.auth.failure_lock.lock_time_seconds = fail_lock_time_prev
     config.auth.failure_lock.fail_count_before_lock = fail_lock_count_prev
+
+
+def test_create_session_rehash_password(test_db, server_address):
+    # a hash made with weaker parameters than the configured ones,
+    # like one made before the config was changed.
+    with db_session:
+        user = test_db.db.User.get(username=test_db.username)
+        old_hasher = argon2.PasswordHasher(time_cost=1, memory_cost=8, parallelism=1)
+        user.password_hash = old_hasher.hash(test_db.password + user.password_salt)
+
+    creation_req = requests.post(
+        f"{server_address}/api/v3/user/session",
+        json={"username": test_db.username, "password": test_db.password},
+    )
+    assert creation_req.status_code == 200
+
+    with db_session:
+        user = test_db.db.User.get(username=test_db.username)
+        assert hasher.check_needs_rehash(user.password_hash) is False
+        assert hasher.verify(user.password_hash, test_db.password + user.password_salt)
+
+
+def test_create_session_hashing_pool_busy(test_db, server_address, monkeypatch):
+    busy_pool = HashingPool(max_concurrent=1, max_queued=0, queue_timeout=0)
+    # take the only slot, so there's nowhere for the login to run.
+    busy_pool._slots.acquire()
+    monkeypatch.setattr("socialserver.util.auth.hashing_pool", busy_pool)
+
+    creation_req = requests.post(
+        f"{server_address}/api/v3/user/session",
+        json={"username": test_db.username, "password": test_db.password},
+    )
+
+    assert creation_req.status_code == 429
+    assert creation_req.json()["error"] == ErrorCodes.SERVER_BUSY.value
@@ -1,7 +1,9 @@
 #  Copyright (c) Niall Asher 2022
 
 # noinspection PyUnresolvedReferences
-from socialserver.util.test import test_db, server_address
+from socialserver.util.test import test_db, server_address, create_user_with_request
+from socialserver.util.username_filter import username_filter, record_username_change
+from pony.orm import db_session
 from socialserver.constants import ErrorCodes
 import requests
 
@@ -39,3 +41,74 @@ def test_username_available_missing_data(test_db, server_address):
     r = requests.get(f"{server_address}/api/v3/username/available", json={})
 
     assert r.status_code == 400
+
+
+def test_username_available_filter_built(test_db, server_address):
+    username_filter.build()
+
+    r = requests.get(
+        f"{server_address}/api/v3/username/available",
+        json={"username": test_db.username},
+    )
+    assert r.status_code == 200
+    assert r.json() is False
+
+    r = requests.get(
+        f"{server_address}/api/v3/username/available", json={"username": "username"}
+    )
+    assert r.status_code == 200
+    assert r.json() is True
+
+
+def test_username_available_after_create_and_delete(test_db, server_address):
+    username_filter.build()
+    create_user_with_request(username="username", password="password")
+
+    r = requests.get(
+        f"{server_address}/api/v3/username/available", json={"username": "username"}
+    )
+    assert r.status_code == 200
+    assert r.json() is False
+
+    r = requests.delete(
+        f"{server_address}/api/v3/user",
+        json={"password": test_db.password},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+    assert r.status_code == 200
+
+    # the name's still in the filter, but the database says it's free.
+    r = requests.get(
+        f"{server_address}/api/v3/username/available",
+        json={"username": test_db.username},
+    )
+    assert r.status_code == 200
+    assert r.json() is True
+
+
+def test_username_available_after_rename(test_db, server_address):
+    username_filter.build()
+
+    r = requests.patch(
+        f"{server_address}/api/v3/user",
+        json={"username": "renamed"},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+    assert r.status_code == 200
+
+    r = requests.get(
+        f"{server_address}/api/v3/username/available", json={"username": "renamed"}
+    )
+    assert r.status_code == 200
+    assert r.json() is False
+
+
+def test_username_filter_catch_up_rename(test_db):
+    username_filter.build()
+    # as if renamed through another worker process
+    with db_session:
+        test_db.db.User.get(username=test_db.username).username = "elsewhere"
+        record_username_change("elsewhere")
+    assert not username_filter.might_contain("elsewhere")
+    username_filter.catch_up()
+    assert username_filter.might_contain("elsewhere")
@@ -0,0 +1 @@
+#  Copyright (c) Niall Asher 2022
@@ -0,0 +1,129 @@
+#  Copyright (c) Niall Asher 2022
+
+import json
+from io import BytesIO
+from random import randint
+from PIL import Image
+from pony.orm import db_session
+# noinspection PyUnresolvedReferences
+from socialserver.util.test import test_db
+from socialserver.constants import ImageTypes, ImageUploadPurposes, ServerSupportedImageFormats
+from socialserver.cli.admin.media import regenerate_media, throttle_delay
+from socialserver.util.filesystem import hash_directory
+from socialserver.util.image import handle_upload, stored_original_path
+from socialserver.util.image_variants import variant_file_path, variants_for_purpose
+from socialserver.util.media_jobs import media_jobs
+import socialserver.util.image
+
+
+def _upload(test_db, purpose=ImageUploadPurposes.POST) -> str:
+    image = Image.new("RGB", (640, 480), tuple(randint(0, 255) for _ in range(0, 3)))
+    image_bytes = BytesIO()
+    image.save(image_bytes, format="JPEG")
+    image_bytes.seek(0)
+    with db_session:
+        user_id = test_db.db.User.get(username=test_db.username).id
+    upload = handle_upload(image_bytes, user_id, threaded=False, purpose=purpose)
+    media_jobs.wait_until_idle()
+    with db_session:
+        return test_db.db.Image[upload.id].sha256sum
+
+
+def _stored_files(image_hash: str) -> set:
+    return set(socialserver.util.image.fs_images.listdir(hash_directory(image_hash)))
+
+
+def test_regenerate_media_missing_variants(test_db, tmp_path):
+    post_hash = _upload(test_db)
+    avatar_hash = _upload(test_db, ImageUploadPurposes.AVATAR)
+    expected = {image_hash: _stored_files(image_hash) for image_hash in [post_hash, avatar_hash]}
+    fs = socialserver.util.image.fs_images
+    for image_hash in [post_hash, avatar_hash]:
+        for name in expected[image_hash]:
+            if not name.startswith(ImageTypes.ORIGINAL.value) and not name.endswith("_1x.jpg"):
+                fs.remove(f"{hash_directory(image_hash)}/{name}")
+
+    results = regenerate_media(workers=2, batch_size=1, cpu_budget=1, checkpoint_path=str(tmp_path / "checkpoint"))
+    assert results["images"] == 2
+    assert results["missing_original"] == 0
+    for image_hash, files in expected.items():
+        assert _stored_files(image_hash) == files
+    # an avatar isn't given a post's variants
+    assert not fs.exists(variant_file_path(avatar_hash, ImageTypes.POST, 1, ServerSupportedImageFormats.JPG))
+    # done, so nothing to resume from
+    assert not (tmp_path / "checkpoint").exists()
+
+
+def test_regenerate_media_overwrite(test_db, tmp_path):
+    image_hash = _upload(test_db)
+    path = variant_file_path(image_hash, ImageTypes.POST, 1, ServerSupportedImageFormats.JPG)
+    socialserver.util.image.fs_images.writebytes(path, b"stale")
+    regenerate_media(checkpoint_path=str(tmp_path / "checkpoint"))
+    assert socialserver.util.image.fs_images.readbytes(path) == b"stale"
+    regenerate_media(overwrite=True, checkpoint_path=str(tmp_path / "checkpoint"))
+    assert Image.open(BytesIO(socialserver.util.image.fs_images.readbytes(path))).format == "JPEG"
+
+
+def test_regenerate_media_resumes(test_db, tmp_path):
+    image_hashes = sorted(_upload(test_db) for _ in range(0, 3))
+    fs = socialserver.util.image.fs_images
+    for image_hash in image_hashes:
+        fs.remove(variant_file_path(image_hash, ImageTypes.POST_PREVIEW, 2, ServerSupportedImageFormats.JPG))
+
+    # as if a run was stopped after the first image
+    checkpoint_path = tmp_path / "checkpoint"
+    checkpoint_path.write_text(json.dumps({"last_hash": image_hashes[0], "images": 1, "missing_original": 0}))
+    results = regenerate_media(checkpoint_path=str(checkpoint_path))
+    assert results["images"] == 3
+    regenerated = [
+        fs.exists(variant_file_path(image_hash, ImageTypes.POST_PREVIEW, 2, ServerSupportedImageFormats.JPG))
+        for image_hash in image_hashes
+    ]
+    assert regenerated == [False, True, True]
+
+    results = regenerate_media(restart=True, checkpoint_path=str(checkpoint_path))
+    assert results["images"] == 3
+    assert fs.exists(variant_file_path(image_hashes[0], ImageTypes.POST_PREVIEW, 2, ServerSupportedImageFormats.JPG))
+
+
+def test_regenerate_media_used_as_avatar(test_db, tmp_path):
+    image_hash = _upload(test_db)
+    with db_session:
+        user = test_db.db.User.get(username=test_db.username)
+        user.profile_pic = test_db.db.Image.get(sha256sum=image_hash)
+    regenerate_media(checkpoint_path=str(tmp_path / "checkpoint"))
+    for variant in variants_for_purpose(ImageUploadPurposes.AVATAR):
+        for pixel_ratio in variant.pixel_ratios:
+            assert socialserver.util.image.fs_images.exists(
+                variant_file_path(image_hash, variant.image_type, pixel_ratio, ServerSupportedImageFormats.JPG)
+            )
+
+
+def test_regenerate_media_missing_original(test_db, tmp_path):
+    image_hash = _upload(test_db)
+    socialserver.util.image.fs_images.remove(stored_original_path(image_hash))
+    results = regenerate_media(checkpoint_path=str(tmp_path / "checkpoint"))
+    assert results["missing_original"] == 1
+
+
+def test_regenerate_media_failed_image(test_db, tmp_path):
+    image_hashes = sorted(_upload(test_db) for _ in range(0, 3))
+    fs = socialserver.util.image.fs_images
+    for image_hash in image_hashes:
+        fs.remove(variant_file_path(image_hash, ImageTypes.POST_PREVIEW, 2, ServerSupportedImageFormats.JPG))
+    fs.writebytes(stored_original_path(image_hashes[1]), b"not an image")
+
+    results = regenerate_media(batch_size=2, checkpoint_path=str(tmp_path / "checkpoint"))
+    assert results["images"] == 3
+    assert results["failed"] == 1
+    assert results["missing_original"] == 0
+    # the others are still done
+    for image_hash in [image_hashes[0], image_hashes[2]]:
+        assert fs.exists(variant_file_path(image_hash, ImageTypes.POST_PREVIEW, 2, ServerSupportedImageFormats.JPG))
+
+
+def test_throttle_delay():
+    # 2 cpu seconds in 1 second is 2 cores' worth; a quarter of 4
+    # cores is 1, so it should have taken 2 seconds.
+    assert throttle_delay(2, 1, 0.25, 4) == 1
+    assert throttle_delay(1, 1, 0.5, 4) == 0
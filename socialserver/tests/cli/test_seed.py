@@ -0,0 +1,63 @@
+#  Copyright (c) Niall Asher 2022
+
+# noinspection PyUnresolvedReferences
+from socialserver.util.test import test_db, server_address, create_post_with_request
+from socialserver.cli.admin.seed import seed_database
+from pony.orm import db_session, select
+import requests
+import pytest
+
+
+def test_seed_database_counts(test_db):
+    results = seed_database(50, follows_per_user=5, posts_per_user=2, likes_per_post=3, comments_per_post=1)
+
+    with db_session:
+        assert select(u for u in test_db.db.User if u.username.startswith("seed_")).count() == 50
+        assert select(p for p in test_db.db.Post).count() == results["counts"]["posts"]
+        assert select(f for f in test_db.db.Follow).count() == results["counts"]["follows"]
+        assert select(b for b in test_db.db.Block).count() == results["counts"]["blocks"]
+        assert select(like for like in test_db.db.PostLike).count() == results["counts"]["post_likes"]
+        assert select(c for c in test_db.db.Comment).count() == results["counts"]["comments"]
+        assert select(h for h in test_db.db.PostHashtag).count() == results["counts"]["post_hashtags"]
+        # nobody follows or blocks themselves, or blocks somebody they follow
+        assert select(f for f in test_db.db.Follow if f.user == f.following).count() == 0
+        assert select(b for b in test_db.db.Block if b.user == b.blocking).count() == 0
+        assert select(
+            b for b in test_db.db.Block for f in test_db.db.Follow
+            if b.user == f.user and b.blocking == f.following
+        ).count() == 0
+
+
+def test_seed_database_existing_prefix(test_db):
+    seed_database(5)
+    with pytest.raises(ValueError):
+        seed_database(5)
+
+
+def test_seeded_data_usable(test_db, server_address):
+    results = seed_database(20, posts_per_user=3, password="password")
+
+    r = requests.post(
+        f"{server_address}/api/v3/user/session",
+        json={"username": "seed_0", "password": "password"},
+    )
+    assert r.status_code == 200
+    access_token = r.json()["access_token"]
+
+    r = requests.get(
+        f"{server_address}/api/v3/posts/single",
+        json={"post_id": results["post_id_range"][0]},
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    assert r.status_code == 201
+
+    r = requests.get(
+        f"{server_address}/api/v3/posts/feed",
+        json={"count": 10, "offset": 0},
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    assert r.status_code == 201
+
+    # ids carry on from the seeded rows
+    post_id = create_post_with_request(test_db.access_token)
+    assert post_id == results["post_id_range"][1] + 1
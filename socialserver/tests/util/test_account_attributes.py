@@ -0,0 +1,70 @@
+#  Copyright (c) Niall Asher 2022
+
+import sqlite3
+import requests
+from pony import orm
+from pony.orm import db_session
+# noinspection PyUnresolvedReferences
+from socialserver.util.test import test_db, server_address, set_user_attributes_db
+from socialserver.constants import AccountAttributes
+from socialserver.db import define_entities, _migrate_account_attributes
+
+
+def test_attribute_helpers(test_db):
+    with db_session:
+        user = test_db.db.User.get(username=test_db.username)
+        assert user.account_attributes == []
+        user.set_attribute(AccountAttributes.MODERATOR)
+        user.set_attribute(AccountAttributes.VERIFIED)
+        assert user.is_moderator and user.is_verified and not user.is_admin
+        assert user.account_attributes == [AccountAttributes.VERIFIED.value, AccountAttributes.MODERATOR.value]
+        user.set_attribute(AccountAttributes.MODERATOR, False)
+        assert not user.has_attribute(AccountAttributes.MODERATOR)
+        user.account_attributes = [AccountAttributes.ADMIN.value]
+        assert user.attribute_flags == 1 << AccountAttributes.ADMIN.value
+
+
+def test_attributes_wire_format(test_db, server_address):
+    set_user_attributes_db(
+        test_db.db, test_db.username, [AccountAttributes.MODERATOR.value, AccountAttributes.VERIFIED.value]
+    )
+    r = requests.get(
+        f"{server_address}/api/v3/user/info",
+        json={"username": test_db.username},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+    assert r.status_code == 200
+    assert r.json()["attributes"] == [AccountAttributes.VERIFIED.value, AccountAttributes.MODERATOR.value]
+
+
+def test_migrate_account_attributes(tmp_path):
+    filename = str(tmp_path / "old.db")
+
+    # build the current schema, then put the old column back in place of the new one.
+    new_db = orm.Database()
+    define_entities(new_db)
+    new_db.bind("sqlite", filename, create_db=True)
+    new_db.generate_mapping(create_tables=True)
+    new_db.disconnect()
+    connection = sqlite3.connect(filename)
+    connection.execute('ALTER TABLE "User" ADD COLUMN "account_attributes" TEXT NOT NULL DEFAULT \'[]\'')
+    connection.execute('ALTER TABLE "User" DROP COLUMN "attribute_flags"')
+    connection.execute(
+        'INSERT INTO "User" (display_name, username, password_hash, password_salt, creation_time, '
+        'is_legacy_account, account_attributes, bio, account_approved) '
+        "VALUES ('old', 'old', 'x', 'x', '2022-01-01 00:00:00', 0, '[1,0,1]', '', 1)"
+    )
+    connection.commit()
+    connection.close()
+
+    migrated_db = orm.Database()
+    define_entities(migrated_db)
+    migrated_db.bind("sqlite", filename)
+    _migrate_account_attributes(migrated_db)
+    migrated_db.generate_mapping(create_tables=True)
+
+    with db_session:
+        user = migrated_db.User.get(username="old")
+        assert user.account_attributes == [AccountAttributes.VERIFIED.value, AccountAttributes.ADMIN.value]
+        assert user.is_admin
+    migrated_db.disconnect()
@@ -0,0 +1,25 @@
+#  Copyright (c) Niall Asher 2022
+
+from socialserver.util.bloom import BloomFilter
+
+
+def test_bloom_filter_no_false_negatives():
+    bloom_filter = BloomFilter(capacity=1000)
+    for i in range(0, 1000):
+        bloom_filter.add(f"user{i}")
+    assert all(f"user{i}" in bloom_filter for i in range(0, 1000))
+    assert bloom_filter.count == 1000
+
+
+def test_bloom_filter_false_positive_rate():
+    bloom_filter = BloomFilter(capacity=1000, error_rate=0.01)
+    for i in range(0, 1000):
+        bloom_filter.add(f"user{i}")
+    false_positives = sum(f"other{i}" in bloom_filter for i in range(0, 10000))
+    # a bit of slack over the 1% target, so this isn't flaky.
+    assert false_positives < 300
+
+
+def test_bloom_filter_empty():
+    bloom_filter = BloomFilter(capacity=10)
+    assert "anything" not in bloom_filter
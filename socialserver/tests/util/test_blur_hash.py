@@ -0,0 +1,103 @@
+#  Copyright (c) Niall Asher 2022
+
+from io import BytesIO
+from random import Random
+import blurhash
+import pytest
+from PIL import Image
+from pony.orm import db_session
+# noinspection PyUnresolvedReferences
+from socialserver.util.test import test_db, server_address, image_data_binary
+from socialserver.util.blur_hash import encode_pixels, encode_image, encode_images, BASE83_CHARACTERS
+from socialserver.util.image import handle_upload, regenerate_blur_hashes
+
+
+# the reference encoder (blurhash-python, which wraps the C implementation)
+def _reference_blur_hash(image, x_components=4, y_components=3) -> str:
+    buffer = BytesIO()
+    image.save(buffer, format="png")
+    buffer.seek(0)
+    return blurhash.encode(buffer, x_components, y_components)
+
+
+def _random_image(rng: Random, width: int, height: int):
+    return Image.frombytes("RGB", (width, height), bytes(rng.randrange(256) for _ in range(width * height * 3)))
+
+
+def _decode83(string: str) -> int:
+    value = 0
+    for character in string:
+        value = value * 83 + BASE83_CHARACTERS.index(character)
+    return value
+
+
+# (maximum value, dc colour channels, ac quantised channels)
+def _quantised_values(blur_hash: str):
+    dc = _decode83(blur_hash[2:6])
+    ac = [_decode83(blur_hash[i:i + 2]) for i in range(6, len(blur_hash), 2)]
+    return (
+        _decode83(blur_hash[1]),
+        [dc >> 16, (dc >> 8) & 255, dc & 255],
+        [[value // 361, (value // 19) % 19, value % 19] for value in ac],
+    )
+
+
+def test_encode_pixels_matches_reference():
+    rng = Random(0)
+    for x_components, y_components in [(4, 3), (1, 1), (9, 9), (3, 7)]:
+        for _ in range(0, 10):
+            image = _random_image(rng, rng.randint(1, 40), rng.randint(1, 40))
+            assert encode_pixels(image.tobytes(), image.width, image.height, x_components, y_components) \
+                   == _reference_blur_hash(image, x_components, y_components)
+
+
+def test_encode_image_small_image_matches_reference():
+    # nothing to downsample, so it should be exact
+    rng = Random(1)
+    images = [_random_image(rng, rng.randint(1, 32), rng.randint(1, 32)) for _ in range(0, 10)]
+    assert encode_images(images) == [_reference_blur_hash(image) for image in images]
+    # other modes are converted, like the reference does
+    grey = images[0].convert("L")
+    assert encode_image(grey) == _reference_blur_hash(grey)
+
+
+def test_encode_image_close_to_full_resolution(image_data_binary):
+    image = Image.open(BytesIO(image_data_binary)).convert("RGB")
+    assert image.width > 32 and image.height > 32
+    reference = _quantised_values(_reference_blur_hash(image))
+    downsampled = _quantised_values(encode_image(image))
+
+    assert abs(reference[0] - downsampled[0]) <= 1
+    for reference_channel, channel in zip(reference[1], downsampled[1]):
+        assert abs(reference_channel - channel) <= 2
+    for reference_factor, factor in zip(reference[2], downsampled[2]):
+        for reference_channel, channel in zip(reference_factor, factor):
+            assert abs(reference_channel - channel) <= 1
+
+
+def test_encode_rejects_bad_components():
+    image = Image.new("RGB", (4, 4))
+    for components in [(0, 3), (4, 10)]:
+        with pytest.raises(ValueError):
+            encode_image(image, *components)
+
+
+def test_regenerate_blur_hashes(test_db, image_data_binary):
+    with db_session:
+        user_id = test_db.db.User.get(username=test_db.username).id
+    first = handle_upload(BytesIO(image_data_binary), user_id, threaded=False)
+    # duplicate upload, sharing the first one's files
+    second = handle_upload(BytesIO(image_data_binary), user_id, threaded=False)
+
+    with db_session:
+        original_blur_hash = test_db.db.Image[first.id].blur_hash
+        for image_id in [first.id, second.id]:
+            test_db.db.Image[image_id].blur_hash = "stale"
+
+    assert regenerate_blur_hashes(batch_size=1) == 1
+
+    with db_session:
+        for image_id in [first.id, second.id]:
+            blur_hash = test_db.db.Image[image_id].blur_hash
+            assert blur_hash != "stale"
+            assert len(blur_hash) == len(original_blur_hash)
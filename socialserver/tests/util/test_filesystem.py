@@ -0,0 +1,156 @@
+#  Copyright (c) Niall Asher 2022
+
+import subprocess
+import sys
+from io import BytesIO
+from threading import Event, Thread
+from time import sleep
+import pytest
+from fs.memoryfs import MemoryFS
+from fs.osfs import OSFS
+from PIL import Image
+from pony.orm import db_session
+# noinspection PyUnresolvedReferences
+from socialserver.util.test import test_db
+from socialserver.util.config import config
+from socialserver.util.filesystem import hash_directory, hash_lock, migrate_storage_layout, write_bytes_atomic
+from socialserver.util.media_jobs import media_jobs
+import socialserver.util.image
+
+HASHES = ["ab" + "0" * 62, "ab" + "1" * 62, "cd" + "2" * 62]
+
+# holds the lock for a hash in another process, until it's told to stop
+CHILD_CODE = (
+    "import sys\n"
+    "from socialserver.util.filesystem import hash_lock\n"
+    "with hash_lock(sys.argv[1]):\n"
+    "    print('locked', flush=True)\n"
+    "    sys.stdin.readline()\n"
+)
+
+
+def test_hash_directory(monkeypatch):
+    assert hash_directory(HASHES[0], "flat") == f"/{HASHES[0]}"
+    assert hash_directory(HASHES[0], "sharded") == f"/ab/00/{HASHES[0]}"
+    monkeypatch.setattr(config.media, "storage_layout", "sharded")
+    assert hash_directory(HASHES[2]) == f"/cd/22/{HASHES[2]}"
+
+
+@pytest.mark.parametrize("filesystem", [MemoryFS, OSFS], ids=["memory", "disk"])
+def test_write_bytes_atomic(filesystem, tmp_path):
+    fs = filesystem(str(tmp_path)) if filesystem is OSFS else filesystem()
+    fs.makedir("/a")
+    write_bytes_atomic(fs, "/a/post_1x.jpg", b"first")
+    write_bytes_atomic(fs, "/a/post_1x.jpg", b"second")
+    assert fs.readbytes("/a/post_1x.jpg") == b"second"
+    # no temporary files left behind
+    assert fs.listdir("/a") == ["post_1x.jpg"]
+    # nor when writing fails
+    with pytest.raises(Exception):
+        write_bytes_atomic(fs, "/missing/post_1x.jpg", b"third")
+    assert not fs.exists("/missing")
+
+
+def _acquire(content_hash: str, acquired: list):
+    with hash_lock(content_hash):
+        acquired.append(True)
+
+
+def test_hash_lock_threads():
+    held = Event()
+    release = Event()
+    acquired = []
+
+    def _hold():
+        with hash_lock(HASHES[0]):
+            held.set()
+            release.wait()
+
+    holder = Thread(target=_hold)
+    holder.start()
+    held.wait(timeout=10)
+    waiter = Thread(target=_acquire, args=(HASHES[0], acquired))
+    waiter.start()
+    sleep(0.1)
+    assert acquired == []
+    release.set()
+    holder.join()
+    waiter.join(timeout=10)
+    assert acquired == [True]
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="only locks between threads on windows")
+def test_hash_lock_processes():
+    child = subprocess.Popen([sys.executable, "-c", CHILD_CODE, HASHES[0]],
+                             stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    try:
+        while child.stdout.readline().strip() != "locked":
+            pass
+        acquired = []
+        waiter = Thread(target=_acquire, args=(HASHES[1], acquired))
+        waiter.start()
+        sleep(0.2)
+        # the same 2 character prefix, so it has to wait
+        assert acquired == []
+        child.stdin.write("\n")
+        child.stdin.flush()
+        waiter.join(timeout=10)
+        assert acquired == [True]
+    finally:
+        child.kill()
+        child.wait()
+
+
+@pytest.mark.parametrize("filesystem", [MemoryFS, OSFS], ids=["memory", "disk"])
+def test_migrate_storage_layout(filesystem, tmp_path):
+    fs = filesystem(str(tmp_path)) if filesystem is OSFS else filesystem()
+    for content_hash in HASHES:
+        fs.makedir(f"/{content_hash}")
+        fs.writebytes(f"/{content_hash}/orig.jpg", content_hash.encode())
+    fs.writebytes("/readme.txt", b"not stored by hash")
+
+    assert migrate_storage_layout(fs, "sharded") == 3
+    for content_hash in HASHES:
+        assert fs.readbytes(f"{hash_directory(content_hash, 'sharded')}/orig.jpg") == content_hash.encode()
+        assert not fs.exists(f"/{content_hash}")
+    assert fs.exists("/readme.txt")
+    # already done
+    assert migrate_storage_layout(fs, "sharded") == 0
+
+    # uploaded again, flat, before the config was changed
+    fs.makedir(f"/{HASHES[0]}")
+    fs.writebytes(f"/{HASHES[0]}/post_1x.jpg", b"variant")
+    assert migrate_storage_layout(fs, "sharded") == 1
+    assert sorted(fs.listdir(hash_directory(HASHES[0], "sharded"))) == ["orig.jpg", "post_1x.jpg"]
+
+    assert migrate_storage_layout(fs, "flat") == 3
+    assert sorted(fs.listdir("/")) == sorted(HASHES + ["readme.txt"])
+
+
+def test_concurrent_identical_uploads(test_db, monkeypatch):
+    from socialserver.util.image import handle_upload
+    saved = []
+    save_image = socialserver.util.image.save_image
+
+    def _counting_save_image(image, image_hash, filename, pixel_ratio, image_format):
+        saved.append((filename, pixel_ratio, image_format))
+        save_image(image, image_hash, filename, pixel_ratio, image_format)
+
+    monkeypatch.setattr("socialserver.util.image.save_image", _counting_save_image)
+    image = Image.new("RGB", (640, 480), (12, 34, 56))
+    image_bytes = BytesIO()
+    image.save(image_bytes, format="JPEG")
+    with db_session:
+        user_id = test_db.db.User.get(username=test_db.username).id
+
+    uploads = [Thread(target=handle_upload, args=(BytesIO(image_bytes.getvalue()), user_id, False))
+               for _ in range(0, 4)]
+    for upload in uploads:
+        upload.start()
+    for upload in uploads:
+        upload.join()
+    media_jobs.wait_until_idle()
+    # every file's made by one of them
+    assert len(saved) == len(set(saved))
+    with db_session:
+        assert all(image.processed for image in test_db.db.Image.select())
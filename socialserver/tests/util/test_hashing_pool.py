@@ -0,0 +1,43 @@
+#  Copyright (c) Niall Asher 2022
+
+from threading import Event, Thread
+from time import perf_counter
+import pytest
+from socialserver.util.hashing_pool import HashingPool, HashingPoolBusyException
+
+
+def test_hashing_pool_run():
+    pool = HashingPool(max_concurrent=2, max_queued=2, queue_timeout=1)
+    assert pool.run(lambda a, b: a + b, 1, 2) == 3
+
+
+def test_hashing_pool_queue_timeout():
+    pool = HashingPool(max_concurrent=1, max_queued=2, queue_timeout=0.1)
+    release = Event()
+    blocker = Thread(target=pool.run, args=(release.wait,))
+    blocker.start()
+    try:
+        with pytest.raises(HashingPoolBusyException):
+            pool.run(lambda: None)
+    finally:
+        release.set()
+        blocker.join()
+    # the slot's free again once the blocking task finishes.
+    assert pool.run(lambda: 1) == 1
+
+
+def test_hashing_pool_queue_full():
+    pool = HashingPool(max_concurrent=1, max_queued=0, queue_timeout=10)
+    release = Event()
+    blocker = Thread(target=pool.run, args=(release.wait,))
+    blocker.start()
+    try:
+        # with nothing allowed to wait, a call is turned away
+        # straight away, rather than waiting out the timeout.
+        start_time = perf_counter()
+        with pytest.raises(HashingPoolBusyException):
+            pool.run(lambda: None)
+        assert perf_counter() - start_time < 1
+    finally:
+        release.set()
+        blocker.join()
@@ -0,0 +1,294 @@
+#  Copyright (c) Niall Asher 2022
+
+from io import BytesIO
+import pytest
+from fs.memoryfs import MemoryFS
+from PIL import Image, ImageChops, ImageDraw, ImageStat
+from pony.orm import db_session
+# noinspection PyUnresolvedReferences
+from socialserver.util.test import test_db, server_address, image_data_binary
+from socialserver.constants import ImageTypes, ImageUploadPurposes, ServerSupportedImageFormats
+from socialserver.util.blur_hash import BASE83_CHARACTERS
+from socialserver.util.config import config
+from socialserver.util.filesystem import hash_directory
+import socialserver.util.image
+import socialserver.util.image_backend
+from socialserver.util.image_backend import PillowBackend, VipsBackend, get_image_backend, vips_available, \
+    decode_scale, ImageTooLargeException
+from socialserver.util.image import generate_variants, handle_upload, stored_original_path, ensure_image_variants
+from socialserver.util.image_variants import variants_for_purpose
+
+requires_vips = pytest.mark.skipif(not vips_available(), reason="pyvips (or libvips) isn't installed")
+
+# the average difference, per channel (0-255), allowed between the
+# two backends' output. they use different resampling kernels, so
+# they're never quite identical.
+MAX_MEAN_DIFFERENCE = 3
+
+
+# smooth, with some hard edges, like a photo
+def _photo(width: int, height: int, image_format="JPEG", **save_options) -> bytes:
+    gradient = Image.linear_gradient("L").resize((width, height))
+    radial = Image.radial_gradient("L").resize((width, height))
+    image = Image.merge("RGB", [gradient, radial, gradient.transpose(Image.FLIP_LEFT_RIGHT)])
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((width // 4, height // 4, width // 2, height // 2), fill=(200, 40, 40))
+    draw.rectangle((width // 2, height // 3, width * 3 // 4, height * 2 // 3), fill=(20, 160, 220))
+    if image_format == "PNG":
+        image.putalpha(Image.linear_gradient("L").resize((width, height)))
+    buffer = BytesIO()
+    image.save(buffer, format=image_format, **save_options)
+    return buffer.getvalue()
+
+
+def _rotated_photo(width: int, height: int) -> bytes:
+    exif = Image.Exif()
+    # orientation: rotate 90 degrees clockwise
+    exif[0x0112] = 6
+    return _photo(width, height, exif=exif)
+
+
+def _to_pil(image):
+    if isinstance(image, Image.Image):
+        return image
+    return Image.frombytes("RGB", (image.width, image.height), image.write_to_memory())
+
+
+def _mean_difference(first, second) -> float:
+    return max(ImageStat.Stat(ImageChops.difference(_to_pil(first), _to_pil(second))).mean)
+
+
+def _decode83(string: str) -> int:
+    value = 0
+    for character in string:
+        value = value * 83 + BASE83_CHARACTERS.index(character)
+    return value
+
+
+def _backends():
+    return PillowBackend(), VipsBackend()
+
+
+OPEN_PARITY_IMAGES = {
+    "jpeg": lambda: _photo(1600, 1200),
+    "jpeg_rotated": lambda: _rotated_photo(1600, 1200),
+    "png_alpha": lambda: _photo(640, 480, image_format="PNG"),
+    "webp": lambda: _photo(300, 200, image_format="WEBP"),
+}
+
+
+@requires_vips
+@pytest.mark.parametrize("image_name", OPEN_PARITY_IMAGES.keys())
+def test_open_parity(image_name):
+    pillow, vips = _backends()
+    data = OPEN_PARITY_IMAGES[image_name]()
+    pillow_image, vips_image = pillow.open(data), vips.open(data)
+    assert pillow.size(pillow_image) == vips.size(vips_image)
+    assert vips_image.bands == 3 and vips_image.format == "uchar"
+    assert _mean_difference(pillow_image, vips_image) <= MAX_MEAN_DIFFERENCE
+
+
+@requires_vips
+def test_open_rotates_to_exif_orientation():
+    for backend in _backends():
+        assert backend.size(backend.open(_rotated_photo(400, 300))) == (300, 400)
+
+
+def test_decode_scale():
+    # fitting inside 600x600 only needs the longest side to be 600
+    assert decode_scale((4000, 3000), [((600, 600), False)]) == 0.15
+    # covering it needs the shortest side to be
+    assert decode_scale((4000, 3000), [((600, 600), True)]) == 0.2
+    # the biggest target wins, and it's never more than the whole image
+    assert decode_scale((4000, 3000), [((600, 600), False), ((64, 64), True)]) == 0.15
+    assert decode_scale((400, 300), [((600, 600), True)]) == 1
+
+
+@requires_vips
+def test_open_shrink_on_load():
+    data = _photo(4000, 3000)
+    for backend in _backends():
+        image = backend.open(data, [((600, 400), False)])
+        # libjpeg can shrink by 1/2, 1/4 or 1/8; 1/4 is the most it can here.
+        assert backend.size(image) == (1000, 750)
+        # 1/8 would be 500x375, too small to cover 600x400
+        assert backend.size(backend.open(data, [((600, 400), True)])) == (1000, 750)
+        assert backend.size(backend.open(data, [((3000, 3000), False)])) == (4000, 3000)
+        # only jpegs can be decoded smaller
+        png = _photo(1600, 1200, image_format="PNG")
+        assert backend.size(backend.open(png, [((100, 100), False)])) == (1600, 1200)
+
+
+@requires_vips
+def test_open_shrink_on_load_rotated():
+    # displayed as 3000x4000, so covering 1000x1000 needs it at
+    # least 1000 wide (as it's stored, high), which 1/2 is.
+    data = _rotated_photo(4000, 3000)
+    for backend in _backends():
+        image = backend.open(data, [((1000, 1000), True)])
+        assert backend.size(image) == (1500, 2000)
+        image = backend.open(data, [((400, 1000), True)])
+        assert backend.size(image) == (750, 1000)
+
+
+@requires_vips
+def test_open_size_limits(monkeypatch):
+    data = _photo(1000, 500)
+    for backend in _backends():
+        monkeypatch.setattr(config.media.images, "max_image_pixels", 500_000)
+        monkeypatch.setattr(config.media.images, "max_image_dimension", 1000)
+        assert backend.size(backend.open(data)) == (1000, 500)
+
+        monkeypatch.setattr(config.media.images, "max_image_pixels", 499_999)
+        with pytest.raises(ImageTooLargeException):
+            backend.open(data)
+
+        monkeypatch.setattr(config.media.images, "max_image_pixels", 500_000)
+        monkeypatch.setattr(config.media.images, "max_image_dimension", 999)
+        with pytest.raises(ImageTooLargeException):
+            backend.open(data)
+
+
+def test_open_size_limit_past_pillows_own(monkeypatch):
+    # pillow won't even open an image more than double its limit,
+    # so it's kept in line with ours.
+    monkeypatch.setattr(config.media.images, "max_image_pixels", 10_000)
+    with pytest.raises(ImageTooLargeException):
+        PillowBackend().open(_photo(500, 500))
+
+
+@requires_vips
+@pytest.mark.parametrize("size", [(500, 500), (1000, 300), (64, 64), (3000, 3000)])
+def test_resize_parity(size):
+    pillow, vips = _backends()
+    data = _photo(1600, 1200)
+    pillow_image, vips_image = pillow.open(data), vips.open(data)
+
+    pillow_fit, vips_fit = pillow.fit(pillow_image, size), vips.fit(vips_image, size)
+    for fit_size in [pillow.size(pillow_fit), vips.size(vips_fit)]:
+        # never made bigger
+        assert fit_size[0] <= min(size[0], 1600) and fit_size[1] <= min(size[1], 1200)
+    assert pillow.size(pillow_fit) == vips.size(vips_fit)
+    assert _mean_difference(pillow_fit, vips_fit) <= MAX_MEAN_DIFFERENCE
+
+    pillow_crop, vips_crop = pillow.crop_fit(pillow_image, size), vips.crop_fit(vips_image, size)
+    assert pillow.size(pillow_crop) == vips.size(vips_crop) == size
+    assert _mean_difference(pillow_crop, vips_crop) <= MAX_MEAN_DIFFERENCE
+
+
+@requires_vips
+def test_encode_parity():
+    for backend in _backends():
+        image = backend.open(_rotated_photo(640, 480))
+
+        jpeg = Image.open(BytesIO(backend.encode(image, ServerSupportedImageFormats.JPG, 80, progressive=True)))
+        assert jpeg.format == "JPEG" and jpeg.size == (480, 640)
+        assert jpeg.info.get("progressive") == 1
+        # the orientation has already been applied, so it mustn't be kept.
+        assert len(jpeg.getexif()) == 0
+
+        baseline = Image.open(BytesIO(backend.encode(image, ServerSupportedImageFormats.JPG, 80)))
+        assert baseline.info.get("progressive") is None
+
+        webp = Image.open(BytesIO(backend.encode(image, ServerSupportedImageFormats.WEBP, 80)))
+        assert webp.format == "WEBP" and webp.size == (480, 640)
+
+
+@requires_vips
+def test_blur_hash_parity():
+    pillow, vips = _backends()
+    data = _photo(1600, 1200)
+    pillow_hash, vips_hash = pillow.blur_hash(pillow.open(data)), vips.blur_hash(vips.open(data))
+    assert len(pillow_hash) == len(vips_hash)
+    # same components & scale
+    assert pillow_hash[:2] == vips_hash[:2]
+    pillow_dc, vips_dc = _decode83(pillow_hash[2:6]), _decode83(vips_hash[2:6])
+    for shift in [16, 8, 0]:
+        assert abs((pillow_dc >> shift & 255) - (vips_dc >> shift & 255)) <= 2
+    for i in range(6, len(pillow_hash), 2):
+        pillow_ac, vips_ac = _decode83(pillow_hash[i:i + 2]), _decode83(vips_hash[i:i + 2])
+        for divisor in [361, 19, 1]:
+            assert abs(pillow_ac // divisor % 19 - vips_ac // divisor % 19) <= 1
+
+
+@requires_vips
+def test_generate_variants_parity(monkeypatch):
+    stored = {}
+    for backend in _backends():
+        fs = MemoryFS()
+        monkeypatch.setattr("socialserver.util.image.fs_images", fs)
+        monkeypatch.setattr(config.media.images, "backend", backend.name)
+        generate_variants(backend.open(_photo(2000, 1500)), "parity", variants_for_purpose(ImageUploadPurposes.POST))
+        stored[backend.name] = {
+            path: Image.open(BytesIO(fs.readbytes(path))) for path in fs.walk.files()
+        }
+    assert stored["pillow"].keys() == stored["vips"].keys()
+    for path, pillow_image in stored["pillow"].items():
+        vips_image = stored["vips"][path]
+        assert pillow_image.format == vips_image.format
+        assert pillow_image.size == vips_image.size
+        assert _mean_difference(pillow_image.convert("RGB"), vips_image.convert("RGB")) <= MAX_MEAN_DIFFERENCE
+
+
+@requires_vips
+def test_handle_upload_with_vips(test_db, image_data_binary, monkeypatch):
+    monkeypatch.setattr(config.media.images, "backend", "vips")
+    with db_session:
+        user_id = test_db.db.User.get(username=test_db.username).id
+    upload = handle_upload(BytesIO(image_data_binary), user_id, threaded=False)
+    with db_session:
+        image = test_db.db.Image[upload.id]
+        assert image.processed is True
+        assert len(image.blur_hash) == 28
+        image_hash = image.sha256sum
+    fs = socialserver.util.image.fs_images
+    preview = Image.open(BytesIO(fs.readbytes(f"{hash_directory(image_hash)}/{ImageTypes.POST_PREVIEW.value}_1x.jpg")))
+    assert preview.format == "JPEG"
+
+
+def test_get_image_backend(monkeypatch):
+    monkeypatch.setattr(config.media.images, "backend", "pillow")
+    assert get_image_backend().name == "pillow"
+    # falls back to pillow if pyvips can't be loaded
+    monkeypatch.setattr(config.media.images, "backend", "vips")
+    monkeypatch.setattr(socialserver.util.image_backend, "vips_available", lambda: False)
+    assert get_image_backend().name == "pillow"
+
+
+def test_handle_upload_stores_original_verbatim(test_db):
+    with db_session:
+        user_id = test_db.db.User.get(username=test_db.username).id
+    data = _photo(640, 480, image_format="PNG")
+    upload = handle_upload(BytesIO(data), user_id, threaded=False)
+    with db_session:
+        image_hash = test_db.db.Image[upload.id].sha256sum
+    assert stored_original_path(image_hash) == f"{hash_directory(image_hash)}/{ImageTypes.ORIGINAL.value}.png"
+    assert socialserver.util.image.fs_images.readbytes(stored_original_path(image_hash)) == data
+
+
+def test_handle_upload_too_large(test_db, monkeypatch):
+    monkeypatch.setattr(config.media.images, "max_image_pixels", 1000)
+    with db_session:
+        user_id = test_db.db.User.get(username=test_db.username).id
+        image_count = test_db.db.Image.select().count()
+    with pytest.raises(ImageTooLargeException):
+        handle_upload(BytesIO(_photo(640, 480)), user_id, threaded=False)
+    # rejected before anything is stored
+    with db_session:
+        assert test_db.db.Image.select().count() == image_count
+    assert len(list(socialserver.util.image.fs_images.walk.files())) == 0
+
+
+def test_ensure_image_variants_from_reencoded_original(test_db):
+    # images processed before originals were stored verbatim
+    # have a quality 100 orig.jpg & orig.webp.
+    fs = socialserver.util.image.fs_images
+    directory = hash_directory("legacy")
+    fs.makedirs(directory)
+    fs.writebytes(f"{directory}/orig.jpg", _photo(1200, 900, quality=100))
+    fs.writebytes(f"{directory}/orig.webp", _photo(1200, 900, image_format="WEBP", quality=100))
+    assert stored_original_path("legacy") == f"{directory}/orig.jpg"
+    assert ensure_image_variants("legacy", ImageUploadPurposes.AVATAR) is True
+    for variant in variants_for_purpose(ImageUploadPurposes.AVATAR):
+        assert fs.exists(f"{directory}/{variant.image_type.value}_1x.jpg")
+    assert stored_original_path("missing") is None
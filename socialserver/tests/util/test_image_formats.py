@@ -0,0 +1,103 @@
+#  Copyright (c) Niall Asher 2022
+
+from io import BytesIO
+import pytest
+from PIL import Image
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+from pony.orm import db_session
+# noinspection PyUnresolvedReferences
+from socialserver.util.test import test_db, server_address, image_data_binary
+from socialserver.constants import ImageTypes, ImageUploadPurposes, ServerSupportedImageFormats
+from socialserver.util.config import config
+from socialserver.util.filesystem import hash_directory
+import socialserver.util.image
+from socialserver.util.image import handle_upload
+from socialserver.util.image_backend import VipsBackend, vips_available
+from socialserver.util.image_formats import formats_to_generate, image_format_quality, negotiate_image_format
+from socialserver.util.image_variants import IMAGE_VARIANTS, variants_for_purpose
+from socialserver.util.media_jobs import media_jobs
+
+F = ServerSupportedImageFormats
+
+
+def _negotiate(accept: str, stored=(F.JPG, F.WEBP, F.AVIF, F.JXL)):
+    return negotiate_image_format(parse_accept_header(accept, MIMEAccept), lambda image_format: image_format in stored)
+
+
+def test_negotiate_image_format():
+    # a browser that can show avif
+    assert _negotiate("image/avif,image/webp,image/apng,image/*,*/*;q=0.8") == F.AVIF
+    assert _negotiate("image/webp,*/*") == F.WEBP
+    assert _negotiate("image/jxl,image/avif,*/*") == F.AVIF
+    # a wildcard doesn't mean it can show anything but jpgs
+    assert _negotiate("*/*") == F.JPG
+    assert _negotiate("image/*") == F.JPG
+    assert _negotiate("") == F.JPG
+    # the client's q values come first
+    assert _negotiate("image/avif;q=0.5,image/webp") == F.WEBP
+    assert _negotiate("image/jpeg,image/avif;q=0.5") == F.JPG
+    assert _negotiate("image/avif;q=0,image/webp") == F.WEBP
+
+
+def test_negotiate_image_format_not_stored():
+    # i.e. the avif hasn't been made yet
+    assert _negotiate("image/avif,image/webp,*/*", stored=(F.JPG, F.WEBP)) == F.WEBP
+    assert _negotiate("image/avif,*/*", stored=(F.JPG,)) == F.JPG
+
+
+def test_image_format_quality(monkeypatch):
+    monkeypatch.setattr(config.media.images.avif, "quality", 42)
+    monkeypatch.setattr(config.media.images.avif, "post_quality", 55)
+    assert image_format_quality(F.AVIF, ImageTypes.POST_PREVIEW) == 42
+    assert image_format_quality(F.AVIF, ImageTypes.POST) == 55
+    assert image_format_quality(F.JPG, ImageTypes.POST) == config.media.images.jpeg.post_quality
+
+
+class _JpegOnlyBackend:
+    name = "jpeg-only"
+
+    def supports(self, image_format):
+        return image_format == F.JPG
+
+
+def test_formats_to_generate(monkeypatch):
+    monkeypatch.setattr(config.media.images.webp, "enabled", True)
+    monkeypatch.setattr(config.media.images.avif, "enabled", True)
+    monkeypatch.setattr(config.media.images.jxl, "enabled", False)
+    assert formats_to_generate(_JpegOnlyBackend()) == [F.JPG]
+
+    class _AllBackend(_JpegOnlyBackend):
+        def supports(self, image_format):
+            return True
+
+    assert formats_to_generate(_AllBackend()) == [F.JPG, F.WEBP, F.AVIF]
+
+
+@pytest.mark.skipif(not vips_available() or not VipsBackend().supports(F.AVIF),
+                    reason="libvips can't encode avif here")
+def test_upload_generates_avif(test_db, image_data_binary, monkeypatch):
+    monkeypatch.setattr(config.media.images, "backend", "vips")
+    monkeypatch.setattr(config.media.images.avif, "enabled", True)
+    # the variants' formats are read from the config at startup, when avif was off
+    for variant in variants_for_purpose(ImageUploadPurposes.POST):
+        monkeypatch.setitem(IMAGE_VARIANTS, variant.image_type, variant._replace(formats=(F.JPG, F.AVIF)))
+
+    with db_session:
+        user_id = test_db.db.User.get(username=test_db.username).id
+    upload = handle_upload(BytesIO(image_data_binary), user_id, threaded=False)
+    # avifs are made in the deferred phase
+    media_jobs.wait_until_idle()
+    with db_session:
+        image_hash = test_db.db.Image[upload.id].sha256sum
+
+    fs = socialserver.util.image.fs_images
+    for variant in variants_for_purpose(ImageUploadPurposes.POST):
+        for pixel_ratio in variant.pixel_ratios:
+            path = f"{hash_directory(image_hash)}/{variant.image_type.value}_{pixel_ratio}x."
+            jpeg = fs.readbytes(path + "jpg")
+            avif = fs.readbytes(path + "avif")
+            # "ftyp" then the avif brand, in the first box
+            assert avif[4:12] == b"ftypavif"
+            assert len(avif) < len(jpeg)
+            assert Image.open(BytesIO(jpeg)).format == "JPEG"
@@ -0,0 +1,81 @@
+#  Copyright (c) Niall Asher 2022
+
+# noinspection PyUnresolvedReferences
+from socialserver.util.test import test_db, server_address, create_post_with_request
+from socialserver.util.api.json_representation import dumps_stdlib, dumps_orjson
+from socialserver.util.api.v3.feed import format_feed_posts_v3
+from socialserver.util.date import format_timestamp_string
+from socialserver.cli.admin.seed import seed_database
+from pony.orm import db_session, select, desc
+from datetime import datetime
+import requests
+import json
+import pytest
+
+pytest.importorskip("orjson")
+
+
+def _assert_same_output(data):
+    # the same json, even if it's not written the same way
+    assert json.loads(dumps_orjson(data)) == json.loads(dumps_stdlib(data))
+
+
+def _assert_flask_restful_output(data):
+    # what flask-restful's own representation sent, when the
+    # datetimes were formatted before being put in responses.
+    assert dumps_stdlib(data) == (json.dumps(data, default=format_timestamp_string) + "\n").encode()
+
+
+def test_feed_payload_output_matches(test_db):
+    seed_database(30, posts_per_user=4, likes_per_post=3, comments_per_post=1)
+
+    with db_session:
+        viewer = test_db.db.User.get(username=test_db.username)
+        posts = select(p for p in test_db.db.Post).order_by(lambda p: desc(p.creation_time))[:32]
+        payload = {
+            "meta": {"reached_end": False, "next_cursor": "abc"},
+            "posts": format_feed_posts_v3(posts, viewer),
+        }
+
+    _assert_same_output(payload)
+    _assert_flask_restful_output(payload)
+    assert json.loads(dumps_orjson(payload))["posts"][0]["post"]["id"] == posts[0].id
+
+
+def test_datetimes_match_format_timestamp_string():
+    for timestamp in [datetime(2022, 4, 1, 12, 30, 5), datetime(2022, 4, 1, 12, 30, 5, 1234)]:
+        assert dumps_orjson(timestamp) == f'"{format_timestamp_string(timestamp)}"\n'.encode()
+        _assert_same_output({"creation_time": timestamp})
+        _assert_flask_restful_output({"creation_time": timestamp})
+
+
+def test_edge_cases_match():
+    data = {
+        "text": "café \U0001F600 \"quoted\" back\\slash\nnew line \x01  ",
+        "empty": [{}, [], "", None, True, False],
+        1: "non string key",
+        "numbers": [0, -1, 2 ** 63 - 1, 1.5, 0.1, 1e16],
+    }
+    _assert_same_output(data)
+    _assert_flask_restful_output(data)
+    assert dumps_stdlib({"a": [1, 2], "name": "café"}) == b'{"a": [1, 2], "name": "caf\\u00e9"}\n'
+    assert dumps_orjson({"a": [1, 2], "name": "café"}) == '{"a":[1,2],"name":"café"}\n'.encode()
+    # too big for orjson; falls back to the stdlib.
+    assert dumps_orjson({"big": 2 ** 70}) == dumps_stdlib({"big": 2 ** 70})
+
+
+def test_feed_response_serialization(test_db, server_address):
+    create_post_with_request(test_db.access_token, text_content="café")
+    r = requests.get(
+        f"{server_address}/api/v3/posts/feed",
+        json={"count": 10, "offset": 0},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+    assert r.status_code == 201
+    assert r.content.endswith(b"}\n")
+    # compact, and utf-8 rather than escaped
+    assert b'{"meta":' in r.content
+    assert "café".encode() in r.content
+    creation_date = r.json()["posts"][0]["post"]["creation_date"]
+    assert creation_date.endswith("Z")
+    datetime.fromisoformat(creation_date[:-1])
@@ -0,0 +1,23 @@
+#  Copyright (c) Niall Asher 2022
+
+import sys
+import pytest
+from socialserver.util.lazy_import import LazyModule
+
+
+def test_lazy_module_imports_on_first_use():
+    # a module nothing else in the server imports
+    sys.modules.pop("colorsys", None)
+    colorsys = LazyModule("colorsys")
+    assert "colorsys" not in sys.modules
+    assert "not loaded" in repr(colorsys)
+
+    assert colorsys.rgb_to_hsv(1, 0, 0) == (0, 1, 1)
+    assert "colorsys" in sys.modules
+    assert "(loaded)" in repr(colorsys)
+
+
+def test_lazy_module_missing_attribute():
+    json = LazyModule("json")
+    with pytest.raises(AttributeError):
+        json.not_a_real_attribute
@@ -0,0 +1,79 @@
+#  Copyright (c) Niall Asher 2022
+
+from threading import Event
+from socialserver.constants import MediaJobLanes, MediaJobPhases
+from socialserver.util.config import config
+from socialserver.util.media_jobs import MediaJobQueue
+from socialserver.util.metrics import media_job_queue_duration, media_phase_latency
+
+
+def _start(queue: MediaJobQueue) -> None:
+    # jobs submitted to a queue without workers wait until it has some
+    queue.workers = 1
+    queue.submit(lambda: None, MediaJobPhases.DEFERRED, MediaJobLanes.BACKLOG)
+
+
+def test_media_jobs_priority():
+    queue = MediaJobQueue(0)
+    ran = []
+    for phase, lane in [(MediaJobPhases.DEFERRED, MediaJobLanes.BACKLOG),
+                        (MediaJobPhases.DEFERRED, MediaJobLanes.INTERACTIVE),
+                        (MediaJobPhases.URGENT, MediaJobLanes.BACKLOG),
+                        (MediaJobPhases.URGENT, MediaJobLanes.INTERACTIVE)]:
+        queue.submit(lambda p=phase, l=lane: ran.append((p, l)), phase, lane)
+    _start(queue)
+    assert queue.wait_until_idle(timeout=10)
+    assert ran == [(MediaJobPhases.URGENT, MediaJobLanes.INTERACTIVE),
+                   (MediaJobPhases.URGENT, MediaJobLanes.BACKLOG),
+                   (MediaJobPhases.DEFERRED, MediaJobLanes.INTERACTIVE),
+                   (MediaJobPhases.DEFERRED, MediaJobLanes.BACKLOG)]
+
+
+def test_media_jobs_preemption():
+    queue = MediaJobQueue(1)
+    ran = []
+    started = Event()
+    release = Event()
+
+    def backlog_steps():
+        ran.append("backlog 1")
+        started.set()
+        release.wait()
+        yield
+        ran.append("backlog 2")
+
+    queue.submit(backlog_steps, MediaJobPhases.DEFERRED, MediaJobLanes.BACKLOG)
+    started.wait(timeout=10)
+    queue.submit(lambda: ran.append("urgent"), MediaJobPhases.URGENT, MediaJobLanes.INTERACTIVE)
+    release.set()
+    assert queue.wait_until_idle(timeout=10)
+    # put aside at its first yield, then finished after
+    assert ran == ["backlog 1", "urgent", "backlog 2"]
+
+
+def test_media_jobs_failure():
+    queue = MediaJobQueue(1)
+    ran = []
+    queue.submit(lambda: 1 / 0, MediaJobPhases.URGENT, MediaJobLanes.BACKLOG)
+    queue.submit(lambda: ran.append(True), MediaJobPhases.URGENT, MediaJobLanes.BACKLOG)
+    # the worker carries on
+    assert queue.wait_until_idle(timeout=10)
+    assert ran == [True]
+
+
+def test_media_jobs_wait_until_idle_timeout():
+    queue = MediaJobQueue(0)
+    queue.submit(lambda: None, MediaJobPhases.URGENT, MediaJobLanes.BACKLOG)
+    assert queue.wait_until_idle(timeout=0.1) is False
+
+
+def test_media_jobs_metrics(monkeypatch):
+    monkeypatch.setattr(config.metrics, "enabled", True)
+    labels = (MediaJobPhases.URGENT.value, MediaJobLanes.INTERACTIVE.value)
+    latency_count = media_phase_latency.count(*labels)
+    queue_count = media_job_queue_duration.count(*labels)
+    queue = MediaJobQueue(1)
+    queue.submit(lambda: None, MediaJobPhases.URGENT, MediaJobLanes.INTERACTIVE)
+    assert queue.wait_until_idle(timeout=10)
+    assert media_phase_latency.count(*labels) == latency_count + 1
+    assert media_job_queue_duration.count(*labels) == queue_count + 1
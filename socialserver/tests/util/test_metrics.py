@@ -0,0 +1,25 @@
+#  Copyright (c) Niall Asher 2022
+
+from socialserver.util.metrics import Histogram, Counter
+
+
+def test_histogram_render():
+    histogram = Histogram("test_seconds", "A test.", ("stage",), buckets=(0.1, 1))
+    histogram.observe(0.05, "a")
+    histogram.observe(0.5, "a")
+    histogram.observe(5, "a")
+    lines = histogram.render()
+    assert 'test_seconds_bucket{stage="a",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{stage="a",le="1"} 2' in lines
+    assert 'test_seconds_bucket{stage="a",le="+Inf"} 3' in lines
+    assert 'test_seconds_sum{stage="a"} 5.55' in lines
+    assert 'test_seconds_count{stage="a"} 3' in lines
+    assert histogram.count("a") == 3
+    assert histogram.count("b") == 0
+
+
+def test_counter_render():
+    counter = Counter("test_total", "A test.")
+    counter.inc()
+    counter.inc(amount=2)
+    assert counter.render() == ["# HELP test_total A test.", "# TYPE test_total counter", "test_total 3"]
@@ -0,0 +1,90 @@
+#  Copyright (c) Niall Asher 2022
+
+from multiprocessing import get_context
+from socialserver.util import rate_limit
+from socialserver.util.rate_limit import SharedRateLimiter, LazySharedRateLimiter
+
+
+def test_rate_limiter_limits(tmp_path):
+    limiter = SharedRateLimiter(str(tmp_path / "rate_limit.bin"))
+    results = [limiter.take("key", 3) for _ in range(4)]
+    assert [result.allowed for result in results] == [True, True, True, False]
+    assert results[0].remaining == 2
+    assert results[3].remaining == 0
+    assert results[3].retry_after > 0
+    # other keys have their own buckets
+    assert limiter.take("other_key", 3).allowed
+
+
+def test_lazy_rate_limiter(tmp_path):
+    filename = tmp_path / "rate_limit.bin"
+    limiter = LazySharedRateLimiter(str(filename))
+    assert not filename.exists()
+    assert limiter.take("key", 1).allowed
+    assert filename.exists()
+    assert not limiter.take("key", 1).allowed
+
+
+def test_rate_limiter_without_fcntl(tmp_path, monkeypatch):
+    monkeypatch.setattr(rate_limit, "fcntl", None)
+    filename = tmp_path / "rate_limit.bin"
+    limiter = SharedRateLimiter(str(filename))
+    assert [limiter.take("key", 2).allowed for _ in range(3)] == [True, True, False]
+    limiter.reset()
+    assert limiter.take("key", 2).allowed
+    # kept in memory, rather than in the file
+    assert not filename.exists()
+
+
+def test_rate_limiter_refills(tmp_path, monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(rate_limit, "time", lambda: now)
+    limiter = SharedRateLimiter(str(tmp_path / "rate_limit.bin"))
+    for _ in range(60):
+        assert limiter.take("key", 60).allowed
+    assert not limiter.take("key", 60).allowed
+    # a token per second at 60 per minute
+    now += 1
+    assert limiter.take("key", 60).allowed
+    assert not limiter.take("key", 60).allowed
+
+
+def test_rate_limiter_full_group_recycles_oldest(tmp_path, monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(rate_limit, "time", lambda: now)
+    # a single group, so every key has to share it
+    limiter = SharedRateLimiter(str(tmp_path / "rate_limit.bin"), groups=1)
+    assert limiter.take("oldest", 1).allowed
+    for i in range(20):
+        now += 1
+        assert limiter.take(f"key_{i}", 1).allowed
+    # the most recent keys keep their buckets, and the
+    # oldest has been pushed out, so it starts over.
+    assert not limiter.take("key_19", 1).allowed
+    assert limiter.take("oldest", 1).allowed
+
+
+def _take_in_process(filename: str, key: str, count: int):
+    limiter = SharedRateLimiter(filename)
+    for _ in range(count):
+        limiter.take(key, 10)
+
+
+def test_rate_limiter_shared_between_processes(tmp_path):
+    filename = str(tmp_path / "rate_limit.bin")
+    limiter = SharedRateLimiter(filename)
+
+    process = get_context("fork").Process(target=_take_in_process, args=(filename, "key", 10))
+    process.start()
+    process.join()
+
+    # the other process used up every token
+    assert not limiter.take("key", 10).allowed
+
+
+def test_rate_limiter_reset(tmp_path):
+    limiter = SharedRateLimiter(str(tmp_path / "rate_limit.bin"))
+    assert limiter.take("key", 1).allowed
+    assert not limiter.take("key", 1).allowed
+    limiter.reset()
+    assert limiter.take("key", 1).allowed
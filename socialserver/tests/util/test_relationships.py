@@ -0,0 +1,44 @@
+#  Copyright (c) Niall Asher 2022
+
+# noinspection PyUnresolvedReferences
+from socialserver.util.test import test_db, server_address, create_user_with_request
+from socialserver.util.relationships import resolve_relationships, Relationship, NO_RELATIONSHIP
+from pony.orm import db_session
+from datetime import datetime
+
+
+def test_resolve_relationships(test_db, server_address):
+    for username in ["followed", "follower", "mutual", "blocked", "blocker", "stranger"]:
+        create_user_with_request(username=username, password="password")
+
+    db = test_db.db
+    with db_session:
+        viewer = db.User.get(username=test_db.username)
+        users = {u.username: u for u in db.User.select(lambda u: u.username != test_db.username)}
+        now = datetime.utcnow()
+        db.Follow(user=viewer, following=users["followed"], creation_time=now)
+        db.Follow(user=users["follower"], following=viewer, creation_time=now)
+        db.Follow(user=viewer, following=users["mutual"], creation_time=now)
+        db.Follow(user=users["mutual"], following=viewer, creation_time=now)
+        db.Block(user=viewer, blocking=users["blocked"], creation_time=now)
+        db.Block(user=users["blocker"], blocking=viewer, creation_time=now)
+        # shouldn't leak into the viewer's relationships
+        db.Follow(user=users["follower"], following=users["stranger"], creation_time=now)
+        ids = {username: user.id for username, user in users.items()}
+
+    with db_session:
+        relationships = resolve_relationships(viewer.id, ids.values())
+
+    assert relationships == {
+        ids["followed"]: Relationship(followed=True, follows_you=False, blocked=False, blocked_by=False),
+        ids["follower"]: Relationship(followed=False, follows_you=True, blocked=False, blocked_by=False),
+        ids["mutual"]: Relationship(followed=True, follows_you=True, blocked=False, blocked_by=False),
+        ids["blocked"]: Relationship(followed=False, follows_you=False, blocked=True, blocked_by=False),
+        ids["blocker"]: Relationship(followed=False, follows_you=False, blocked=False, blocked_by=True),
+        ids["stranger"]: NO_RELATIONSHIP,
+    }
+
+
+def test_resolve_relationships_empty(test_db, server_address):
+    with db_session:
+        assert resolve_relationships(1, []) == {}
@@ -0,0 +1,63 @@
+#  Copyright (c) Niall Asher 2022
+
+from typing import List, Optional
+from flask import Flask
+from pydantic import Field
+from werkzeug.exceptions import HTTPException
+from socialserver.util.api.request_args import RequestArgs, request_args, parse_request_args
+import pytest
+
+app = Flask(__name__)
+
+
+class _Args(RequestArgs):
+    count: int
+    username: Optional[str] = None
+    tags: Optional[List[str]] = None
+    session_token: str = Field(..., description="Authentication Token")
+
+
+def test_parse_json_body():
+    with app.test_request_context(method="POST", json={"count": "5", "session_token": "t", "extra": 1}):
+        args = parse_request_args(_Args)
+    assert args.count == 5
+    assert args["session_token"] == "t"
+    assert args.username is None
+
+
+def test_parse_query_string_and_lists():
+    with app.test_request_context(query_string="count=2&session_token=t&tags=a&tags=b"):
+        args = parse_request_args(_Args)
+    assert args.count == 2
+    assert args.tags == ["a", "b"]
+
+    # a single json value for a list is wrapped, like reqparse's append.
+    with app.test_request_context(method="POST", json={"count": 2, "session_token": "t", "tags": "a"}):
+        assert parse_request_args(_Args).tags == ["a"]
+
+
+def test_json_preferred_over_query_string():
+    with app.test_request_context(method="POST", query_string="count=1&username=query",
+                                  json={"count": 3, "session_token": "t"}):
+        args = parse_request_args(_Args)
+    assert args.count == 3
+    assert args.username == "query"
+
+
+def test_invalid_arguments_abort():
+    with app.test_request_context(method="POST", json={"count": "many"}):
+        with pytest.raises(HTTPException) as exception:
+            parse_request_args(_Args)
+    assert exception.value.code == 400
+    assert exception.value.data["message"]["session_token"] == "Authentication Token"
+    assert "count" in exception.value.data["message"]
+
+
+def test_decorator_passes_args():
+    class Resource:
+        @request_args(_Args)
+        def get(self, args, **kwargs):
+            return args.count, kwargs
+
+    with app.test_request_context(query_string="count=4&session_token=t"):
+        assert Resource().get(imageid="x") == (4, {"imageid": "x"})
@@ -0,0 +1,79 @@
+#  Copyright (c) Niall Asher 2022
+
+# noinspection PyUnresolvedReferences
+from socialserver.util.test import (
+    test_db,
+    server_address,
+    set_user_attributes_db,
+    create_post_with_request,
+    create_comment_with_request,
+    create_user_with_request,
+)
+from socialserver.constants import AccountAttributes
+from socialserver.util.statistics import get_statistics, recount_statistics
+from socialserver.cli.admin.seed import seed_database
+from pony.orm import db_session, select
+import requests
+
+
+def _counters(db):
+    with db_session:
+        return dict(select((c.name, c.value) for c in db.StatisticsCounter))
+
+
+def _assert_counters_match_recount(db):
+    counters = _counters(db)
+    with db_session:
+        recounted = recount_statistics(db)
+    assert counters == recounted
+
+
+def test_counters_follow_changes(test_db, server_address):
+    create_user_with_request(username="other", password="password")
+    set_user_attributes_db(
+        test_db.db, test_db.username, [AccountAttributes.ADMIN.value, AccountAttributes.VERIFIED.value]
+    )
+    set_user_attributes_db(test_db.db, "other", [AccountAttributes.MODERATOR.value])
+    post_id = create_post_with_request(test_db.access_token)
+    create_post_with_request(test_db.access_token)
+    create_comment_with_request(test_db.access_token, post_id)
+
+    counters = _counters(test_db.db)
+    assert counters["users"] == 2
+    assert counters["admins"] == 1
+    assert counters["moderators"] == 1
+    assert counters["verified_users"] == 1
+    assert counters["posts"] == 2
+    assert counters["comments"] == 1
+    assert counters["sessions"] == 1
+    _assert_counters_match_recount(test_db.db)
+
+    # removing attributes, and deleting a post (cascading to its comment)
+    set_user_attributes_db(test_db.db, test_db.username, [AccountAttributes.VERIFIED.value])
+    r = requests.delete(
+        f"{server_address}/api/v3/posts/single",
+        json={"post_id": post_id},
+        headers={"Authorization": f"Bearer {test_db.access_token}"},
+    )
+    assert r.status_code == 200
+
+    counters = _counters(test_db.db)
+    assert counters["admins"] == 0
+    assert counters["verified_users"] == 1
+    assert counters["posts"] == 1
+    assert counters["comments"] == 0
+    _assert_counters_match_recount(test_db.db)
+
+
+def test_counters_follow_bulk_inserts(test_db):
+    seed_database(30, posts_per_user=2, blocks_per_user=1)
+    _assert_counters_match_recount(test_db.db)
+
+
+def test_statistics_snapshot_cached(test_db):
+    first = get_statistics(test_db.db)
+    assert first["users"]["total"] == 1
+    create_user_with_request(username="other", password="password")
+
+    assert get_statistics(test_db.db)["users"]["total"] == 1
+    assert get_statistics(test_db.db, max_age=0)["users"]["total"] == 2
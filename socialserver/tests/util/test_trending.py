@@ -0,0 +1,89 @@
+#  Copyright (c) Niall Asher 2022
+
+from socialserver.util.trending import SpaceSavingCounter, TrendingCounter
+
+
+def test_space_saving_counter_bounded():
+    counter = SpaceSavingCounter(capacity=4)
+    for i in range(0, 1000):
+        counter.add(f"rare{i}")
+        counter.add("popular")
+    assert len(counter) == 4
+    assert dict(counter.items())["popular"] >= 1000
+
+
+def test_trending_counter_top():
+    now = [0.0]
+    counter = TrendingCounter(window_seconds=60, bucket_count=6, capacity=8,
+                              refresh_seconds=0, clock=lambda: now[0])
+    counter.record(["a", "b"])
+    counter.record(["a"])
+    now[0] = 15
+    counter.record(["a", "c"])
+    assert counter.top(2) == [("a", 3), ("b", 1)]
+
+
+def test_trending_counter_window_expiry():
+    now = [0.0]
+    counter = TrendingCounter(window_seconds=60, bucket_count=6, capacity=8,
+                              refresh_seconds=0, clock=lambda: now[0])
+    counter.record(["old"])
+    now[0] = 61
+    counter.record(["new"])
+    assert counter.top(10) == [("new", 1)]
+
+
+def test_trending_counter_cached():
+    now = [0.0]
+    counter = TrendingCounter(window_seconds=60, bucket_count=6, capacity=8,
+                              refresh_seconds=10, clock=lambda: now[0])
+    counter.record(["a"])
+    assert counter.top(10) == [("a", 1)]
+    counter.record(["b"])
+    # not rebuilt until refresh_seconds have passed
+    assert counter.top(10) == [("a", 1)]
+    now[0] = 10
+    assert counter.top(10) == [("a", 1), ("b", 1)]
+
+
+def test_trending_counter_snapshot_restore():
+    now = [0.0]
+    counter = TrendingCounter(window_seconds=60, bucket_count=6, capacity=8,
+                              refresh_seconds=0, clock=lambda: now[0])
+    counter.record(["a", "a", "b"])
+    restored = TrendingCounter(window_seconds=60, bucket_count=6, capacity=8,
+                               refresh_seconds=0, clock=lambda: now[0])
+    restored.restore(counter.snapshot())
+    assert restored.top(10) == counter.top(10)
+
+
+def test_trending_counter_pending():
+    now = [0.0]
+    counter = TrendingCounter(window_seconds=60, bucket_count=6, capacity=8,
+                              refresh_seconds=0, clock=lambda: now[0])
+    counter.record(["a"])
+    pending = counter.take_pending()
+    assert pending["buckets"] == [[0, {"a": 1}]]
+    assert counter.take_pending()["buckets"] == []
+    counter.return_pending(pending)
+    assert counter.take_pending()["buckets"] == [[0, {"a": 1}]]
+
+
+def test_trending_counter_merge_and_restore():
+    now = [15.0]
+    counter = TrendingCounter(window_seconds=60, bucket_count=6, capacity=8,
+                              refresh_seconds=0, clock=lambda: now[0])
+    other = TrendingCounter(window_seconds=60, bucket_count=6, capacity=8,
+                            refresh_seconds=0, clock=lambda: now[0])
+    counter.record(["a"])
+    other.record(["a", "b"])
+    merged = TrendingCounter(window_seconds=60, bucket_count=6, capacity=8,
+                             refresh_seconds=0, clock=lambda: now[0])
+    merged.merge(counter.take_pending())
+    merged.merge(other.take_pending())
+    assert merged.top(10) == [("a", 2), ("b", 1)]
+
+    # recorded after the pending counts were taken, so not in the merged ones
+    counter.record(["c"])
+    counter.restore(merged.snapshot())
+    assert counter.top(10) == [("a", 2), ("b", 1), ("c", 1)]
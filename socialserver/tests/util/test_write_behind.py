@@ -0,0 +1,96 @@
+#  Copyright (c) Niall Asher 2022
+
+import pytest
+from datetime import datetime, timedelta
+from pony.orm import db_session, commit
+from socialserver.db import create_test_db
+from socialserver.util.write_behind import WriteBehindBuffer
+
+
+def _create_user_with_session(db):
+    with db_session:
+        user = db.User(
+            display_name="test",
+            username="test",
+            password_hash="x",
+            password_salt="x",
+            creation_time=datetime.utcnow(),
+            is_legacy_account=False,
+            bio="",
+            recent_failed_login_count=0,
+            account_approved=True,
+        )
+        session = db.UserSession(
+            user=user,
+            access_token_hash="x",
+            creation_ip="127.0.0.1",
+            creation_time=datetime(2022, 1, 1),
+            last_access_time=datetime(2022, 1, 1),
+            user_agent="x",
+        )
+        commit()
+        return user.id, session.id
+
+
+def test_write_behind_session_access(monkeypatch):
+    db = create_test_db()
+    monkeypatch.setattr("socialserver.util.write_behind.db", db)
+    user_id, session_id = _create_user_with_session(db)
+    buffer = WriteBehindBuffer()
+
+    access_time = datetime(2022, 6, 1, 12, 30)
+    buffer.record_session_access(session_id, access_time - timedelta(minutes=5))
+    buffer.record_session_access(session_id, access_time)
+    # readers see the pending value before it's flushed.
+    assert buffer.session_access_time(session_id, datetime(2022, 1, 1)) == access_time
+
+    buffer.flush()
+    with db_session:
+        assert db.UserSession[session_id].last_access_time == access_time
+
+
+def test_write_behind_failed_logins(monkeypatch):
+    db = create_test_db()
+    monkeypatch.setattr("socialserver.util.write_behind.db", db)
+    user_id, _ = _create_user_with_session(db)
+    buffer = WriteBehindBuffer()
+
+    attempt_time = datetime(2022, 6, 1, 12, 30)
+    for _ in range(0, 3):
+        buffer.record_failed_login(user_id, attempt_time)
+    assert buffer.failed_logins(user_id, 2, None) == (5, attempt_time)
+
+    buffer.flush()
+    with db_session:
+        user = db.User[user_id]
+        assert user.recent_failed_login_count == 3
+        assert user.last_failed_login_attempt == attempt_time
+    assert buffer.failed_logins(user_id, 3, attempt_time) == (3, attempt_time)
+
+
+def test_write_behind_clear_failed_logins():
+    buffer = WriteBehindBuffer()
+    buffer.record_failed_login(1)
+    buffer.clear_failed_logins(1)
+    assert buffer.failed_logins(1, 0, None) == (0, None)
+
+
+def test_write_behind_failed_flush_keeps_failed_logins(monkeypatch):
+    def _fail(*args):
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr("socialserver.util.write_behind._write_batches", _fail)
+    buffer = WriteBehindBuffer()
+
+    first_attempt = datetime(2022, 6, 1, 12, 30)
+    for _ in range(0, 3):
+        buffer.record_failed_login(1, first_attempt)
+
+    with pytest.raises(RuntimeError):
+        buffer.flush()
+    assert buffer.failed_logins(1, 0, None) == (3, first_attempt)
+
+    # failures recorded after the failed flush add to the kept count.
+    second_attempt = first_attempt + timedelta(minutes=1)
+    buffer.record_failed_login(1, second_attempt)
+    assert buffer.failed_logins(1, 0, None) == (4, second_attempt)
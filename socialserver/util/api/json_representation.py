@@ -0,0 +1,99 @@
+#  Copyright (c) Niall Asher 2022
+
+import json
+from datetime import datetime
+from flask import make_response, current_app
+from socialserver.util.date import format_timestamp_string
+from socialserver.util.output import console
+
+# orjson is optional; without it responses are serialized with the
+# standard library, producing the same json, only slower.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+"""
+    JSON response serialization
+
+    both serializers end responses in a newline, and write naive datetimes
+    (all of ours are utc) the same way as format_timestamp_string, so they
+    can be put in responses as they are. they parse to the same values,
+    but aren't written the same way:
+    - the standard library writes everything else exactly as flask-restful
+      did, with ", " and ": " between items, and non-ascii escaped.
+    - orjson writes compact utf-8, and floats in exponent form without
+      the + (1e16, rather than 1e+16).
+"""
+
+
+def _default(obj):
+    if isinstance(obj, datetime):
+        return format_timestamp_string(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps_stdlib(data, **settings) -> bytes:
+    return (json.dumps(data, **{"default": _default, **settings}) + "\n").encode()
+
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z | orjson.OPT_APPEND_NEWLINE
+
+
+def dumps_orjson(data) -> bytes:
+    try:
+        return orjson.dumps(data, option=ORJSON_OPTIONS)
+    except orjson.JSONEncodeError:
+        # i.e. ints too big for 64 bits, which the stdlib doesn't mind.
+        return dumps_stdlib(data)
+
+
+JSON_SERIALIZERS = {
+    "stdlib": dumps_stdlib,
+    "orjson": dumps_orjson,
+}
+
+"""
+    get_json_serializer
+
+    returns the serializer with the given name. auto picks orjson if it's
+    installed. if orjson is asked for but isn't installed, the standard
+    library is used instead, with a warning.
+"""
+
+
+def get_json_serializer(name: str):
+    if name == "auto":
+        name = "orjson" if orjson is not None else "stdlib"
+    if name == "orjson" and orjson is None:
+        console.log("[bold red]api.json_serializer is orjson, but it isn't installed! Using the standard library.")
+        name = "stdlib"
+    return JSON_SERIALIZERS[name]
+
+
+"""
+    make_json_representation
+
+    a flask-restful representation for application/json, serializing
+    responses with the given serializer. debug mode and RESTFUL_JSON
+    still get the standard library, with their settings, as before.
+"""
+
+
+def make_json_representation(serializer):
+    def output_json(data, code, headers=None):
+        settings = current_app.config.get("RESTFUL_JSON", {})
+        if current_app.debug:
+            settings = {"indent": 4, **settings}
+
+        if len(settings) > 0:
+            dumped = dumps_stdlib(data, **settings)
+        else:
+            dumped = serializer(data)
+
+        response = make_response(dumped, code)
+        response.headers.extend(headers or {})
+        return response
+
+    return output_json
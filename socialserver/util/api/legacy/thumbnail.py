@@ -1,17 +1,23 @@
 #  Copyright (c) Niall Asher 2022
 from base64 import b64encode
 from io import BytesIO
-from PIL import Image
-from socialserver.constants import ImageTypes, ROOT_DIR
+from socialserver.constants import ImageTypes, ROOT_DIR, ServerSupportedImageFormats
 from socialserver.util.config import config
 from socialserver.util.filesystem import fs_images
+from socialserver.util.image_variants import closest_pixel_ratio, stored_pixel_ratio, variant_file_path
+from socialserver.util.lazy_import import LazyModule
+
+Image = LazyModule("PIL.Image")
 
 
 def _load_thumbnail(thumbnail_sha256sum, format_ext: str) -> Image:
+    wanted_pixel_ratio = config.legacy_api_interface.image_pixel_ratio
+    pixel_ratio = stored_pixel_ratio(fs_images, thumbnail_sha256sum, ImageTypes.POST_PREVIEW, wanted_pixel_ratio,
+                                     ServerSupportedImageFormats(format_ext)) \
+        or closest_pixel_ratio(ImageTypes.POST_PREVIEW, wanted_pixel_ratio)
     thumbnail_bytes = BytesIO(
-        fs_images.readbytes(f"/{thumbnail_sha256sum}" +
-                            f"/{ImageTypes.POST_PREVIEW.value}" +
-                            f"_{config.legacy_api_interface.image_pixel_ratio}x.{format_ext}")
+        fs_images.readbytes(variant_file_path(thumbnail_sha256sum, ImageTypes.POST_PREVIEW, pixel_ratio,
+                                              ServerSupportedImageFormats(format_ext)))
     )
 
     return Image.open(thumbnail_bytes)
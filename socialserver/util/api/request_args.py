@@ -0,0 +1,103 @@
+#  Copyright (c) Niall Asher 2022
+
+from functools import wraps, lru_cache
+from flask import request
+from flask_restful import abort
+from pydantic import BaseModel, Extra, ValidationError
+from pydantic.fields import SHAPE_LIST
+
+"""
+    RequestArgs
+
+    base for the models declaring each endpoint's arguments, replacing
+    reqparse. fields are annotated with their type, and are required
+    unless they have a default; a Field description is used as the error
+    message, like reqparse's help. pydantic builds the validators when
+    the class is defined (so once, at import), where reqparse needed
+    a parser constructing for every request.
+"""
+
+
+class RequestArgs(BaseModel):
+    class Config:
+        extra = Extra.ignore
+
+    # handlers were written against reqparse's namespace, which
+    # allowed args["name"] as well as args.name.
+    def __getitem__(self, item):
+        return getattr(self, item)
+
+
+@lru_cache(maxsize=None)
+def _compile(model) -> tuple:
+    # (name, takes a list, error message override) for every field
+    return tuple(
+        (name, field.shape == SHAPE_LIST, field.field_info.description)
+        for name, field in model.__fields__.items()
+    )
+
+
+"""
+    parse_request_args
+
+    reads the model's arguments from the current request, in one pass
+    over the json body and the query string/form data, then validates
+    them. like reqparse, json wins if an argument is in both, and list
+    fields take every value given. aborts with a 400 if they're invalid.
+"""
+
+
+def parse_request_args(model):
+    fields = _compile(model)
+
+    json_body = request.get_json(silent=True)
+    if not isinstance(json_body, dict):
+        json_body = {}
+    # werkzeug parses the form when values is first read, so it's
+    # only touched if something isn't in the json body.
+    values = None
+
+    data = {}
+    for name, is_list, _ in fields:
+        if name in json_body:
+            value = json_body[name]
+            data[name] = value if not is_list or isinstance(value, list) else [value]
+            continue
+        if values is None:
+            values = request.values
+        if name in values:
+            data[name] = values.getlist(name) if is_list else values[name]
+
+    try:
+        return model(**data)
+    except ValidationError as error:
+        messages = {}
+        descriptions = {name: description for name, _, description in fields}
+        for field_error in error.errors():
+            name = field_error["loc"][0]
+            messages.setdefault(name, descriptions.get(name) or field_error["msg"])
+        abort(400, message=messages)
+
+
+"""
+    request_args
+
+    decorator for resource methods, passing the request's arguments,
+    parsed with the given model, in after self.
+    should go below any auth decorators, so unauthenticated requests are
+    still turned away before their arguments are looked at.
+"""
+
+
+def request_args(model):
+    _compile(model)
+
+    def decorator(f):
+        @wraps(f)
+        def wrapper(resource, *args, **kwargs):
+            return f(resource, parse_request_args(model), *args, **kwargs)
+
+        wrapper.request_args_model = model
+        return wrapper
+
+    return decorator
@@ -2,11 +2,21 @@
 from socialserver.api.v3.models.post import AttachmentEntryModel, InvalidAttachmentEntryException
 from socialserver.constants import PostAdditionalContentTypes
 from socialserver.db import db
-from socialserver.util.date import format_timestamp_string
+from socialserver.util.relationships import resolve_relationship
+
+"""
+    format_userdata_v3
+
+    if current_user is given, how they relate to the user is included.
+    when formatting a list of users, resolve the relationships for the
+    whole page with resolve_relationships, and pass each one in as
+    relationship instead, so it doesn't cost a query per user.
+"""
 
 
 def format_userdata_v3(
-        user_object, current_user=None, include_header=False, include_bio=False, include_follower_info=False
+        user_object, current_user=None, include_header=False, include_bio=False, include_follower_info=False,
+        relationship=None
 ):
     pfp_identifier = None
     pfp_blur_hash = None
@@ -42,10 +52,14 @@ def format_userdata_v3(
         userdata["follower_count"] = user_object.followers.count()
         userdata["following_count"] = user_object.following.count()
 
-    if current_user is not None:
-        existing_follow = db.Follow.get(user=current_user, following=user_object)
-        print(existing_follow)
-        userdata["followed"] = existing_follow is not None
+    if relationship is None and current_user is not None:
+        relationship = resolve_relationship(current_user.id, user_object.id)
+
+    if relationship is not None:
+        userdata["followed"] = relationship.followed
+        userdata["follows_you"] = relationship.follows_you
+        userdata["blocked"] = relationship.blocked
+        userdata["blocked_by"] = relationship.blocked_by
 
     return userdata
 
@@ -111,7 +125,8 @@ def format_post_v3(post_object):
     return {
         "id": post_object.id,
         "content": post_object.text,
-        "creation_date": format_timestamp_string(post_object.creation_time),
+        # serialized by the json representation, see util.api.json_representation
+        "creation_date": post_object.creation_time,
         "like_count": len(post_object.likes),
         "comment_count": len(post_object.comments),
         "attachments": ext_attachments
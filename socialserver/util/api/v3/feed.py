@@ -0,0 +1,92 @@
+#  Copyright (c) Niall Asher 2022
+
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from datetime import datetime
+from typing import Tuple
+from pony import orm
+from socialserver.db import db
+from socialserver.util.api.v3.data_format import format_post_v3, format_userdata_v3
+
+"""
+    get_blocked_users_for_feed
+
+    returns a list of the users a user has blocked,
+    so their posts can be filtered out of a feed.
+"""
+
+
+def get_blocked_users_for_feed(user) -> list:
+    # seems like pycharm doesn't see the pony object as iterable
+    # it is, so we're safe to do this.
+    # noinspection PyTypeChecker
+    return orm.select(b.blocking for b in db.Block if b.user == user)[:]
+
+
+"""
+    format_feed_posts_v3
+
+    formats a list of posts for a feed, with the post,
+    its author and some info relevant to the requesting user.
+"""
+
+
+def format_feed_posts_v3(posts, requesting_user) -> list:
+    formatted_posts = []
+    for post in posts:
+        user_has_liked_post = (
+                db.PostLike.get(user=requesting_user, post=post) is not None
+        )
+
+        user_owns_post = post.user == requesting_user
+
+        formatted_posts.append(
+            {
+                "post": format_post_v3(post),
+                "user": format_userdata_v3(post.user),
+                "meta": {
+                    "user_likes_post": user_has_liked_post,
+                    "user_owns_post": user_owns_post,
+                },
+            }
+        )
+    return formatted_posts
+
+
+"""
+    InvalidFeedCursorException
+
+    Raised if a feed cursor given by a client can't be decoded.
+"""
+
+
+class InvalidFeedCursorException(Exception):
+    pass
+
+
+"""
+    encode_feed_cursor
+
+    creates an opaque cursor pointing at an entry in a feed, for keyset
+    pagination. the next page is everything older than the entry.
+"""
+
+
+def encode_feed_cursor(creation_time: datetime, entry_id: int) -> str:
+    return urlsafe_b64encode(f"{creation_time.isoformat()}|{entry_id}".encode()).decode()
+
+
+"""
+    decode_feed_cursor
+
+    reverses encode_feed_cursor, returning the creation time and id of the entry.
+    raises InvalidFeedCursorException if the cursor is malformed.
+"""
+
+
+def decode_feed_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        creation_time, entry_id = urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(creation_time), int(entry_id)
+    except (BinasciiError, UnicodeDecodeError, ValueError):
+        raise InvalidFeedCursorException
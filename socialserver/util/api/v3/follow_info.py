@@ -4,18 +4,18 @@ from socialserver.db import db
 from socialserver.constants import FollowListSortTypes, ErrorCodes, FollowListListTypes
 from socialserver.util.api.v3.data_format import format_userdata_v3
 from socialserver.util.api.v3.error_format import format_error_return_v3
+from socialserver.util.relationships import resolve_relationships
 from pony.orm import select, desc
 
 
 def get_follow_info_for_user(user_object: db.User, count: int, offset: int, sort_type: int,
-                             list_type: int) -> (dict, int):
+                             list_type: int, viewer: db.User = None) -> (dict, int):
 
-    def extract_correct_userdata(fe):
+    def extract_correct_user(fe):
         if is_following_list:
-            return format_userdata_v3(fe.following)
+            return fe.following
         else:
-            return format_userdata_v3(fe.user)
-        pass
+            return fe.user
 
     is_following_list = False
     if list_type == FollowListListTypes.FOLLOWERS:
@@ -39,9 +39,16 @@ def get_follow_info_for_user(user_object: db.User, count: int, offset: int, sort
     # convert to a list
     query = query[::]
 
+    users = [extract_correct_user(fe) for fe in query]
+
+    # one query for the viewer's relationship with the whole page
+    relationships = {}
+    if viewer is not None:
+        relationships = resolve_relationships(viewer.id, [user.id for user in users])
+
     user_objects = []
-    for fe in query:
-        user_objects.append(extract_correct_userdata(fe))
+    for user in users:
+        user_objects.append(format_userdata_v3(user, relationship=relationships.get(user.id)))
 
     return {
                "meta": {
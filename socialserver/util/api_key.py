@@ -0,0 +1,150 @@
+#  Copyright (c) Niall Asher 2022
+
+from hashlib import sha256
+from hmac import compare_digest
+from secrets import token_urlsafe
+from threading import Lock
+from time import monotonic
+from types import SimpleNamespace
+from typing import Iterable, Optional
+from socialserver.db import db
+from socialserver.constants import API_KEY_PREFIX, API_KEY_CACHE_TTL_SECONDS, ApiKeyPermissions
+
+"""
+    API keys look like ssk_<id>_<secret>. The id is the key's primary
+    key, so looking one up is a single index hit; the secret is then
+    checked against the stored sha256 hash. The id isn't secret, and
+    lets users tell their keys apart.
+"""
+
+
+def _hash(plaintext: str) -> str:
+    return sha256(plaintext.encode()).hexdigest()
+
+
+"""
+    generate_api_key_secret
+    returns a random secret for a new api key, and its sha256 hash.
+    the full key can only be put together once the db entry has an id,
+    using format_api_key.
+"""
+
+
+def generate_api_key_secret() -> SimpleNamespace(secret=str, hash=str):
+    secret = token_urlsafe(32)
+    return SimpleNamespace(secret=secret, hash=_hash(secret))
+
+
+def format_api_key(key_id: int, secret: str) -> str:
+    return f"{API_KEY_PREFIX}{key_id}_{secret}"
+
+
+def is_api_key(token: str) -> bool:
+    return token.startswith(API_KEY_PREFIX)
+
+
+"""
+    permissions_to_bitset
+    packs a list of ApiKeyPermissions values into an int,
+    so a permission check is a single bitwise and.
+"""
+
+
+def permissions_to_bitset(permissions: Iterable[int]) -> int:
+    bitset = 0
+    for permission in permissions:
+        bitset |= 1 << permission
+    return bitset
+
+
+"""
+    CachedApiKey
+
+    What we need to know about an api key to authenticate a request
+    with it, without touching the database.
+"""
+
+
+class CachedApiKey:
+    def __init__(self, key_id: int, owner_id: int, permissions: int):
+        self.key_id = key_id
+        self.owner_id = owner_id
+        self.permissions = permissions
+        self.expires_at = monotonic() + API_KEY_CACHE_TTL_SECONDS
+
+    def has_permission(self, permission: ApiKeyPermissions) -> bool:
+        return bool(self.permissions & (1 << permission.value))
+
+
+"""
+    ApiKeyCache
+
+    Validated api keys, by the hash of the whole key. Entries expire
+    after API_KEY_CACHE_TTL_SECONDS, so keys revoked by another process
+    stop working within that time; keys revoked in this one are evicted
+    straight away.
+"""
+
+
+class ApiKeyCache:
+    def __init__(self):
+        self._lock = Lock()
+        self._keys = {}
+
+    """
+        get
+        returns the CachedApiKey for a full api key, or None if it's not valid.
+        must be called inside a db_session, in case it needs to be looked up.
+    """
+
+    def get(self, api_key: str) -> Optional[CachedApiKey]:
+        cache_key = _hash(api_key)
+
+        with self._lock:
+            cached_key = self._keys.get(cache_key)
+        if cached_key is not None and cached_key.expires_at > monotonic():
+            return cached_key
+
+        try:
+            key_id, secret = api_key[len(API_KEY_PREFIX):].split("_", 1)
+            key_id = int(key_id)
+        except ValueError:
+            return None
+
+        key_entry = db.ApiKey.get(id=key_id)
+        if key_entry is None:
+            self.evict(key_id)
+            return None
+        if not compare_digest(key_entry.key_hash, _hash(secret)):
+            return None
+
+        new_cached_key = CachedApiKey(
+            key_id=key_entry.id,
+            owner_id=key_entry.owner.id,
+            permissions=permissions_to_bitset(key_entry.permissions),
+        )
+        with self._lock:
+            self._keys[cache_key] = new_cached_key
+        return new_cached_key
+
+    def evict(self, key_id: int) -> None:
+        with self._lock:
+            self._keys = {
+                cache_key: cached_key for cache_key, cached_key in self._keys.items()
+                if cached_key.key_id != key_id
+            }
+
+    def evict_owner(self, owner_id: int) -> None:
+        # for when the owner's deleted, taking their keys with them.
+        with self._lock:
+            self._keys = {
+                cache_key: cached_key for cache_key, cached_key in self._keys.items()
+                if cached_key.owner_id != owner_id
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._keys = {}
+
+
+api_key_cache = ApiKeyCache()
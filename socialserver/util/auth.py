@@ -1,6 +1,7 @@
 #  Copyright (c) Niall Asher 2022
 from datetime import timedelta, datetime
 from functools import wraps
+from os import cpu_count
 from types import SimpleNamespace
 import argon2
 from secrets import randbits
@@ -10,12 +11,33 @@ from secrets import token_urlsafe
 from pony.orm import db_session
 from socialserver.db import db
 from flask import abort, request, make_response, jsonify
-from socialserver.constants import ErrorCodes, LegacyErrorCodes, AccountAttributes, \
-    AuthHeaderInvalidOrNotPresentException
+from socialserver.constants import ErrorCodes, LegacyErrorCodes, \
+    AuthHeaderInvalidOrNotPresentException, ApiKeyPermissions
 from socialserver.util.config import config
+from socialserver.util.hashing_pool import HashingPool, HashingPoolBusyException
+from socialserver.util.write_behind import write_behind
+from socialserver.util.api_key import api_key_cache, is_api_key
+from socialserver.util.rate_limit import check_user_rate_limit, check_api_key_rate_limit
 import pyotp
 
-hasher = argon2.PasswordHasher()
+hasher = argon2.PasswordHasher(
+    time_cost=config.auth.password_hashing.time_cost,
+    memory_cost=config.auth.password_hashing.memory_cost_kib,
+    parallelism=config.auth.password_hashing.parallelism,
+)
+
+hashing_pool = HashingPool(
+    max_concurrent=config.auth.password_hashing.max_concurrent or cpu_count() or 1,
+    max_queued=config.auth.password_hashing.max_queued,
+    queue_timeout=config.auth.password_hashing.queue_timeout_seconds,
+)
+
+
+def _run_in_hashing_pool(function, *args):
+    try:
+        return hashing_pool.run(function, *args)
+    except HashingPoolBusyException:
+        abort(make_response(jsonify(error=ErrorCodes.SERVER_BUSY.value), 429))
 
 """
     generate_key
@@ -80,29 +102,47 @@ def generate_salt() -> str:
 """
     hash_password
     hash a password with a salt. you can generate a salt using
-    generate_salt()
+    generate_salt(). runs in the hashing pool; if it's overloaded,
+    the request is aborted with a 429.
 """
 
 
 def hash_password(plaintext: str, salt: str) -> str:
     assembled_password = plaintext + salt
-    return hasher.hash(assembled_password)
+    return _run_in_hashing_pool(hasher.hash, assembled_password)
 
 
 """
     verify_password_valid
-    take a plaintext password and a hash, and verify that the password is ok
-
+    take a plaintext password and a hash, and verify that the password is ok.
+    runs in the hashing pool, same as hash_password.
 """
 
 
-def verify_password_valid(plaintext: str, salt: str, given_hash: str) -> bool:
+def _verify_password(given_hash: str, assembled_password: str) -> bool:
     try:
-        return hasher.verify(given_hash, plaintext + salt)
+        return hasher.verify(given_hash, assembled_password)
     except argon2.exceptions.VerifyMismatchError:
         return False
 
 
+def verify_password_valid(plaintext: str, salt: str, given_hash: str) -> bool:
+    return _run_in_hashing_pool(_verify_password, given_hash, plaintext + salt)
+
+
+"""
+    rehash_password_if_needed
+    if a users password hash was made with different argon2 parameters
+    than the ones currently configured, hash it again with the current ones.
+    needs the plaintext, so only call it after a successful login.
+"""
+
+
+def rehash_password_if_needed(user, plaintext: str) -> None:
+    if hasher.check_needs_rehash(user.password_hash):
+        user.password_hash = hash_password(plaintext, user.password_salt)
+
+
 """
     hash_plaintext_sha256
     hash plaintext with the sha256 algo
@@ -177,6 +217,10 @@ def get_user_session_from_header():
         )
         return
 
+    # api keys don't have sessions.
+    if is_api_key(auth_token):
+        abort(make_response(jsonify(error=ErrorCodes.API_KEY_MISSING_PERMISSION.value), 403))
+
     auth_token_hash = hash_plaintext_sha256(auth_token)
     existing_session = db.UserSession.get(access_token_hash=auth_token_hash)
     if existing_session is None:
@@ -190,18 +234,87 @@ def get_user_session_from_header():
 """
 
 
-def get_ip_from_request() -> str:
-    ip = request.headers.get("X-Forwarded-For")
+def get_ip_from_request(current_request=None) -> str:
+    # callers that already have the request object can pass it in,
+    # to skip going through flask's context local again.
+    if current_request is None:
+        current_request = request
+    ip = current_request.headers.get("X-Forwarded-For")
     if ip is None:
-        ip = request.remote_addr
+        ip = current_request.remote_addr
     return ip
 
 
+"""
+    api_key_permission
+
+    Decorator marking which ApiKeyPermissions a resource method needs
+    when it's called with an api key. None means api keys can't be used
+    at all. Put it directly below @auth_reqd.
+
+    Without it, api keys with READ can use GET requests,
+    and can't use anything else.
+"""
+
+
+def api_key_permission(permission: ApiKeyPermissions or None):
+    def decorator(f):
+        f.api_key_permission = permission
+        return f
+
+    return decorator
+
+
+def _get_required_api_key_permission(f):
+    if hasattr(f, "api_key_permission"):
+        return f.api_key_permission
+    if request.method in ["GET", "HEAD", "OPTIONS"]:
+        return ApiKeyPermissions.READ
+    return None
+
+
+"""
+    _check_api_key
+    
+    validates an api key for a request, aborting if it's invalid,
+    doesn't have the given permission, or is over its rate limit.
+    returns the CachedApiKey.
+"""
+
+
+def _check_api_key(api_key: str, required_permission: ApiKeyPermissions or None):
+    cached_key = api_key_cache.get(api_key)
+    if cached_key is None:
+        abort(make_response(jsonify(error=ErrorCodes.API_KEY_INVALID.value), 401))
+    if required_permission is None or not cached_key.has_permission(required_permission):
+        abort(make_response(jsonify(error=ErrorCodes.API_KEY_MISSING_PERMISSION.value), 403))
+    check_api_key_rate_limit(cached_key.key_id)
+    check_user_rate_limit(cached_key.owner_id)
+    return cached_key
+
+
+"""
+    _get_api_key_owner_or_abort
+
+    returns the user owning a cached api key. the key's treated as
+    invalid if they've since been deleted, since it's gone with them,
+    even if it's still cached.
+"""
+
+
+def _get_api_key_owner_or_abort(cached_key):
+    owner = db.User.get(id=cached_key.owner_id)
+    if owner is None:
+        api_key_cache.evict_owner(cached_key.owner_id)
+        abort(make_response(jsonify(error=ErrorCodes.API_KEY_INVALID.value), 401))
+    return owner
+
+
 """
     auth_reqd
     
     Decorator for any resources that require auth.
-    It will validate whether a token is correct.
+    It will validate whether a token (or api key) is correct.
 """
 
 
@@ -218,11 +331,16 @@ def auth_reqd(f):
                 ), 401)
             )
             return
+        if is_api_key(auth_token):
+            _check_api_key(auth_token, _get_required_api_key_permission(f))
+            return f(*args, **kwargs)
         existing_entry = db.UserSession.get(
             access_token_hash=hash_plaintext_sha256(auth_token)
         )
         if existing_entry is None:
             abort(make_response(jsonify(error=ErrorCodes.TOKEN_INVALID.value), 401))
+        check_user_rate_limit(existing_entry.user.id)
+        write_behind.record_session_access(existing_entry.id)
         return f(*args, **kwargs)
 
     return decorated_function
@@ -250,13 +368,23 @@ def admin_reqd(f):
         # we just want <token>, and since there are no spaces in
         # the token format anyway, it's pretty easy to parse.
         auth_token = headers.get("Authorization").split(" ")[1]
+        if is_api_key(auth_token):
+            cached_key = _check_api_key(auth_token, ApiKeyPermissions.ACCESS_ADMIN)
+            owner = _get_api_key_owner_or_abort(cached_key)
+            # the key's permission isn't enough on its own; the owner
+            # might not be an admin anymore.
+            if not owner.is_admin:
+                abort(make_response(jsonify(error=ErrorCodes.USER_NOT_ADMIN.value), 401))
+            return f(*args, **kwargs)
         existing_entry = db.UserSession.get(
             access_token_hash=hash_plaintext_sha256(auth_token)
         )
         if existing_entry is None:
             abort(make_response(jsonify(error=ErrorCodes.TOKEN_INVALID.value), 401))
-        if AccountAttributes.ADMIN.value not in existing_entry.user.account_attributes:
+        if not existing_entry.user.is_admin:
             abort(make_response(jsonify(error=ErrorCodes.USER_NOT_ADMIN.value), 401))
+        check_user_rate_limit(existing_entry.user.id)
+        write_behind.record_session_access(existing_entry.id)
         return f(*args, **kwargs)
 
     return decorated_function
@@ -305,6 +433,12 @@ def get_user_from_auth_header():
         )
         return
 
+    if is_api_key(auth_token):
+        cached_key = api_key_cache.get(auth_token)
+        if cached_key is None:
+            abort(make_response(jsonify(error=ErrorCodes.API_KEY_INVALID.value), 401))
+        return _get_api_key_owner_or_abort(cached_key)
+
     existing_entry = db.UserSession.get(
         access_token_hash=hash_plaintext_sha256(auth_token)
     )
@@ -376,6 +510,18 @@ class TotpInvalidException(Exception):
     pass
 
 
+"""
+    record_failed_login
+
+    counts a failed login towards a users failure lock.
+    buffered, rather than written straight to the database.
+"""
+
+
+def record_failed_login(user: db.User) -> None:
+    write_behind.record_failed_login(user.id)
+
+
 """
     check_and_handle_account_lock_status
     
@@ -386,8 +532,12 @@ class TotpInvalidException(Exception):
 
 def check_and_handle_account_lock_status(user: db.User) -> bool:
     lock_time_seconds = config.auth.failure_lock.lock_time_seconds
-    if user.last_failed_login_attempt is not None:
-        unlock_at = user.last_failed_login_attempt + timedelta(seconds=lock_time_seconds)
+    # recent failures might not have been written to the database yet.
+    failed_login_count, last_failed_login_attempt = write_behind.failed_logins(
+        user.id, user.recent_failed_login_count, user.last_failed_login_attempt
+    )
+    if last_failed_login_attempt is not None:
+        unlock_at = last_failed_login_attempt + timedelta(seconds=lock_time_seconds)
     else:
         # in case the field is empty for some reason, just set it to current utc time + lock_time_seconds.
         new_unlock_time = datetime.utcnow() + timedelta(seconds=lock_time_seconds)
@@ -398,9 +548,10 @@ def check_and_handle_account_lock_status(user: db.User) -> bool:
     if not config.auth.failure_lock.enabled:
         return False
 
-    if user.recent_failed_login_count > config.auth.failure_lock.fail_count_before_lock:
+    if failed_login_count > config.auth.failure_lock.fail_count_before_lock:
         if unlock_at < datetime.utcnow():
             # account is unlocked by now.
+            write_behind.clear_failed_logins(user.id)
             user.recent_failed_login_count = 0
             return False
         else:
@@ -0,0 +1,51 @@
+#  Copyright (c) Niall Asher 2022
+
+from hashlib import blake2b
+from math import ceil, log
+
+"""
+    BloomFilter
+
+    Set membership test that can give false positives, but never false
+    negatives. If an item isn't in the filter, it was definitely never added.
+    Sized for `capacity` items at roughly `error_rate` false positives;
+    adding more than that still works, but the false positive rate climbs.
+    Items can't be removed.
+"""
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        capacity = max(capacity, 1)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.bit_count = ceil(-capacity * log(error_rate) / (log(2) ** 2))
+        self.hash_count = max(1, round(self.bit_count / capacity * log(2)))
+        self.count = 0
+        self._bits = bytearray((self.bit_count + 7) // 8)
+
+    # positions are derived from two halves of one digest
+    # (Kirsch & Mitzenmacher), rather than hashing once per position.
+    def _positions(self, item: str):
+        digest = blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[0:8], "little")
+        h2 = int.from_bytes(digest[8:16], "little") | 1
+        bit_count = self.bit_count
+        return [(h1 + i * h2) % bit_count for i in range(self.hash_count)]
+
+    def add(self, item: str) -> None:
+        bits = self._bits
+        for position in self._positions(item):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        bits = self._bits
+        for position in self._positions(item):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    @property
+    def size_bytes(self) -> int:
+        return len(self._bits)
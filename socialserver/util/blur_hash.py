@@ -0,0 +1,222 @@
+#  Copyright (c) Niall Asher 2022
+
+from functools import lru_cache
+from math import cos, pi, floor, copysign
+from operator import mul
+from typing import Iterable, List, Optional, Tuple
+from socialserver.constants import BLURHASH_X_COMPONENTS, BLURHASH_Y_COMPONENTS, BLURHASH_SAMPLE_SIZE
+from socialserver.util.lazy_import import LazyModule
+
+Image = LazyModule("PIL.Image")
+
+# a BlurHash encoder, producing the same output as the reference
+# implementation (https://github.com/woltapp/blurhash). blurhash-python's
+# encode wants an encoded image file, which it decodes and reads pixel by
+# pixel; this works on the pixels of a small, already downsampled image.
+# the hash only has a handful of components, so a 32x32 sample gives
+# (nearly) the same result as the full image.
+
+BASE83_CHARACTERS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+
+
+def _srgb_to_linear(value: int) -> float:
+    v = value / 255
+    if v <= 0.04045:
+        return v / 12.92
+    return ((v + 0.055) / 1.055) ** 2.4
+
+
+# only 256 possible inputs, so there's no point working any of them out twice.
+SRGB_TO_LINEAR = [_srgb_to_linear(value) for value in range(0, 256)]
+
+
+def _linear_to_srgb(value: float) -> int:
+    v = max(0.0, min(1.0, value))
+    if v <= 0.0031308:
+        return int(v * 12.92 * 255 + 0.5)
+    return int((1.055 * (v ** (1 / 2.4)) - 0.055) * 255 + 0.5)
+
+
+def _sign_pow(value: float, exponent: float) -> float:
+    return copysign(abs(value) ** exponent, value)
+
+
+def _encode83(value: int, length: int) -> str:
+    result = ""
+    for i in range(1, length + 1):
+        digit = (value // (83 ** (length - i))) % 83
+        result += BASE83_CHARACTERS[digit]
+    return result
+
+
+# the reference evaluates the basis functions at each pixel's left (or top)
+# edge. a downsampled pixel is the average of a block of source pixels, so
+# it's evaluated at the mean of their edges instead, which is offset from
+# its own edge by half a pixel, less half a source pixel. without that, the
+# hash of a sample drifts noticeably from the hash of the full image.
+def _sample_offset(length: int, source_length: int) -> float:
+    return 0.5 * (1 - length / source_length)
+
+
+@lru_cache(maxsize=64)
+def _basis(length: int, components: int, offset: float) -> Tuple[Tuple[float, ...], ...]:
+    # cos(pi * component * position / length), for every component & position.
+    # the basis functions are separable, so rows and columns get their own.
+    return tuple(
+        tuple(cos(pi * component * (position + offset) / length) for position in range(0, length))
+        for component in range(0, components)
+    )
+
+
+def _factors(channels: List[List[float]], width: int, height: int, x_components: int, y_components: int,
+             source_size: Tuple[int, int]) -> List[Tuple[float, float, float]]:
+    # channels are the red, green and blue values, in linear light, row by row.
+    x_basis = _basis(width, x_components, _sample_offset(width, source_size[0]))
+    y_basis = _basis(height, y_components, _sample_offset(height, source_size[1]))
+
+    # sum each row against the horizontal basis functions first, so the
+    # vertical ones only need applying to x_components sums per row,
+    # rather than to every pixel for every component.
+    row_sums = []
+    for y in range(0, height):
+        rows = [channel[y * width:(y + 1) * width] for channel in channels]
+        row_sums.append([
+            [sum(map(mul, x_basis[x], row)) for row in rows]
+            for x in range(0, x_components)
+        ])
+
+    scale = 1 / (width * height)
+    factors = []
+    for j in range(0, y_components):
+        column = y_basis[j]
+        for i in range(0, x_components):
+            normalisation = scale if i == 0 and j == 0 else scale * 2
+            factors.append(tuple(
+                sum(column[y] * row_sums[y][i][channel] for y in range(0, height)) * normalisation
+                for channel in range(0, 3)
+            ))
+    return factors
+
+
+def _encode_factors(factors: List[Tuple[float, float, float]], x_components: int, y_components: int) -> str:
+    dc, ac = factors[0], factors[1:]
+
+    blur_hash = _encode83((x_components - 1) + (y_components - 1) * 9, 1)
+
+    if len(ac) > 0:
+        actual_maximum_value = max(abs(value) for factor in ac for value in factor)
+        quantised_maximum_value = int(max(0, min(82, floor(actual_maximum_value * 166 - 0.5))))
+        maximum_value = (quantised_maximum_value + 1) / 166
+        blur_hash += _encode83(quantised_maximum_value, 1)
+    else:
+        maximum_value = 1
+        blur_hash += _encode83(0, 1)
+
+    blur_hash += _encode83(
+        (_linear_to_srgb(dc[0]) << 16) + (_linear_to_srgb(dc[1]) << 8) + _linear_to_srgb(dc[2]), 4
+    )
+
+    for factor in ac:
+        r, g, b = [
+            int(max(0, min(18, floor(_sign_pow(value / maximum_value, 0.5) * 9 + 9.5))))
+            for value in factor
+        ]
+        blur_hash += _encode83(r * 19 * 19 + g * 19 + b, 2)
+
+    return blur_hash
+
+
+def _check_components(x_components: int, y_components: int):
+    if not 1 <= x_components <= 9 or not 1 <= y_components <= 9:
+        raise ValueError("x_components and y_components must be between 1 and 9")
+
+
+"""
+    encode_pixels
+
+    BlurHash for raw 8 bit RGB pixel data, row by row, as given by
+    Image.tobytes() on an RGB image. If the pixels were downsampled from
+    a larger image, source_size is that image's size, so the hash comes
+    out closer to that image's; otherwise the output is exactly the
+    reference encoder's.
+"""
+
+
+def encode_pixels(pixels: bytes, width: int, height: int,
+                  x_components: int = BLURHASH_X_COMPONENTS, y_components: int = BLURHASH_Y_COMPONENTS,
+                  source_size: Optional[Tuple[int, int]] = None) -> str:
+    _check_components(x_components, y_components)
+    linear = SRGB_TO_LINEAR
+    channels = [[linear[value] for value in pixels[channel::3]] for channel in range(0, 3)]
+    factors = _factors(channels, width, height, x_components, y_components, source_size or (width, height))
+    return _encode_factors(factors, x_components, y_components)
+
+
+"""
+    blur_hash_sample_size
+
+    The size an image is shrunk to for encoding: no bigger than
+    BLURHASH_SAMPLE_SIZE, keeping its aspect ratio.
+"""
+
+
+def blur_hash_sample_size(size: Tuple[int, int]) -> Tuple[int, int]:
+    width, height = size
+    scale = min(1, BLURHASH_SAMPLE_SIZE[0] / width, BLURHASH_SAMPLE_SIZE[1] / height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+"""
+    encode_image
+
+    BlurHash for a PIL image, computed from a small sample of it. The
+    smaller the image given, the less work this is, so pass in the
+    smallest uncropped copy there is.
+"""
+
+
+def encode_image(image, x_components: int = BLURHASH_X_COMPONENTS,
+                 y_components: int = BLURHASH_Y_COMPONENTS) -> str:
+    _check_components(x_components, y_components)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    sample_size = blur_hash_sample_size(image.size)
+    # each channel is converted to linear light (as floats) before it's
+    # shrunk, since that's what the encoder averages. averaging the srgb
+    # values instead darkens anything bright on a dark background.
+    channels = [
+        list(band.point(SRGB_TO_LINEAR, "F").resize(sample_size, Image.BOX).getdata())
+        for band in image.split()
+    ]
+    return encode_linear_sample(channels, *sample_size, image.size, x_components, y_components)
+
+
+"""
+    encode_linear_sample
+
+    BlurHash from a sample that's already been converted to linear light
+    and shrunk (to blur_hash_sample_size), given as its red, green and
+    blue channels, row by row. source_size is the size of the image it
+    was taken from. For image backends that make their own samples.
+"""
+
+
+def encode_linear_sample(channels: List[List[float]], width: int, height: int, source_size: Tuple[int, int],
+                         x_components: int = BLURHASH_X_COMPONENTS,
+                         y_components: int = BLURHASH_Y_COMPONENTS) -> str:
+    _check_components(x_components, y_components)
+    factors = _factors(channels, width, height, x_components, y_components, source_size)
+    return _encode_factors(factors, x_components, y_components)
+
+
+"""
+    encode_images
+
+    encode_image, for many images at once, for backfilling. Images
+    can be a generator, so only one of them needs to be loaded at a time.
+"""
+
+
+def encode_images(images: Iterable, x_components: int = BLURHASH_X_COMPONENTS,
+                  y_components: int = BLURHASH_Y_COMPONENTS) -> List[str]:
+    return [encode_image(image, x_components, y_components) for image in images]
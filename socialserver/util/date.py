@@ -4,7 +4,7 @@ from datetime import datetime
 
 
 def format_timestamp_string(datetime_object: datetime):
-    return datetime_object.utcnow().isoformat() + "Z"  # zero offset; UTC time.
+    return datetime_object.isoformat() + "Z"  # zero offset; UTC time.
 
 
 if __name__ == "__main__":
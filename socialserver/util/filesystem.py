@@ -1,19 +1,22 @@
 #  Copyright (c) Niall Asher 2022
 # TODO: Optional S3 implementation for storage directories. Will need config file updates too.
 
-from socialserver.util.config import config
+from socialserver.util.config import config, FILE_ROOT
 from socialserver.util.output import console
-from fs.osfs import OSFS
-from typing import Union
-from fs_s3fs import S3FS
+from contextlib import contextmanager
+from secrets import token_hex
+from threading import Lock
+from typing import Optional
 from os import getenv
 import atexit
+import os
+import re
 
-
-def _close_filesystem(fs: Union[OSFS, S3FS], title: str):
-    console.log(f"Closing {title} filesystem object...")
-    fs.close()
-
+try:
+    import fcntl
+except ImportError:
+    # windows; hash_lock only works between threads there.
+    fcntl = None
 
 IMAGE_STORAGE_DIR_OVERRIDE = getenv("SOCIALSERVER_IMAGE_STORAGE_DIR", None)
 VIDEO_STORAGE_DIR_OVERRIDE = getenv("SOCIALSERVER_VIDEO_STORAGE_DIR", None)
@@ -21,9 +24,188 @@ VIDEO_STORAGE_DIR_OVERRIDE = getenv("SOCIALSERVER_VIDEO_STORAGE_DIR", None)
 video_dir = VIDEO_STORAGE_DIR_OVERRIDE or config.media.videos.storage_dir
 image_dir = IMAGE_STORAGE_DIR_OVERRIDE or config.media.images.storage_dir
 
-fs_images = OSFS(image_dir, create=True)
-fs_videos = OSFS(video_dir, create=True)
+"""
+    LazyFilesystem
+
+    a storage directory, opened (and created if need be) the first time
+    it's used, rather than whenever this module is imported. pyfilesystem
+    is slow to import, and most cli commands never touch the files.
+    it's closed at exit, if it was ever opened.
+"""
+
+
+class LazyFilesystem:
+    def __init__(self, directory: str, title: str):
+        self._directory = directory
+        self._title = title
+        self._fs = None
+        self._lock = Lock()
+
+    def _open(self):
+        if self._fs is None:
+            with self._lock:
+                if self._fs is None:
+                    from fs.osfs import OSFS
+                    self._fs = OSFS(self._directory, create=True)
+                    atexit.register(self._close)
+        return self._fs
+
+    def _close(self):
+        console.log(f"Closing {self._title} filesystem object...")
+        self._fs.close()
+
+    def __getattr__(self, attribute):
+        return getattr(self._open(), attribute)
+
+
+fs_images = LazyFilesystem(image_dir, "image")
+fs_videos = LazyFilesystem(video_dir, "video")
+
+
+CONTENT_HASH_REGEX = re.compile("[0-9a-f]{64}")
+SHARD_DIRECTORY_REGEX = re.compile("[0-9a-f]{2}")
+HASH_LOCK_DIR = f"{FILE_ROOT}/locks"
+
+"""
+    hash_directory
+
+    The directory a file (an image & its variants, or a video) is stored
+    in, by the sha256sum of its content. In the sharded layout, that's
+    under two levels of directories, named for the first four characters
+    of it (i.e. /ab/cd/abcd...), so that no directory ends up with millions
+    of entries in it. Uses media.storage_layout, unless given one.
+"""
+
+
+def hash_directory(content_hash: str, layout: Optional[str] = None) -> str:
+    if (layout or config.media.storage_layout) == "sharded":
+        return f"/{content_hash[0:2]}/{content_hash[2:4]}/{content_hash}"
+    return f"/{content_hash}"
+
+
+"""
+    write_bytes_atomic
+
+    Writes a file under a temporary name in the same directory, then
+    renames it over the real one, so nothing (another request, or the
+    server after a crash) ever sees half of it. Temporary files start
+    with a ., so they're never mistaken for a variant or an original.
+"""
+
+
+def write_bytes_atomic(filesystem, path: str, data: bytes) -> None:
+    directory, filename = path.rsplit("/", 1)
+    temp_path = f"{directory}/.{filename}.{token_hex(8)}.tmp"
+    try:
+        filesystem.writebytes(temp_path, data)
+        filesystem.move(temp_path, path, overwrite=True)
+    except Exception:
+        if filesystem.exists(temp_path):
+            filesystem.remove(temp_path)
+        raise
+
+
+_hash_thread_locks = {}
+_hash_thread_locks_lock = Lock()
+
+
+@contextmanager
+def _hash_process_lock(content_hash: str):
+    if fcntl is None:
+        yield
+        return
+    # one lock file per 2 character prefix, rather than per hash, so
+    # they don't pile up. a clash only means waiting a bit longer.
+    os.makedirs(HASH_LOCK_DIR, exist_ok=True)
+    with open(f"{HASH_LOCK_DIR}/{content_hash[0:2]}.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+"""
+    hash_lock
+
+    A context manager, held while writing the files for a hash, so two
+    uploads of the same file, on different threads or in different
+    processes (i.e. gunicorn workers), don't both do the work. Whatever
+    has it should check what's already stored first. It isn't reentrant.
+"""
+
+
+@contextmanager
+def hash_lock(content_hash: str):
+    with _hash_thread_locks_lock:
+        entry = _hash_thread_locks.setdefault(content_hash, [Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0], _hash_process_lock(content_hash):
+            yield
+    finally:
+        with _hash_thread_locks_lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _hash_thread_locks[content_hash]
+
+
+def _stored_hash_directories(filesystem) -> list:
+    directories = []
+    for name in filesystem.listdir("/"):
+        if CONTENT_HASH_REGEX.fullmatch(name):
+            directories.append((f"/{name}", name))
+        elif SHARD_DIRECTORY_REGEX.fullmatch(name) and filesystem.isdir(f"/{name}"):
+            for second in filesystem.listdir(f"/{name}"):
+                if not SHARD_DIRECTORY_REGEX.fullmatch(second) or not filesystem.isdir(f"/{name}/{second}"):
+                    continue
+                for content_hash in filesystem.listdir(f"/{name}/{second}"):
+                    if CONTENT_HASH_REGEX.fullmatch(content_hash):
+                        directories.append((f"/{name}/{second}/{content_hash}", content_hash))
+    return directories
+
+
+def _move_directory(filesystem, source: str, destination: str) -> None:
+    from fs.errors import NoSysPath
+    filesystem.makedirs(destination.rsplit("/", 1)[0] or "/", recreate=True)
+    if not filesystem.exists(destination):
+        try:
+            # a rename, rather than copying every file, on disk.
+            os.rename(filesystem.getsyspath(source), filesystem.getsyspath(destination))
+        except NoSysPath:
+            filesystem.movedir(source, destination, create=True)
+        return
+    # i.e. it was uploaded again, after the config was changed, but
+    # before this was run. the files are the same either way.
+    for filename in filesystem.listdir(source):
+        if not filesystem.exists(f"{destination}/{filename}"):
+            filesystem.move(f"{source}/{filename}", f"{destination}/{filename}")
+    filesystem.removetree(source)
+
+
+"""
+    migrate_storage_layout
+
+    Moves everything stored by hash into the given layout (see
+    hash_directory), leaving anything else alone. It can be stopped &
+    run again, since whatever's already been moved is skipped. The
+    server should be stopped while it runs, then started again with
+    media.storage_layout changed to match. Returns the number moved.
+"""
+
 
-# close all filesystems safely during program exit.
-atexit.register(lambda: _close_filesystem(fs_images, "image"))
-atexit.register(lambda: _close_filesystem(fs_videos, "video"))
+def migrate_storage_layout(filesystem, layout: str) -> int:
+    moved = 0
+    for directory, content_hash in _stored_hash_directories(filesystem):
+        destination = hash_directory(content_hash, layout)
+        if directory == destination:
+            continue
+        with hash_lock(content_hash):
+            _move_directory(filesystem, directory, destination)
+        moved += 1
+        # leave no empty shard directories behind, going back to flat.
+        parent = directory.rsplit("/", 1)[0]
+        while parent != "" and filesystem.isempty(parent):
+            filesystem.removedir(parent)
+            parent = parent.rsplit("/", 1)[0]
+    return moved
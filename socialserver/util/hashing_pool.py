@@ -0,0 +1,66 @@
+#  Copyright (c) Niall Asher 2022
+
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock
+from typing import Callable, TypeVar
+
+T = TypeVar("T")
+
+"""
+    HashingPoolBusyException
+
+    Raised if a task couldn't get a slot in the pool in time,
+    or if too many tasks are already waiting for one.
+"""
+
+
+class HashingPoolBusyException(Exception):
+    pass
+
+
+"""
+    HashingPool
+
+    Runs expensive hashing work (i.e. argon2) on a fixed number of
+    dedicated threads, so a flood of logins can only ever tie up that many
+    cores, instead of every request thread we have.
+
+    Callers wait up to queue_timeout seconds for a slot. If max_queued
+    callers are already waiting, new ones are turned away straight away,
+    rather than piling up behind them.
+"""
+
+
+class HashingPool:
+    def __init__(self, max_concurrent: int, max_queued: int, queue_timeout: float):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrent, thread_name_prefix="hashing_pool"
+        )
+        self._slots = BoundedSemaphore(max_concurrent)
+        self._waiting_lock = Lock()
+        self._waiting = 0
+
+    def _wait_for_slot(self) -> bool:
+        with self._waiting_lock:
+            if self._waiting >= self.max_queued:
+                return False
+            self._waiting += 1
+        try:
+            return self._slots.acquire(timeout=self.queue_timeout)
+        finally:
+            with self._waiting_lock:
+                self._waiting -= 1
+
+    def run(self, function: Callable[..., T], *args) -> T:
+        if not self._slots.acquire(blocking=False) and not self._wait_for_slot():
+            raise HashingPoolBusyException
+
+        try:
+            # holding a slot means there's always a free worker,
+            # so this never queues inside the executor itself.
+            return self._executor.submit(function, *args).result()
+        finally:
+            self._slots.release()
@@ -0,0 +1,169 @@
+#  Copyright (c) Niall Asher 2022
+
+import re
+from datetime import datetime
+from threading import Thread
+from time import sleep
+from typing import List
+from pony.orm import select, db_session, commit
+from socialserver.db import db
+from socialserver.util.output import console
+from socialserver.util.trending import TrendingCounter
+from socialserver.constants import (
+    REGEX_HASHTAG,
+    TRENDING_HASHTAG_WINDOW_SECONDS,
+    TRENDING_HASHTAG_BUCKET_COUNT,
+    TRENDING_HASHTAG_CAPACITY,
+    TRENDING_HASHTAG_REFRESH_INTERVAL,
+    TRENDING_HASHTAG_CHECKPOINT_INTERVAL,
+    MAX_TRENDING_HASHTAGS_GET_COUNT,
+)
+
+_hashtag_regex = re.compile(REGEX_HASHTAG)
+
+
+def _new_trending_counter() -> TrendingCounter:
+    return TrendingCounter(
+        window_seconds=TRENDING_HASHTAG_WINDOW_SECONDS,
+        bucket_count=TRENDING_HASHTAG_BUCKET_COUNT,
+        capacity=TRENDING_HASHTAG_CAPACITY,
+        refresh_seconds=TRENDING_HASHTAG_REFRESH_INTERVAL,
+        top_count=MAX_TRENDING_HASHTAGS_GET_COUNT,
+    )
+
+
+# process-wide trending counts, fed whenever a post with hashtags is made.
+# NOTE: with multiple worker processes, each counts the posts it handles.
+# they're merged together in the database at every checkpoint, and each
+# worker picks up the merged counts from there.
+trending_hashtags = _new_trending_counter()
+
+"""
+    extract_hashtags
+
+    returns the unique hashtags in a string of post text, lowercase and
+    without the leading #, in the order they first appear.
+"""
+
+
+def extract_hashtags(text: str) -> List[str]:
+    # the regex is case-insensitive, but we store tags lowercase,
+    # so we convert the text here rather than each match afterwards.
+    tags = []
+    for match in _hashtag_regex.findall(text.lower()):
+        tag_name = match[1:]
+        if tag_name not in tags:
+            tags.append(tag_name)
+    return tags
+
+
+"""
+    get_or_create_hashtags
+
+    returns db.Hashtag objects for each given name, creating any that don't
+    exist yet. existing tags are fetched in a single query, rather than
+    one per tag. must be called inside a db_session.
+"""
+
+
+def get_or_create_hashtags(tag_names: List[str]) -> list:
+    if len(tag_names) == 0:
+        return []
+
+    existing_tags = {
+        tag.name: tag
+        for tag in select(h for h in db.Hashtag if h.name in tag_names)
+    }
+
+    tags = []
+    for tag_name in tag_names:
+        tag = existing_tags.get(tag_name)
+        if tag is None:
+            tag = db.Hashtag(creation_time=datetime.utcnow(), name=tag_name)
+            existing_tags[tag_name] = tag
+        tags.append(tag)
+    return tags
+
+
+"""
+    attach_hashtags_to_post
+
+    associates a post with each of the given hashtag names,
+    creating any of the hashtags that don't exist yet.
+    the tags aren't counted as trending until the post is committed;
+    call trending_hashtags.record with them after that.
+"""
+
+
+def attach_hashtags_to_post(post, tag_names: List[str]) -> None:
+    for tag in get_or_create_hashtags(tag_names):
+        db.PostHashtag(post=post, hashtag=tag, creation_time=post.creation_time)
+
+
+"""
+    checkpoint_trending_hashtags
+
+    merges the trending hashtag counts recorded since the last checkpoint
+    into the ones in the database, which every worker adds to, then picks
+    up the merged counts, so each worker sees the posts the others handle.
+"""
+
+
+@db_session
+def checkpoint_trending_hashtags():
+    pending = trending_hashtags.take_pending()
+    try:
+        existing_snapshot = select(s for s in db.TrendingHashtagSnapshot).for_update().first()
+        merged = _new_trending_counter()
+        if existing_snapshot is not None:
+            merged.restore(existing_snapshot.data)
+        merged.merge(pending)
+        snapshot = merged.snapshot()
+        if existing_snapshot is None:
+            # a fixed id, so if two workers make it at once, one fails,
+            # rather than both making their own.
+            db.TrendingHashtagSnapshot(id=1, last_update_time=datetime.utcnow(), data=snapshot)
+        else:
+            existing_snapshot.last_update_time = datetime.utcnow()
+            existing_snapshot.data = snapshot
+        commit()
+    except Exception:
+        # counted again next time, rather than lost.
+        trending_hashtags.return_pending(pending)
+        raise
+    trending_hashtags.restore(snapshot)
+
+
+"""
+    restore_trending_hashtags
+
+    loads the last saved trending hashtag counts, if there are any.
+"""
+
+
+@db_session
+def restore_trending_hashtags():
+    existing_snapshot = select(s for s in db.TrendingHashtagSnapshot).first()
+    if existing_snapshot is not None:
+        trending_hashtags.restore(existing_snapshot.data)
+
+
+def start_trending_hashtag_checkpoint_thread():
+    def _run():
+        while True:
+            try:
+                sleep(TRENDING_HASHTAG_CHECKPOINT_INTERVAL)
+                checkpoint_trending_hashtags()
+            except KeyboardInterrupt:
+                break
+            except Exception as e:
+                # the counts are kept in memory until they're saved,
+                # so it's fine to try again next time.
+                console.log(f"[bold red]Trending hashtag checkpoint failed: {e}")
+
+    restore_trending_hashtags()
+    console.log(
+        f"Starting trending hashtag checkpoint thread, interval={TRENDING_HASHTAG_CHECKPOINT_INTERVAL}"
+    )
+    checkpoint_thread = Thread(target=_run, daemon=True)
+    checkpoint_thread.start()
@@ -6,98 +6,52 @@ from base64 import urlsafe_b64decode
 from math import gcd
 from types import SimpleNamespace
 from base64 import b64encode
-import PIL
-from PIL import Image, ImageOps, ExifTags
 from pony.orm import commit, db_session, select
 from socialserver.util.config import config
 from socialserver.util.output import console
+from socialserver.util.metrics import image_stage_timer
+from socialserver.util.media_jobs import media_jobs, record_phase_latency
 from socialserver.db import db
-from socialserver.util.filesystem import fs_images
+from socialserver.util.filesystem import fs_images, hash_directory, hash_lock, write_bytes_atomic
+from socialserver.util.lazy_import import LazyModule
+from socialserver.util.image_backend import get_image_backend
+from socialserver.util.image_formats import IMAGE_ENCODERS, formats_to_generate, image_format_quality, \
+    image_format_progressive
+from socialserver.util.image_variants import IMAGE_VARIANTS, ImageVariant, variants_for_purpose, missing_variants, \
+    closest_pixel_ratio, stored_pixel_ratio, unstored_variants, variant_file_path
 from socialserver.constants import (
     ImageTypes,
+    ImageUploadPurposes,
+    MediaJobLanes,
+    MediaJobPhases,
     MAX_PIXEL_RATIO,
-    MAX_IMAGE_SIZE_GALLERY_PREVIEW,
-    MAX_IMAGE_SIZE_POST_PREVIEW,
-    MAX_IMAGE_SIZE_POST,
-    MAX_IMAGE_SIZE_PROFILE_PICTURE,
-    MAX_IMAGE_SIZE_PROFILE_PICTURE_LARGE,
     ImageSupportedMimeTypes,
-    BLURHASH_X_COMPONENTS,
-    BLURHASH_Y_COMPONENTS,
     PROCESSING_BLURHASH, ServerSupportedImageFormats, ROOT_DIR,
+    BLURHASH_SAMPLE_SIZE,
 )
 from secrets import token_urlsafe
-from copy import copy
-import magic
-from typing import Tuple
-import blurhash
+from typing import List, Optional, Tuple
 from io import BytesIO
-from threading import Thread
 from hashlib import sha256
+from time import perf_counter
 
-GENERATE_WEBP_IMAGES = config.media.images.webp.enabled
-
-"""
-    rotate_image_accounting_for_exif_data
-    Reads the Exif tags associated with an uploaded image.
-    If it finds a rotation tag, it will apply the correct rotation to the image object.
-    Important for iOS image uploads, which always seem to end up the wrong way around.
-"""
-
-
-def rotate_image_accounting_for_exif_data(image_object: Image) -> Image:
-    # this may have issues with png depending on pillow version!
-    # might need to be done manually.
-    console.log("Rotating image to account for exif orientation data.")
-    rotated_image = ImageOps.exif_transpose(image_object)
-    return rotated_image
-
+# imported on first use; see LazyModule
+magic = LazyModule("magic")
 
 """
     save_image
-    saves a PIL.Image
+    saves an image from the image backend
 """
 
 
-def save_image(image: Image, image_hash: str, filename: str, pixel_ratio: str,
+def save_image(image, image_hash: str, filename: str, pixel_ratio: str,
                image_format: ServerSupportedImageFormats):
-    type = ImageTypes(filename)
-    save_format = ""
-    ext = ""
-    quality = ""
-    use_progressive = False
-    if image_format == ServerSupportedImageFormats.WEBP:
-        quality = config.media.images.webp.quality \
-            if not type == ImageTypes.POST else \
-            config.media.images.webp.post_quality
-        use_progressive = config.media.images.webp.use_progressive_images
-        save_format = "WEBP"
-        ext = "webp"
-    elif image_format == ServerSupportedImageFormats.JPG:
-        quality = config.media.images.jpeg.quality \
-            if not type == ImageTypes.POST else \
-            config.media.images.jpeg.post_quality
-        use_progressive = config.media.images.jpeg.use_progressive_images
-        save_format = "JPEG"
-        ext = "jpg"
-    else:
-        raise InvalidImageException
+    # the quality etc. come from the format's config section; see image_formats.
+    quality = image_format_quality(image_format, ImageTypes(filename))
+    use_progressive = image_format_progressive(image_format)
 
-    temp_buffer = BytesIO()
-    image.save(
-        temp_buffer,
-        format=save_format,
-        quality=quality,
-        progressive=use_progressive
-    )
-
-    # return to start of buffer before saving it to disk
-    temp_buffer.seek(0)
-
-    fs_images.writebytes(f"/{image_hash}/{filename}_{pixel_ratio}x.{ext}",
-                         temp_buffer.read())
-
-    del temp_buffer
+    write_bytes_atomic(fs_images, variant_file_path(image_hash, ImageTypes(filename), pixel_ratio, image_format),
+                       get_image_backend().encode(image, image_format, quality, use_progressive))
 
 
 """
@@ -105,53 +59,59 @@ def save_image(image: Image, image_hash: str, filename: str, pixel_ratio: str,
     Saves an imageset (e.g. profile pic sm, lg) to disk, in the correct directory, with consistent naming.
     Does not create a database entry.
     in the future, this might be moved into amazon s3?
+    images maps each ImageTypes to a list of (pixel ratio, image).
+    If skip_existing is true, files that are already there are left alone.
 """
 
 
-# TODO: not sure how to best represent a dict with pythons type
-# annotations. Need to fix this.
-def save_images_to_disk(images: dict, image_hash: str, use_webp=False) -> None:
-    save_format = ServerSupportedImageFormats.WEBP if use_webp else ServerSupportedImageFormats.JPG
-    image_format = "WEBP" if use_webp else "JPEG"
-    image_ext = "webp" if use_webp else "jpg"
+def save_images_to_disk(images: dict, image_hash: str,
+                        save_format: ServerSupportedImageFormats = ServerSupportedImageFormats.JPG,
+                        skip_existing: bool = False) -> None:
+    # recreate, since another upload of the same image (or one generating
+    # its other variants) might make the directory between checking & making it.
+    fs_images.makedirs(hash_directory(image_hash), recreate=True)
 
-    def save_with_pixel_ratio(image, filename, pixel_ratio):
+    for image_type, resized_images in images.items():
+        # some variants aren't stored in every format
+        if save_format not in IMAGE_VARIANTS[image_type].formats:
+            continue
+        for pixel_ratio, image in resized_images:
+            if skip_existing and fs_images.exists(variant_file_path(image_hash, image_type, pixel_ratio, save_format)):
+                continue
+            # using the fs object is more secure, since it can't affect anything
+            # above its root directory, limiting what could happen with paths
+            save_image(image, image_hash, image_type.value, pixel_ratio, save_format)
 
-        print(f"\n\n\n processing image pr {pixel_ratio} \n\n\n")
 
-        # this isn't that efficient, but I'm not aware of a better way
-        # without using syspath.
-        # using the fs object is more secure, since it can't affect anything
-        # above its root directory, limiting what could happen with paths
-        save_image(image, image_hash, filename, pixel_ratio, save_format)
+"""
+    save_original_to_disk
+    Saves the uploaded file, exactly as it was uploaded, as the image's
+    original. Re-encoding it would only lose quality (or, at a high enough
+    quality to not, make it bigger). It's what the sha256sum is of, too.
+"""
 
-    # FIXME: this is due to some deficiencies in the testing process.
 
-    if not fs_images.exists(f"/{image_hash}"):
-        console.log(f"Creating images/{image_hash}...")
-        fs_images.makedir(f"/{image_hash}")
+def save_original_to_disk(data: bytes, image_hash: str, extension: str) -> None:
+    fs_images.makedirs(hash_directory(image_hash), recreate=True)
+    write_bytes_atomic(fs_images, f"{hash_directory(image_hash)}/{ImageTypes.ORIGINAL.value}.{extension}", data)
 
-    for i in images.keys():
-        if i == ImageTypes.ORIGINAL:
-            console.log(f"Saving original image ({image_ext}) for {image_hash}")
-            temp_image_buffer = BytesIO()
-            images[i][0].save(
-                temp_image_buffer,
-                format=image_format,
-                quality=100,
-            )
-            temp_image_buffer.seek(0)
-            fs_images.writebytes(
-                f"/{image_hash}/{ImageTypes.ORIGINAL.value}.{image_ext}", temp_image_buffer.read()
-            )
-            del temp_image_buffer
-        else:
-            # TODO: use something less scuffed than this counter!
-            counter = 1
-            for j in images[i]:
-                console.log(f"Saving {i.value}image ({image_ext}) for {image_hash}")
-                save_with_pixel_ratio(j, i.value, counter)
-                counter += 1
+
+"""
+    stored_original_path
+    Where an image's original is stored, or None if it isn't. Images
+    processed before originals were kept verbatim have a re-encoded
+    orig.jpg (and maybe orig.webp), so the jpg is preferred.
+"""
+
+
+def stored_original_path(image_hash: str) -> Optional[str]:
+    directory = hash_directory(image_hash)
+    if not fs_images.exists(directory):
+        return None
+    for filename in sorted(fs_images.listdir(directory)):
+        if filename.startswith(f"{ImageTypes.ORIGINAL.value}."):
+            return f"{directory}/{filename}"
+    return None
 
 
 """
@@ -184,10 +144,8 @@ def mult_size_tuple(size: Tuple[int, int], multiplier: int) -> Tuple[int, int]:
 """
 
 
-def fit_image_to_size(image: PIL.Image, size: Tuple[int, int]) -> PIL.Image:
-    img = copy(image)
-    img.thumbnail(size, PIL.Image.ANTIALIAS)
-    return img
+def fit_image_to_size(image, size: Tuple[int, int]):
+    return get_image_backend().fit(image, size)
 
 
 """
@@ -195,31 +153,61 @@ def fit_image_to_size(image: PIL.Image, size: Tuple[int, int]) -> PIL.Image:
     Resize an image, aspect aware.
     Returns the result of fit_image_to_size after cropping to aspect
     ratio from the top left. (i.e. you will get back an array of images,
-    for different pixel ratios, from 1 to MAX_PIXEL_RATIO)
+    for the given pixel ratios, by default from 1 to MAX_PIXEL_RATIO)
 """
 
 
-# TODO: fix typing returns a list of images
-def resize_image_aspect_aware(image: PIL.Image, size: Tuple[int, int]) -> PIL.Image:
+def resize_image_aspect_aware(image, size: Tuple[int, int],
+                              pixel_ratios=range(1, MAX_PIXEL_RATIO + 1)) -> list:
     #  TODO: this really need to make sure the image isn't
     #  smaller than the requested size already, since we don't
     #  want to make the size LARGER!
+    backend = get_image_backend()
+    image_size = backend.size(image)
     images = []
-    if image.size[0] < size[0] or image.size[1] < size[1]:
+    if image_size[0] < size[0] or image_size[1] < size[1]:
         # create the largest possible image within max_image_size
         size = calculate_largest_fit(image, size)
-    for pixel_ratio in range(1, MAX_PIXEL_RATIO + 1):
+    for pixel_ratio in pixel_ratios:
         scaled_size = mult_size_tuple(size, pixel_ratio)
         # if the scaled size is larger than the original, use the original
-        if scaled_size[0] > image.size[0] or scaled_size[1] > image.size[1]:
+        if scaled_size[0] > image_size[0] or scaled_size[1] > image_size[1]:
             # TODO: see why the hell these are coming out as floats...
             scaled_size = (int(size[0]), int(size[1]))
-        images.append(
-            ImageOps.fit(image, scaled_size, PIL.Image.BICUBIC, centering=(0.5, 0.5))
-        )
+        images.append(backend.crop_fit(image, scaled_size))
     return images
 
 
+"""
+    resize_to_variant
+    Resizes an image for each of a variant's pixel ratios (or just
+    the given ones). Returns a list of (pixel ratio, image).
+"""
+
+
+def resize_to_variant(image, variant: ImageVariant, pixel_ratios=None) -> List[tuple]:
+    pixel_ratios = variant.pixel_ratios if pixel_ratios is None else pixel_ratios
+    if variant.crop:
+        resized = resize_image_aspect_aware(image, variant.size, pixel_ratios)
+    else:
+        resized = [
+            fit_image_to_size(image, mult_size_tuple(variant.size, pixel_ratio))
+            for pixel_ratio in pixel_ratios
+        ]
+    return list(zip(pixel_ratios, resized))
+
+
+"""
+    variant_decode_targets
+    The biggest size each of the given variants is made at, for
+    decoding an image at no more than the size that needs.
+"""
+
+
+def variant_decode_targets(variants) -> List[Tuple[Tuple[int, int], bool]]:
+    return [(mult_size_tuple(variant.size, variant.pixel_ratios[-1]), variant.crop) for variant in variants]
+
+
 """
     calculate largest image size to fit in the aspect ratio
     given by a size.
@@ -230,13 +218,14 @@ def resize_image_aspect_aware(image: PIL.Image, size: Tuple[int, int]) -> PIL.Im
 
 
 def calculate_largest_fit(
-        image: PIL.Image, max_size: Tuple[int, int]
+        image, max_size: Tuple[int, int]
 ) -> Tuple[int, int]:
     # calculate *target* aspect ratio from max size
     divisor = gcd(max_size[0], max_size[1])
     target_aspect_ratio = (max_size[0] / divisor, max_size[1] / divisor)
     # create the largest possible image within the original image size, and the aspect ratio
-    new_width = image.size[0] - (image.size[0] % target_aspect_ratio[0])
+    image_width = get_image_backend().size(image)[0]
+    new_width = image_width - (image_width % target_aspect_ratio[0])
     new_height = new_width * (target_aspect_ratio[0] / target_aspect_ratio[1])
     return tuple((new_width, new_height))
 
@@ -263,13 +252,18 @@ def convert_data_url_to_byte_buffer(data_url: str) -> BytesIO:
 """ 
     convert_buffer_to_image
     
-    Converts a buffer to a pil.Image object
+    Converts a buffer to an image from the image backend. It's rotated
+    to match its Exif orientation, which is important for iOS image
+    uploads, which always seem to end up the wrong way around.
+    If it's only going to be used for the given variants, jpegs
+    are decoded at a fraction of their size, where that's enough.
+    Raises ImageTooLargeException if it's over the size limits.
 """
 
 
-def convert_buffer_to_image(buffer: BytesIO) -> PIL.Image:
-    image = Image.open(buffer).convert("RGB")
-    return image
+def convert_buffer_to_image(buffer: BytesIO, variants=None):
+    targets = None if variants is None else variant_decode_targets(variants)
+    return get_image_backend().open(buffer.read(), targets)
 
 
 """
@@ -343,14 +337,16 @@ def check_buffer_mimetype(buffer, mimetypes):
 """
 
 
-def _verify_image(image: BytesIO):
-    if not check_buffer_mimetype(image, ImageSupportedMimeTypes):
+def _verify_image(image: BytesIO) -> str:
+    mimetype = magic.from_buffer(image.read(2048), mime=True)
+    image.seek(0)
+    if mimetype not in ImageSupportedMimeTypes:
         raise InvalidImageException
 
-    # we don't need to return anything;
-    # the exception will interrupt control
-    # flow if we have a problem. Otherwise,
-    # we just want to continue
+    # the exception will interrupt control flow if we
+    # have a problem. Otherwise, we return the extension
+    # to store the original with.
+    return ImageSupportedMimeTypes[mimetype]
 
 
 """
@@ -375,21 +371,20 @@ def get_image_data_url_legacy(identifier: str, image_type: ImageTypes) -> str:
     if image is None:
         raise InvalidImageException
 
-    pixel_ratio = config.legacy_api_interface.image_pixel_ratio
+    # the bigger pixel ratios might not have been made yet
+    pixel_ratio = stored_pixel_ratio(fs_images, image.sha256sum, image_type,
+                                     config.legacy_api_interface.image_pixel_ratio, ServerSupportedImageFormats.JPG) \
+        or closest_pixel_ratio(image_type, config.legacy_api_interface.image_pixel_ratio)
     send_webp = config.legacy_api_interface.send_webp_images
-    if image_type == ImageTypes.POST.value:
-        # only 1x for posts, since we store them at a very high size already.
-        # no other pixel ratio variants exist!
-        pixel_ratio = 1
 
     ext = "webp" if send_webp else "jpg"
 
     try:
-        file = f"/{image.sha256sum}/{image_type.value}_{pixel_ratio}x.{ext}"
+        file = variant_file_path(image.sha256sum, image_type, pixel_ratio, ServerSupportedImageFormats(ext))
 
         if not fs_images.exists(file) and ext == "webp":
             ext = "jpg"
-            file = f"/{image.sha256sum}/{image_type.value}_{pixel_ratio}x.jpg"
+            file = variant_file_path(image.sha256sum, image_type, pixel_ratio, ServerSupportedImageFormats.JPG)
 
         if not fs_images.exists(file):
             raise InvalidImageException
@@ -404,66 +399,306 @@ def get_image_data_url_legacy(identifier: str, image_type: ImageTypes) -> str:
 
 """
     generate_blur_hash
-    Generate a blur hash from a given image
+    Generate a blur hash from a given image.
+    It's computed from a tiny copy of the image, so pass in the
+    smallest uncropped version of it there is.
 """
 
 
-def generate_blur_hash(image: Image) -> str:
-    im = copy(image)
-    buffer = BytesIO()
-    im.save(buffer, format="jpeg")
-    blur_hash = blurhash.encode(buffer, BLURHASH_X_COMPONENTS, BLURHASH_Y_COMPONENTS)
-    return blur_hash
+def generate_blur_hash(image) -> str:
+    return get_image_backend().blur_hash(image)
+
+
+"""
+    _open_stored_original
+    Opens the stored original of a processed image, for regenerating
+    things from it. Returns None if it's not there.
+"""
+
+
+def _open_stored_original(image_hash: str):
+    path = stored_original_path(image_hash)
+    if path is None:
+        return None
+    # lets libjpeg decode at a fraction of the size, which is all
+    # the blur hash needs. a bit more than it needs, so the downscale
+    # is mostly done in linear light; see encode_image.
+    return get_image_backend().open(
+        fs_images.readbytes(path), [((BLURHASH_SAMPLE_SIZE[0] * 8, BLURHASH_SAMPLE_SIZE[1] * 8), True)]
+    )
+
+
+"""
+    regenerate_blur_hashes
+    Recomputes the blur hash of every processed image, from its stored
+    original, a batch at a time. For backfilling, after the
+    encoder (or BLURHASH_X/Y_COMPONENTS) changes.
+    Returns the number of stored images that were updated.
+"""
+
+
+def regenerate_blur_hashes(batch_size: int = 100) -> int:
+    updated = 0
+    last_hash = ""
+    while True:
+        # duplicate uploads share their files (and blur hash), so
+        # this walks the stored images, rather than the Image entries.
+        with db_session:
+            image_hashes = select(
+                image.sha256sum for image in db.Image
+                if image.processed is True and image.sha256sum > last_hash
+            ).order_by(1)[:batch_size]
+        if len(image_hashes) == 0:
+            return updated
+        last_hash = image_hashes[-1]
+
+        stored = [(h, _open_stored_original(h)) for h in image_hashes]
+        stored = [(h, image) for h, image in stored if image is not None]
+        blur_hashes = {h: generate_blur_hash(image) for h, image in stored}
+
+        if len(blur_hashes) == 0:
+            continue
+        updated_hashes = list(blur_hashes.keys())
+        with db_session:
+            for image in select(image for image in db.Image if image.sha256sum in updated_hashes):
+                image.blur_hash = blur_hashes[image.sha256sum]
+        updated += len(blur_hashes)
+
+
+"""
+    generate_variants
+    Resizes an image to each of the given variants, and saves them to
+    disk, in every format, all at once. If skip_existing is true, files
+    that are already there are left alone. Returns the resized images,
+    as a dict of ImageTypes to a list of (pixel ratio, image).
+"""
+
+
+def generate_variants(image, image_hash: str, variants, skip_existing: bool = False) -> dict:
+    with image_stage_timer("resize"):
+        images = {variant.image_type: resize_to_variant(image, variant) for variant in variants}
+
+    for _ in _save_formats(images, image_hash, skip_existing):
+        pass
+    return images
+
+
+# saves a variant in a format at a time, yielding after each.
+def _save_formats(images: dict, image_hash: str, skip_existing: bool):
+    for image_format in formats_to_generate(get_image_backend()):
+        for image_type, resized_images in images.items():
+            # i.e. save_jpeg, save_webp
+            with hash_lock(image_hash), image_stage_timer(f"save_{IMAGE_ENCODERS[image_format].config_section}"):
+                save_images_to_disk({image_type: resized_images}, image_hash, image_format, skip_existing)
+            yield
+
+
+# the variants, cut down to what generate_urgent_variants makes, for decoding.
+def _urgent_variants(variants) -> list:
+    return [variant._replace(pixel_ratios=variant.pixel_ratios[:1]) for variant in variants]
+
+
+# the smallest image of a variant, as made by generate_urgent_variants,
+# or from its file, if that made it some other time.
+def _urgent_image(images: dict, image_hash: str, variant: ImageVariant):
+    if variant.image_type in images:
+        return images[variant.image_type][0][1]
+    path = variant_file_path(image_hash, variant.image_type, variant.pixel_ratios[0], variant.formats[0])
+    return get_image_backend().open(fs_images.readbytes(path))
+
+
+"""
+    generate_urgent_variants
+    The urgent phase of processing an image (see MediaJobPhases). Resizes
+    it to each of the given variants, at their smallest pixel ratio, and
+    saves them in their first format (jpg, unless the config says
+    otherwise). That's enough for any client to show it. Returns the
+    resized images, like generate_variants.
+"""
+
+
+def generate_urgent_variants(image, image_hash: str, variants) -> dict:
+    with image_stage_timer("resize"):
+        images = {
+            variant.image_type: resize_to_variant(image, variant, variant.pixel_ratios[:1]) for variant in variants
+        }
+
+    for variant in variants:
+        image_format = variant.formats[0]
+        with image_stage_timer(f"save_{IMAGE_ENCODERS[image_format].config_section}"):
+            save_images_to_disk({variant.image_type: images[variant.image_type]}, image_hash, image_format)
+    return images
+
+
+"""
+    deferred_variant_steps
+    The deferred phase of processing an image: everything the urgent phase
+    leaves out, i.e. the bigger pixel ratios, and the other formats. The
+    image is decoded from the stored original again, rather than being kept
+    in memory while this waits. Anything that's already stored is skipped.
+    It's a generator, yielding after each variant is saved in each format,
+    so a MediaJobQueue can put it aside for something more important.
+"""
+
+
+def deferred_variant_steps(image_hash: str, variants):
+    formats = formats_to_generate(get_image_backend())
+    # the pixel ratios that are missing in any format
+    pending = []
+    for variant in variants:
+        pixel_ratios = [
+            pixel_ratio for pixel_ratio in variant.pixel_ratios
+            if any(
+                not fs_images.exists(variant_file_path(image_hash, variant.image_type, pixel_ratio, image_format))
+                for image_format in formats if image_format in variant.formats
+            )
+        ]
+        if len(pixel_ratios) > 0:
+            pending.append((variant, pixel_ratios))
+    if len(pending) == 0:
+        return
+
+    path = stored_original_path(image_hash)
+    if path is None:
+        console.log(f"[bold red]Couldn't generate the rest of image, sha256sum={image_hash}: it has no original!")
+        return
+    with image_stage_timer("decode"):
+        image = convert_buffer_to_image(BytesIO(fs_images.readbytes(path)), [variant for variant, _ in pending])
+    yield
+
+    images = {}
+    for variant, pixel_ratios in pending:
+        with image_stage_timer("resize"):
+            images[variant.image_type] = resize_to_variant(image, variant, pixel_ratios)
+        yield
+    del image
+
+    yield from _save_formats(images, image_hash, skip_existing=True)
 
 
 """
     process_image
     Convert the image into the appropriate format and commit it to the disk.
+    Only the variants needed for the upload's purpose are made. If variants
+    is given, only those are; if blur_hash is, it's used rather than making
+    a new one. The original has already been saved, by handle_upload.
+    This is the urgent phase (see MediaJobPhases); the image is marked as
+    processed, and the deferred phase is queued, in the given lane.
 """
 
 
 @db_session
-def process_image(image: Image, image_hash: str, image_id: int) -> None:
-    console.log(f"Processing image, id={image_id}. sha256sum={image_hash}")
-    # all resized images get 4 different pixel ratios, returned in an array from
-    # 0 to 3, where the pixel ratio is the index + 1. except for posts.
-    # we always deliver them in ''full'' quality (defined by MAX_IMAGE_SIZE_POST)
-    arr_gallery_preview_image = resize_image_aspect_aware(
-        image, MAX_IMAGE_SIZE_GALLERY_PREVIEW
-    )
-
-    # if upload_type == ImageUploadTypes.PROFILE_PICTURE:
-    arr_profilepic = resize_image_aspect_aware(image, MAX_IMAGE_SIZE_PROFILE_PICTURE)
-    arr_profilepic_lg = resize_image_aspect_aware(
-        image, MAX_IMAGE_SIZE_PROFILE_PICTURE_LARGE
-    )
-    img_post = fit_image_to_size(image, MAX_IMAGE_SIZE_POST)
-    arr_post_preview = resize_image_aspect_aware(image, MAX_IMAGE_SIZE_POST_PREVIEW)
-
-    arr_header = resize_image_aspect_aware(image, MAX_IMAGE_SIZE_POST)
-
-    images = {
-        ImageTypes.ORIGINAL: [image],
-        ImageTypes.POST: [img_post],
-        ImageTypes.POST_PREVIEW: arr_post_preview,
-        ImageTypes.HEADER: arr_header,
-        ImageTypes.GALLERY_PREVIEW: arr_gallery_preview_image,
-        ImageTypes.PROFILE_PICTURE: arr_profilepic,
-        ImageTypes.PROFILE_PICTURE_LARGE: arr_profilepic_lg,
-    }
-
-    save_images_to_disk(images, image_hash)
-    if GENERATE_WEBP_IMAGES:
-        console.log(f"Generating WEBP images for image {image_id}...")
-        save_images_to_disk(images, image_hash, use_webp=True)
+def process_image(image, image_hash: str, image_id: int,
+                  purpose: ImageUploadPurposes = ImageUploadPurposes.POST,
+                  variants=None, blur_hash: Optional[str] = None,
+                  lane: MediaJobLanes = MediaJobLanes.BACKLOG, started_at: Optional[float] = None) -> None:
+    console.log(f"Processing image, id={image_id}, purpose={purpose.value}. sha256sum={image_hash}")
+    start_time = perf_counter()
+
+    variants = variants_for_purpose(purpose) if variants is None else variants
+    with hash_lock(image_hash):
+        # another upload of the same file might have made them already
+        images = generate_urgent_variants(image, image_hash, unstored_variants(fs_images, image_hash, variants))
+
+    if blur_hash is None:
+        with image_stage_timer("blurhash"):
+            # made from the purpose's main variant, at its smallest
+            # pixel ratio, which is (much) smaller than the upload.
+            blur_hash = generate_blur_hash(_urgent_image(images, image_hash, variants[0]))
 
     db_image = db.Image.get(id=image_id)
     db_image.processed = True
-    db_image.blur_hash = generate_blur_hash(image)
+    db_image.blur_hash = blur_hash
+
+    # the legacy api lets an image be set as an avatar or header before
+    # it's been processed, so those variants can't be made until now.
+    if purpose != ImageUploadPurposes.AVATAR and len(db_image.associated_profile_pics) > 0:
+        ensure_image_variants(image_hash, ImageUploadPurposes.AVATAR)
+    if purpose != ImageUploadPurposes.HEADER and len(db_image.associated_header_pics) > 0:
+        ensure_image_variants(image_hash, ImageUploadPurposes.HEADER)
 
     commit()
 
-    console.log(f"Image, id={image_id}, processed.")
+    console.log(f"Image, id={image_id}, processed in {perf_counter() - start_time:.2f}s.")
+
+    # clients fall back to the smaller & jpg versions until these are there.
+    media_jobs.submit(lambda: deferred_variant_steps(image_hash, variants), MediaJobPhases.DEFERRED, lane,
+                      started_at)
+
+
+"""
+    ensure_image_variants
+    Makes sure an already processed image has every variant needed to
+    use it for the given purpose (e.g. an image uploaded for a post,
+    being set as a profile picture), generating any that are missing
+    from the stored original. Returns false if they couldn't be made.
+    Like process_image, only the urgent phase is done straight away.
+"""
+
+
+def ensure_image_variants(image_hash: str, purpose: ImageUploadPurposes,
+                          lane: MediaJobLanes = MediaJobLanes.INTERACTIVE) -> bool:
+    with hash_lock(image_hash):
+        missing = missing_variants(fs_images, image_hash, purpose)
+        if len(missing) == 0:
+            return True
+
+        path = stored_original_path(image_hash)
+        if path is None:
+            return False
+        started_at = perf_counter()
+        console.log(f"Generating {', '.join(v.image_type.value for v in missing)} for image, sha256sum={image_hash}")
+        # only decoded at the size the urgent phase needs
+        original = convert_buffer_to_image(BytesIO(fs_images.readbytes(path)), _urgent_variants(missing))
+        generate_urgent_variants(original, image_hash, missing)
+    record_phase_latency(MediaJobPhases.URGENT, lane, started_at)
+    media_jobs.submit(lambda: deferred_variant_steps(image_hash, missing), MediaJobPhases.DEFERRED, lane, started_at)
+    return True
+
+
+"""
+    stored_image_purposes
+    The purposes an image has been stored for, going by which variants
+    it has files for; one counts if its main (first) variant does.
+    Images don't record what they were uploaded for, and the same
+    image can be used for more than one thing.
+"""
+
+
+def stored_image_purposes(image_hash: str) -> List[ImageUploadPurposes]:
+    directory = hash_directory(image_hash)
+    if not fs_images.exists(directory):
+        return []
+    # i.e. prof-pic-l_2x.webp
+    stored_types = {name.split("_")[0] for name in fs_images.listdir(directory)}
+    return [
+        purpose for purpose in ImageUploadPurposes
+        if variants_for_purpose(purpose)[0].image_type.value in stored_types
+    ]
+
+
+"""
+    regenerate_image_variants
+    Makes any of the given variants an already processed image is
+    missing, at any pixel ratio, in any enabled format, from its stored
+    original. For after the variants in the config change. If overwrite
+    is true, every file is made again, i.e. after the quality settings
+    change. Returns false if there's no original to make them from.
+"""
+
+
+def regenerate_image_variants(image_hash: str, variants, overwrite: bool = False) -> bool:
+    path = stored_original_path(image_hash)
+    if path is None:
+        return False
+    if overwrite:
+        with image_stage_timer("decode"):
+            image = convert_buffer_to_image(BytesIO(fs_images.readbytes(path)), variants)
+        generate_variants(image, image_hash, variants)
+    else:
+        for _ in deferred_variant_steps(image_hash, variants):
+            pass
+    return True
 
 
 """
@@ -473,15 +708,23 @@ def process_image(image: Image, image_hash: str, image_id: int) -> None:
     a SimpleNamespace with the following keys:
         - id: db.Image ID
         - uid: Image identifier
+    Raises InvalidImageException if it isn't a supported image, or
+    ImageTooLargeException if it's over the size limits.
+    Processing is queued in the given lane (see MediaJobLanes); by
+    default, interactive for avatars, headers & non-threaded uploads.
 """
 
 
 @db_session
 def handle_upload(
-        image: BytesIO, userid: int, threaded: bool = True
+        image: BytesIO, userid: int, threaded: bool = True,
+        purpose: ImageUploadPurposes = ImageUploadPurposes.POST,
+        lane: Optional[MediaJobLanes] = None
 ) -> SimpleNamespace:
+    started_at = perf_counter()
     # check that the given data is valid.
-    _verify_image(image)
+    with image_stage_timer("verify"):
+        extension = _verify_image(image)
 
     uploader = db.User.get(id=userid)
     if uploader is None:
@@ -492,8 +735,10 @@ def handle_upload(
     # hash exists, since there is no point duplicating them in storage.
 
     # get the hash of the image
-    image_hash = sha256(image.read()).hexdigest()
-    image.seek(0)
+    with image_stage_timer("hash"):
+        data = image.read()
+        image_hash = sha256(data).hexdigest()
+        image.seek(0)
 
     # and try to find an existing Image with the same one.
     # if this != null, we'll use it to fill in some Image entry fields later.
@@ -502,9 +747,27 @@ def handle_upload(
     ).limit(1)[::]
     existing_image = existing_image[0] if len(existing_image) >= 1 else None
 
-    image = convert_buffer_to_image(image)
+    # the files are shared with the existing image, but it might have been
+    # uploaded for something else, so not have everything this one needs.
+    variants = None
+    blur_hash = None
+    if existing_image is not None and existing_image.processed:
+        blur_hash = existing_image.blur_hash
+        variants = missing_variants(fs_images, image_hash, purpose)
+
+    # there's nothing to decode it for, if it's all there already.
+    if variants is None or len(variants) > 0:
+        with image_stage_timer("decode"):
+            image = convert_buffer_to_image(
+                image, _urgent_variants(variants_for_purpose(purpose) if variants is None else variants)
+            )
 
-    image = rotate_image_accounting_for_exif_data(image)
+    # a processed existing image's original is the same file.
+    if variants is None:
+        # another upload of it, that's still being processed, might have.
+        with hash_lock(image_hash), image_stage_timer("save_original"):
+            if stored_original_path(image_hash) is None:
+                save_original_to_disk(data, image_hash, extension)
 
     access_id = create_random_image_identifier()
 
@@ -513,22 +776,30 @@ def handle_upload(
         creation_time=datetime.datetime.utcnow(),
         identifier=access_id,
         uploader=db.User.get(id=userid),
-        blur_hash=PROCESSING_BLURHASH,
+        blur_hash=PROCESSING_BLURHASH if blur_hash is None else blur_hash,
         sha256sum=image_hash,
-        processed=False,
+        processed=variants is not None and len(variants) == 0,
     )
 
     commit()
 
-    if existing_image is not None:
-        entry.blur_hash = existing_image.blur_hash
-        entry.processed = True
+    if entry.processed:
         return SimpleNamespace(id=entry.id, identifier=access_id, processed=True)
 
+    if lane is None:
+        # someone's waiting to see their new avatar or header
+        interactive = not threaded or purpose in (ImageUploadPurposes.AVATAR, ImageUploadPurposes.HEADER)
+        lane = MediaJobLanes.INTERACTIVE if interactive else MediaJobLanes.BACKLOG
+
+    def _process():
+        process_image(image, image_hash, entry.id, purpose, variants=variants, blur_hash=blur_hash,
+                      lane=lane, started_at=started_at)
+
     if threaded:
-        Thread(target=lambda: process_image(image, image_hash, entry.id)).start()
+        media_jobs.submit(_process, MediaJobPhases.URGENT, lane, started_at)
     else:
-        process_image(image, image_hash, entry.id)
+        _process()
+        record_phase_latency(MediaJobPhases.URGENT, lane, started_at)
 
     # if we're not using threading, then it will have been processed by now.
     return SimpleNamespace(id=entry.id, identifier=access_id, processed=(not threaded))
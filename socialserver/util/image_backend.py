@@ -0,0 +1,344 @@
+#  Copyright (c) Niall Asher 2022
+
+from abc import ABC, abstractmethod
+from array import array
+from functools import lru_cache
+from importlib import import_module
+from io import BytesIO
+from math import ceil
+from typing import List, Optional, Tuple
+from socialserver.constants import ServerSupportedImageFormats
+from socialserver.util.blur_hash import blur_hash_sample_size, encode_image, encode_linear_sample
+from socialserver.util.config import config
+from socialserver.util.lazy_import import LazyModule
+from socialserver.util.output import console
+
+# imported on first use; see LazyModule
+Image = LazyModule("PIL.Image")
+ImageOps = LazyModule("PIL.ImageOps")
+pyvips = LazyModule("pyvips")
+
+# the exif orientations that rotate an image by 90 degrees, one way
+# or the other, so swap its width & height.
+TRANSPOSING_ORIENTATIONS = [5, 6, 7, 8]
+EXIF_ORIENTATION_TAG = 0x0112
+
+"""
+    ImageTooLargeException
+
+    Raised when opening an image that's bigger than
+    media.images.max_image_pixels, or max_image_dimension.
+"""
+
+
+class ImageTooLargeException(Exception):
+    pass
+
+
+"""
+    check_image_size
+    Raises ImageTooLargeException if an image of the given size is
+    over the configured limits. It's given the size from the image's
+    header, so nothing has been decoded yet.
+"""
+
+
+def check_image_size(size: Tuple[int, int]) -> None:
+    if max(size) > config.media.images.max_image_dimension:
+        raise ImageTooLargeException
+    if size[0] * size[1] > config.media.images.max_image_pixels:
+        raise ImageTooLargeException
+
+
+"""
+    decode_scale
+    How small an image of the given (displayed, so after its exif
+    orientation) size can be decoded, as a fraction of its size, while
+    still being big enough to make each target from. Targets are
+    (size, crop) pairs; crop ones have to be covered, others fit inside.
+"""
+
+
+def decode_scale(size: Tuple[int, int], targets: List[Tuple[Tuple[int, int], bool]]) -> float:
+    scale = 0
+    for (width, height), crop in targets:
+        scales = (width / size[0], height / size[1])
+        scale = max(scale, max(scales) if crop else min(scales))
+    return min(scale, 1)
+
+
+def _decode_size(size: Tuple[int, int], orientation: int, targets) -> Tuple[int, int]:
+    # the smallest size (as stored, before rotating it) the decoder
+    # can give back, for decode_scale.
+    displayed_size = (size[1], size[0]) if orientation in TRANSPOSING_ORIENTATIONS else size
+    scale = decode_scale(displayed_size, targets)
+    return ceil(size[0] * scale), ceil(size[1] * scale)
+
+"""
+    ImageBackend
+
+    the image library that decodes, resizes & encodes uploads. images
+    are passed around as whatever the backend uses for them (a PIL.Image,
+    or a pyvips.Image), so only the backend that made an image should
+    be given it. every image it opens is 8 bit rgb, rotated to match
+    its exif orientation.
+"""
+
+
+class ImageBackend(ABC):
+    name = None
+
+    # decodes an encoded image, raising ImageTooLargeException (before
+    # decoding it) if it's over the size limits. if targets are given
+    # (see decode_scale), the decoder can make it smaller while loading
+    # it, if it supports doing that, as long as every target can still
+    # be made from it.
+    @abstractmethod
+    def open(self, data: bytes, targets: Optional[List[Tuple[Tuple[int, int], bool]]] = None):
+        pass
+
+    @abstractmethod
+    def size(self, image) -> Tuple[int, int]:
+        pass
+
+    # resizes an image to fit inside the given size, keeping its
+    # aspect ratio. it's never made bigger.
+    @abstractmethod
+    def fit(self, image, size: Tuple[int, int]):
+        pass
+
+    # resizes an image to cover the given size, keeping its aspect
+    # ratio, then crops it to exactly that size, around the centre.
+    @abstractmethod
+    def crop_fit(self, image, size: Tuple[int, int]):
+        pass
+
+    # whether encode can make the given format. jpg & webp always can;
+    # the others need optional libraries.
+    @abstractmethod
+    def supports(self, image_format: ServerSupportedImageFormats) -> bool:
+        pass
+
+    @abstractmethod
+    def encode(self, image, image_format: ServerSupportedImageFormats, quality: int,
+               progressive: bool = False) -> bytes:
+        pass
+
+    @abstractmethod
+    def blur_hash(self, image) -> str:
+        pass
+
+
+@lru_cache(maxsize=None)
+def _module_available(name: str) -> bool:
+    try:
+        import_module(name)
+    except ImportError:
+        return False
+    return True
+
+
+class PillowBackend(ImageBackend):
+    name = "pillow"
+
+    ENCODER_FORMATS = {
+        ServerSupportedImageFormats.JPG: "JPEG",
+        ServerSupportedImageFormats.WEBP: "WEBP",
+        ServerSupportedImageFormats.AVIF: "AVIF",
+        ServerSupportedImageFormats.JXL: "JXL",
+    }
+
+    # pillow plugins that add an encoder for a format, when imported.
+    ENCODER_PLUGINS = {
+        ServerSupportedImageFormats.AVIF: "pillow_avif",
+        ServerSupportedImageFormats.JXL: "pillow_jxl",
+    }
+
+    def open(self, data: bytes, targets: Optional[List[Tuple[Tuple[int, int], bool]]] = None):
+        # pillow has its own decompression bomb check, when opening an
+        # image. it warns past this, and refuses past double it, so it's
+        # kept in line with ours.
+        Image.MAX_IMAGE_PIXELS = config.media.images.max_image_pixels
+        try:
+            image = Image.open(BytesIO(data))
+        except Image.DecompressionBombError:
+            raise ImageTooLargeException
+        check_image_size(image.size)
+        if targets is not None:
+            orientation = image.getexif().get(EXIF_ORIENTATION_TAG, 1)
+            # only does anything for jpegs. libjpeg decodes at 1/2, 1/4
+            # or 1/8 of the size, whichever is smallest, but at least this.
+            image.draft("RGB", _decode_size(image.size, orientation, targets))
+        # this may have issues with png depending on pillow version!
+        # might need to be done manually.
+        return ImageOps.exif_transpose(image.convert("RGB"))
+
+    def size(self, image) -> Tuple[int, int]:
+        return image.size
+
+    def fit(self, image, size: Tuple[int, int]):
+        image = image.copy()
+        image.thumbnail(size, Image.ANTIALIAS)
+        return image
+
+    def crop_fit(self, image, size: Tuple[int, int]):
+        return ImageOps.fit(image, size, Image.BICUBIC, centering=(0.5, 0.5))
+
+    def supports(self, image_format: ServerSupportedImageFormats) -> bool:
+        plugin = self.ENCODER_PLUGINS.get(image_format)
+        return plugin is None or _module_available(plugin)
+
+    def encode(self, image, image_format: ServerSupportedImageFormats, quality: int,
+               progressive: bool = False) -> bytes:
+        plugin = self.ENCODER_PLUGINS.get(image_format)
+        if plugin is not None:
+            # registers the format with pillow
+            import_module(plugin)
+        options = {}
+        if image_format == ServerSupportedImageFormats.AVIF:
+            # pillow-avif-plugin's speed goes the other way, from 0 to 10
+            options["speed"] = 9 - config.media.images.avif.effort
+        buffer = BytesIO()
+        image.save(buffer, format=self.ENCODER_FORMATS[image_format], quality=quality, progressive=progressive,
+                   **options)
+        return buffer.getvalue()
+
+    def blur_hash(self, image) -> str:
+        return encode_image(image)
+
+
+class VipsBackend(ImageBackend):
+    name = "vips"
+
+    # shrink-on-load factors libjpeg supports
+    JPEG_SHRINK_FACTORS = [8, 4, 2]
+
+    def open(self, data: bytes, targets: Optional[List[Tuple[Tuple[int, int], bool]]] = None):
+        # this only reads the header; the pixels aren't decoded until
+        # they're needed.
+        image = pyvips.Image.new_from_buffer(data, "")
+        check_image_size((image.width, image.height))
+        if targets is not None and image.get("vips-loader").startswith("jpegload"):
+            orientation = image.get("orientation") if image.get_typeof("orientation") != 0 else 1
+            decode_size = _decode_size((image.width, image.height), orientation, targets)
+            # picked the same way pillow's draft does, so both backends
+            # decode at the same size.
+            largest_shrink = min(image.width // decode_size[0], image.height // decode_size[1])
+            for shrink in self.JPEG_SHRINK_FACTORS:
+                if shrink <= largest_shrink:
+                    image = pyvips.Image.new_from_buffer(data, "", shrink=shrink)
+                    break
+        image = image.autorot()
+        if image.interpretation != "srgb":
+            image = image.colourspace("srgb")
+        if image.bands > 3:
+            # like pillow's convert("RGB"); the alpha channel is dropped.
+            image = image.extract_band(0, n=3)
+        return image.cast("uchar")
+
+    def size(self, image) -> Tuple[int, int]:
+        return image.width, image.height
+
+    def fit(self, image, size: Tuple[int, int]):
+        return image.thumbnail_image(size[0], height=size[1], size="down")
+
+    def crop_fit(self, image, size: Tuple[int, int]):
+        return image.thumbnail_image(size[0], height=size[1], crop="centre")
+
+    def _save_options(self) -> dict:
+        # vips keeps exif etc. by default, which pillow doesn't. we
+        # don't want to be giving anybody's gps coordinates out.
+        if pyvips.at_least_libvips(8, 15):
+            return {"keep": "none"}
+        return {"strip": True}
+
+    def supports(self, image_format: ServerSupportedImageFormats) -> bool:
+        if image_format == ServerSupportedImageFormats.AVIF:
+            return _vips_can_save("heifsave_buffer", compression="av1")
+        if image_format == ServerSupportedImageFormats.JXL:
+            return _vips_can_save("jxlsave_buffer")
+        return True
+
+    def encode(self, image, image_format: ServerSupportedImageFormats, quality: int,
+               progressive: bool = False) -> bytes:
+        if image_format == ServerSupportedImageFormats.WEBP:
+            return image.webpsave_buffer(Q=quality, **self._save_options())
+        if image_format == ServerSupportedImageFormats.AVIF:
+            return image.heifsave_buffer(Q=quality, compression="av1", effort=config.media.images.avif.effort,
+                                         **self._save_options())
+        if image_format == ServerSupportedImageFormats.JXL:
+            return image.jxlsave_buffer(Q=quality, **self._save_options())
+        return image.jpegsave_buffer(Q=quality, interlace=progressive, **self._save_options())
+
+    def blur_hash(self, image) -> str:
+        # the same as encode_image does with pillow: converted to linear
+        # light (as floats) and shrunk, then given to the encoder.
+        sample_size = blur_hash_sample_size((image.width, image.height))
+        sample = image.colourspace("scrgb").resize(
+            sample_size[0] / image.width, vscale=sample_size[1] / image.height, kernel="linear"
+        )
+        pixels = array("f")
+        pixels.frombytes(sample.write_to_memory())
+        channels = [pixels[channel::3].tolist() for channel in range(0, 3)]
+        return encode_linear_sample(channels, sample.width, sample.height, (image.width, image.height))
+
+
+"""
+    _vips_can_save
+    whether libvips has the given saver, and the library behind it. the
+    heif one can be there without an av1 encoder, so it's tried out on a
+    tiny image, rather than just looked up.
+"""
+
+
+@lru_cache(maxsize=None)
+def _vips_can_save(saver: str, **options) -> bool:
+    try:
+        getattr(pyvips.Image.black(8, 8, bands=3), saver)(**options)
+    except (AttributeError, pyvips.Error):
+        # pyvips doesn't have a method for savers libvips doesn't have
+        return False
+    return True
+
+
+IMAGE_BACKENDS = {
+    "pillow": PillowBackend(),
+    "vips": VipsBackend(),
+}
+
+"""
+    vips_available
+
+    whether pyvips can be used. it needs libvips itself as well,
+    which pip doesn't install, so it can be installed but not work.
+"""
+
+
+@lru_cache(maxsize=1)
+def vips_available() -> bool:
+    try:
+        import pyvips  # noqa: F401
+    except (ImportError, OSError):
+        return False
+    return True
+
+
+_vips_warned = False
+
+"""
+    get_image_backend
+
+    returns the backend set in media.images.backend. if that's vips,
+    but it can't be loaded, pillow is used instead, with a warning.
+"""
+
+
+def get_image_backend() -> ImageBackend:
+    global _vips_warned
+    name = config.media.images.backend
+    if name == "vips" and not vips_available():
+        if not _vips_warned:
+            console.log("[bold red]media.images.backend is vips, but pyvips couldn't be loaded! Using pillow.")
+            _vips_warned = True
+        name = "pillow"
+    return IMAGE_BACKENDS[name]
@@ -0,0 +1,131 @@
+#  Copyright (c) Niall Asher 2022
+
+from collections import namedtuple
+from typing import Callable, List
+from socialserver.constants import ImageTypes, ServerSupportedImageFormats, SERVER_SUPPORTED_IMAGE_FORMATS_MIMETYPES
+from socialserver.util.config import config
+from socialserver.util.output import console
+
+"""
+    ImageEncoder
+
+    How images are stored & served in a format. config_section is its
+    section under media.images (for enabled, quality, post_quality &
+    use_progressive_images). Formats are encoded in the order they're
+    registered, so the slowest go last. When picking a format from an
+    Accept header, the lowest negotiation_priority wins, between formats
+    the client likes as much as each other.
+"""
+
+ImageEncoder = namedtuple("ImageEncoder", ["image_format", "config_section", "negotiation_priority"])
+
+IMAGE_ENCODERS = {}
+
+"""
+    register_image_encoder
+
+    Adds a format to the registry. The image backends need to be
+    able to encode it too; see ImageBackend.supports.
+"""
+
+
+def register_image_encoder(encoder: ImageEncoder) -> None:
+    IMAGE_ENCODERS[encoder.image_format] = encoder
+
+
+register_image_encoder(ImageEncoder(ServerSupportedImageFormats.JPG, "jpeg", negotiation_priority=3))
+register_image_encoder(ImageEncoder(ServerSupportedImageFormats.WEBP, "webp", negotiation_priority=2))
+register_image_encoder(ImageEncoder(ServerSupportedImageFormats.AVIF, "avif", negotiation_priority=0))
+register_image_encoder(ImageEncoder(ServerSupportedImageFormats.JXL, "jxl", negotiation_priority=1))
+
+
+def _encoder_config(image_format: ServerSupportedImageFormats):
+    return getattr(config.media.images, IMAGE_ENCODERS[image_format].config_section)
+
+
+"""
+    image_format_enabled
+
+    Whether a format is turned on in the config. Jpegs are always
+    made, since every client can show them.
+"""
+
+
+def image_format_enabled(image_format: ServerSupportedImageFormats) -> bool:
+    if image_format == ServerSupportedImageFormats.JPG:
+        return True
+    return _encoder_config(image_format).enabled
+
+
+def image_format_quality(image_format: ServerSupportedImageFormats, image_type: ImageTypes) -> int:
+    section = _encoder_config(image_format)
+    return section.post_quality if image_type == ImageTypes.POST else section.quality
+
+
+def image_format_progressive(image_format: ServerSupportedImageFormats) -> bool:
+    return getattr(_encoder_config(image_format), "use_progressive_images", False)
+
+
+def image_format_mimetype(image_format: ServerSupportedImageFormats) -> str:
+    return SERVER_SUPPORTED_IMAGE_FORMATS_MIMETYPES[image_format.value]
+
+
+_unsupported_warned = set()
+
+"""
+    formats_to_generate
+
+    The enabled formats the given image backend can encode, in the
+    order they should be made. Enabled formats that it can't are left
+    out, with a warning the first time.
+"""
+
+
+def formats_to_generate(backend) -> List[ServerSupportedImageFormats]:
+    formats = []
+    for encoder in IMAGE_ENCODERS.values():
+        if not image_format_enabled(encoder.image_format):
+            continue
+        if not backend.supports(encoder.image_format):
+            if encoder.image_format not in _unsupported_warned:
+                console.log(f"[bold red]media.images.{encoder.config_section} is enabled, but the "
+                            f"{backend.name} image backend can't encode it! Skipping it.")
+                _unsupported_warned.add(encoder.image_format)
+            continue
+        formats.append(encoder.image_format)
+    return formats
+
+
+"""
+    negotiate_image_format
+
+    Picks the format to send from an Accept header (as werkzeug's
+    MIMEAccept), out of the ones exists says are stored. Formats other
+    than jpg have to be listed by name; a */* doesn't mean a client
+    can show avif. Falls back to jpg.
+"""
+
+# what clients might call jpegs, and the wildcards that cover them.
+JPEG_ACCEPT_MIMETYPES = ["image/jpeg", "image/jpg", "image/*", "*/*"]
+
+
+def negotiate_image_format(accept_mimetypes,
+                           exists: Callable[[ServerSupportedImageFormats], bool]) -> ServerSupportedImageFormats:
+    accepted = {}
+    for mimetype, quality in accept_mimetypes:
+        accepted[mimetype] = max(quality, accepted.get(mimetype, 0))
+
+    qualities = {}
+    for encoder in IMAGE_ENCODERS.values():
+        if encoder.image_format == ServerSupportedImageFormats.JPG:
+            # no accept header at all means anything goes
+            quality = max(accepted.get(m, 0) for m in JPEG_ACCEPT_MIMETYPES) if len(accepted) > 0 else 1
+        else:
+            quality = accepted.get(image_format_mimetype(encoder.image_format), 0)
+        if quality > 0:
+            qualities[encoder] = quality
+
+    for encoder in sorted(qualities, key=lambda e: (-qualities[e], e.negotiation_priority)):
+        if exists(encoder.image_format):
+            return encoder.image_format
+    return ServerSupportedImageFormats.JPG
@@ -0,0 +1,139 @@
+#  Copyright (c) Niall Asher 2022
+
+from collections import namedtuple
+from typing import List, Optional, Tuple
+from socialserver.constants import ImageTypes, ImageUploadPurposes, ServerSupportedImageFormats
+from socialserver.util.config import config
+from socialserver.util.filesystem import hash_directory
+from socialserver.util.image_formats import image_format_enabled
+
+"""
+    ImageVariant
+
+    One of the sizes an uploaded image is stored in, from
+    media.images.variants in the config. Each pixel ratio is
+    stored as its own file, in each format.
+"""
+
+ImageVariant = namedtuple("ImageVariant", ["image_type", "size", "crop", "pixel_ratios", "formats"])
+
+
+def _load_variants() -> dict:
+    variants = {}
+    for name, variant in config.media.images.variants.items():
+        formats = [ServerSupportedImageFormats(f) for f in variant.formats]
+        formats = [f for f in formats if image_format_enabled(f)]
+        if len(formats) == 0:
+            formats = [ServerSupportedImageFormats.JPG]
+        image_type = ImageTypes(name)
+        variants[image_type] = ImageVariant(
+            image_type=image_type,
+            size=(variant.width, variant.height),
+            crop=variant.crop,
+            pixel_ratios=tuple(variant.pixel_ratios),
+            formats=tuple(formats),
+        )
+    return variants
+
+
+IMAGE_VARIANTS = _load_variants()
+
+IMAGE_PURPOSE_VARIANTS = {
+    ImageUploadPurposes(purpose): tuple(IMAGE_VARIANTS[ImageTypes(name)] for name in variants)
+    for purpose, variants in config.media.images.purposes.items()
+}
+
+
+"""
+    variants_for_purpose
+
+    The variants to generate for an image uploaded for the given purpose.
+    The first is the one its blur hash is made from.
+"""
+
+
+def variants_for_purpose(purpose: ImageUploadPurposes) -> Tuple[ImageVariant, ...]:
+    return IMAGE_PURPOSE_VARIANTS[purpose]
+
+
+"""
+    variant_file_path
+
+    Where a variant is stored, relative to the image storage directory.
+"""
+
+
+def variant_file_path(image_hash: str, image_type: ImageTypes, pixel_ratio: int,
+                      image_format: ServerSupportedImageFormats) -> str:
+    return f"{hash_directory(image_hash)}/{image_type.value}_{pixel_ratio}x.{image_format.value}"
+
+
+"""
+    closest_pixel_ratio
+
+    The pixel ratio to serve for a request wanting the given one: the
+    smallest generated one at least as big, or the biggest there is.
+"""
+
+
+def closest_pixel_ratio(image_type: ImageTypes, wanted_pixel_ratio: int) -> int:
+    variant = IMAGE_VARIANTS.get(image_type)
+    if variant is None:
+        # the original; it's only stored at 1x.
+        return 1
+    for pixel_ratio in variant.pixel_ratios:
+        if pixel_ratio >= wanted_pixel_ratio:
+            return pixel_ratio
+    return variant.pixel_ratios[-1]
+
+
+"""
+    stored_pixel_ratio
+
+    The pixel ratio to serve for a request wanting the given one, out of
+    the ones actually stored in the given format, i.e. going by
+    closest_pixel_ratio, but falling back to a smaller one while the
+    bigger ones are still being generated. None if none are stored.
+"""
+
+
+def stored_pixel_ratio(fs, image_hash: str, image_type: ImageTypes, wanted_pixel_ratio: int,
+                       image_format: ServerSupportedImageFormats) -> Optional[int]:
+    variant = IMAGE_VARIANTS.get(image_type)
+    if variant is None:
+        return None
+    closest = closest_pixel_ratio(image_type, wanted_pixel_ratio)
+    # the closest, then smaller ones, biggest first
+    candidates = [closest] + [r for r in reversed(variant.pixel_ratios) if r < closest]
+    for pixel_ratio in candidates:
+        if fs.exists(variant_file_path(image_hash, image_type, pixel_ratio, image_format)):
+            return pixel_ratio
+    return None
+
+
+"""
+    missing_variants
+
+    The variants of the given purpose that an image can't be shown as
+    yet. Only what the urgent phase of processing makes is checked (each
+    variant's first format, at its smallest pixel ratio); the rest is
+    left to the deferred phase.
+"""
+
+
+def missing_variants(fs, image_hash: str, purpose: ImageUploadPurposes) -> List[ImageVariant]:
+    return unstored_variants(fs, image_hash, variants_for_purpose(purpose))
+
+
+"""
+    unstored_variants
+
+    Like missing_variants, but out of the given variants.
+"""
+
+
+def unstored_variants(fs, image_hash: str, variants) -> List[ImageVariant]:
+    return [
+        variant for variant in variants
+        if not fs.exists(variant_file_path(image_hash, variant.image_type, variant.pixel_ratios[0], variant.formats[0]))
+    ]
@@ -0,0 +1,38 @@
+#  Copyright (c) Niall Asher 2022
+
+from importlib import import_module
+from threading import Lock
+
+"""
+    LazyModule
+
+    stands in for a module, importing it the first time one of its
+    attributes is used. for the heavy libraries (pillow, libmagic,
+    ffmpeg etc.) that only some code paths need, so importing the server,
+    or running a cli command, doesn't pay for them.
+
+        Image = LazyModule("PIL.Image")
+        Image.open(...)  # imported here
+"""
+
+
+class LazyModule:
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        self._lock = Lock()
+
+    def _load(self):
+        if self._module is None:
+            # image processing threads can get here at the same time.
+            with self._lock:
+                if self._module is None:
+                    self._module = import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<LazyModule {self._name} ({state})>"
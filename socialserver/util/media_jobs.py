@@ -0,0 +1,143 @@
+#  Copyright (c) Niall Asher 2022
+
+from collections.abc import Iterator
+from heapq import heappop, heappush
+from itertools import count
+from os import cpu_count
+from threading import Condition, Thread
+from time import perf_counter
+from typing import Callable, Optional
+from socialserver.constants import MediaJobLanes, MediaJobPhases
+from socialserver.util.config import config
+from socialserver.util.metrics import media_job_queue_duration, media_phase_latency
+from socialserver.util.output import console
+
+PHASE_ORDER = list(MediaJobPhases)
+LANE_ORDER = list(MediaJobLanes)
+
+"""
+    record_phase_latency
+
+    Records how long it took, from an image being uploaded (started_at,
+    from perf_counter), for a phase of processing it to be done.
+"""
+
+
+def record_phase_latency(phase: MediaJobPhases, lane: MediaJobLanes, started_at: float) -> None:
+    if config.metrics.enabled:
+        media_phase_latency.observe(perf_counter() - started_at, phase.value, lane.value)
+
+
+class _MediaJob:
+    def __init__(self, function: Callable, phase: MediaJobPhases, lane: MediaJobLanes,
+                 started_at: float, sequence: int):
+        self.function = function
+        self.phase = phase
+        self.lane = lane
+        self.started_at = started_at
+        # lowest first: every urgent job, then every deferred one.
+        # a preempted job keeps its sequence number, so it goes back
+        # in front of anything of the same priority submitted after it.
+        self.priority = (PHASE_ORDER.index(phase), LANE_ORDER.index(lane))
+        self.sequence = sequence
+        self.queued_at = None
+        # the generator, once a job that is one has been started
+        self.steps = None
+
+
+"""
+    MediaJobQueue
+
+    Runs image processing on a fixed number of worker threads, most
+    important job first (see MediaJobPhases & MediaJobLanes), rather than
+    a thread per upload all fighting over the cpu.
+
+    A job can be a generator, yielding between chunks of work (i.e. after
+    each file it saves). If something more important has been submitted
+    by then, it's put back in the queue, and picked up where it left off
+    once that's done. Otherwise, a job has its worker until it returns.
+
+    The workers are started on the first submit, so importing this
+    doesn't start any threads.
+"""
+
+
+class MediaJobQueue:
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._condition = Condition()
+        self._heap = []
+        self._sequence = count()
+        self._threads = []
+        # queued & running
+        self._unfinished = 0
+
+    def submit(self, function: Callable, phase: MediaJobPhases, lane: MediaJobLanes,
+               started_at: Optional[float] = None) -> None:
+        job = _MediaJob(function, phase, lane, started_at or perf_counter(), next(self._sequence))
+        with self._condition:
+            self._unfinished += 1
+            self._push(job)
+            while len(self._threads) < self.workers:
+                thread = Thread(target=self._run_worker, name=f"media_jobs_{len(self._threads)}", daemon=True)
+                self._threads.append(thread)
+                thread.start()
+
+    """
+        wait_until_idle
+
+        Waits for every submitted job to be done. Returns false
+        if that's taken longer than the timeout (in seconds).
+    """
+
+    def wait_until_idle(self, timeout: Optional[float] = None) -> bool:
+        with self._condition:
+            return self._condition.wait_for(lambda: self._unfinished == 0, timeout)
+
+    # call with the condition held
+    def _push(self, job: _MediaJob) -> None:
+        job.queued_at = perf_counter()
+        heappush(self._heap, (job.priority, job.sequence, job))
+        self._condition.notify_all()
+
+    def _more_important_waiting(self, job: _MediaJob) -> bool:
+        with self._condition:
+            return len(self._heap) > 0 and self._heap[0][0] < job.priority
+
+    def _run_worker(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: len(self._heap) > 0)
+                _, _, job = heappop(self._heap)
+            if config.metrics.enabled:
+                media_job_queue_duration.observe(perf_counter() - job.queued_at, job.phase.value, job.lane.value)
+
+            try:
+                finished = self._run(job)
+            except Exception as e:
+                console.log(f"[bold red]Media job ({job.phase.value}, {job.lane.value}) failed: {e}")
+                finished = True
+
+            with self._condition:
+                if finished:
+                    self._unfinished -= 1
+                    self._condition.notify_all()
+                else:
+                    self._push(job)
+
+    # returns false if the job was preempted, and needs putting back.
+    def _run(self, job: _MediaJob) -> bool:
+        if job.steps is None:
+            result = job.function()
+            if not isinstance(result, Iterator):
+                record_phase_latency(job.phase, job.lane, job.started_at)
+                return True
+            job.steps = result
+        for _ in job.steps:
+            if self._more_important_waiting(job):
+                return False
+        record_phase_latency(job.phase, job.lane, job.started_at)
+        return True
+
+
+media_jobs = MediaJobQueue(config.media.processing.workers or cpu_count() or 1)
@@ -0,0 +1,338 @@
+#  Copyright (c) Niall Asher 2022
+
+import cProfile
+import os
+from contextlib import contextmanager
+from random import random
+from threading import Lock, local
+from time import perf_counter, strftime
+from flask import request
+from socialserver.util.config import config, FILE_ROOT
+from socialserver.util.output import console
+
+# in seconds, roughly following the prometheus client defaults.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+# media jobs can wait behind a lot of others, so these go up to minutes.
+MEDIA_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+"""
+    Counter, Histogram
+
+    Just enough of the prometheus data model to expose what we collect,
+    without pulling in prometheus_client. Each series is keyed by a tuple
+    of label values, in the order of label_names.
+
+    These are per process; with more than one worker, each one reports
+    its own numbers, depending on which one answers the scrape.
+"""
+
+
+def _format_labels(label_names, label_values, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, label_names: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._lock = Lock()
+        self._values = {}
+
+    def inc(self, *label_values, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def get(self, *label_values) -> float:
+        return self._values.get(label_values, 0)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, label_values)} {value}")
+        return lines
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values = {}
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, label_names: tuple = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        self._lock = Lock()
+        # label values -> [count per bucket..., sum, count]
+        self._values = {}
+
+    def observe(self, value: float, *label_values) -> None:
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                series = self._values[label_values] = [0] * (len(self.buckets) + 2)
+            # buckets are only counted once here, and made
+            # cumulative when they're rendered.
+            for i, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, *label_values) -> int:
+        series = self._values.get(label_values)
+        return series[-1] if series is not None else 0
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, series in sorted(self._values.items()):
+                cumulative = 0
+                for upper_bound, bucket_count in zip(self.buckets, series):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.label_names, label_values, f'le="{upper_bound}"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.label_names, label_values, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+                labels = _format_labels(self.label_names, label_values)
+                lines.append(f"{self.name}_sum{labels} {series[-2]}")
+                lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values = {}
+
+
+request_duration = Histogram(
+    "socialserver_request_duration_seconds",
+    "Time taken to handle a request.",
+    ("endpoint", "method", "status"),
+)
+request_db_queries = Histogram(
+    "socialserver_request_db_queries",
+    "Database queries made while handling a request.",
+    ("endpoint", "method"),
+    buckets=QUERY_COUNT_BUCKETS,
+)
+request_db_duration = Histogram(
+    "socialserver_request_db_duration_seconds",
+    "Time spent in database queries while handling a request.",
+    ("endpoint", "method"),
+)
+db_queries = Counter(
+    "socialserver_db_queries_total",
+    "Database queries made, including by background threads.",
+)
+db_query_duration = Counter(
+    "socialserver_db_query_duration_seconds_total",
+    "Time spent in database queries, including by background threads.",
+)
+slow_queries = Counter(
+    "socialserver_db_slow_queries_total",
+    "Database queries slower than metrics.slow_query_threshold_ms.",
+)
+image_stage_duration = Histogram(
+    "socialserver_image_stage_duration_seconds",
+    "Time taken by each stage of uploading and processing an image.",
+    ("stage",),
+)
+media_job_queue_duration = Histogram(
+    "socialserver_media_job_queue_seconds",
+    "Time media jobs waited for a worker, including after being preempted.",
+    ("phase", "lane"),
+    buckets=MEDIA_LATENCY_BUCKETS,
+)
+media_phase_latency = Histogram(
+    "socialserver_media_phase_latency_seconds",
+    "Time from an image being uploaded, to each phase of processing it being done.",
+    ("phase", "lane"),
+    buckets=MEDIA_LATENCY_BUCKETS,
+)
+profiles_written = Counter(
+    "socialserver_profiles_written_total",
+    "Slow request profiles written to metrics.profiling.output_dir.",
+)
+
+ALL_METRICS = [
+    request_duration,
+    request_db_queries,
+    request_db_duration,
+    db_queries,
+    db_query_duration,
+    slow_queries,
+    image_stage_duration,
+    media_job_queue_duration,
+    media_phase_latency,
+    profiles_written,
+]
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in ALL_METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def reset_metrics() -> None:
+    for metric in ALL_METRICS:
+        metric.reset()
+
+
+# what's known about the request being handled on this thread.
+# database queries are only added to it between start_request_metrics
+# and record_request_metrics; background threads never have one.
+_request_state = local()
+
+# cProfile can't profile two things on the same thread at once, and
+# running it on several requests at once would skew all of them anyway.
+_profile_lock = Lock()
+
+"""
+    instrument_database
+
+    wraps a pony database's provider, so every query it runs is counted
+    and timed, and slow queries are logged. this is pony's lowest level
+    hook; everything it runs (including raw sql) goes through execute.
+"""
+
+
+def instrument_database(db_object) -> None:
+    provider = db_object.provider
+    original_execute = provider.execute
+
+    def execute(cursor, sql, arguments=None, returning_id=False):
+        start_time = perf_counter()
+        try:
+            return original_execute(cursor, sql, arguments, returning_id)
+        finally:
+            _record_query(sql, perf_counter() - start_time)
+
+    provider.execute = execute
+
+
+def _record_query(sql: str, duration: float) -> None:
+    if not config.metrics.enabled:
+        return
+    db_queries.inc()
+    db_query_duration.inc(amount=duration)
+
+    if getattr(_request_state, "active", False):
+        _request_state.queries += 1
+        _request_state.query_seconds += duration
+
+    threshold_ms = config.metrics.slow_query_threshold_ms
+    if threshold_ms and duration * 1000 >= threshold_ms:
+        slow_queries.inc()
+        # collapse whitespace, so it fits on a line.
+        console.log(f"[bold yellow]Slow query ({duration * 1000:.1f}ms): {' '.join(sql.split())[:500]}")
+
+
+"""
+    image_stage_timer
+
+    context manager timing a stage of the image pipeline,
+    i.e. with image_stage_timer("resize"): ...
+"""
+
+
+@contextmanager
+def image_stage_timer(stage: str):
+    start_time = perf_counter()
+    try:
+        yield
+    finally:
+        if config.metrics.enabled:
+            image_stage_duration.observe(perf_counter() - start_time, stage)
+
+
+"""
+    start_request_metrics
+
+    before_request hook. starts timing the request, and counting its
+    queries. a sample of requests are also run under cProfile, if
+    metrics.profiling.sample_rate is set.
+"""
+
+
+def start_request_metrics() -> None:
+    _request_state.active = False
+    _request_state.profiler = None
+    _request_state.duration = None
+    if not config.metrics.enabled:
+        return
+    _request_state.active = True
+    _request_state.queries = 0
+    _request_state.query_seconds = 0.0
+    _request_state.start_time = perf_counter()
+
+    sample_rate = config.metrics.profiling.sample_rate
+    if sample_rate > 0 and random() < sample_rate and _profile_lock.acquire(blocking=False):
+        profiler = cProfile.Profile()
+        _request_state.profiler = profiler
+        profiler.enable()
+
+
+"""
+    record_request_metrics
+
+    after_request hook, recording the request's latency and queries.
+"""
+
+
+def record_request_metrics(response):
+    if not getattr(_request_state, "active", False):
+        return response
+    _request_state.active = False
+    duration = perf_counter() - _request_state.start_time
+    _request_state.duration = duration
+
+    endpoint = request.endpoint or "none"
+    method = request.method
+    request_duration.observe(duration, endpoint, method, str(response.status_code))
+    request_db_queries.observe(_request_state.queries, endpoint, method)
+    request_db_duration.observe(_request_state.query_seconds, endpoint, method)
+    return response
+
+
+"""
+    finish_request_profile
+
+    teardown_request hook, so the profiler's always stopped (and the lock
+    released), even if the request failed before after_request ran.
+    the profile is only written out if the request was slow.
+"""
+
+
+def finish_request_profile(_exception=None) -> None:
+    profiler = getattr(_request_state, "profiler", None)
+    if profiler is None:
+        return
+    _request_state.profiler = None
+    try:
+        profiler.disable()
+        duration = _request_state.duration
+        if duration is None:
+            duration = perf_counter() - _request_state.start_time
+        if duration * 1000 >= config.metrics.profiling.slow_request_threshold_ms:
+            _write_profile(profiler, duration)
+    finally:
+        _profile_lock.release()
+
+
+def _write_profile(profiler: cProfile.Profile, duration: float) -> None:
+    output_dir = config.metrics.profiling.output_dir or f"{FILE_ROOT}/profiles"
+    os.makedirs(output_dir, exist_ok=True)
+    endpoint = request.endpoint or "none"
+    filename = f"{output_dir}/{strftime('%Y%m%d-%H%M%S')}_{endpoint}_{request.method}_{round(duration * 1000)}ms.prof"
+    profiler.dump_stats(filename)
+    profiles_written.inc()
+    console.log(f"[bold yellow]Slow request ({duration * 1000:.0f}ms), profile saved to {filename}")
@@ -1,8 +1,9 @@
 #  Copyright (c) Niall Asher 2022
 
 from socialserver.util.output import console
-from socialserver.constants import UNPROCESSED_POST_CHECK_INTERVAL
+from socialserver.constants import UNPROCESSED_POST_CHECK_INTERVAL, ImageUploadPurposes
 from socialserver.db import db
+from socialserver.util.image import ensure_image_variants
 from pony.orm import select, db_session, commit
 from threading import Thread
 from time import sleep
@@ -20,6 +21,11 @@ def _check_unprocessed_posts():
             if image.processed is False:
                 ok_to_mark_processed = False
         if ok_to_mark_processed:
+            # images can be attached while they're being processed for
+            # something else, so they might not have post sized copies.
+            for media_entry in post_images:
+                image = db.Image.get(identifier=media_entry["identifier"])
+                ensure_image_variants(image.sha256sum, ImageUploadPurposes.POST)
             post.processed = True
     commit()
 
@@ -0,0 +1,316 @@
+#  Copyright (c) Niall Asher 2022
+
+import mmap
+import os
+from hashlib import blake2b
+from math import ceil
+from struct import Struct
+from threading import Lock
+from time import time
+from types import SimpleNamespace
+from typing import Optional
+from flask import request, g, abort, make_response, jsonify
+from socialserver.constants import (
+    ErrorCodes,
+    RateLimitClasses,
+    RATE_LIMIT_TABLE_GROUPS,
+    RATE_LIMIT_SLOTS_PER_GROUP,
+)
+from socialserver.util.config import config, FILE_ROOT
+
+try:
+    import fcntl
+except ImportError:
+    # windows; the limits are only shared between threads there.
+    fcntl = None
+
+# each slot is (key hash, tokens, last update time).
+# a key hash of 0 means the slot's empty.
+_SLOT = Struct("<Qdd")
+_GROUP = Struct("<" + "Qdd" * RATE_LIMIT_SLOTS_PER_GROUP)
+
+# every bucket holds a minutes worth of tokens, so one that
+# hasn't been touched for this long is full, the same as an empty one.
+_BUCKET_REFILL_SECONDS = 60
+
+"""
+    SharedRateLimiter
+
+    Token buckets kept in a memory mapped file, so every worker process
+    on the machine (i.e. under gunicorn) shares the same limits, without
+    needing redis or anything else running alongside the server.
+
+    The file's a fixed size hash table, split into groups of slots. A key
+    always goes in the same group, which is locked (with an fcntl record
+    lock, plus a thread lock for this process) while its bucket is updated.
+    If a group's full, the bucket that was used longest ago is recycled;
+    the worst that can do is hand a busy key a fresh bucket.
+
+    Without fcntl, the table's kept in this process's memory instead,
+    and only the thread lock is used, so each process has its own limits.
+"""
+
+
+class SharedRateLimiter:
+    def __init__(self, filename: str, groups: int = RATE_LIMIT_TABLE_GROUPS):
+        self.filename = filename
+        self.groups = groups
+        self._thread_lock = Lock()
+
+        size = groups * _GROUP.size
+        if fcntl is None:
+            self._fd = None
+            self._map = mmap.mmap(-1, size)
+            return
+        self._fd = os.open(filename, os.O_RDWR | os.O_CREAT, 0o600)
+        # whichever process gets here first sizes the file; the rest
+        # wait on the lock, and then just map what's there.
+        fcntl.lockf(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size != size:
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, size)
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN)
+        self._map = mmap.mmap(self._fd, size)
+
+    """
+        take
+
+        takes a token from the bucket for the given key, which holds
+        limit_per_minute tokens and refills at the same rate.
+        returns whether the request's allowed, how many tokens are left,
+        the number of seconds until the bucket is full again, and until
+        the next token if there isn't one.
+    """
+
+    def take(self, key: str, limit_per_minute: int) -> SimpleNamespace(
+        allowed=bool, remaining=int, reset=int, retry_after=int, limit=int
+    ):
+        key_hash = int.from_bytes(blake2b(key.encode(), digest_size=8).digest(), "little") or 1
+        offset = (key_hash % self.groups) * _GROUP.size
+        refill_rate = limit_per_minute / 60
+        now = time()
+
+        with self._thread_lock:
+            self._lock_file(_GROUP.size, offset)
+            try:
+                slots = _GROUP.unpack_from(self._map, offset)
+                slot_index = None
+                free_index = None
+                oldest_index = 0
+                for i in range(RATE_LIMIT_SLOTS_PER_GROUP):
+                    slot_key, updated = slots[i * 3], slots[i * 3 + 2]
+                    if slot_key == key_hash:
+                        slot_index = i
+                        break
+                    if free_index is None and (slot_key == 0 or now - updated >= _BUCKET_REFILL_SECONDS):
+                        free_index = i
+                    if updated < slots[oldest_index * 3 + 2]:
+                        oldest_index = i
+
+                if slot_index is None:
+                    slot_index = free_index if free_index is not None else oldest_index
+                    tokens = float(limit_per_minute)
+                else:
+                    tokens = min(
+                        float(limit_per_minute),
+                        slots[slot_index * 3 + 1] + (now - slots[slot_index * 3 + 2]) * refill_rate,
+                    )
+
+                allowed = tokens >= 1
+                if allowed:
+                    tokens -= 1
+                _SLOT.pack_into(self._map, offset + slot_index * _SLOT.size, key_hash, tokens, now)
+            finally:
+                self._unlock_file(_GROUP.size, offset)
+
+        return SimpleNamespace(
+            allowed=allowed,
+            remaining=int(tokens),
+            reset=ceil((limit_per_minute - tokens) / refill_rate),
+            retry_after=0 if tokens >= 1 else ceil((1 - tokens) / refill_rate),
+            limit=limit_per_minute,
+        )
+
+    def reset(self) -> None:
+        with self._thread_lock:
+            self._lock_file()
+            try:
+                self._map[:] = bytes(len(self._map))
+            finally:
+                self._unlock_file()
+
+    # the whole file if length is 0. the thread lock has to be held too.
+    def _lock_file(self, length: int = 0, offset: int = 0) -> None:
+        if self._fd is not None:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, length, offset)
+
+    def _unlock_file(self, length: int = 0, offset: int = 0) -> None:
+        if self._fd is not None:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, length, offset)
+
+
+"""
+    LazySharedRateLimiter
+
+    A SharedRateLimiter that isn't opened until it's first used, so just
+    importing this module (i.e. for the cli) doesn't create, or resize,
+    the file.
+"""
+
+
+class LazySharedRateLimiter:
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._limiter = None
+        self._lock = Lock()
+
+    def _open(self) -> SharedRateLimiter:
+        if self._limiter is None:
+            with self._lock:
+                if self._limiter is None:
+                    self._limiter = SharedRateLimiter(self.filename)
+        return self._limiter
+
+    def take(self, key: str, limit_per_minute: int):
+        return self._open().take(key, limit_per_minute)
+
+    def reset(self) -> None:
+        self._open().reset()
+
+
+rate_limiter = LazySharedRateLimiter(
+    config.rate_limit.storage_file or f"{FILE_ROOT}/rate_limit.bin"
+)
+
+# routes that don't just go by their http method. endpoints are the
+# lowercased resource names, which is what flask-restful uses by default.
+_ROUTE_CLASS_OVERRIDES = {
+    "user": {"POST": RateLimitClasses.LOGIN, "DELETE": RateLimitClasses.LOGIN},
+    "usersession": {"POST": RateLimitClasses.LOGIN},
+    "userpasswordchange": {"PATCH": RateLimitClasses.LOGIN},
+    "userapikey": {"POST": RateLimitClasses.LOGIN},
+    "twofactorauthenticationverification": {"POST": RateLimitClasses.LOGIN},
+    "newimage": {"POST": RateLimitClasses.UPLOAD},
+    "newimageprocessbeforereturn": {"POST": RateLimitClasses.UPLOAD},
+    "newvideo": {"POST": RateLimitClasses.UPLOAD},
+    "legacyuser": {"POST": RateLimitClasses.LOGIN},
+    "legacyauthentication": {"POST": RateLimitClasses.LOGIN},
+    "legacyimage": {"POST": RateLimitClasses.UPLOAD},
+}
+
+
+def get_route_class(endpoint: str, method: str) -> RateLimitClasses:
+    override = _ROUTE_CLASS_OVERRIDES.get(endpoint, {}).get(method)
+    if override is not None:
+        return override
+    if method in ["GET", "HEAD", "OPTIONS"]:
+        return RateLimitClasses.READ
+    return RateLimitClasses.WRITE
+
+
+"""
+    _RequestRateLimitState
+
+    what the rate limiter knows about the current request. kept in
+    flask.g as a single object, since every lookup through g (or request)
+    goes through werkzeug's context locals, which adds up at this scale.
+"""
+
+
+class _RequestRateLimitState:
+    def __init__(self, route_class: Optional[RateLimitClasses]):
+        self.route_class = route_class
+        # the most restrictive result so far, for the RateLimit-* headers.
+        self.result = None
+
+    def take_or_abort(self, key: str, limit_per_minute: int) -> None:
+        result = rate_limiter.take(key, limit_per_minute)
+        if self.result is None or result.remaining < self.result.remaining or not result.allowed:
+            self.result = result
+        if not result.allowed:
+            abort(make_response(jsonify(error=ErrorCodes.RATE_LIMITED.value), 429))
+
+
+"""
+    check_ip_rate_limit
+
+    before_request hook, limiting each ip address per route class.
+    the route class is kept around for check_user_rate_limit, since the
+    user isn't known until the request's been authenticated.
+"""
+
+
+def check_ip_rate_limit() -> None:
+    if not config.rate_limit.enabled:
+        return
+    current_request = request._get_current_object()
+    if current_request.endpoint is None:
+        return
+    # imported here, since auth depends on this module.
+    from socialserver.util.auth import get_ip_from_request
+
+    route_class = get_route_class(current_request.endpoint, current_request.method)
+    state = _RequestRateLimitState(route_class)
+    g.rate_limit = state
+    limits = getattr(config.rate_limit, route_class.value)
+    state.take_or_abort(
+        f"ip:{route_class.value}:{get_ip_from_request(current_request)}", limits.per_ip_per_minute
+    )
+
+
+"""
+    check_user_rate_limit
+
+    limits the signed in user for the current route class.
+    called by auth_reqd and admin_reqd, once they know who the user is.
+"""
+
+
+def check_user_rate_limit(user_id: int) -> None:
+    state = g.get("rate_limit")
+    if state is None:
+        return
+    limits = getattr(config.rate_limit, state.route_class.value)
+    state.take_or_abort(f"user:{state.route_class.value}:{user_id}", limits.per_user_per_minute)
+
+
+"""
+    check_api_key_rate_limit
+
+    limits a single api key, separately from its owner. this one
+    applies even if the rest of the rate limiting is disabled.
+"""
+
+
+def check_api_key_rate_limit(key_id: int) -> None:
+    state = g.get("rate_limit")
+    if state is None:
+        state = _RequestRateLimitState(None)
+        g.rate_limit = state
+    state.take_or_abort(f"api_key:{key_id}", config.auth.api_keys.rate_limit_per_minute)
+
+
+"""
+    add_rate_limit_headers
+
+    after_request hook, adding the RateLimit-* headers from the
+    IETF draft (and Retry-After, when the request was limited).
+"""
+
+
+def add_rate_limit_headers(response):
+    state = g.get("rate_limit")
+    if state is None or state.result is None:
+        return response
+    result = state.result
+    headers = response.headers
+    # add, rather than set, since nothing else sets these, and
+    # set has to scan the existing headers for the name first.
+    headers.add("RateLimit-Limit", str(result.limit))
+    headers.add("RateLimit-Remaining", str(result.remaining))
+    headers.add("RateLimit-Reset", str(result.reset))
+    if not result.allowed:
+        headers.add("Retry-After", str(result.retry_after))
+    return response
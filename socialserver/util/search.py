@@ -0,0 +1,187 @@
+#  Copyright (c) Niall Asher 2022
+
+import re
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from typing import List, Tuple, Optional
+from socialserver.db import db
+from socialserver.constants import MAX_SEARCH_TERMS
+
+# queries are split into plain words before being handed to the database,
+# so users can't inject fts5/tsquery syntax (or just break it with a stray quote).
+_search_term_regex = re.compile(r"\w+")
+
+"""
+    InvalidSearchQueryException
+
+    Raised if a search query doesn't contain anything searchable.
+"""
+
+
+class InvalidSearchQueryException(Exception):
+    pass
+
+
+"""
+    InvalidSearchCursorException
+
+    Raised if a search cursor given by a client can't be decoded.
+"""
+
+
+class InvalidSearchCursorException(Exception):
+    pass
+
+
+"""
+    encode_search_cursor
+
+    creates an opaque cursor pointing at a search result, so the next
+    page can pick up after it. results are ordered by score, then id.
+"""
+
+
+def encode_search_cursor(score: float, entry_id: int) -> str:
+    return urlsafe_b64encode(f"{score!r}|{entry_id}".encode()).decode()
+
+
+"""
+    decode_search_cursor
+
+    reverses encode_search_cursor. raises InvalidSearchCursorException
+    if the cursor is malformed.
+"""
+
+
+def decode_search_cursor(cursor: str) -> Tuple[float, int]:
+    try:
+        score, entry_id = urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return float(score), int(entry_id)
+    except (BinasciiError, UnicodeDecodeError, ValueError):
+        raise InvalidSearchCursorException
+
+
+def _get_search_terms(query: str) -> List[str]:
+    terms = _search_term_regex.findall(query.lower())[0:MAX_SEARCH_TERMS]
+    if len(terms) == 0:
+        raise InvalidSearchQueryException
+    return terms
+
+
+def _build_match_query(terms: List[str], prefix: bool) -> str:
+    if db.provider_name == "postgres":
+        return " & ".join(f"{t}:*" if prefix else t for t in terms)
+    # fts5. every term is quoted, so it's always treated as a plain string.
+    return " ".join(f'"{t}"*' if prefix else f'"{t}"' for t in terms)
+
+
+def _cursor_clause(score_expression: str, id_column: str, cursor) -> str:
+    if cursor is None:
+        return ""
+    # comparing the score for equality is safe, since it's recomputed
+    # the same way, bit for bit, as long as the index hasn't changed,
+    # and the cursor keeps it exactly (repr round trips a float).
+    # anything scoring the same is then ordered by id.
+    return f"""AND ({score_expression} < $cursor_score
+                OR ({score_expression} = $cursor_score AND {id_column} < $cursor_id))"""
+
+
+"""
+    search_posts
+
+    full-text search over post text. returns a list of (post id, score),
+    best match first, leaving out posts from users the requesting user has
+    blocked, and posts that are under moderation or still processing.
+    cursor is a (score, id) tuple from a previous result.
+    NOTE: scores depend on everything in the index, so if posts are made,
+    edited or removed between pages, every score can shift, and results
+    around the cursor can be skipped or repeated. there's no stable key
+    to page by that would keep the best matches first.
+"""
+
+
+def search_posts(query: str, requesting_user_id: int, count: int,
+                 cursor: Optional[Tuple[float, int]] = None) -> List[Tuple[int, float]]:
+    match_query = _build_match_query(_get_search_terms(query), prefix=False)
+
+    quote_name = db.provider.quote_name
+    post_table = quote_name(db.Post._table_)
+    block_table = quote_name(db.Block._table_)
+
+    params = {
+        "match_query": match_query,
+        "user_id": requesting_user_id,
+        "count": count,
+        "yes": True,
+        "no": False,
+        "cursor_score": cursor[0] if cursor is not None else None,
+        "cursor_id": cursor[1] if cursor is not None else None,
+    }
+
+    if db.provider_name == "postgres":
+        score = "ts_rank(to_tsvector('simple', p.\"text\"), to_tsquery('simple', $match_query))::float8"
+        return db.select(f"""SELECT p."id", {score} FROM {post_table} p
+            WHERE to_tsvector('simple', p."text") @@ to_tsquery('simple', $match_query)
+            AND p."under_moderation" = $no AND p."processed" = $yes
+            AND p."user" NOT IN (SELECT b."blocking" FROM {block_table} b WHERE b."user" = $user_id)
+            {_cursor_clause(score, 'p."id"', cursor)}
+            ORDER BY 2 DESC, 1 DESC LIMIT $count""", params)
+
+    # bm25 is lower for better matches, so it's flipped to line up with postgres.
+    score = "-bm25(post_search)"
+    return db.select(f"""SELECT p."id", {score} FROM post_search
+        JOIN {post_table} p ON p."id" = post_search.rowid
+        WHERE post_search MATCH $match_query
+        AND p."under_moderation" = $no AND p."processed" = $yes
+        AND p."user" NOT IN (SELECT b."blocking" FROM {block_table} b WHERE b."user" = $user_id)
+        {_cursor_clause(score, 'p."id"', cursor)}
+        ORDER BY 2 DESC, 1 DESC LIMIT $count""", params)
+
+
+"""
+    search_users
+
+    prefix search over usernames and display names, so partially typed
+    names still match. returns a list of (user id, score), best match first,
+    leaving out unapproved accounts and users the requesting user has blocked.
+    paged the same way as search_posts, with the same caveat.
+"""
+
+
+def search_users(query: str, requesting_user_id: int, count: int,
+                 cursor: Optional[Tuple[float, int]] = None) -> List[Tuple[int, float]]:
+    match_query = _build_match_query(_get_search_terms(query), prefix=True)
+
+    quote_name = db.provider.quote_name
+    user_table = quote_name(db.User._table_)
+    block_table = quote_name(db.Block._table_)
+
+    params = {
+        "match_query": match_query,
+        "user_id": requesting_user_id,
+        "count": count,
+        "yes": True,
+        "cursor_score": cursor[0] if cursor is not None else None,
+        "cursor_id": cursor[1] if cursor is not None else None,
+    }
+
+    if db.provider_name == "postgres":
+        vector = "to_tsvector('simple', u.\"username\" || ' ' || u.\"display_name\")"
+        score = f"ts_rank({vector}, to_tsquery('simple', $match_query))::float8"
+        return db.select(f"""SELECT u."id", {score} FROM {user_table} u
+            WHERE {vector} @@ to_tsquery('simple', $match_query)
+            AND u."account_approved" = $yes
+            AND u."id" NOT IN (SELECT b."blocking" FROM {block_table} b WHERE b."user" = $user_id)
+            {_cursor_clause(score, 'u."id"', cursor)}
+            ORDER BY 2 DESC, 1 DESC LIMIT $count""", params)
+
+    # usernames count for more than display names, so an exact
+    # username match comes out on top.
+    score = "-bm25(user_search, 2.0, 1.0)"
+    return db.select(f"""SELECT u."id", {score} FROM user_search
+        JOIN {user_table} u ON u."id" = user_search.rowid
+        WHERE user_search MATCH $match_query
+        AND u."account_approved" = $yes
+        AND u."id" NOT IN (SELECT b."blocking" FROM {block_table} b WHERE b."user" = $user_id)
+        {_cursor_clause(score, 'u."id"', cursor)}
+        ORDER BY 2 DESC, 1 DESC LIMIT $count""", params)
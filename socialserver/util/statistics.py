@@ -0,0 +1,283 @@
+#  Copyright (c) Niall Asher 2022
+
+from collections import namedtuple
+from datetime import datetime
+from threading import Lock
+from time import monotonic
+from pony import orm
+from socialserver.constants import AccountAttributes, STATISTICS_CACHE_SECONDS
+
+"""
+    Statistics counters
+
+    Running totals for the statistics that would otherwise mean counting
+    (or worse, scanning and parsing) the biggest tables. They're kept in
+    the StatisticsCounter table by triggers, so anything that changes the
+    rows (the api, the cli, cascading deletes, bulk inserts with raw sql)
+    keeps them right, with no application code involved.
+
+    A counter counts the rows of a table matching a condition, or all of
+    them if it doesn't have one. columns lists what the condition depends
+    on, so updates to anything else don't fire the trigger.
+"""
+
+_Counter = namedtuple("_Counter", ["name", "entity", "condition", "columns"])
+
+
+def _attribute_condition(attribute: AccountAttributes):
+    def condition(db_object, row):
+        return db_object.User.attribute_condition_sql(attribute, row)
+
+    return condition
+
+
+def _column_condition(column_name: str, negate: bool = False):
+    def condition(db_object, row):
+        return f"{'NOT ' if negate else ''}{row}.{db_object.provider.quote_name(column_name)}"
+
+    return condition
+
+
+STATISTICS_COUNTERS = [
+    _Counter("users", "User", None, ()),
+    _Counter("unapproved_users", "User", _column_condition("account_approved", negate=True), ("account_approved",)),
+    _Counter("admins", "User", _attribute_condition(AccountAttributes.ADMIN), ("attribute_flags",)),
+    _Counter("moderators", "User", _attribute_condition(AccountAttributes.MODERATOR), ("attribute_flags",)),
+    _Counter("verified_users", "User", _attribute_condition(AccountAttributes.VERIFIED), ("attribute_flags",)),
+    _Counter("sessions", "UserSession", None, ()),
+    _Counter("blocks", "Block", None, ()),
+    _Counter("posts", "Post", None, ()),
+    _Counter("posts_under_moderation", "Post", _column_condition("under_moderation"), ("under_moderation",)),
+    _Counter("comments", "Comment", None, ()),
+]
+
+
+def _counter_amount(db_object, counter: _Counter, row: str) -> str:
+    if counter.condition is None:
+        return "1"
+    return f"(CASE WHEN {counter.condition(db_object, row)} THEN 1 ELSE 0 END)"
+
+
+def _counter_update(db_object, counters: list, new_row: str or None, old_row: str or None) -> str:
+    # a single statement for all of a table's counters, so a write
+    # only costs one extra update, however many counters there are.
+    quote_name = db_object.provider.quote_name
+    value = quote_name("value")
+    name = quote_name("name")
+    cases = []
+    for counter in counters:
+        amount = []
+        if new_row is not None:
+            amount.append(f"+ {_counter_amount(db_object, counter, new_row)}")
+        if old_row is not None:
+            amount.append(f"- {_counter_amount(db_object, counter, old_row)}")
+        cases.append(f"WHEN '{counter.name}' THEN {value} {' '.join(amount)}")
+    names = ", ".join(f"'{counter.name}'" for counter in counters)
+    return (
+        f"UPDATE {quote_name(db_object.StatisticsCounter._table_)} "
+        f"SET {value} = CASE {name} {' '.join(cases)} END WHERE {name} IN ({names})"
+    )
+
+
+def _counters_by_table() -> dict:
+    tables = {}
+    for counter in STATISTICS_COUNTERS:
+        tables.setdefault(counter.entity, []).append(counter)
+    return tables
+
+
+def _create_sqlite_triggers(db_object, rebuild: bool) -> None:
+    quote_name = db_object.provider.quote_name
+    for entity_name, counters in _counters_by_table().items():
+        table = quote_name(getattr(db_object, entity_name)._table_)
+        trigger_prefix = f"statistics_{entity_name.lower()}"
+        if rebuild:
+            for event in ["insert", "delete", "update"]:
+                db_object.execute(f"DROP TRIGGER IF EXISTS {trigger_prefix}_{event}")
+
+        db_object.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {trigger_prefix}_insert AFTER INSERT ON {table} BEGIN
+                {_counter_update(db_object, counters, "new", None)};
+            END""")
+        db_object.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {trigger_prefix}_delete AFTER DELETE ON {table} BEGIN
+                {_counter_update(db_object, counters, None, "old")};
+            END""")
+
+        conditional = [counter for counter in counters if counter.condition is not None]
+        if len(conditional) > 0:
+            columns = sorted({column for counter in conditional for column in counter.columns})
+            db_object.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {trigger_prefix}_update
+                    AFTER UPDATE OF {', '.join(map(quote_name, columns))} ON {table} BEGIN
+                    {_counter_update(db_object, conditional, "new", "old")};
+                END""")
+
+
+def _create_postgres_triggers(db_object) -> None:
+    quote_name = db_object.provider.quote_name
+    for entity_name, counters in _counters_by_table().items():
+        table = quote_name(getattr(db_object, entity_name)._table_)
+        function_name = f"statistics_{entity_name.lower()}"
+
+        conditional = [counter for counter in counters if counter.condition is not None]
+        update_branch = ""
+        events = "INSERT OR DELETE"
+        if len(conditional) > 0:
+            update_branch = f"""
+                ELSIF TG_OP = 'UPDATE' THEN
+                    {_counter_update(db_object, conditional, "NEW", "OLD")};"""
+            columns = sorted({column for counter in conditional for column in counter.columns})
+            events += f" OR UPDATE OF {', '.join(map(quote_name, columns))}"
+
+        db_object.execute(f"""
+            CREATE OR REPLACE FUNCTION {function_name}() RETURNS trigger AS $$body$$
+            BEGIN
+                IF TG_OP = 'INSERT' THEN
+                    {_counter_update(db_object, counters, "NEW", None)};
+                ELSIF TG_OP = 'DELETE' THEN
+                    {_counter_update(db_object, counters, None, "OLD")};{update_branch}
+                END IF;
+                RETURN NULL;
+            END
+            $$body$$ LANGUAGE plpgsql""")
+        db_object.execute(f"DROP TRIGGER IF EXISTS {function_name} ON {table}")
+        db_object.execute(f"""
+            CREATE TRIGGER {function_name} AFTER {events} ON {table}
+                FOR EACH ROW EXECUTE PROCEDURE {function_name}()""")
+
+
+"""
+    recount_statistics
+
+    counts every counter from scratch, with one aggregate query per
+    table, and stores the results. only needed when the counters are
+    first created, or if they're suspected to have drifted.
+    must be called inside a db_session.
+"""
+
+
+def recount_statistics(db_object) -> dict:
+    quote_name = db_object.provider.quote_name
+    values = {}
+    for entity_name, counters in _counters_by_table().items():
+        table = quote_name(getattr(db_object, entity_name)._table_)
+        sums = ", ".join(f"SUM({_counter_amount(db_object, counter, 'counted')})" for counter in counters)
+        row = db_object.select(f"SELECT {sums} FROM {table} counted")[0]
+        if len(counters) == 1:
+            row = [row]
+        for counter, value in zip(counters, row):
+            values[counter.name] = int(value or 0)
+
+    for name, value in values.items():
+        counter = db_object.StatisticsCounter.get(name=name)
+        if counter is None:
+            db_object.StatisticsCounter(name=name, value=value)
+        else:
+            counter.value = value
+    return values
+
+
+"""
+    create_statistics_counters
+
+    creates the triggers maintaining the counters, and counts anything
+    that doesn't have a counter yet (i.e. on a new database, or the first
+    start after upgrading). if rebuild is true, the triggers are recreated
+    and everything's recounted.
+"""
+
+
+def create_statistics_counters(db_object, rebuild: bool = False) -> None:
+    with orm.db_session:
+        if db_object.provider_name == "sqlite":
+            _create_sqlite_triggers(db_object, rebuild)
+        elif db_object.provider_name == "postgres":
+            _create_postgres_triggers(db_object)
+
+        existing = set(orm.select(counter.name for counter in db_object.StatisticsCounter))
+        if rebuild or any(counter.name not in existing for counter in STATISTICS_COUNTERS):
+            recount_statistics(db_object)
+
+
+"""
+    get_statistics
+
+    a snapshot of the server's statistics. the counters are read in one
+    query, and the few cheap counts left over in two more.
+
+    snapshots are cached for STATISTICS_CACHE_SECONDS by default, so
+    monitoring (or a lot of admins) polling it doesn't load the database.
+"""
+
+_snapshot_lock = Lock()
+_snapshot_cache = {}
+
+
+def get_statistics(db_object, max_age: float = STATISTICS_CACHE_SECONDS) -> dict:
+    with _snapshot_lock:
+        cached = _snapshot_cache.get("snapshot")
+        if cached is not None and monotonic() - _snapshot_cache["time"] < max_age:
+            return cached
+
+        snapshot = _take_snapshot(db_object)
+        _snapshot_cache["snapshot"] = snapshot
+        _snapshot_cache["time"] = monotonic()
+        return snapshot
+
+
+def clear_statistics_cache() -> None:
+    with _snapshot_lock:
+        _snapshot_cache.clear()
+
+
+@orm.db_session
+def _take_snapshot(db_object) -> dict:
+    quote_name = db_object.provider.quote_name
+
+    counters = dict(orm.select((counter.name, counter.value) for counter in db_object.StatisticsCounter))
+
+    def count(entity, condition=""):
+        return f"(SELECT COUNT(*) FROM {quote_name(entity._table_)}{condition})"
+
+    totp_enabled, hashtags, images, videos = db_object.select(
+        "SELECT " + ", ".join([
+            count(db_object.Totp, f" WHERE {quote_name('confirmed')}"),
+            count(db_object.Hashtag),
+            count(db_object.Image),
+            count(db_object.Video),
+        ])
+    )[0]
+
+    reports = {bool(active): report_count for active, report_count in db_object.select(
+        f"SELECT {quote_name('active')}, COUNT(*) FROM {quote_name(db_object.PostReport._table_)} "
+        f"GROUP BY {quote_name('active')}"
+    )}
+
+    return {
+        "generated_at": datetime.utcnow().isoformat() + "Z",
+        "users": {
+            "total": counters.get("users", 0),
+            "admins": counters.get("admins", 0),
+            "moderators": counters.get("moderators", 0),
+            "verified": counters.get("verified_users", 0),
+            "totp_enabled": totp_enabled,
+            "unapproved": counters.get("unapproved_users", 0),
+            "blocks": counters.get("blocks", 0),
+            "sessions": counters.get("sessions", 0),
+        },
+        "posts": {
+            "total": counters.get("posts", 0),
+            "under_moderation": counters.get("posts_under_moderation", 0),
+            "reports_active": reports.get(True, 0),
+            "reports_inactive": reports.get(False, 0),
+            "hashtags": hashtags,
+        },
+        "comments": {
+            "total": counters.get("comments", 0),
+        },
+        "media": {
+            "images": images,
+            "videos": videos,
+        },
+    }
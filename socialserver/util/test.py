@@ -9,6 +9,12 @@ from socialserver.db import create_test_db
 from pony.orm import db_session
 from socialserver.tests.test_data.test_image import TEST_IMAGE_B64
 from socialserver.util.namespace import dict_to_simple_namespace
+from socialserver.util.username_filter import username_filter
+from socialserver.util.write_behind import write_behind
+from socialserver.util.api_key import api_key_cache
+from socialserver.util.rate_limit import rate_limiter
+from socialserver.util.statistics import clear_statistics_cache
+from socialserver.util.media_jobs import media_jobs
 from socialserver.constants import ROOT_DIR
 from base64 import urlsafe_b64decode
 from io import BytesIO
@@ -28,8 +34,17 @@ UA = (
 
 @pytest.fixture
 def test_db(monkeypatch):
+    # the last test's images might still be being processed.
+    media_jobs.wait_until_idle()
     test_db = create_test_db()
     monkeypatch_api_db(pytest.MonkeyPatch(), test_db)
+    # the filter holds usernames from the last test's database.
+    username_filter.reset()
+    # anything buffered belongs to the last test's database too.
+    write_behind.reset()
+    api_key_cache.clear()
+    rate_limiter.reset()
+    clear_statistics_cache()
     create_user_with_request(username="test", password="password", display_name="test")
     access_token = create_user_session_with_request(
         username="test", password="password"
@@ -151,9 +166,20 @@ def monkeypatch_api_db(monkeypatch: pytest.MonkeyPatch, db: pony.orm.Database) -
     monkeypatch.setattr("socialserver.util.image.db", db)
     monkeypatch.setattr("socialserver.util.video.db", db)
     monkeypatch.setattr("socialserver.util.api.v3.data_format.db", db)
+    monkeypatch.setattr("socialserver.util.relationships.db", db)
+    monkeypatch.setattr("socialserver.util.api.v3.feed.db", db)
+    monkeypatch.setattr("socialserver.util.hashtag.db", db)
+    monkeypatch.setattr("socialserver.util.search.db", db)
+    monkeypatch.setattr("socialserver.util.username_filter.db", db)
+    monkeypatch.setattr("socialserver.util.write_behind.db", db)
+    monkeypatch.setattr("socialserver.util.api_key.db", db)
+    monkeypatch.setattr("socialserver.cli.admin.seed.db", db)
+    monkeypatch.setattr("socialserver.cli.admin.getstats.db", db)
+    monkeypatch.setattr("socialserver.cli.admin.media.db", db)
 
     monkeypatch.setattr("socialserver.api.v3.block.db", db)
     monkeypatch.setattr("socialserver.api.v3.feed.db", db)
+    monkeypatch.setattr("socialserver.api.v3.hashtag_feed.db", db)
     monkeypatch.setattr("socialserver.api.v3.follow.db", db)
     # follow lists don't use the database directly!
     monkeypatch.setattr("socialserver.api.v3.image.db", db)
@@ -162,11 +188,13 @@ def monkeypatch_api_db(monkeypatch: pytest.MonkeyPatch, db: pony.orm.Database) -
     monkeypatch.setattr("socialserver.api.v3.post_like_list.db", db)
     monkeypatch.setattr("socialserver.api.v3.bookmark.db", db)
     monkeypatch.setattr("socialserver.api.v3.report.db", db)
+    monkeypatch.setattr("socialserver.api.v3.search.db", db)
     monkeypatch.setattr("socialserver.api.v3.user.db", db)
     monkeypatch.setattr("socialserver.api.v3.two_factor.db", db)
     monkeypatch.setattr("socialserver.api.v3.user_session.db", db)
-    monkeypatch.setattr("socialserver.api.v3.username_available.db", db)
+    monkeypatch.setattr("socialserver.api.v3.api_key.db", db)
     monkeypatch.setattr("socialserver.api.v3.admin.user_approvals.db", db)
+    monkeypatch.setattr("socialserver.api.v3.admin.statistics.db", db)
     monkeypatch.setattr("socialserver.api.v3.comment.db", db)
     monkeypatch.setattr("socialserver.api.v3.comment_feed.db", db)
     monkeypatch.setattr("socialserver.api.v3.comment_like.db", db)
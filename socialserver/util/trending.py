@@ -0,0 +1,207 @@
+#  Copyright (c) Niall Asher 2022
+
+from collections import deque
+from heapq import heappush, heappop, heapify
+from threading import Lock
+from time import time
+from typing import Callable, Iterable, List, Tuple
+
+"""
+    SpaceSavingCounter
+
+    Approximate counter for the most frequent items in a stream
+    (the Space-Saving algorithm, Metwally et al.). Only tracks up to
+    `capacity` items; when a new item arrives and it's full, the least
+    counted item is evicted and the new one inherits its count. Counts can
+    be overestimated by at most the evicted count, but anything seen more
+    than (total / capacity) times is guaranteed to be tracked.
+"""
+
+
+class SpaceSavingCounter:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._counts = {}
+        # min-heap of (count, item). entries go stale when an item's count
+        # changes; they're skipped when popped, and the heap is rebuilt
+        # if too many pile up, so memory stays proportional to capacity.
+        self._heap = []
+
+    def add(self, item: str, count: int = 1) -> None:
+        if item in self._counts:
+            self._counts[item] += count
+        elif len(self._counts) < self.capacity:
+            self._counts[item] = count
+        else:
+            evicted_item, evicted_count = self._pop_min()
+            del self._counts[evicted_item]
+            self._counts[item] = evicted_count + count
+        heappush(self._heap, (self._counts[item], item))
+        if len(self._heap) > self.capacity * 4:
+            self._rebuild_heap()
+
+    def _pop_min(self) -> Tuple[str, int]:
+        while True:
+            count, item = heappop(self._heap)
+            if self._counts.get(item) == count:
+                return item, count
+
+    def _rebuild_heap(self) -> None:
+        self._heap = [(count, item) for item, count in self._counts.items()]
+        heapify(self._heap)
+
+    def items(self):
+        return self._counts.items()
+
+    def __len__(self):
+        return len(self._counts)
+
+
+"""
+    TrendingCounter
+
+    Counts the most frequent items over a sliding time window.
+    The window is split into buckets, each with its own SpaceSavingCounter,
+    and buckets that fall out of the window are dropped. Memory is bounded
+    by bucket_count * capacity, no matter how many distinct items are seen.
+
+    The merged top list is cached and rebuilt at most every refresh_seconds,
+    so reading it is constant time regardless of post volume.
+
+    Counts recorded since the last take_pending are also kept aside, so
+    they can be merged into counts kept elsewhere (i.e. shared between
+    processes), without counting anything twice.
+"""
+
+
+class TrendingCounter:
+    def __init__(self, window_seconds: int, bucket_count: int, capacity: int,
+                 refresh_seconds: float = 10, top_count: int = 32,
+                 clock: Callable[[], float] = time):
+        self.bucket_seconds = window_seconds / bucket_count
+        self.bucket_count = bucket_count
+        self.capacity = capacity
+        self.refresh_seconds = refresh_seconds
+        self.top_count = top_count
+        self._clock = clock
+        self._lock = Lock()
+        # deque of (bucket index, SpaceSavingCounter), oldest first.
+        self._buckets = deque()
+        # bucket index -> SpaceSavingCounter, of what's not been taken yet.
+        self._pending = {}
+        self._cached_top = []
+        self._cached_top_time = None
+
+    def _current_bucket_index(self, now: float) -> int:
+        return int(now // self.bucket_seconds)
+
+    def _drop_expired_buckets(self, now: float) -> None:
+        oldest_valid_index = self._current_bucket_index(now) - self.bucket_count + 1
+        while len(self._buckets) > 0 and self._buckets[0][0] < oldest_valid_index:
+            self._buckets.popleft()
+        for bucket_index in [i for i in self._pending if i < oldest_valid_index]:
+            del self._pending[bucket_index]
+
+    def _bucket(self, bucket_index: int) -> SpaceSavingCounter:
+        # buckets are almost always added at the end, but merged counts
+        # can belong anywhere in the window.
+        position = len(self._buckets)
+        while position > 0 and self._buckets[position - 1][0] >= bucket_index:
+            if self._buckets[position - 1][0] == bucket_index:
+                return self._buckets[position - 1][1]
+            position -= 1
+        bucket = SpaceSavingCounter(self.capacity)
+        self._buckets.insert(position, (bucket_index, bucket))
+        return bucket
+
+    def _add_counts(self, bucket_index: int, counts: dict, now: float) -> None:
+        if bucket_index < self._current_bucket_index(now) - self.bucket_count + 1:
+            return
+        bucket = self._bucket(bucket_index)
+        for item, count in counts.items():
+            bucket.add(item, count)
+
+    def record(self, items: Iterable[str]) -> None:
+        now = self._clock()
+        bucket_index = self._current_bucket_index(now)
+        with self._lock:
+            if len(self._buckets) == 0 or self._buckets[-1][0] != bucket_index:
+                self._drop_expired_buckets(now)
+            bucket = self._bucket(bucket_index)
+            pending = self._pending.setdefault(bucket_index, SpaceSavingCounter(self.capacity))
+            for item in items:
+                bucket.add(item)
+                pending.add(item)
+
+    def _merge_buckets(self, now: float) -> List[Tuple[str, int]]:
+        self._drop_expired_buckets(now)
+        totals = {}
+        for _, bucket in self._buckets:
+            for item, count in bucket.items():
+                totals[item] = totals.get(item, 0) + count
+        return sorted(totals.items(), key=lambda x: (-x[1], x[0]))[0:self.top_count]
+
+    def top(self, count: int) -> List[Tuple[str, int]]:
+        now = self._clock()
+        with self._lock:
+            if self._cached_top_time is None or now - self._cached_top_time >= self.refresh_seconds:
+                self._cached_top = self._merge_buckets(now)
+                self._cached_top_time = now
+            return self._cached_top[0:count]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "bucket_seconds": self.bucket_seconds,
+                "buckets": [
+                    [bucket_index, dict(bucket.items())] for bucket_index, bucket in self._buckets
+                ],
+            }
+
+    def take_pending(self) -> dict:
+        # same format as snapshot, so it can be merged into one.
+        with self._lock:
+            pending = {
+                "bucket_seconds": self.bucket_seconds,
+                "buckets": [
+                    [bucket_index, dict(bucket.items())] for bucket_index, bucket in sorted(self._pending.items())
+                ],
+            }
+            self._pending = {}
+            return pending
+
+    def return_pending(self, pending: dict) -> None:
+        # for when what take_pending gave couldn't be saved.
+        now = self._clock()
+        oldest_valid_index = self._current_bucket_index(now) - self.bucket_count + 1
+        with self._lock:
+            for bucket_index, counts in pending["buckets"]:
+                if bucket_index >= oldest_valid_index:
+                    bucket = self._pending.setdefault(bucket_index, SpaceSavingCounter(self.capacity))
+                    for item, count in counts.items():
+                        bucket.add(item, count)
+
+    def merge(self, snapshot: dict) -> None:
+        # a snapshot taken with a different bucket size can't be lined up
+        # with the current buckets, so it's just thrown away.
+        if snapshot.get("bucket_seconds") != self.bucket_seconds:
+            return
+        now = self._clock()
+        with self._lock:
+            for bucket_index, counts in snapshot.get("buckets", []):
+                self._add_counts(bucket_index, counts, now)
+            self._cached_top_time = None
+
+    def restore(self, snapshot: dict) -> None:
+        if snapshot.get("bucket_seconds") != self.bucket_seconds:
+            return
+        now = self._clock()
+        with self._lock:
+            self._buckets.clear()
+            for bucket_index, counts in snapshot.get("buckets", []):
+                self._add_counts(bucket_index, counts, now)
+            # anything recorded since the pending counts were last taken
+            # can't be in the snapshot yet.
+            for bucket_index, bucket in self._pending.items():
+                self._add_counts(bucket_index, dict(bucket.items()), now)
+            self._cached_top_time = None
@@ -0,0 +1,217 @@
+#  Copyright (c) Niall Asher 2022
+
+from datetime import datetime
+from threading import Thread, Lock
+from time import sleep
+from typing import Optional
+from pony import orm
+from pony.orm import select, db_session
+from socialserver.db import db
+from socialserver.util.bloom import BloomFilter
+from socialserver.util.output import console
+from socialserver.constants import (
+    USERNAME_FILTER_ERROR_RATE,
+    USERNAME_FILTER_MIN_CAPACITY,
+    USERNAME_FILTER_SCAN_BATCH_SIZE,
+    USERNAME_FILTER_SYNC_INTERVAL,
+)
+
+"""
+    UsernameFilter
+
+    Keeps a bloom filter of every taken username, so most checks for
+    a free username never have to go to the database. A miss means the name
+    is definitely free (as of the last sync); a hit has to be confirmed
+    with the database, since it might be a false positive, or a name that's
+    since been freed up.
+
+    Until the first build finishes, every name is reported as maybe taken,
+    so everything falls back to the database.
+"""
+
+
+class UsernameFilter:
+    def __init__(self):
+        self._lock = Lock()
+        self._filter: Optional[BloomFilter] = None
+        # names added while a rebuild is scanning the table, which might
+        # have been missed by it. they're copied into the new filter.
+        self._pending = None
+        # bumped on reset, so a build that was running against
+        # an old database doesn't get swapped in afterwards.
+        self._generation = 0
+        # the highest user id the filter has seen, so users created
+        # by other processes can be picked up without a full rescan.
+        self._last_user_id = 0
+        # same again, for the UsernameChange log, so renames are too.
+        self._last_change_id = 0
+        # names that are in the filter but have been freed up.
+        # they can't be taken out, so they just count towards a rebuild.
+        self._stale_count = 0
+
+    @property
+    def ready(self) -> bool:
+        return self._filter is not None
+
+    def might_contain(self, username: str) -> bool:
+        bloom_filter = self._filter
+        if bloom_filter is None:
+            return True
+        return username in bloom_filter
+
+    def add(self, username: str) -> None:
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(username)
+            if self._pending is not None:
+                self._pending.append(username)
+
+    def remove(self, username: str) -> None:
+        with self._lock:
+            self._stale_count += 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self._filter = None
+            self._pending = None
+            self._generation += 1
+            self._last_user_id = 0
+            self._last_change_id = 0
+            self._stale_count = 0
+
+    def needs_rebuild(self) -> bool:
+        bloom_filter = self._filter
+        if bloom_filter is None:
+            return True
+        return bloom_filter.count + self._stale_count > bloom_filter.capacity
+
+    def build(self) -> None:
+        with self._lock:
+            generation = self._generation
+            self._pending = []
+
+        with db_session:
+            user_count = db.User.select().count()
+            # renames from here on might be missed by the scan,
+            # so catch_up picks them up from here.
+            last_change_id = orm.max(c.id for c in db.UsernameChange) or 0
+        # headroom for new users, so we don't have to rebuild straight away.
+        bloom_filter = BloomFilter(
+            max(user_count * 2, USERNAME_FILTER_MIN_CAPACITY), USERNAME_FILTER_ERROR_RATE
+        )
+
+        # the table's scanned in batches by id, so memory use
+        # doesn't depend on how many users there are.
+        last_user_id = 0
+        while True:
+            with db_session:
+                batch = select(
+                    (u.id, u.username) for u in db.User if u.id > last_user_id
+                ).order_by(1).limit(USERNAME_FILTER_SCAN_BATCH_SIZE)[:]
+            for user_id, username in batch:
+                bloom_filter.add(username)
+            if len(batch) > 0:
+                last_user_id = batch[-1][0]
+            if len(batch) < USERNAME_FILTER_SCAN_BATCH_SIZE:
+                break
+
+        with self._lock:
+            if generation != self._generation:
+                return
+            for username in self._pending:
+                bloom_filter.add(username)
+            self._pending = None
+            self._filter = bloom_filter
+            self._last_user_id = max(self._last_user_id, last_user_id)
+            self._last_change_id = max(self._last_change_id, last_change_id)
+            self._stale_count = 0
+
+    """
+        catch_up
+
+        adds users created, and names changed to, since the last build
+        or catch up, which covers users registered or renamed through
+        other worker processes.
+    """
+
+    def catch_up(self) -> None:
+        with self._lock:
+            generation = self._generation
+            last_user_id = self._last_user_id
+            last_change_id = self._last_change_id
+
+        with db_session:
+            new_users = select(
+                (u.id, u.username) for u in db.User if u.id > last_user_id
+            ).order_by(1)[:]
+            changes = select(
+                (c.id, c.username) for c in db.UsernameChange if c.id > last_change_id
+            ).order_by(1)[:]
+
+        with self._lock:
+            if generation != self._generation or self._filter is None:
+                return
+            for user_id, username in new_users:
+                self._filter.add(username)
+                self._last_user_id = max(self._last_user_id, user_id)
+            for change_id, username in changes:
+                if change_id > self._last_change_id:
+                    self._filter.add(username)
+                    # each one frees up the old name
+                    self._stale_count += 1
+                    self._last_change_id = change_id
+
+
+username_filter = UsernameFilter()
+
+"""
+    username_taken
+
+    checks if a username is taken, only going to the database
+    if the filter says it might be.
+"""
+
+
+def username_taken(username: str) -> bool:
+    if not username_filter.might_contain(username):
+        return False
+    return db.User.get(username=username) is not None
+
+
+"""
+    record_username_change
+
+    logs a user being renamed, so the filters in other worker processes
+    pick up the new name. call it in the same transaction as the rename;
+    the filter in this process still needs updating after it's committed.
+"""
+
+
+def record_username_change(username: str) -> None:
+    db.UsernameChange(username=username, change_time=datetime.utcnow())
+
+
+def start_username_filter_thread():
+    def _run():
+        while True:
+            try:
+                if username_filter.needs_rebuild():
+                    username_filter.build()
+                else:
+                    username_filter.catch_up()
+                sleep(USERNAME_FILTER_SYNC_INTERVAL)
+            except KeyboardInterrupt:
+                break
+            except Exception as e:
+                # lookups just fall back to the database while the
+                # filter's out of date, so it's fine to try again later.
+                console.log(f"[bold red]Username filter sync failed: {e}")
+                sleep(USERNAME_FILTER_SYNC_INTERVAL)
+
+    console.log(
+        f"Starting username filter thread, interval={USERNAME_FILTER_SYNC_INTERVAL}"
+    )
+    # the filter's built in the background, so startup isn't held up
+    # by scanning the user table. lookups use the database until it's ready.
+    filter_thread = Thread(target=_run, daemon=True)
+    filter_thread.start()
@@ -1,19 +1,21 @@
 #  Copyright (c) Niall Asher 2022
 
-import ffmpeg
 from datetime import datetime
 from secrets import token_urlsafe
 from socialserver.util.image import check_buffer_mimetype
 from socialserver.util.image import handle_upload as handle_image_upload
 from types import SimpleNamespace
 from io import BytesIO
-from socialserver.constants import VIDEO_SUPPORTED_FORMATS
+from socialserver.constants import VIDEO_SUPPORTED_FORMATS, ImageUploadPurposes
 from socialserver.db import db
 from pony.orm import commit, select
 from socialserver.util.output import console
 from tempfile import NamedTemporaryFile
 from hashlib import sha256
-from socialserver.util.filesystem import fs_videos
+from socialserver.util.filesystem import fs_videos, hash_directory, hash_lock, write_bytes_atomic
+from socialserver.util.lazy_import import LazyModule
+
+ffmpeg = LazyModule("ffmpeg")
 
 
 class InvalidVideoException(Exception):
@@ -27,12 +29,15 @@ def _verify_video(video: BytesIO):
 
 def write_video(video: BytesIO, video_hash: str) -> None:
     console.log(f"Writing new video, hash={video_hash}")
-    # FIXME: testing needs work before this is removed.
-    if fs_videos.exists(f"/{video_hash}"):
-        return
+    path = f"{hash_directory(video_hash)}/video.mp4"
+    # another upload of the same video might be writing it.
+    with hash_lock(video_hash):
+        # FIXME: testing needs work before this is removed.
+        if fs_videos.exists(path):
+            return
 
-    fs_videos.makedir(f"/{video_hash}")
-    fs_videos.writebytes(f"/{video_hash}/video.mp4", video.read())
+        fs_videos.makedirs(hash_directory(video_hash), recreate=True)
+        write_bytes_atomic(fs_videos, path, video.read())
 
 
 # screenshot the first frame of a video, so we can make thumbnails etc. out of it.
@@ -79,7 +84,9 @@ def handle_video_upload(video: BytesIO, userid: int) -> SimpleNamespace:
     console.log("Generating image upload from thumbnail capture")
     # we're using the database ID since it's internal,
     # not the user facing identifier
-    thumbnail_id = handle_image_upload(thumbnail_image, userid, threaded=False).id
+    thumbnail_id = handle_image_upload(
+        thumbnail_image, userid, threaded=False, purpose=ImageUploadPurposes.VIDEO_THUMBNAIL
+    ).id
 
     commit()
 
@@ -0,0 +1,219 @@
+#  Copyright (c) Niall Asher 2022
+
+import atexit
+from datetime import datetime
+from threading import Thread, Lock
+from time import sleep
+from typing import Optional, Tuple
+from pony.orm import db_session
+from socialserver.db import db
+from socialserver.util.output import console
+from socialserver.constants import WRITE_BEHIND_FLUSH_INTERVAL, WRITE_BEHIND_BATCH_SIZE
+
+"""
+    WriteBehindBuffer
+
+    Holds small, frequent writes in memory, so they don't turn every
+    authenticated request into a write transaction (which sqlite has to
+    run one at a time). Session access times and failed login counts are
+    coalesced per session/user, and flushed in batched UPDATEs every
+    WRITE_BEHIND_FLUSH_INTERVAL seconds, and on shutdown.
+
+    Anything reading these values should merge in the pending ones,
+    using session_access_time and failed_logins.
+"""
+
+
+class WriteBehindBuffer:
+    def __init__(self):
+        self._lock = Lock()
+        # held for the whole of a flush, including the database write.
+        self._flush_lock = Lock()
+        # session id -> last access time
+        self._session_access_times = {}
+        # user id -> [failure count, last failure time]
+        self._failed_logins = {}
+        # the batch that's being written right now. it still counts
+        # until it's committed, so readers don't miss it in between.
+        self._flushing_access_times = {}
+        self._flushing_failed_logins = {}
+
+    def record_session_access(self, session_id: int, access_time: datetime = None) -> None:
+        with self._lock:
+            self._session_access_times[session_id] = access_time or datetime.utcnow()
+
+    def record_failed_login(self, user_id: int, attempt_time: datetime = None) -> None:
+        attempt_time = attempt_time or datetime.utcnow()
+        with self._lock:
+            entry = self._failed_logins.setdefault(user_id, [0, attempt_time])
+            entry[0] += 1
+            entry[1] = max(entry[1], attempt_time)
+
+    """
+        clear_failed_logins
+
+        drops any buffered failures for a user, when their count is being
+        reset. waits for a flush that's in progress, so it can't write
+        the old failures back over the reset afterwards.
+    """
+
+    def clear_failed_logins(self, user_id: int) -> None:
+        with self._flush_lock:
+            with self._lock:
+                self._failed_logins.pop(user_id, None)
+
+    """
+        session_access_time
+
+        returns the newest known access time for a session,
+        given the one stored in the database.
+    """
+
+    def session_access_time(self, session_id: int, stored_time: datetime) -> datetime:
+        with self._lock:
+            pending_times = [
+                t for t in (
+                    self._session_access_times.get(session_id),
+                    self._flushing_access_times.get(session_id),
+                ) if t is not None
+            ]
+        return max([stored_time, *pending_times])
+
+    """
+        failed_logins
+
+        returns a users failed login count and last failure time,
+        given the ones stored in the database.
+    """
+
+    def failed_logins(self, user_id: int, stored_count: Optional[int],
+                      stored_time: Optional[datetime]) -> Tuple[int, Optional[datetime]]:
+        count = stored_count or 0
+        last_time = stored_time
+        with self._lock:
+            # oldest first. a buffered failure always replaces the stored
+            # time, the same as if it had been written straight away.
+            for pending in (self._flushing_failed_logins, self._failed_logins):
+                entry = pending.get(user_id)
+                if entry is not None:
+                    count += entry[0]
+                    last_time = entry[1]
+        return count, last_time
+
+    def reset(self) -> None:
+        with self._lock:
+            self._session_access_times = {}
+            self._failed_logins = {}
+            self._flushing_access_times = {}
+            self._flushing_failed_logins = {}
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        with self._lock:
+            access_times = self._session_access_times
+            failed_logins = self._failed_logins
+            self._session_access_times = {}
+            self._failed_logins = {}
+            self._flushing_access_times = access_times
+            self._flushing_failed_logins = failed_logins
+
+        try:
+            if len(access_times) > 0 or len(failed_logins) > 0:
+                _write_batches(access_times, failed_logins)
+        except Exception:
+            # put the failed logins back so they're retried on the next
+            # flush; dropping them would reset brute-force progress.
+            # the session access times are only activity timestamps.
+            with self._lock:
+                for user_id, (count, last_time) in failed_logins.items():
+                    entry = self._failed_logins.setdefault(user_id, [0, last_time])
+                    entry[0] += count
+                    entry[1] = max(entry[1], last_time)
+                self._flushing_access_times = {}
+                self._flushing_failed_logins = {}
+            raise
+        finally:
+            with self._lock:
+                self._flushing_access_times = {}
+                self._flushing_failed_logins = {}
+
+
+def _chunks(items: list):
+    for i in range(0, len(items), WRITE_BEHIND_BATCH_SIZE):
+        yield items[i:i + WRITE_BEHIND_BATCH_SIZE]
+
+
+# each batch is written with a single UPDATE, picking the new
+# value for each row with a CASE on its id. rows that have been
+# deleted in the meantime just don't match anything.
+@db_session
+def _write_batches(access_times: dict, failed_logins: dict) -> None:
+    quote_name = db.provider.quote_name
+
+    session_table = quote_name(db.UserSession._table_)
+    for batch in _chunks(list(access_times.items())):
+        params = {}
+        cases = []
+        for i, (session_id, access_time) in enumerate(batch):
+            params[f"id{i}"] = session_id
+            params[f"t{i}"] = access_time
+            cases.append(f"WHEN $id{i} THEN $t{i}")
+        id_list = ", ".join(f"$id{i}" for i in range(len(batch)))
+        db.execute(f"""UPDATE {session_table}
+            SET "last_access_time" = CASE "id" {" ".join(cases)} END
+            WHERE "id" IN ({id_list})""", params)
+
+    user_table = quote_name(db.User._table_)
+    for batch in _chunks(list(failed_logins.items())):
+        params = {}
+        count_cases = []
+        time_cases = []
+        for i, (user_id, (count, attempt_time)) in enumerate(batch):
+            params[f"id{i}"] = user_id
+            params[f"c{i}"] = count
+            params[f"t{i}"] = attempt_time
+            count_cases.append(f"WHEN $id{i} THEN $c{i}")
+            time_cases.append(f"WHEN $id{i} THEN $t{i}")
+        id_list = ", ".join(f"$id{i}" for i in range(len(batch)))
+        db.execute(f"""UPDATE {user_table}
+            SET "recent_failed_login_count" = COALESCE("recent_failed_login_count", 0)
+                + CASE "id" {" ".join(count_cases)} END,
+            "last_failed_login_attempt" = CASE "id" {" ".join(time_cases)} END
+            WHERE "id" IN ({id_list})""", params)
+
+
+write_behind = WriteBehindBuffer()
+
+
+# anything still buffered when the server stops would be lost otherwise.
+def _flush_on_exit():
+    try:
+        write_behind.flush()
+    except Exception as e:
+        console.log(f"[bold red]Write-behind flush on exit failed: {e}")
+
+
+atexit.register(_flush_on_exit)
+
+
+def start_write_behind_flush_thread():
+    def _run():
+        while True:
+            try:
+                sleep(WRITE_BEHIND_FLUSH_INTERVAL)
+                write_behind.flush()
+            except KeyboardInterrupt:
+                break
+            except Exception as e:
+                # failed login counts are kept and retried on the
+                # next tick; only session access times are dropped.
+                console.log(f"[bold red]Write-behind flush failed: {e}")
+
+    console.log(
+        f"Starting write-behind flush thread, interval={WRITE_BEHIND_FLUSH_INTERVAL}"
+    )
+    flush_thread = Thread(target=_run, daemon=True)
+    flush_thread.start()